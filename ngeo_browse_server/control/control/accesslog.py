@@ -0,0 +1,375 @@
+#-------------------------------------------------------------------------------
+#
+# Project: ngEO Browse Server <http://ngeo.eox.at>
+# Authors: Fabian Schindler <fabian.schindler@eox.at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2013 European Space Agency
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+
+"""\
+Incremental aggregation of Apache access logs for the browse access reports.
+
+The requests of an access log are aggregated per time bin (one hour) and per
+user and browse layers. The aggregates are stored together with the offset
+up to which the log has been read, so that each report only parses the lines
+appended since the previous one. For each bin the offset of its first line
+and the end of its last line are kept as a sparse time to offset index: bins
+only partially covered by the requested time window are re-read from the log
+within that range.
+
+A rotated or truncated log file is detected by its inode, its size and a
+hash of its first bytes, and read again from the beginning.
+"""
+
+import os
+import re
+import json
+import logging
+import tempfile
+import urlparse
+from os.path import join, exists, abspath
+from calendar import timegm
+from collections import OrderedDict
+from hashlib import sha1
+
+from ngeo_browse_server.lock import FileLock
+
+
+logger = logging.getLogger(__name__)
+
+
+#10.0.2.2 - - [28/Apr/2014:13:00:08 +0000] "GET /c/wmts/?SERVICE=WMTS&REQUEST=GetCapabilities&VERSION=1.0.0 HTTP/1.1" 200 1576 "-" "Mo..." 1927 "-"
+ACCESS_LOG_REGEX = re.compile(
+    r'[(\d\.)]+ - - \[(.*?)\] "GET (.*?) HTTP/1\.." (\d+) (\d+|-) ".*?" ".*?" '
+    r'(\d+) "(.*?)"'
+)
+
+MONTHS = dict(
+    (month, index + 1) for index, month in enumerate((
+        "Jan", "Feb", "Mar", "Apr", "May", "Jun",
+        "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"
+    ))
+)
+
+HEAD_SIZE = 1024 # bytes hashed to recognize a log file
+
+_day_cache = {}
+
+
+def parse_access_time(raw):
+    """ Parses an access log timestamp like "28/Apr/2014:13:00:08 +0000" to
+    seconds since the epoch (UTC). The start of each day is computed only
+    once, which makes this many times faster than `time.strptime`. Raises
+    `ValueError` for invalid timestamps.
+    """
+
+    if len(raw) != 26 or raw[2] != "/" or raw[11] != ":":
+        raise ValueError("Invalid timestamp '%s'." % raw)
+
+    try:
+        day = _day_cache[raw[:11]]
+    except KeyError:
+        try:
+            day = timegm((
+                int(raw[7:11]), MONTHS[raw[3:6]], int(raw[0:2]), 0, 0, 0
+            ))
+        except KeyError:
+            raise ValueError("Invalid timestamp '%s'." % raw)
+        _day_cache[raw[:11]] = day
+
+    seconds = (
+        day + int(raw[12:14]) * 3600 + int(raw[15:17]) * 60 + int(raw[18:20])
+    )
+
+    zone = raw[21:]
+    if zone != "+0000":
+        offset = int(zone[1:3]) * 3600 + int(zone[3:5]) * 60
+        seconds -= offset if zone[0] == "+" else -offset
+    return seconds
+
+
+def get_layers(request):
+    """ Returns the browse layers requested by a WMS or WMTS request or
+    `None`.
+    """
+
+    if "?" in request:
+        qs = request.split("?")[1]
+    else:
+        qs = request
+    kvps = dict(
+        (key.lower(), value)
+        for key, value in urlparse.parse_qsl(qs)
+    )
+
+    if request.startswith("/c/wmts"):
+        if kvps:
+            return kvps.get("layer")
+        try:
+            layer = request.split("/")[3]
+            if layer == "WMTSCapabilities.xml":
+                return None
+            return layer
+        except IndexError:
+            return None
+    elif request.startswith("/c/wms"):
+        return kvps.get("layers")
+
+
+def parse_access_line(line):
+    """ Parses a line of the access log. Returns the tuple
+    `(time, user, layers, size, processing_time)` for successful browse
+    requests or `None` for all other lines.
+    """
+
+    match = ACCESS_LOG_REGEX.match(line)
+    if not match:
+        return None
+
+    raw_dt, request, raw_status, raw_size, raw_pt, user = match.groups()
+
+    if raw_status not in ("200", "304"):
+        return None
+
+    layers = get_layers(request)
+    if not layers:
+        return None
+
+    try:
+        time = parse_access_time(raw_dt)
+    except ValueError:
+        logger.debug("Skipping access log line with invalid timestamp '%s'."
+                     % raw_dt)
+        return None
+
+    try:
+        size = max(int(raw_size), 0)
+    except ValueError:
+        size = 0
+
+    processing_time = max(int(raw_pt), 0)
+
+    return time, user, layers, size, processing_time
+
+
+def _add(aggregates, key, time, count, size, processing_time):
+    """ Adds to the `[count, size, processing_time, max_time]` aggregate of
+    `key`.
+    """
+    try:
+        aggregate = aggregates[key]
+    except KeyError:
+        aggregates[key] = [count, size, processing_time, time]
+    else:
+        aggregate[0] += count
+        aggregate[1] += size
+        aggregate[2] += processing_time
+        if time > aggregate[3]:
+            aggregate[3] = time
+
+
+class AccessLogAggregator(object):
+    """ Aggregates the browse requests of the access log `filename`. When a
+    `state_dir` is given, the aggregates are stored in that directory and
+    only the new lines of the log are parsed on each :meth:`update`.
+    """
+
+    BIN_SIZE = 3600 # seconds
+
+    def __init__(self, filename, state_dir=None, lock_timeout=60):
+        self.filename = filename
+        self.state_filename = None
+        if state_dir:
+            self.state_filename = join(state_dir, "%s.json" % sha1(
+                abspath(filename)
+            ).hexdigest())
+        self.lock_timeout = lock_timeout
+        self.bins = {}
+        self.offset = 0
+        self.bytes_read = 0
+
+    def update(self):
+        """ Reads the lines appended to the log since the last update. """
+
+        if not self.state_filename:
+            self._read_log()
+            return
+
+        if not exists(os.path.dirname(self.state_filename)):
+            os.makedirs(os.path.dirname(self.state_filename))
+
+        with FileLock(self.state_filename + ".lck", self.lock_timeout):
+            info = self._get_file_info()
+            self._load_state(info)
+            self._read_log()
+            self._save_state(info)
+
+    def aggregate(self, begin=None, end=None):
+        """ Returns the aggregates of the requests between `begin` and `end`
+        (seconds since the epoch, both optional) as a list of tuples
+        `(user, layers, count, size, processing_time, max_time)`.
+        """
+
+        totals = {}
+        with open(self.filename, "rb") as f:
+            for bin_start in sorted(self.bins):
+                bin_end = bin_start + self.BIN_SIZE
+                if (begin is not None and bin_end <= begin) or \
+                        (end is not None and bin_start > end):
+                    continue
+
+                aggregates = self.bins[bin_start][2]
+                if (begin is None or bin_start >= begin) and \
+                        (end is None or bin_end - 1 <= end):
+                    # bin completely within the time window
+                    for key, (count, size, pt, time) in aggregates.items():
+                        _add(totals, key, time, count, size, pt)
+                else:
+                    self._read_bin(f, bin_start, begin, end, totals)
+
+        return [
+            key + tuple(aggregate) for key, aggregate in totals.items()
+        ]
+
+    def _get_file_info(self):
+        stat = os.stat(self.filename)
+        with open(self.filename, "rb") as f:
+            head = sha1(f.read(HEAD_SIZE)).hexdigest()
+        return stat.st_ino, stat.st_size, head
+
+    def _read_log(self):
+        """ Parses the lines after the current offset. An incomplete last
+        line is left for the next update.
+        """
+
+        offset = self.offset
+        bin_size = self.BIN_SIZE
+        bins = self.bins
+        with open(self.filename, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                line_offset = offset
+                offset += len(line)
+                parsed = parse_access_line(line)
+                if parsed is None:
+                    continue
+
+                time, user, layers, size, processing_time = parsed
+                bin_start = time - time % bin_size
+                try:
+                    start, _, aggregates = bins[bin_start]
+                except KeyError:
+                    start, aggregates = line_offset, OrderedDict()
+                bins[bin_start] = (start, offset, aggregates)
+                _add(aggregates, (user, layers), time, 1, size,
+                     processing_time)
+
+        self.bytes_read = offset - self.offset
+        self.offset = offset
+        logger.debug("Read %d bytes of access log '%s'."
+                     % (self.bytes_read, self.filename))
+
+    def _read_bin(self, f, bin_start, begin, end, totals):
+        """ Re-reads the requests of a single bin within the time window from
+        the log, from the offset of the first to the end of the last line of
+        the bin.
+        """
+
+        start, stop, _ = self.bins[bin_start]
+        bin_end = bin_start + self.BIN_SIZE
+        f.seek(start)
+        for line in f:
+            start += len(line)
+            if start > stop:
+                break
+            parsed = parse_access_line(line)
+            if parsed is None:
+                continue
+
+            time, user, layers, size, processing_time = parsed
+            if time < bin_start or time >= bin_end or \
+                    (begin is not None and time < begin) or \
+                    (end is not None and time > end):
+                continue
+            _add(totals, (user, layers), time, 1, size, processing_time)
+
+    def _load_state(self, info):
+        """ Loads the stored state unless the log has been rotated or
+        truncated since.
+        """
+
+        self.bins = {}
+        self.offset = 0
+        try:
+            with open(self.state_filename) as f:
+                state = json.load(f)
+        except (IOError, ValueError):
+            return
+
+        inode, size, head = info
+        if state.get("inode") != inode or state.get("head") != head or \
+                state.get("offset", 0) > size or \
+                state.get("bin_size") != self.BIN_SIZE:
+            logger.info("Access log '%s' has changed, reading it from the "
+                        "beginning." % self.filename)
+            return
+
+        self.offset = state["offset"]
+        for bin_start, start, stop, records in state["bins"]:
+            aggregates = OrderedDict()
+            for user, layers, count, size, pt, time in records:
+                # the strings were stored decoded as latin-1 (see below)
+                key = (user.encode("latin-1"), layers.encode("latin-1"))
+                aggregates[key] = [count, size, pt, time]
+            self.bins[bin_start] = (start, stop, aggregates)
+
+    def _save_state(self, info):
+        inode, _, head = info
+        state = {
+            "inode": inode,
+            "head": head,
+            "offset": self.offset,
+            "bin_size": self.BIN_SIZE,
+            "bins": [
+                [bin_start, start, stop, [
+                    list(key) + aggregate
+                    for key, aggregate in aggregates.items()
+                ]]
+                for bin_start, (start, stop, aggregates)
+                in sorted(self.bins.items())
+            ],
+        }
+
+        handle, tmp_filename = tempfile.mkstemp(
+            prefix=".access_log_", dir=os.path.dirname(self.state_filename)
+        )
+        try:
+            with os.fdopen(handle, "w") as f:
+                # logged strings are not necessarily valid UTF-8
+                json.dump(state, f, encoding="latin-1")
+            os.rename(tmp_filename, self.state_filename)
+        except:
+            if exists(tmp_filename):
+                os.remove(tmp_filename)
+            raise
@@ -120,3 +120,15 @@ def get_configured_log_file_patterns(config):
         return []
 
     return map(get_project_relative_path, items.split(","))
+
+
+def get_access_log_index_dir(config=None):
+    """ Returns the directory of the stored access log aggregates or `None`
+    if the access logs shall be read completely for each report.
+    """
+    config = config or get_ngeo_config()
+
+    path = safe_get(
+        config, CTRL_SECTION, "access_log_index_dir", "access_log_index"
+    )
+    return get_project_relative_path(path) if path else None
@@ -29,9 +29,13 @@ import re
 from os.path import join
 import logging
 import urllib2
-import time
-from datetime import datetime
 import urlparse
+import httplib
+import socket
+import tempfile
+from cStringIO import StringIO
+from calendar import timegm
+from datetime import datetime
 
 from collections import namedtuple
 from lxml import etree
@@ -44,12 +48,23 @@ from ngeo_browse_server.config import models
 from ngeo_browse_server.config import get_ngeo_config, safe_get
 from ngeo_browse_server.control.control.config import (
     get_controller_config, get_controller_config_path, get_instance_id,
-    CONTROLLER_SERVER_SECTION
+    get_access_log_index_dir, CONTROLLER_SERVER_SECTION
+)
+from ngeo_browse_server.control.control.accesslog import (
+    AccessLogAggregator, get_layers
 )
 
 
 logger = logging.getLogger(__name__)
 
+
+def _get_timestamp(dt):
+    """ Converts a datetime (UTC if naive) to seconds since the epoch. """
+    if dt is None:
+        return None
+    return timegm(dt.utctimetuple()) + dt.microsecond / 1e6
+
+
 class Report(object):
     operation = None
     def __init__(self, begin, end, filename):
@@ -58,101 +73,36 @@ class Report(object):
         self.filename = filename
 
 
-#10.0.2.2 - - [28/Apr/2014:13:00:08 +0000] "GET /c/wmts/?SERVICE=WMTS&REQUEST=GetCapabilities&VERSION=1.0.0 HTTP/1.1" 200 1576 "-" "Mo..." 1927 "-"
-
 class BrowseAccessReport(Report):
     operation = "BROWSE_ACCESS"
 
-    def get_records(self):
-        regex = re.compile('[(\d\.)]+ - - \[(.*?)\] "GET (.*?) HTTP/1\.." (\d+) (\d+|-) ".*?" ".*?" (\d+) "(.*?)"')
-
-        with open(self.filename) as f:
-
-            bins = {}
-
-            for line in f:
-                match = regex.match(line)
-                if not match:
-                    continue
-
-                raw_dt, request, raw_status, raw_size, raw_pt, user = match.groups()
+    def __init__(self, begin, end, filename, state_dir=None):
+        super(BrowseAccessReport, self).__init__(begin, end, filename)
+        self.state_dir = state_dir
 
-                dt = datetime(
-                    *time.strptime(raw_dt, "%d/%b/%Y:%H:%M:%S +0000")[0:6],
-                    tzinfo=utc
-                )
-
-                if self.begin and dt < self.begin:
-                    continue
-                elif self.end and dt > self.end:
-                    continue
-
-                if int(raw_status) not in (200, 304):
-                    continue
-
-                try:
-                    size = int(raw_size)
-                except ValueError:
-                    size = 0
-
-                size = max(size, 0)
-
-                try:
-                    processing_time = int(raw_pt)
-                except ValueError:
-                    processing_time = 0
-
-                processing_time = max(processing_time, 0)
-
-                layers = self.get_layers(request)
-                if not layers:
-                    continue
-
-                bins.setdefault((user, layers), []).append(
-                    (size, processing_time, dt)
-                )
-
-
-            for (user, layers), items in bins.items():
-                count = str(len(items))
-                sizes, processing_times, dts = zip(*items)
-                agg_size = str(sum(sizes))
-                agg_processing_time = str(sum(processing_times))
-                max_dt = max(dts)
+    def get_records(self):
+        # only the lines appended since the last report are parsed when a
+        # state directory is configured
+        aggregator = AccessLogAggregator(self.filename, self.state_dir)
+        aggregator.update()
 
-                yield BrowseAccessRecord(
-                    max_dt.replace(tzinfo=None).isoformat("T") + "Z",
-                    layers, user, count, agg_size, agg_processing_time
-                )
+        records = aggregator.aggregate(
+            _get_timestamp(self.begin), _get_timestamp(self.end)
+        )
+        for user, layers, count, size, processing_time, time in records:
+            yield BrowseAccessRecord(
+                datetime.utcfromtimestamp(time).isoformat("T") + "Z",
+                layers, user, str(count), str(size), str(processing_time)
+            )
 
     def get_additional_keys(self, record):
         return ()
 
     def get_data(self, record):
-        return record._asdict()
+        return dict(zip(record._fields, record))
 
     def get_layers(self, request):
-        if "?" in request:
-            qs = request.split("?")[1]
-        else:
-            qs = request
-        kvps = dict(
-            (key.lower(), value)
-            for key, value in urlparse.parse_qsl(qs)
-        )
-
-        if request.startswith("/c/wmts"):
-            if kvps:
-                return kvps.get("layer")
-            try:
-                layer = request.split("/")[3]
-                if layer == "WMTSCapabilities.xml":
-                    return None
-                return layer
-            except IndexError:
-                return None
-        elif request.startswith("/c/wms"):
-            return kvps.get("layers")
+        return get_layers(request)
 
     def get_fields(self):
         return BrowseAccessRecord._fields
@@ -165,18 +115,19 @@ class BrowseReportReport(Report):
         with open(self.filename) as f:
             for line in f:
                 items = line[:-1].split("/\\/\\")
-                date = getDateTime(items[0])
-                if self.end and self.end < date:
-                    continue
-                elif self.begin and self.begin > date:
-                    continue
+                if self.begin or self.end:
+                    date = getDateTime(items[0])
+                    if self.end and self.end < date:
+                        continue
+                    elif self.begin and self.begin > date:
+                        continue
                 yield BrowseReportRecord(*items)
 
     def get_additional_keys(self, record):
         return ()
 
     def get_data(self, record):
-        return record._asdict()
+        return dict(zip(record._fields, record))
 
     def get_fields(self):
         return BrowseReportRecord._fields
@@ -185,7 +136,44 @@ class BrowseReportReport(Report):
 BrowseAccessRecord = namedtuple("BrowseAccessRecord", ("TIME", "browselayers", "userid", "numRequests", "aggregatedSize", "aggregatedProcessingTime"))
 BrowseReportRecord = namedtuple("BrowseReportRecord", ("TIME", "BROWSE_TYPE", "BROWSE_LAYER_IDENTIFIER", "BROWSE_BEGIN_DATE", "BROWSE_END_DATE"))
 
-def get_report_xml(begin, end, access_logfile=None, report_logfile=None, config=None):
+REPORT_CHUNK_SIZE = 65536 # bytes
+
+RECORD_TIME_REGEX = re.compile(
+    r"^(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)(?:\.(\d{1,6}))?Z$"
+)
+
+
+def _parse_record_time(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%fZ")
+    except ValueError:
+        return datetime.strptime(value, "%Y-%m-%dT%H:%M:%SZ")
+
+
+def _get_record_time_key(value):
+    """ Returns a key of the ISO 8601 record time `value` sorting like the
+    parsed time. Only unusual formats are parsed.
+    """
+    match = RECORD_TIME_REGEX.match(value)
+    if match:
+        date, fraction = match.groups()
+        return date, int((fraction or "").ljust(6, "0"))
+    date = _parse_record_time(value)
+    return date.isoformat("T")[:19], date.microsecond
+
+
+def _format_window_date(value):
+    if value is None:
+        return ""
+    return _parse_record_time(value).isoformat("T") + "Z"
+
+
+def iter_report_xml(begin, end, access_logfile=None, report_logfile=None, config=None):
+    """ Generates the serialized XML report in chunks of about
+    `REPORT_CHUNK_SIZE` bytes. As the header contains the time window of all
+    records, the rows are spooled to a temporary file first, so the memory
+    used is independent of the number of records.
+    """
 
     start = datetime.utcnow().isoformat("T") + "Z"
     config = config or get_ngeo_config()
@@ -193,42 +181,106 @@ def get_report_xml(begin, end, access_logfile=None, report_logfile=None, config=
 
     reports = []
     if access_logfile:
-        reports.append(BrowseAccessReport(begin, end, access_logfile))
+        reports.append(BrowseAccessReport(
+            begin, end, access_logfile, get_access_log_index_dir(config)
+        ))
     if report_logfile:
         reports.append(BrowseReportReport(begin, end, report_logfile))
 
-    root = E("DWH_DATA")
-    header = E("HEADER", E("CONTENT_ID", "NGEO_BROW"))
-    root.append(header)
-
-    window_start_date = ""
-    window_end_date = ""
-
-    rowset = E("ROWSET")
-    for report in reports:
-        for record in report.get_records():
-            report_data = report.get_data(record)
-            rowset.append(
-                E("ROW", *[
-                    E(key, report_data[key]) for key in report.get_fields()
-                ])
-            )
-            try:
-                date = datetime.strptime(report_data["TIME"], "%Y-%m-%dT%H:%M:%S.%fZ" )
-            except ValueError:
-                date = datetime.strptime(report_data["TIME"], "%Y-%m-%dT%H:%M:%SZ" )
-            window_start_date = date if (window_start_date == "" or window_start_date > date) else window_start_date
-            window_end_date = date if (window_end_date == "" or window_end_date < date) else window_end_date
-    root.append(rowset)
-
-    header.append(E("EXTRACTION_START_DATE", start))
-    header.append(E("EXTRACTION_END_DATE", datetime.utcnow().isoformat("T") + "Z"))
-    header.append(E("WINDOW_START_DATE", "" if window_start_date == "" else window_start_date.replace(tzinfo=None).isoformat("T") + "Z"))
-    header.append(E("WINDOW_END_DATE", "" if window_start_date == "" else window_end_date.replace(tzinfo=None).isoformat("T") + "Z"))
+    window_start = window_end = None
+    window_start_key = window_end_key = None
+
+    with tempfile.TemporaryFile() as rows:
+        for report in reports:
+            # the row elements are reused and indented like pretty printed
+            fields = report.get_fields()
+            row = E("ROW", *[E(key) for key in fields])
+            row.text = "\n      "
+            for child in row:
+                child.tail = "\n      "
+            row[-1].tail = "\n    "
+
+            for record in report.get_records():
+                report_data = report.get_data(record)
+                for child, key in zip(row, fields):
+                    child.text = report_data[key]
+                rows.write("    %s\n" % etree.tostring(row))
+
+                date = report_data["TIME"]
+                key = _get_record_time_key(date)
+                if window_start_key is None or window_start_key > key:
+                    window_start, window_start_key = date, key
+                if window_end_key is None or window_end_key < key:
+                    window_end, window_end_key = date, key
+
+        header = E("HEADER",
+            E("CONTENT_ID", "NGEO_BROW"),
+            E("EXTRACTION_START_DATE", start),
+            E("EXTRACTION_END_DATE", datetime.utcnow().isoformat("T") + "Z"),
+            E("WINDOW_START_DATE", _format_window_date(window_start)),
+            E("WINDOW_END_DATE", _format_window_date(window_end)),
+        )
+        yield "<DWH_DATA>\n%s" % "".join(
+            "  %s\n" % line
+            for line in etree.tostring(header, pretty_print=True).splitlines()
+        )
+
+        if not rows.tell():
+            yield "  <ROWSET/>\n</DWH_DATA>\n"
+            return
 
+        rows.seek(0)
+        yield "  <ROWSET>\n"
+        while True:
+            chunk = rows.read(REPORT_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+        yield "  </ROWSET>\n</DWH_DATA>\n"
+
+
+def get_report_xml(begin, end, access_logfile=None, report_logfile=None, config=None):
+    """ Returns the report as an element tree. Use :func:`iter_report_xml`
+    for large reports.
+    """
+    root = etree.fromstring("".join(
+        iter_report_xml(begin, end, access_logfile, report_logfile, config)
+    ))
+    # keep empty values serialized as start and end tag
+    for element in root.iter():
+        if element.text is None and not len(element) and \
+                element.tag != "ROWSET":
+            element.text = ""
     return root
 
 
+def _post_chunked(url, chunks, timeout=10):
+    """ POSTs the XML document `chunks` to `url` with chunked transfer
+    encoding. Raises `urllib2.HTTPError` for error responses.
+    """
+    parsed = urlparse.urlsplit(url)
+    connection = httplib.HTTPConnection(parsed.netloc, timeout=timeout)
+    try:
+        connection.putrequest("POST", parsed.path or "/")
+        connection.putheader("Content-Type", "text/xml")
+        connection.putheader("Transfer-Encoding", "chunked")
+        connection.endheaders()
+        for chunk in chunks:
+            connection.send("%x\r\n%s\r\n" % (len(chunk), chunk))
+        connection.send("0\r\n\r\n")
+
+        response = connection.getresponse()
+        body = response.read()
+    finally:
+        connection.close()
+
+    if response.status >= 400:
+        raise urllib2.HTTPError(
+            url, response.status, response.reason, response.msg,
+            StringIO(body)
+        )
+
+
 def send_report(ip_address=None, begin=None, end=None, access_logfile=None, report_logfile=None, config=None):
     config = config or get_ngeo_config()
 
@@ -243,16 +295,14 @@ def send_report(ip_address=None, begin=None, end=None, access_logfile=None, repo
     if not ip_address:
         raise Exception("IP address could not be determined")
 
-    tree = get_report_xml(begin, end, types, access_logfile, report_logfile)
-    req = urllib2.Request(
-        url="http://%s/notify" % ip_address,
-        data=etree.tostring(tree, pretty_print=True),
-        headers={'Content-Type': 'text/xml'}
-    )
-    print req.data
     try:
-        urllib2.urlopen(req, timeout=10)
-    except (urllib2.HTTPError, urllib2.URLError), e:
+        _post_chunked(
+            "http://%s/notify" % ip_address, iter_report_xml(
+                begin, end, access_logfile, report_logfile, config
+            )
+        )
+    except (urllib2.HTTPError, urllib2.URLError, httplib.HTTPException,
+            socket.error), e:
         logger.error(
             "Could not send report (%s): '%s'" % (type(e).__name__, str(e))
         )
@@ -261,7 +311,7 @@ def send_report(ip_address=None, begin=None, end=None, access_logfile=None, repo
 
 def save_report(filename, begin=None, end=None, access_logfile=None, report_logfile=None, config=None):
     config = config or get_ngeo_config()
-    tree = get_report_xml(begin, end, access_logfile, report_logfile, config)
 
     with open(filename, "w+") as f:
-        f.write(etree.tostring(tree, pretty_print=True))
+        for chunk in iter_report_xml(begin, end, access_logfile, report_logfile, config):
+            f.write(chunk)
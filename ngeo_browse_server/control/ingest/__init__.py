@@ -28,11 +28,10 @@
 #-------------------------------------------------------------------------------
 
 import sys
-from time import time
 from os import remove, makedirs, rmdir, environ
 from os.path import (
     exists, dirname, join, isdir, samefile, commonprefix, abspath, relpath,
-    basename, getsize,
+    basename,
 )
 import shutil
 from numpy import arange
@@ -41,8 +40,7 @@ import traceback
 from datetime import datetime, timedelta as dt_timedelta
 import string
 import uuid
-from urllib2 import urlopen, URLError, HTTPError
-from socket import setdefaulttimeout
+from urllib2 import URLError, HTTPError
 from math import copysign
 
 from django.conf import settings
@@ -84,8 +82,8 @@ from ngeo_browse_server.control.ingest.config import (
 )
 from ngeo_browse_server.control.ingest.exceptions import IngestionException
 from ngeo_browse_server.mapcache import models as mapcache_models
-from ngeo_browse_server.mapcache.tasks import CRS_BOUNDS, seed_mapcache
-from ngeo_browse_server.mapcache.config import get_mapcache_seed_config
+from ngeo_browse_server.mapcache.tasks import CRS_BOUNDS
+from ngeo_browse_server.mapcache.seedqueue import seed
 from ngeo_browse_server.config.browsereport.serialization import (
     serialize_browse_report
 )
@@ -95,7 +93,14 @@ from ngeo_browse_server.control.queries import (
 from ngeo_browse_server.control.ingest.preprocessing.preprocessor import (
     NGEOPreProcessor
 )
+from ngeo_browse_server.control.ingest.parallel import (
+    PreProcessingPool, can_use_pool
+)
+from ngeo_browse_server.control.ingest.download import (
+    download_file, BrowsePrefetcher
+)
 from ngeo_browse_server.storage import get_file_manager
+from ngeo_browse_server.control.system import init_system
 
 
 logger = logging.getLogger(__name__)
@@ -111,8 +116,8 @@ def ingest_browse_report(parsed_browse_report, do_preprocessing=True, config=Non
     externally
     """
 
-    # initialize the EOxServer system/registry/configuration
-    System.init()
+    # initialize the EOxServer system/registry/configuration once per process
+    init_system()
 
     try:
         # get the according browse layer
@@ -202,74 +207,109 @@ def ingest_browse_report(parsed_browse_report, do_preprocessing=True, config=Non
     # Create a file manager, either local or a remote storage one
     manager = get_file_manager(config)
 
-    # iterate over all browses in the browse report
-    for parsed_browse in parsed_browse_report:
-        # transaction management per browse
-        with transaction.commit_manually():
-            with transaction.commit_manually(using="mapcache"):
-                try:
-                    seed_areas = []
-                    # try ingest a single browse and log success
-                    result = ingest_browse(parsed_browse, browse_report,
-                                           browse_layer, preprocessor, crs,
-                                           success_dir, failure_dir,
-                                           seed_areas, manager, config=config)
-
-                    report_result.add(result)
-                    succeded.append(parsed_browse)
-
-                    # commit here to allow seeding
-                    transaction.commit()
-                    transaction.commit(using="mapcache")
-
-                    logger.info("Committed changes to database.")
-                    if browse_layer.disable_seeding_ingestion is not True:
-                        for minx, miny, maxx, maxy, start_time, end_time in seed_areas:
-                            try:
-
-                                # seed MapCache synchronously
-                                # TODO: maybe replace this with an async solution
-                                seed_mapcache(tileset=browse_layer.id,
-                                              grid=browse_layer.grid,
-                                              minx=minx, miny=miny,
-                                              maxx=maxx, maxy=maxy,
-                                              minzoom=browse_layer.lowest_map_level,
-                                              maxzoom=browse_layer.highest_map_level,
-                                              start_time=start_time,
-                                              end_time=end_time,
-                                              delete=False,
-                                              **get_mapcache_seed_config(config))
-                                logger.info("Successfully finished seeding.")
-
-                            except Exception, e:
-                                logger.warn("Seeding failed: %s" % str(e))
-
-                    # log ingestions for report generation
-                    # date/browseType/browseLayerId/start/end
-                    report_logger.info("/\\/\\".join((
-                        datetime.utcnow().isoformat("T") + "Z",
-                        parsed_browse_report.browse_type,
-                        browse_layer.id,
-                        (parsed_browse.start_time.replace(tzinfo=None)-parsed_browse.start_time.utcoffset()).isoformat("T") + "Z",
-                        (parsed_browse.end_time.replace(tzinfo=None)-parsed_browse.end_time.utcoffset()).isoformat("T") + "Z"
-                    )))
-
-                except Exception, e:
-                    # report error
-                    logger.error("Failure during ingestion of browse '%s'." %
-                                 parsed_browse.browse_identifier)
-                    logger.error("Exception was '%s': %s" % (type(e).__name__, str(e)))
-                    logger.debug(traceback.format_exc() + "\n")
-
-                    # undo latest changes, append the failure and continue
-                    report_result.add(IngestBrowseFailureResult(
-                        parsed_browse.browse_identifier,
-                        getattr(e, "code", None) or type(e).__name__, str(e)
-                    ))
-                    failed.append(parsed_browse)
-
-                    transaction.rollback()
-                    transaction.rollback(using="mapcache")
+    pool = None
+    prefetcher = None
+    try:
+        # start the preprocessing of all browses in parallel if configured
+        workers = get_ingest_config(config)["workers"]
+        if workers > 1 and not can_use_pool():
+            logger.info("Preprocessing browses serially as daemonic "
+                        "processes cannot have worker processes.")
+        elif preprocessor and workers > 1 and len(parsed_browse_report) > 1:
+            logger.info("Preprocessing browses using %d worker processes."
+                        % workers)
+            optimized_dir = dirname(get_optimized_path("", config=config))
+            safe_makedirs(optimized_dir)
+            pool = PreProcessingPool(preprocessor, workers, optimized_dir)
+            for parsed_browse in parsed_browse_report:
+                _submit_preprocessing(pool, parsed_browse, config)
+
+        # download browses referenced by URL ahead of their ingestion
+        prefetcher = _create_prefetcher(parsed_browse_report, config)
+
+        # iterate over all browses in the browse report
+        for index, parsed_browse in enumerate(parsed_browse_report):
+            if prefetcher:
+                prefetcher.advance(index)
+
+            # transaction management per browse
+            with transaction.commit_manually():
+                with transaction.commit_manually(using="mapcache"):
+                    try:
+                        seed_areas = []
+                        # try ingest a single browse and log success
+                        result = ingest_browse(parsed_browse, browse_report,
+                                               browse_layer, preprocessor, crs,
+                                               success_dir, failure_dir,
+                                               seed_areas, manager, pool=pool,
+                                               prefetcher=prefetcher,
+                                               config=config)
+
+                        report_result.add(result)
+                        succeded.append(parsed_browse)
+
+                        # commit here to allow seeding
+                        transaction.commit()
+                        transaction.commit(using="mapcache")
+
+                        logger.info("Committed changes to database.")
+                        if browse_layer.disable_seeding_ingestion is not True:
+                            for minx, miny, maxx, maxy, start_time, end_time in seed_areas:
+                                try:
+
+                                    # seed MapCache synchronously or add it to
+                                    # the seed queue if deferred
+                                    seed(tileset=browse_layer.id,
+                                         grid=browse_layer.grid,
+                                         minx=minx, miny=miny,
+                                         maxx=maxx, maxy=maxy,
+                                         minzoom=browse_layer.lowest_map_level,
+                                         maxzoom=browse_layer.highest_map_level,
+                                         start_time=start_time,
+                                         end_time=end_time,
+                                         delete=False, config=config)
+                                    logger.info("Successfully finished seeding.")
+
+                                except Exception, e:
+                                    logger.warn("Seeding failed: %s" % str(e))
+
+                            # commit the queued seed jobs, if any
+                            transaction.commit(using="mapcache")
+
+                        # log ingestions for report generation
+                        # date/browseType/browseLayerId/start/end
+                        report_logger.info("/\\/\\".join((
+                            datetime.utcnow().isoformat("T") + "Z",
+                            parsed_browse_report.browse_type,
+                            browse_layer.id,
+                            (parsed_browse.start_time.replace(tzinfo=None)-parsed_browse.start_time.utcoffset()).isoformat("T") + "Z",
+                            (parsed_browse.end_time.replace(tzinfo=None)-parsed_browse.end_time.utcoffset()).isoformat("T") + "Z"
+                        )))
+
+                    except Exception, e:
+                        # report error
+                        logger.error("Failure during ingestion of browse '%s'." %
+                                     parsed_browse.browse_identifier)
+                        logger.error("Exception was '%s': %s" % (type(e).__name__, str(e)))
+                        logger.debug(traceback.format_exc() + "\n")
+
+                        # undo latest changes, append the failure and continue
+                        report_result.add(IngestBrowseFailureResult(
+                            parsed_browse.browse_identifier,
+                            getattr(e, "code", None) or type(e).__name__, str(e)
+                        ))
+                        failed.append(parsed_browse)
+
+                        transaction.rollback()
+                        transaction.rollback(using="mapcache")
+    finally:
+        if pool:
+            pool.close()
+        if prefetcher:
+            prefetcher.close()
+
+    if manager:
+        manager.log_statistics()
 
     # generate browse report and save to to success/failure dir
     if len(succeded):
@@ -318,7 +358,8 @@ def ingest_browse_report(parsed_browse_report, do_preprocessing=True, config=Non
 
 
 def ingest_browse(parsed_browse, browse_report, browse_layer, preprocessor, crs,
-                  success_dir, failure_dir, seed_areas, manager, config=None):
+                  success_dir, failure_dir, seed_areas, manager, pool=None,
+                  prefetcher=None, config=None):
     """ Ingests a single browse report, performs the preprocessing of the data
     file and adds the generated browse model to the browse report model. Returns
     a boolean value, indicating whether or not the browse has been inserted or
@@ -418,7 +459,9 @@ def ingest_browse(parsed_browse, browse_report, browse_layer, preprocessor, crs,
 
             if strategy == "merge" and timedelta < threshold:
                 logger.debug("Existing browse found, merging it.")
-                input_filename = retrieve_browse(parsed_browse.file_name, config)
+                input_filename = retrieve_browse(
+                    parsed_browse.file_name, config, prefetcher
+                )
 
                 if previous_time > current_time:
                     # TODO: raise exception?
@@ -447,7 +490,9 @@ def ingest_browse(parsed_browse, browse_report, browse_layer, preprocessor, crs,
             else:
                 # perform replacement
                 logger.info("Existing browse found, replacing it.")
-                input_filename = retrieve_browse(parsed_browse.file_name, config)
+                input_filename = retrieve_browse(
+                    parsed_browse.file_name, config, prefetcher
+                )
 
                 replaced_time_interval = (existing_browse_model.start_time,
                                           existing_browse_model.end_time)
@@ -461,7 +506,9 @@ def ingest_browse(parsed_browse, browse_report, browse_layer, preprocessor, crs,
         else:
             # A browse with that identifier does not exist, so create a new one
             logger.info("Creating new browse.")
-            input_filename = retrieve_browse(parsed_browse.file_name, config)
+            input_filename = retrieve_browse(
+                parsed_browse.file_name, config, prefetcher
+            )
 
         replaced_filename_remote = None
         if replaced_filename and replaced_filename.startswith('/vsiswift'):
@@ -472,11 +519,17 @@ def ingest_browse(parsed_browse, browse_report, browse_layer, preprocessor, crs,
         merge_with_remote = None
         if merge_with and merge_with.startswith('/vsiswift'):
             merge_with_remote = merge_with
-            # TODO: get local path
             merge_with = "/tmp/merge_%s_%s" % (
                 uuid.uuid4().hex, basename(parsed_browse.file_name)
             )
-            manager.download_file(merge_with_remote, merge_with)
+            if manager.cache:
+                # the merged file is modified and deleted by the preprocessor,
+                # so work on a copy of the cached file
+                shutil.copyfile(
+                    manager.get_cached_file(merge_with_remote), merge_with
+                )
+            else:
+                manager.download_file(merge_with_remote, merge_with)
 
         # assert that the output file does not exist (unless it is a to-be
         # replaced file).
@@ -495,13 +548,9 @@ def ingest_browse(parsed_browse, browse_report, browse_layer, preprocessor, crs,
                     raise IngestionException("Input file '%s' does not exist."
                                              % input_filename)
 
-                clipping = None
-                if (parsed_browse.geo_type == "regularGridBrowse" and
-                    ingest_config["regular_grid_clipping"]) or \
-                    (parsed_browse.geo_type == "footprintBrowse" and
-                     ("ncol" in parsed_browse.col_row_list or
-                      "nrow" in parsed_browse.col_row_list)):
-                    clipping = _get_clipping(input_filename)
+                clipping = _get_browse_clipping(
+                    parsed_browse, input_filename, ingest_config
+                )
 
                 # initialize a GeoReference for the preprocessor
                 geo_reference = _georef_from_parsed(parsed_browse, clipping)
@@ -513,13 +562,21 @@ def ingest_browse(parsed_browse, browse_report, browse_layer, preprocessor, crs,
                 logger.info("Starting preprocessing on file '%s' to create '%s'."
                             % (input_filename, output_filename))
 
-                try:
-                    result = preprocessor.process(
-                        input_filename, output_filename, geo_reference,
-                        True, merge_with, merge_footprint
+                result = None
+                if pool and merge_with is None:
+                    # use the result of the parallel preprocessing if any
+                    result = pool.collect(
+                        parsed_browse, input_filename, output_filename
                     )
-                except (RuntimeError, GCPTransformException), e:
-                    raise IngestionException, str(e), sys.exc_info()[2]
+
+                if result is None:
+                    try:
+                        result = preprocessor.process(
+                            input_filename, output_filename, geo_reference,
+                            True, merge_with, merge_footprint
+                        )
+                    except (RuntimeError, GCPTransformException), e:
+                        raise IngestionException, str(e), sys.exc_info()[2]
 
                 # validate preprocess result
                 if result.num_bands not in (1, 3, 4):  # color index, RGB, RGBA
@@ -531,8 +588,20 @@ def ingest_browse(parsed_browse, browse_report, browse_layer, preprocessor, crs,
                         browse_layer.id, str(parsed_browse.start_time.year)
                     )
 
-                    manager.upload_file(prefix, output_filename)
-                    remove(output_filename)
+                    # the output filename differs in each attempt, so the
+                    # segments of an interrupted upload are kept per browse
+                    # to be reused by the next attempt
+                    etag = manager.upload_file(
+                        prefix, output_filename, key=_valid_path(
+                            parsed_browse.browse_identifier or
+                            basename(parsed_browse.file_name)
+                        )
+                    )
+                    # keep the uploaded file in the local cache, if enabled
+                    manager.cache_file(
+                        join(prefix, basename(output_filename)), etag,
+                        output_filename
+                    )
 
                     manager.prepare_environment()
 
@@ -634,40 +703,40 @@ def ingest_browse(parsed_browse, browse_report, browse_layer, preprocessor, crs,
                                      replaced_time_interval)
 
 
-def retrieve_browse(browse_location, config):
+def retrieve_browse(browse_location, config, prefetcher=None):
     """ Retrieve browse image and get the local path to it.
-    If location is a URL perform download.
+    If location is a URL perform download, or wait for the download of the
+    `prefetcher`.
     """
     # if file_name is a URL download browse first and store it locally
     validate = URLValidator()
     try:
         validate(browse_location)
-        input_filename = abspath(get_storage_path(
-            basename(browse_location), config=config))
+        input_filename = _get_download_path(browse_location, config)
         logger.info("URL given, downloading browse image from '%s' to '%s'.",
                     browse_location, input_filename)
-        if not exists(input_filename):
-            start = time()
-            try:
-                # timeout in seconds
-                setdefaulttimeout(120)
-                remote_browse = urlopen(browse_location)
-                with open(input_filename, "wb") as local_browse:
-                    local_browse.write(remote_browse.read())
-            except HTTPError, error:
-                raise IngestionException("HTTP error downloading '%s': %s"
-                                         % (browse_location, error.code))
-            except URLError, error:
-                raise IngestionException("URL error downloading '%s': %s"
-                                         % (browse_location, error.reason))
-            logger.info(
-                "Retrieved %s %dB in %.3fs", browse_location,
-                getsize(input_filename), time() - start,
-            )
+        if prefetcher is not None and browse_location in prefetcher:
+            retrieve = prefetcher.get
+        elif not exists(input_filename):
+            retrieve = lambda location: download_file(location, input_filename)
         else:
             raise IngestionException("File to download already exists locally "
                                      "as '%s'" % input_filename)
 
+        try:
+            result = retrieve(browse_location)
+        except HTTPError, error:
+            raise IngestionException("HTTP error downloading '%s': %s"
+                                     % (browse_location, error.code))
+        except URLError, error:
+            raise IngestionException("URL error downloading '%s': %s"
+                                     % (browse_location, error.reason))
+        logger.info(
+            "Retrieved %s %dB in %.3fs (%.1fkB/s, resumed at %dB, waited "
+            "%.3fs)", browse_location, result.size, result.duration,
+            result.throughput / 1024, result.resumed_from, result.wait_time,
+        )
+
     except ValidationError:
         input_filename = abspath(get_storage_path(browse_location,
                                                   config=config))
@@ -704,6 +773,78 @@ def _get_clipping(path):
     return ds.RasterXSize, ds.RasterYSize
 
 
+def _get_browse_clipping(parsed_browse, input_filename, ingest_config):
+    """ Returns the clipping of the browse image if it is required by the
+    geo reference of the parsed browse or `None` otherwise.
+    """
+
+    if (parsed_browse.geo_type == "regularGridBrowse" and
+        ingest_config["regular_grid_clipping"]) or \
+        (parsed_browse.geo_type == "footprintBrowse" and
+         ("ncol" in parsed_browse.col_row_list or
+          "nrow" in parsed_browse.col_row_list)):
+        return _get_clipping(input_filename)
+    return None
+
+
+def _get_download_path(browse_location, config):
+    return abspath(get_storage_path(basename(browse_location), config=config))
+
+
+def _create_prefetcher(parsed_browse_report, config):
+    """ Returns a `BrowsePrefetcher` for the browses of the report referenced
+    by URL or `None` if prefetching is disabled or not applicable.
+    """
+
+    count = get_ingest_config(config)["prefetch"]
+    locations = []
+    for parsed_browse in parsed_browse_report:
+        try:
+            URLValidator()(parsed_browse.file_name)
+            locations.append(parsed_browse.file_name)
+        except ValidationError:
+            locations.append(None)
+
+    if not count or len(filter(None, locations)) < 2:
+        return None
+
+    logger.info("Prefetching up to %d browses referenced by URL." % count)
+    return BrowsePrefetcher(
+        locations, count,
+        lambda location: _get_download_path(location, config)
+    )
+
+
+def _submit_preprocessing(pool, parsed_browse, config):
+    """ Submits the preprocessing of a locally stored browse to the pool.
+    Browses referenced by URL are retrieved and processed during their
+    ingestion. Errors are ignored here, they are reported when the browse is
+    actually ingested.
+    """
+
+    try:
+        URLValidator()(parsed_browse.file_name)
+        return
+    except ValidationError:
+        pass
+
+    try:
+        input_filename = retrieve_browse(parsed_browse.file_name, config)
+        if not exists(input_filename):
+            return
+
+        clipping = _get_browse_clipping(
+            parsed_browse, input_filename, get_ingest_config(config)
+        )
+        pool.submit(
+            parsed_browse, input_filename,
+            _georef_from_parsed(parsed_browse, clipping)
+        )
+    except Exception, e:
+        logger.debug("Not preprocessing browse '%s' in parallel: %s"
+                     % (parsed_browse.browse_identifier, str(e)))
+
+
 def _georef_from_parsed(parsed_browse, clipping=None):
     srid = fromShortCode(parsed_browse.reference_system_identifier)
 
@@ -937,14 +1078,17 @@ class GCPList(GeographicReference):
             'x,y,[z,]pixel,line'.
         """
 
-        self.gcps = map(lambda gcp: gdal.GCP(*gcp) if len(gcp) == 5
-                        else gdal.GCP(gcp[0], gcp[1], 0.0, gcp[2], gcp[3]),
+        # GCPs are kept as plain tuples to keep the object picklable
+        self.gcps = map(lambda gcp: tuple(gcp) if len(gcp) == 5
+                        else (gcp[0], gcp[1], 0.0, gcp[2], gcp[3]),
                         gcps)
         self.gcp_srid = gcp_srid
         self.srid = srid
 
 
     def apply(self, src_ds):
+        gcps = [gdal.GCP(*gcp) for gcp in self.gcps]
+
         # setup
         dst_sr = osr.SpatialReference()
         gcp_sr = osr.SpatialReference()
@@ -956,11 +1100,11 @@ class GCPList(GeographicReference):
 
         logger.debug("Using GCP Projection '%s'" % gcp_sr.ExportToWkt())
         logger.debug("Applying GCPs: MULTIPOINT(%s) -> MULTIPOINT(%s)" % (
-            ", ".join([("(%f %f)") % (gcp.GCPX, gcp.GCPY) for gcp in self.gcps]),
-            ", ".join([("(%f %f)") % (gcp.GCPPixel, gcp.GCPLine) for gcp in self.gcps])
+            ", ".join([("(%f %f)") % (gcp.GCPX, gcp.GCPY) for gcp in gcps]),
+            ", ".join([("(%f %f)") % (gcp.GCPPixel, gcp.GCPLine) for gcp in gcps])
         ))
         # set the GCPs
-        src_ds.SetGCPs(self.gcps, gcp_sr.ExportToWkt())
+        src_ds.SetGCPs(gcps, gcp_sr.ExportToWkt())
 
         # Try to find and use the best transform method/order.
         # Orders are: -1 (TPS), 3, 2, and 1 (all GCP)
@@ -195,6 +195,12 @@ def get_optimization_config(config=None):
     except:
         pass
 
+    try:
+        values["footprint_decimation"] = config.getint(
+            INGEST_SECTION, "footprint_decimation")
+    except:
+        pass
+
     in_memory = False
     try:
         in_memory = config.getboolean(INGEST_SECTION, "in_memory")
@@ -231,7 +237,21 @@ def parse_time_delta(string):
 def get_ingest_config(config=None):
     config = config or get_ngeo_config()
 
+    workers = 1
+    try:
+        workers = max(1, config.getint(INGEST_SECTION, "workers"))
+    except:
+        pass
+
+    prefetch = 2
+    try:
+        prefetch = max(0, config.getint(INGEST_SECTION, "prefetch"))
+    except:
+        pass
+
     return {
+        "workers": workers,
+        "prefetch": prefetch,
         "strategy": safe_get(config, INGEST_SECTION, "strategy", "replace"),
         "merge_threshold": parse_time_delta(
             safe_get(config, INGEST_SECTION, "merge_threshold", "5h")
@@ -0,0 +1,193 @@
+#-------------------------------------------------------------------------------
+#
+# Project: ngEO Browse Server <http://ngeo.eox.at>
+# Authors: Fabian Schindler <fabian.schindler@eox.at>
+#          Marko Locher <marko.locher@eox.at>
+#          Stephan Meissl <stephan.meissl@eox.at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2012 European Space Agency
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+
+"""\
+Retrieval of browses referenced by URL.
+
+Browses are streamed to disk in chunks. An interrupted download leaves a
+partial file which is continued with a HTTP range request on the next
+attempt. The `BrowsePrefetcher` downloads the next browses of a report in
+background threads while the current one is ingested.
+"""
+
+import logging
+import threading
+from os import rename, remove
+from os.path import exists, getsize
+from time import time
+from urllib2 import urlopen, Request, HTTPError
+
+
+logger = logging.getLogger(__name__)
+
+PARTIAL_EXT = ".part"
+CHUNK_SIZE = 1024 * 1024
+DEFAULT_TIMEOUT = 120
+
+
+class DownloadResult(object):
+    """ Statistics of a (possibly prefetched) download. """
+
+    def __init__(self, size, duration, resumed_from=0, wait_time=0.0):
+        self.size = size
+        self.duration = duration
+        self.resumed_from = resumed_from
+        self.wait_time = wait_time
+
+    @property
+    def throughput(self):
+        """ Throughput of the transferred bytes in bytes per second. """
+        transferred = self.size - self.resumed_from
+        return transferred / self.duration if self.duration else 0.0
+
+
+def download_file(url, filename, timeout=DEFAULT_TIMEOUT,
+                  chunk_size=CHUNK_SIZE):
+    """ Streams the file at `url` to `filename`. The data is written to a
+    partial file first, which is renamed when the download is complete. A
+    partial file of a previous attempt is resumed when the server supports
+    range requests. Returns a `DownloadResult`. Raises `HTTPError` and
+    `URLError` of `urllib2`.
+    """
+
+    partial_filename = filename + PARTIAL_EXT
+    offset = getsize(partial_filename) if exists(partial_filename) else 0
+
+    request = Request(url)
+    if offset:
+        request.add_header("Range", "bytes=%d-" % offset)
+
+    start = time()
+    try:
+        response = urlopen(request, timeout=timeout)
+    except HTTPError, error:
+        # the partial file is already complete
+        if error.code != 416 or not offset:
+            raise
+        response = None
+
+    if response is not None:
+        if offset and response.getcode() != 206:
+            logger.debug("Server does not support resuming the download of "
+                         "'%s', restarting." % url)
+            offset = 0
+
+        try:
+            with open(partial_filename, "ab" if offset else "wb") as f:
+                while True:
+                    chunk = response.read(chunk_size)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+        finally:
+            response.close()
+
+    rename(partial_filename, filename)
+    return DownloadResult(getsize(filename), time() - start, offset)
+
+
+class BrowsePrefetcher(object):
+    """ Downloads browses referenced by URL in background threads ahead of
+    their ingestion.
+
+    `locations` is the ordered list of browse locations of a report, the
+    prefetcher starts the downloads of the `count` locations following the
+    one passed to :meth:`advance`. :meth:`get` waits for a download.
+    `get_filename` maps a location to the local file name.
+    """
+
+    def __init__(self, locations, count, get_filename,
+                 timeout=DEFAULT_TIMEOUT):
+        self.locations = list(locations)
+        self.count = count
+        self.get_filename = get_filename
+        self.timeout = timeout
+        self._jobs = {}
+        self._next = 0
+
+    def advance(self, index):
+        """ Starts the downloads of the `count` locations following `index`.
+        """
+        while self._next <= min(index + self.count,
+                                len(self.locations) - 1):
+            location = self.locations[self._next]
+            self._next += 1
+            # locations of browses not referenced by URL are `None`
+            if location is not None and location not in self._jobs:
+                self._start(location)
+
+    def _start(self, location):
+        filename = self.get_filename(location)
+        job = {"thread": None, "result": None, "error": None}
+
+        if exists(filename):
+            # the file is retrieved (and rejected) during ingestion
+            return
+
+        def run():
+            try:
+                job["result"] = download_file(location, filename, self.timeout)
+            except Exception, e:
+                job["error"] = e
+
+        job["thread"] = threading.Thread(target=run)
+        job["thread"].daemon = True
+        job["thread"].start()
+        self._jobs[location] = job
+        logger.debug("Prefetching browse from '%s'." % location)
+
+    def __contains__(self, location):
+        return location in self._jobs
+
+    def get(self, location):
+        """ Waits for the prefetched download of `location` and returns its
+        `DownloadResult`, or raises the error of the download.
+        """
+        job = self._jobs.pop(location)
+        start = time()
+        job["thread"].join()
+        wait_time = time() - start
+
+        if job["error"] is not None:
+            raise job["error"]
+
+        result = job["result"]
+        result.wait_time = wait_time
+        return result
+
+    def close(self):
+        """ Waits for all pending downloads and removes the files of the ones
+        not retrieved.
+        """
+        for location, job in self._jobs.items():
+            job["thread"].join()
+            filename = self.get_filename(location)
+            if job["result"] is not None and exists(filename):
+                remove(filename)
+        self._jobs = {}
@@ -0,0 +1,150 @@
+#-------------------------------------------------------------------------------
+#
+# Project: ngEO Browse Server <http://ngeo.eox.at>
+# Authors: Fabian Schindler <fabian.schindler@eox.at>
+#          Marko Locher <marko.locher@eox.at>
+#          Stephan Meissl <stephan.meissl@eox.at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2012 European Space Agency
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+
+"""\
+Parallel preprocessing of the browses of a browse report.
+
+The (CPU bound) `NGEOPreProcessor.process` step is run for all browses of a
+report in a pool of worker processes, while everything touching the database,
+the MapCache tilesets or the result bookkeeping stays in the ingesting process
+and is still done one browse at a time.
+"""
+
+import logging
+import shutil
+import tempfile
+from multiprocessing import Pool, current_process
+from os.path import join, basename, exists
+
+from django.contrib.gis.geos import GEOSGeometry
+from eoxserver.processing.preprocessing import PreProcessResult
+
+
+logger = logging.getLogger(__name__)
+
+
+def can_use_pool():
+    """ Returns whether or not the current process may start a pool of worker
+    processes, which is not allowed for daemonic processes, e.g: the workers
+    of the browsewatchd2 daemon.
+    """
+    return not current_process().daemon
+
+
+def _preprocess(preprocessor, input_filename, output_filename, geo_reference):
+    """ Worker function: runs the preprocessing of a single browse and returns
+    a picklable tuple ``(footprint_hex, num_bands)``. Exceptions are not
+    propagated but logged and signalled by returning `None`, the browse is then
+    processed again in the ingesting process to get the original error.
+    """
+
+    try:
+        result = preprocessor.process(
+            input_filename, output_filename, geo_reference, True
+        )
+        return result.footprint_geom.hexewkb, result.num_bands
+    except Exception, e:
+        logger.warn("Parallel preprocessing of '%s' failed: %s"
+                    % (input_filename, str(e)))
+        return None
+
+
+class PreProcessingPool(object):
+    """ Runs the preprocessing of browses in a pool of `workers` processes.
+
+    Jobs are submitted with :meth:`submit` and collected with :meth:`collect`
+    which moves the generated file to its final location. Jobs which are never
+    collected (e.g: skipped or merged browses) are simply dropped. The
+    preprocessed files are written to a temporary directory within `directory`
+    (should be on the same file system as the optimized files) which is
+    removed on :meth:`close` together with all files not collected.
+    """
+
+    def __init__(self, preprocessor, workers, directory=None):
+        self.preprocessor = preprocessor
+        self.workers = workers
+        self._tmp_dir = tempfile.mkdtemp(prefix=".preprocessing_", dir=directory)
+        try:
+            self._pool = Pool(workers)
+        except:
+            shutil.rmtree(self._tmp_dir, True)
+            raise
+        self._jobs = {}
+        self._count = 0
+
+    def submit(self, key, input_filename, geo_reference):
+        """ Submits the preprocessing of `input_filename` with the given
+        `geo_reference`. `key` identifies the job when collecting it.
+        """
+
+        self._count += 1
+        output_filename = self.preprocessor.generate_filename(
+            join(self._tmp_dir, "%d_%s" % (self._count, basename(input_filename)))
+        )
+        self._jobs[key] = (
+            input_filename, output_filename, self._pool.apply_async(
+                _preprocess, (
+                    self.preprocessor, input_filename, output_filename,
+                    geo_reference
+                )
+            )
+        )
+        logger.debug("Submitted preprocessing of '%s'." % input_filename)
+
+    def collect(self, key, input_filename, output_filename):
+        """ Waits for the job identified by `key` and moves its result to
+        `output_filename`. Returns a `PreProcessResult` or `None` if no
+        (successful) job was submitted for that input file.
+        """
+
+        try:
+            submitted_input, tmp_filename, async_result = self._jobs.pop(key)
+        except KeyError:
+            return None
+
+        result = async_result.get()
+        if result is None or submitted_input != input_filename or \
+                not exists(tmp_filename):
+            return None
+
+        footprint_hex, num_bands = result
+        shutil.move(tmp_filename, output_filename)
+        logger.debug("Collected preprocessed file for '%s'." % input_filename)
+        return PreProcessResult(
+            output_filename, GEOSGeometry(footprint_hex), num_bands
+        )
+
+    def close(self):
+        """ Terminates the worker processes and removes all remaining
+        temporary files.
+        """
+        self._pool.terminate()
+        self._pool.join()
+        self._jobs = {}
+        shutil.rmtree(self._tmp_dir, True)
@@ -366,32 +366,85 @@ class GDALDatasetMerger(object):
 ################################################################################
 
 
-def generate_footprint_wkt(ds, simplification_factor=2):
-    """ Generate a fooptrint from a raster, using black/no-data as exclusion
+# maximum number of (mask) pixels processed per window when computing the data
+# mask of a dataset
+MASK_WINDOW_PIXELS = 4 * 1024 * 1024
+
+
+def get_data_mask_size(ds, decimation=1):
+    """ Returns the size of the data mask of `ds` when computed with the given
+    `decimation` factor.
+    """
+    decimation = max(1, decimation)
+    return (
+        int(math.ceil(ds.RasterXSize / float(decimation))),
+        int(math.ceil(ds.RasterYSize / float(decimation)))
+    )
+
+
+def copy_data_mask_georeference(ds, mask_ds, decimation=1):
+    """ Copies the projection and geotransform of `ds` to the data mask
+    dataset `mask_ds`, adjusting the pixel size if the mask is decimated.
+    """
+    copy_projection(ds, mask_ds)
+
+    size_x, size_y = get_data_mask_size(ds, decimation)
+    if (size_x, size_y) != (ds.RasterXSize, ds.RasterYSize):
+        scale_x = ds.RasterXSize / float(size_x)
+        scale_y = ds.RasterYSize / float(size_y)
+        gt = ds.GetGeoTransform()
+        mask_ds.SetGeoTransform((
+            gt[0], gt[1] * scale_x, gt[2] * scale_y,
+            gt[3], gt[4] * scale_x, gt[5] * scale_y
+        ))
+
+
+def write_data_mask(ds, mask_band, decimation=1):
+    """ Writes the mask of all pixels of `ds` that are not no-data (or black)
+    in at least one band to `mask_band`.
+
+    The mask is computed and written window by window, so only a few lines of
+    each band are held in memory at once. With a `decimation` factor greater
+    than 1, the bands are read with a reduced resolution (nearest neighbour)
+    resulting in a mask of size `get_data_mask_size`.
     """
 
-    # create an empty boolean array initialized as 'False' to store where
-    # values exist as a mask array.
-    nodata_map = np.zeros((ds.RasterYSize, ds.RasterXSize), dtype=np.bool)
+    size_x, size_y = get_data_mask_size(ds, decimation)
+    scale_y = ds.RasterYSize / float(size_y)
+    window_lines = max(1, MASK_WINDOW_PIXELS // size_x)
 
+    bands = []
     for idx in range(1, ds.RasterCount + 1):
         band = ds.GetRasterBand(idx)
-        raster_data = band.ReadAsArray()
         nodata = band.GetNoDataValue()
+        bands.append((band, nodata if nodata is not None else 0))
+
+    for offset_y in range(0, size_y, window_lines):
+        lines = min(window_lines, size_y - offset_y)
+        src_offset_y = int(round(offset_y * scale_y))
+        src_lines = int(round((offset_y + lines) * scale_y)) - src_offset_y
+
+        mask = np.zeros((lines, size_x), dtype=np.bool)
+        for band, nodata in bands:
+            mask |= (band.ReadAsArray(
+                0, src_offset_y, ds.RasterXSize, src_lines, size_x, lines
+            ) != nodata)
 
-        if nodata is None:
-            nodata = 0
+        mask_band.WriteArray(mask.astype(np.uint8), 0, offset_y)
 
-        # apply the output to the map
-        nodata_map |= (raster_data != nodata)
+
+def generate_footprint_wkt(ds, simplification_factor=2, decimation=1):
+    """ Generate a fooptrint from a raster, using black/no-data as exclusion
+    """
 
     # create a temporary in-memory dataset and write the nodata mask
     # into its single band
-    with temporary_dataset(ds.RasterXSize + 2, ds.RasterYSize + 2, 1,
+    size_x, size_y = get_data_mask_size(ds, decimation)
+    with temporary_dataset(size_x + 2, size_y + 2, 1,
                            gdal.GDT_Byte) as tmp_ds:
-        copy_projection(ds, tmp_ds)
+        copy_data_mask_georeference(ds, tmp_ds, decimation)
         tmp_band = tmp_ds.GetRasterBand(1)
-        tmp_band.WriteArray(nodata_map.astype(np.uint8))
+        write_data_mask(ds, tmp_band, decimation)
 
         # create an OGR in memory layer to hold the created polygon
         sr = osr.SpatialReference()
@@ -435,7 +488,7 @@ def generate_footprint_wkt(ds, simplification_factor=2):
             geometry.Transform(osr.CoordinateTransformation(sr.sr, dst_sr.sr))
 
     gt = ds.GetGeoTransform()
-    resolution = min(abs(gt[1]), abs(gt[5]))
+    resolution = min(abs(gt[1]), abs(gt[5])) * max(1, decimation)
 
     simplification_value = simplification_factor * resolution
 
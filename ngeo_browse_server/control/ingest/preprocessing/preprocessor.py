@@ -27,9 +27,11 @@
 #-------------------------------------------------------------------------------
 
 import logging
+import resource
+from time import time
 from uuid import uuid4
 import tempfile
-from os.path import join
+from os.path import join, getsize
 from os import (remove, rename)
 
 from django.contrib.gis.geos import (
@@ -48,7 +50,8 @@ from eoxserver.processing.preprocessing.exceptions import GCPTransformException
 from eoxserver.resources.coverages.geo import getExtentFromRectifiedDS
 
 from ngeo_browse_server.control.ingest.preprocessing.merge import (
-    GDALDatasetMerger, GDALGeometryMaskMergeSource
+    GDALDatasetMerger, GDALGeometryMaskMergeSource, get_data_mask_size,
+    copy_data_mask_georeference, write_data_mask
 )
 
 
@@ -59,6 +62,29 @@ logger = logging.getLogger(__name__)
 RGB = range(3)
 
 
+def create_virtual_copy(ds):
+    """ Returns an in-memory VRT referencing all bands of `ds`. In contrast to
+    a MEM copy no pixels are read, but georeference and metadata can be
+    altered without touching the original dataset.
+    """
+    return gdal.GetDriverByName("VRT").CreateCopy("", ds)
+
+
+def get_file_size(filename):
+    """ Returns the size of the given file or 0 if it does not exist. """
+    try:
+        return getsize(filename)
+    except OSError:
+        return 0
+
+
+def get_peak_memory_usage():
+    """ Returns the peak memory usage (maximum resident set size) of the
+    current process in MB.
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
 class NGEOPreProcessor(WMSPreProcessor):
 
     def __init__(self, format_selection, overviews=True, overviews_self=False,
@@ -67,7 +93,8 @@ class NGEOPreProcessor(WMSPreProcessor):
                  overview_resampling=None, overview_levels=None,
                  overview_minsize=None, radiometric_interval_min=None,
                  radiometric_interval_max=None, sieve_max_threshold=None,
-                 simplification_factor=None, temporary_directory=None):
+                 simplification_factor=None, temporary_directory=None,
+                 footprint_decimation=None):
 
         self.format_selection = format_selection
         self.overviews_self = overviews_self  # Don't use EOxServer one
@@ -101,15 +128,19 @@ class NGEOPreProcessor(WMSPreProcessor):
             # default 2 * resolution == 2 pixels
             self.simplification_factor = 2
 
+        # compute the footprint on every n-th pixel only
+        self.footprint_decimation = max(1, footprint_decimation or 1)
+
         self.temporary_directory = temporary_directory
 
     def process(self, input_filename, output_filename,
                 geo_reference=None, generate_metadata=True,
                 merge_with=None, original_footprint=None):
 
-        # open the dataset and create an In-Memory Dataset as copy
-        # to perform optimizations
-        ds = create_mem_copy(gdal.Open(input_filename))
+        # open the dataset as a virtual copy to perform optimizations. Pixels
+        # are only read when materialised by an optimization or the final
+        # copy, the original file is never modified
+        ds = source_ds = create_virtual_copy(gdal.Open(input_filename))
 
         gt = ds.GetGeoTransform()
         footprint_wkt = None
@@ -139,17 +170,24 @@ class NGEOPreProcessor(WMSPreProcessor):
 
                 if new_ds is not ds:
                     # cleanup afterwards
-                    cleanup_temp(ds)
+                    if ds is not source_ds:
+                        cleanup_temp(ds)
                     ds = new_ds
             except:
-                cleanup_temp(ds)
+                if ds is not source_ds:
+                    cleanup_temp(ds)
                 raise
 
 
         # generate the footprint from the dataset
         if not footprint_wkt:
             logger.debug("Generating footprint.")
+            start = time()
             footprint_wkt = self._generate_footprint_wkt(ds)
+            logger.info("Generated footprint of %dx%d pixels in %.3fs. Peak "
+                        "memory usage: %.1f MB."
+                        % (ds.RasterXSize, ds.RasterYSize, time() - start,
+                           get_peak_memory_usage()))
         # check that footprint is inside of extent of generated image
         # regenerate otherwise
         else:
@@ -182,6 +220,12 @@ class NGEOPreProcessor(WMSPreProcessor):
                              "generated image.")
                 footprint_wkt = tmp_footprint.intersection(tmp_bbox).wkt
 
+        # the alpha band and the merge write into the dataset itself, which
+        # requires a materialised copy of the virtual input
+        if ds is source_ds and (self.footprint_alpha or merge_with is not None):
+            logger.debug("Materialising virtual input dataset.")
+            ds = create_mem_copy(source_ds)
+
         if self.footprint_alpha:
             logger.debug("Applying optimization 'AlphaBandOptimization'.")
             opt = AlphaBandOptimization()
@@ -189,6 +233,10 @@ class NGEOPreProcessor(WMSPreProcessor):
             ds.FlushCache()
 
         output_filename = self.generate_filename(output_filename)
+        overviews_built = False
+
+        # bytes written to disc for this browse
+        bytes_written = 0
 
         if merge_with is not None:
             if original_footprint is None:
@@ -218,7 +266,8 @@ class NGEOPreProcessor(WMSPreProcessor):
             original_ds = None
             driver.Delete(merge_with)
 
-            cleanup_temp(ds)
+            if ds is not source_ds:
+                cleanup_temp(ds)
 
         else:
             logger.debug(
@@ -231,15 +280,23 @@ class NGEOPreProcessor(WMSPreProcessor):
             logger.debug("Metadata tags to be written: %s"
                          % ", ".join(ds.GetMetadata_List("") or []))
 
-            # save the file to the disc
-            driver = gdal.GetDriverByName(self.format_selection.driver_name)
-            final_ds = driver.CreateCopy(
-                output_filename, ds,
-                options=self.format_selection.creation_options
-            )
+            if self.overviews_self:
+                # write the image with its internal overviews in one go
+                final_ds = self._create_with_overviews(output_filename, ds)
+                overviews_built = True
+            else:
+                # save the file to the disc
+                driver = gdal.GetDriverByName(
+                    self.format_selection.driver_name
+                )
+                final_ds = driver.CreateCopy(
+                    output_filename, ds,
+                    options=self.format_selection.creation_options
+                )
 
             # cleanup
-            cleanup_temp(ds)
+            if ds is not source_ds:
+                cleanup_temp(ds)
 
         for optimization in self.get_post_optimizations(final_ds):
             logger.debug("Applying post-optimization '%s'."
@@ -248,21 +305,9 @@ class NGEOPreProcessor(WMSPreProcessor):
 
         num_bands = final_ds.RasterCount
 
-        if self.overviews_self:
+        if self.overviews_self and not overviews_built:
             logger.debug("Applying OverviewOptimization ourselves")
-            levels = self.overview_levels
-
-            # calculate the overviews automatically.
-            if not levels:
-                desired_size = abs(self.overview_minsize or 256)
-                size = max(final_ds.RasterXSize, final_ds.RasterYSize)
-                level = 1
-                levels = []
-
-                while size > desired_size:
-                    size /= 2
-                    level *= 2
-                    levels.append(level)
+            levels = self._get_overview_levels(final_ds)
 
             logger.debug(
                 "Building overview levels %s with resampling method '%s'."
@@ -276,19 +321,11 @@ class NGEOPreProcessor(WMSPreProcessor):
 
             # finally close the dataset and write it to the disc
             final_ds = None
+            bytes_written += get_file_size(final_filename)
 
             # re-build overviews
-            # use .ovr trick to accommodate very large images (>65536 pixels)
-            for level in levels:
-                try:
-                    input_ds = gdal.Open(filename, gdal.GA_ReadOnly)
-                    input_ds.BuildOverviews(self.overview_resampling, [2])
-                    filename = '%s.ovr' % filename
-                    input_ds = None
-                except RuntimeError:
-                    logger.warning(
-                        "Overview building failed for level '%s'." % level
-                    )
+            ovr_filenames = self._build_overview_files(filename, levels)
+            bytes_written += sum(map(get_file_size, ovr_filenames))
 
             tmp_filename = join(tempfile.gettempdir(), '%s.tif' % uuid4().hex)
             tmp_ds = driver.CreateCopy(
@@ -299,15 +336,17 @@ class NGEOPreProcessor(WMSPreProcessor):
                 ]
             )
             tmp_ds = None
-            filename = final_filename
-            for level in levels:
-                filename = '%s.ovr' % filename
+            bytes_written += get_file_size(tmp_filename)
+            for filename in ovr_filenames:
                 remove(filename)
             rename(tmp_filename, final_filename)
 
         else:
             # finally close the dataset and write it to the disc
             final_ds = None
+            bytes_written += get_file_size(output_filename)
+
+        logger.info("Wrote %d bytes for '%s'." % (bytes_written, output_filename))
 
         # generate metadata if requested
         footprint = None
@@ -341,34 +380,84 @@ class NGEOPreProcessor(WMSPreProcessor):
 
         return PreProcessResult(output_filename, footprint, num_bands)
 
-    def _generate_footprint_wkt(self, ds):
-        """ Generate a footprint from a raster, using black/no-data as
-            exclusion
+    def _build_overview_files(self, filename, levels):
+        """ Builds the overview `levels` of the image `filename` as cascading
+        external `.ovr` files, one level each, and returns their filenames.
+        The .ovr trick accommodates very large images (>65536 pixels).
         """
+        filenames = []
+        for level in levels:
+            try:
+                input_ds = gdal.Open(filename, gdal.GA_ReadOnly)
+                input_ds.BuildOverviews(
+                    self.overview_resampling or "NEAREST", [2]
+                )
+                input_ds = None
+                filename = '%s.ovr' % filename
+                filenames.append(filename)
+            except RuntimeError:
+                logger.warning(
+                    "Overview building failed for level '%s'." % level
+                )
+                break
+        return filenames
 
-        # create an empty boolean array initialized as 'False' to store where
-        # values exist as a mask array.
-        nodata_map = numpy.zeros((ds.RasterYSize, ds.RasterXSize),
-                                 dtype=numpy.bool)
+    def _create_with_overviews(self, output_filename, ds):
+        """ Writes `ds` to `output_filename` once and builds the internal
+        overviews in place. Returns the written dataset.
+        """
+        driver = gdal.GetDriverByName(self.format_selection.driver_name)
+        final_ds = driver.CreateCopy(
+            output_filename, ds, options=self.format_selection.creation_options
+        )
+        final_ds = None
+
+        levels = self._get_overview_levels(ds)
+        logger.debug(
+            "Building internal overview levels %s with resampling method "
+            "'%s'." % (", ".join(map(str, levels)), self.overview_resampling)
+        )
+        final_ds = gdal.Open(output_filename, gdal.GA_Update)
+        if levels:
+            final_ds.BuildOverviews(
+                self.overview_resampling or "NEAREST", levels
+            )
+        return final_ds
+
+    def _get_overview_levels(self, ds):
+        """ Returns the configured overview levels or calculates them
+        automatically from the size of `ds`.
+        """
+        levels = self.overview_levels
+
+        # calculate the overviews automatically.
+        if not levels:
+            desired_size = abs(self.overview_minsize or 256)
+            size = max(ds.RasterXSize, ds.RasterYSize)
+            level = 1
+            levels = []
+
+            while size > desired_size:
+                size /= 2
+                level *= 2
+                levels.append(level)
 
-        for idx in range(1, ds.RasterCount + 1):
-            band = ds.GetRasterBand(idx)
-            raster_data = band.ReadAsArray()
-            nodata = band.GetNoDataValue()
+        return levels
 
-            if nodata is None:
-                nodata = 0
+    def _generate_footprint_wkt(self, ds):
+        """ Generate a footprint from a raster, using black/no-data as
+            exclusion
+        """
 
-            # apply the output to the map
-            nodata_map |= (raster_data != nodata)
+        decimation = self.footprint_decimation
 
         # create a temporary in-memory dataset and write the nodata mask
-        # into its single band
-        tmp_ds = create_mem(ds.RasterXSize + 2, ds.RasterYSize + 2, 1,
-                            gdal.GDT_Byte)
-        copy_projection(ds, tmp_ds)
+        # into its single band, window by window
+        size_x, size_y = get_data_mask_size(ds, decimation)
+        tmp_ds = create_mem(size_x + 2, size_y + 2, 1, gdal.GDT_Byte)
+        copy_data_mask_georeference(ds, tmp_ds, decimation)
         tmp_band = tmp_ds.GetRasterBand(1)
-        tmp_band.WriteArray(nodata_map.astype(numpy.uint8))
+        write_data_mask(ds, tmp_band, decimation)
 
         # Remove unwanted small areas of nodata
         # www.gdal.org/gdal__alg_8h.html#a33309c0a316b223bd33ae5753cc7f616
@@ -376,7 +465,10 @@ class NGEOPreProcessor(WMSPreProcessor):
         threshold = 4
         max_threshold = (no_pixels / 16)
         if self.sieve_max_threshold > 0:
-            max_threshold = self.sieve_max_threshold
+            # the threshold is given in pixels of the full resolution
+            max_threshold = max(
+                threshold, self.sieve_max_threshold / (decimation ** 2)
+            )
         while threshold <= max_threshold and threshold < 2147483647:
             gdal.SieveFilter(tmp_band, None, tmp_band, threshold, 4)
             threshold *= 4
@@ -439,7 +531,7 @@ class NGEOPreProcessor(WMSPreProcessor):
                 geometry.Transform(osr.CoordinateTransformation(sr, dst_sr))
 
         gt = ds.GetGeoTransform()
-        resolution = min(abs(gt[1]), abs(gt[5]))
+        resolution = min(abs(gt[1]), abs(gt[5])) * decimation
 
         simplification_value = self.simplification_factor * resolution
 
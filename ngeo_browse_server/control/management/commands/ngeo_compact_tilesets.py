@@ -0,0 +1,128 @@
+#-------------------------------------------------------------------------------
+#
+# Project: ngEO Browse Server <http://ngeo.eox.at>
+# Authors: Stephan Meissl <stephan.meissl@eox.at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2021 EOX IT Services GmbH
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+
+
+import logging
+from os.path import getsize
+from itertools import groupby
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ngeo_browse_server.config import models
+from ngeo_browse_server.control.management.commands import LogToConsoleMixIn
+from ngeo_browse_server.lock import LockException
+from ngeo_browse_server.mapcache import tileset
+from ngeo_browse_server.mapcache.config import (
+    get_tileset_path, get_tileset_paths
+)
+from ngeo_browse_server.mapcache.tasks import get_seed_lock
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(LogToConsoleMixIn, BaseCommand):
+
+    args = ("[browse_layer_id ...]")
+    help = ("Converts the tilesets of all or the given browse layers to the "
+            "deduplicating schema and removes duplicate tile data. "
+            "Reports the space reclaimed per tileset. Already converted "
+            "tilesets are compacted again.")
+
+    def handle(self, *browse_layer_ids, **kwargs):
+        # parse command arguments
+        self.verbosity = int(kwargs.get("verbosity", 1))
+        traceback = kwargs.get("traceback", False)
+        self.set_up_logging(["ngeo_browse_server"], self.verbosity, traceback)
+
+        browse_layers_qs = models.BrowseLayer.objects.all()
+        if browse_layer_ids:
+            browse_layers_qs = browse_layers_qs.filter(id__in=browse_layer_ids)
+            missing = set(browse_layer_ids) - set(
+                browse_layers_qs.values_list("id", flat=True)
+            )
+            if missing:
+                logger.error("Browse layer '%s' does not exist."
+                             % ", ".join(sorted(missing)))
+                raise CommandError("Browse layer '%s' does not exist."
+                                   % ", ".join(sorted(missing)))
+
+        # browse layers of the same browse type share a tileset
+        browse_layers = sorted(
+            browse_layers_qs, key=lambda browse_layer: browse_layer.browse_type
+        )
+        reclaimed = 0
+        for browse_type, layers in groupby(
+                browse_layers, lambda browse_layer: browse_layer.browse_type):
+            tilesets = [layer.id for layer in layers]
+            paths = get_tileset_paths(browse_type)
+            if not paths:
+                logger.info("Skipping tileset '%s' which does not exist."
+                            % get_tileset_path(browse_type))
+
+            # all shards of sharded tilesets
+            for path in paths:
+                try:
+                    reclaimed += self.compact(path, tilesets)
+                except LockException, e:
+                    logger.error("Could not lock tileset '%s': %s"
+                                 % (path, str(e)))
+                    raise CommandError("Could not lock tileset '%s': %s"
+                                       % (path, str(e)))
+
+        logger.info("Reclaimed %d bytes in total." % reclaimed)
+
+    def compact(self, path, tilesets):
+        """ Compacts the tileset file at `path` while holding the seed locks
+        of the `tilesets` stored in it. Returns the reclaimed bytes.
+        """
+
+        locks = [get_seed_lock(name) for name in tilesets]
+        acquired = []
+        try:
+            for lock in locks:
+                lock.acquire()
+                acquired.append(lock)
+
+            size = getsize(path)
+            with tileset.open(path) as ts:
+                converted = not ts.dedup
+                stats = ts.compact()
+            reclaimed = size - getsize(path)
+
+        finally:
+            for lock in reversed(acquired):
+                lock.release()
+
+        logger.info(
+            "%s tileset '%s': %d tiles in %d blobs, removed %d duplicate "
+            "and %d unreferenced blobs. Reclaimed %d of %d bytes."
+            % ("Converted" if converted else "Compacted", path,
+               stats["tiles"], stats["blobs"], stats["duplicates"],
+               stats["orphans"], reclaimed, size)
+        )
+        return reclaimed
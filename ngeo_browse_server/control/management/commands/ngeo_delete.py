@@ -40,8 +40,7 @@ from eoxserver.core.util.timetools import getDateTime, isotime
 
 from ngeo_browse_server.control.management.commands import LogToConsoleMixIn
 from ngeo_browse_server.config.models import BrowseLayer, Browse
-from ngeo_browse_server.mapcache.tasks import seed_mapcache
-from ngeo_browse_server.mapcache.config import get_mapcache_seed_config
+from ngeo_browse_server.mapcache.seedqueue import seed
 from ngeo_browse_server.storage import get_file_manager
 from json import dumps
 
@@ -151,7 +150,9 @@ class Command(LogToConsoleMixIn, BaseCommand):
 
 
     def _handle(self, start, end, coverage_id, browse_layer_id, browse_type):
-        from ngeo_browse_server.control.queries import remove_browse
+        from ngeo_browse_server.control.queries import (
+            remove_browse, get_coverage_infos
+        )
         summary = {
           "browses_found": 0,
           "files_deleted": 0,
@@ -209,11 +210,16 @@ class Command(LogToConsoleMixIn, BaseCommand):
                 logger.info("Deleting '%d' browse%s from database."
                             % (browses_qs.count(),
                                "s" if browses_qs.count() > 1 else ""))
+                coverage_infos = get_coverage_infos(browses_qs)
                 # go through all browses to be deleted
                 for browse_model in browses_qs:
                     # reference to ID is lost after remove_browse completes
                     save_id = browse_model.coverage_id
-                    _, filename = remove_browse(browse_model, browse_layer_model, browse_model.coverage_id, seed_areas)
+                    _, filename = remove_browse(
+                        browse_model, browse_layer_model,
+                        browse_model.coverage_id, seed_areas,
+                        coverage_info=coverage_infos.get(save_id)
+                    )
                     paths_to_delete.append(filename)
                     deleted[save_id] = {
                         "start": browse_model.start_time,
@@ -225,16 +231,11 @@ class Command(LogToConsoleMixIn, BaseCommand):
         # loop through optimized browse images and delete them
         # This is done at this point to make sure a rollback is possible
         # if there is an error while deleting the browses and coverages
+        remote_paths = []
         for file_path in paths_to_delete:
             if manager and file_path and file_path.startswith('/vsi'):
                 # remove '', 'vsiswift', and <container>
-                path = "/".join(file_path.split('/')[3:])
-                manager.delete_file(path)
-                logger.info(
-                    "Optimized browse image deleted: %s/%s/%s" % (
-                        manager.storage_url, manager.container, path
-                    )
-                )
+                remote_paths.append("/".join(file_path.split('/')[3:]))
             elif exists(file_path):
                 remove(file_path)
                 summary["files_deleted"] += 1
@@ -243,6 +244,17 @@ class Command(LogToConsoleMixIn, BaseCommand):
                 logger.warning("Optimized browse image to be deleted not found "
                                "in path: %s" % file_path)
 
+        # delete the files on the remote storage concurrently
+        if remote_paths:
+            manager.delete_files(remote_paths)
+            for path in remote_paths:
+                logger.info(
+                    "Optimized browse image deleted: %s/%s/%s" % (
+                        manager.storage_url, manager.container, path
+                    )
+                )
+            manager.log_statistics()
+
         # only if either start or end is present browses are left
         if start or end or coverage_id:
             if start:
@@ -263,18 +275,17 @@ class Command(LogToConsoleMixIn, BaseCommand):
             for minx, miny, maxx, maxy, start_time, end_time in seed_areas:
                 try:
 
-                    # seed MapCache synchronously
-                    # TODO: maybe replace this with an async solution
-                    seed_mapcache(tileset=browse_layer_model.id,
-                                  grid=browse_layer_model.grid,
-                                  minx=minx, miny=miny,
-                                  maxx=maxx, maxy=maxy,
-                                  minzoom=browse_layer_model.lowest_map_level,
-                                  maxzoom=browse_layer_model.highest_map_level,
-                                  start_time=start_time,
-                                  end_time=end_time,
-                                  delete=False,
-                                  **get_mapcache_seed_config())
+                    # seed MapCache synchronously or add it to the seed
+                    # queue if deferred
+                    seed(tileset=browse_layer_model.id,
+                         grid=browse_layer_model.grid,
+                         minx=minx, miny=miny,
+                         maxx=maxx, maxy=maxy,
+                         minzoom=browse_layer_model.lowest_map_level,
+                         maxzoom=browse_layer_model.highest_map_level,
+                         start_time=start_time,
+                         end_time=end_time,
+                         delete=False)
                     logger.info("Successfully finished seeding.")
 
                 except Exception, e:
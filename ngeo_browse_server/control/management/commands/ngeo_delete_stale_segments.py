@@ -0,0 +1,72 @@
+#-------------------------------------------------------------------------------
+#
+# Project: ngEO Browse Server <http://ngeo.eox.at>
+# Authors: Stephan Meissl <stephan.meissl@eox.at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2021 EOX IT Services GmbH
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+
+
+
+import logging
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ngeo_browse_server.control.management.commands import LogToConsoleMixIn
+from ngeo_browse_server.storage import get_file_manager
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(LogToConsoleMixIn, BaseCommand):
+
+    option_list = BaseCommand.option_list + (
+        make_option('--max-age',
+            dest='max_age', type='int', default=168,
+            help=("Optional. Number of hours after which the segments of an "
+                  "interrupted upload are deleted. Defaults to 168.")
+        ),
+    )
+
+    help = ("Deletes the segments of interrupted uploads of large browse "
+            "images to the OpenStack swift object storage which have not "
+            "been resumed by a repeated ingestion within the given age.")
+
+    def handle(self, *args, **kwargs):
+        # parse command arguments
+        self.verbosity = int(kwargs.get("verbosity", 1))
+        traceback = kwargs.get("traceback", False)
+        self.set_up_logging(["ngeo_browse_server"], self.verbosity, traceback)
+
+        manager = get_file_manager()
+        if not manager:
+            logger.error("Storage method not set to swift.")
+            raise CommandError("Storage method not set to swift.")
+
+        try:
+            count = manager.delete_stale_segments(kwargs["max_age"] * 3600)
+        finally:
+            manager.close()
+
+        logger.info("Deleted %d stale segments." % count)
@@ -28,8 +28,10 @@
 #-------------------------------------------------------------------------------
 
 import logging
+from os.path import isfile
 from optparse import make_option
 from itertools import izip
+from contextlib import contextmanager
 import uuid
 
 from django.core.management.base import BaseCommand, CommandError
@@ -46,15 +48,33 @@ from ngeo_browse_server.config.browsereport.serialization import serialize_brows
 from ngeo_browse_server.config.browselayer.data import get_layer_max_cached_zoom, BrowseLayer as BL
 from ngeo_browse_server.config.browselayer.serialization import serialize_browse_layers
 from ngeo_browse_server.control.migration import package
+from ngeo_browse_server.control.queries import get_coverage_infos
 from ngeo_browse_server.mapcache import tileset
 from ngeo_browse_server.mapcache import models as mapcache_models
-from ngeo_browse_server.mapcache.config import get_tileset_path
+from ngeo_browse_server.mapcache.config import (
+    get_tileset_path, is_tileset_sharded
+)
 from ngeo_browse_server.mapcache.tileset import URN_TO_GRID
+from ngeo_browse_server.storage import get_file_manager
 
 
 logger = logging.getLogger(__name__)
 
 
+@contextmanager
+def open_browse_file(manager, filename):
+    """ Opens the optimized file of a browse. Files on a remote storage are
+    read from a local copy, taken from the local file cache if configured.
+    """
+    if manager and filename.startswith('/vsi'):
+        with manager.local_file(filename) as local_filename:
+            with open(local_filename) as f:
+                yield f
+    else:
+        with open(filename) as f:
+            yield f
+
+
 class Command(LogToConsoleMixIn, BaseCommand):
 
     option_list = BaseCommand.option_list + (
@@ -181,6 +201,16 @@ class Command(LogToConsoleMixIn, BaseCommand):
                 browse_count=Count('browses')
             ).filter(browse_layer=browse_layer_model, browse_count__gt=0)
             
+            # the file manager of the remote storage, if any
+            manager = get_file_manager()
+            
+            # get path to sqlite tileset and open it, shards are opened per
+            # dimension
+            ts = None
+            sharded = is_tileset_sharded()
+            if export_cache and not sharded:
+                ts = tileset.open(get_tileset_path(browse_layer.browse_type))
+            
             # iterate over all browse reports
             for browse_report_model in browse_reports_qs:
                 browses_qs = Browse.objects.filter(
@@ -195,12 +225,14 @@ class Command(LogToConsoleMixIn, BaseCommand):
                     browse_report_model, browses_qs
                 )
                 
+                # fetch file paths and footprints of all browses at once
+                coverage_infos = get_coverage_infos(browses_qs, footprint=True)
+                
+                dims = []
+                
                 # iterate over all browses in the query
                 for browse, browse_model in izip(browse_report, browses_qs):
-                    coverage_wrapper = System.getRegistry().getFromFactory(
-                        "resources.coverages.wrappers.EOCoverageFactory",
-                        {"obj_id": browse_model.coverage_id}
-                    )
+                    coverage_info = coverage_infos[browse_model.coverage_id]
                     
                     # set the 
                     base_filename = browse_model.coverage_id
@@ -210,12 +242,9 @@ class Command(LogToConsoleMixIn, BaseCommand):
                     browse._file_name = data_filename
                     
                     # add optimized browse image to package
-                    data_package = coverage_wrapper.getData()
-                    data_package.prepareAccess()
-                    browse_file_path = data_package.getGDALDatasetIdentifier()
-                    with open(browse_file_path) as f:
+                    with open_browse_file(manager, coverage_info.filename) as f:
                         p.add_browse(f, data_filename)
-                        wkb = coverage_wrapper.getFootprint().wkb
+                        wkb = coverage_info.footprint.wkb
                         p.add_footprint(footprint_filename, wkb)
                     
                     if export_cache:
@@ -243,20 +272,31 @@ class Command(LogToConsoleMixIn, BaseCommand):
                                                "without exporting the cache."
                                                % browse_layer_model.id)
                         
-                        # get path to sqlite tileset and open it
-                        ts = tileset.open(
-                            get_tileset_path(browse_layer.browse_type)
-                        )
-                        
-                        for tile_desc in ts.get_tiles(
-                            browse_layer.id,
-                            URN_TO_GRID[browse_layer.grid], dim=dim,
-                            minzoom=browse_layer.lowest_map_level,
-                            maxzoom=get_layer_max_cached_zoom(browse_layer),
-                        ):
-                            p.add_cache_file(*tile_desc)
-                            
-                        
+                        dims.append(dim)
+                
+                # add the cached tiles of all browses of the report at once
+                if export_cache and not sharded:
+                    for tile_desc in ts.get_tiles(
+                        browse_layer.id,
+                        URN_TO_GRID[browse_layer.grid], dim=dims,
+                        minzoom=browse_layer.lowest_map_level,
+                        maxzoom=get_layer_max_cached_zoom(browse_layer),
+                    ):
+                        p.add_cache_file(*tile_desc)
+                elif export_cache:
+                    for dim in sorted(set(dims)):
+                        path = get_tileset_path(browse_layer.browse_type,
+                                                dim=dim)
+                        if not isfile(path):
+                            continue
+                        with tileset.open(path) as shard:
+                            for tile_desc in shard.get_tiles(
+                                browse_layer.id,
+                                URN_TO_GRID[browse_layer.grid], dim=dim,
+                                minzoom=browse_layer.lowest_map_level,
+                                maxzoom=get_layer_max_cached_zoom(browse_layer),
+                            ):
+                                p.add_cache_file(*tile_desc)
                 
                 # save browse report xml and add it to the package
                 p.add_browse_report(
@@ -268,5 +308,8 @@ class Command(LogToConsoleMixIn, BaseCommand):
                         uuid.uuid4().hex
                     )
                 )
+            
+            if ts:
+                ts.close()
 
         logger.info("Successfully finished browse export from command line.")
@@ -29,6 +29,7 @@
 
 
 import os
+import sys
 import logging
 from lxml import etree
 from optparse import make_option
@@ -83,12 +84,19 @@ class Command(LogToConsoleMixIn, BaseCommand):
             help=("Use this option to generate an XML ingestion result instead " 
                   "of the usual command line output. The result is printed on "
                   "the standard output stream.")
-        )
+        ),
+        make_option('--serve', action="store_true",
+            dest='serve', default=False,
+            help=("Keep running and ingest the browse report files whose "
+                  "paths are read line by line from the standard input until "
+                  "it is closed. The initialization is done only once for "
+                  "all files.")
+        ),
     )
     
     args = ("<browse-report-xml-file1> [<browse-report-xml-file2>] "
             "[--on-error=<on-error>] [--delete-on-success] [--use-store-path | "
-            "--path-prefix=<path-to-dir>]")
+            "--path-prefix=<path-to-dir>] [--serve]")
     help = ("Ingests the specified ngEO Browse Reports. All referenced browse "
             "images are optimized and saved to the configured directory as " 
             "specified in the 'ngeo.conf'. Optionally deletes the original "
@@ -109,9 +117,14 @@ class Command(LogToConsoleMixIn, BaseCommand):
         optimized_dir = kwargs.get("optimized_dir")
         create_result = kwargs["create_result"]
         leave_original = kwargs["leave_original"]
-        
+        serve = kwargs["serve"]
+
         # check consistency
-        if not len(filenames):
+        if serve:
+            if len(filenames):
+                raise CommandError("No input files allowed with --serve.")
+            filenames = self._read_filenames(sys.stdin)
+        elif not len(filenames):
             logger.error("No input files given.")
             raise CommandError("No input files given.")
         
@@ -158,6 +171,13 @@ class Command(LogToConsoleMixIn, BaseCommand):
                     "handled and %d failed."
                    % (no_reports_handled_success, no_reports_handled_error))
 
+    def _read_filenames(self, stream):
+        """ Yields the non-empty lines of the stream as they arrive. """
+        # readline() does not wait for the read-ahead buffer to be filled
+        for line in iter(stream.readline, ""):
+            filename = line.strip()
+            if filename:
+                yield filename
 
     def _handle_file(self, filename, create_result, config):
         logger.info("Processing input file '%s'." % filename)
@@ -179,6 +199,7 @@ class Command(LogToConsoleMixIn, BaseCommand):
             # print ingest result
             print(render_to_string("control/ingest_response.xml",
                                    {"results": results}))
+            sys.stdout.flush()
         
         logger.info("%d browse%s handled, %d successfully replaced "
                     "and %d successfully inserted."
@@ -87,7 +87,9 @@ class Command(LogToConsoleMixIn, BaseCommand):
         logger.info("Successfully finished browse layer purging from command line.")
 
     def _handle(self, browse_layer_id, browse_type):
-        from ngeo_browse_server.control.queries import remove_browse
+        from ngeo_browse_server.control.queries import (
+            remove_browse, get_coverage_infos
+        )
 
         # query the browse layer
         if browse_layer_id:
@@ -122,12 +124,16 @@ class Command(LogToConsoleMixIn, BaseCommand):
                 logger.info("Deleting '%d' browse%s from database."
                             % (browses_qs.count(),
                                "s" if browses_qs.count() > 1 else ""))
+                coverage_infos = get_coverage_infos(browses_qs)
                 # go through all browses to be deleted
                 for browse_model in browses_qs:
                     _, filename = remove_browse(
                         browse_model, browse_layer_model,
                         browse_model.coverage_id, seed_areas,
-                        unseed=False
+                        unseed=False,
+                        coverage_info=coverage_infos.get(
+                            browse_model.coverage_id
+                        )
                     )
 
                     paths_to_delete.append(filename)
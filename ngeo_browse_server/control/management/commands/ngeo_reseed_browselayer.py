@@ -36,7 +36,7 @@ from ngeo_browse_server.config import models
 from ngeo_browse_server.control.management.commands import LogToConsoleMixIn
 from ngeo_browse_server.mapcache.tasks import seed_mapcache
 from ngeo_browse_server.mapcache import models as mapcache_models
-from ngeo_browse_server.mapcache.config import get_mapcache_seed_config
+from ngeo_browse_server.mapcache.seedqueue import get_seed_config
 
 
 logger = logging.getLogger(__name__)
@@ -141,7 +141,10 @@ class Command(LogToConsoleMixIn, BaseCommand):
                                   start_time=time_model.start_time,
                                   end_time=time_model.end_time,
                                   delete=False, force=force,
-                                  **get_mapcache_seed_config())
+                                  **get_seed_config(
+                                      browse_layer.id, time_model.start_time,
+                                      time_model.end_time
+                                  ))
                     logger.info("Successfully finished (re)seeding time span.")
                 except Exception, e:
                     logger.warn("(Re)seeding failed: %s" % str(e))
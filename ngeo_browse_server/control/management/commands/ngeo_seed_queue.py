@@ -0,0 +1,91 @@
+#-------------------------------------------------------------------------------
+#
+# Project: ngEO Browse Server <http://ngeo.eox.at>
+# Authors: Stephan Meissl <stephan.meissl@eox.at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2015 EOX IT Services GmbH
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+
+
+import time
+import logging
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ngeo_browse_server.config import models
+from ngeo_browse_server.control.management.commands import LogToConsoleMixIn
+from ngeo_browse_server.mapcache.seedqueue import process_seed_queue
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(LogToConsoleMixIn, BaseCommand):
+
+    option_list = BaseCommand.option_list + (
+        make_option('--interval',
+            dest='interval', type="float", default=None,
+            help=("Optional number of seconds to wait between processing the "
+                  "seed queue. When given, the queue is processed until the "
+                  "command is interrupted, otherwise only once.")
+        ),
+    )
+
+    args = ("[browse_layer_id]")
+    help = ("Processes the queued (un-)seeding jobs of deferred seeding, "
+            "optionally only the ones of the given browse layer.")
+
+    def handle(self, *browse_layer_id, **kwargs):
+        # parse command arguments
+        self.verbosity = int(kwargs.get("verbosity", 1))
+        traceback = kwargs.get("traceback", False)
+        self.set_up_logging(["ngeo_browse_server"], self.verbosity, traceback)
+
+        interval = kwargs.get("interval")
+
+        tileset = None
+        if len(browse_layer_id) > 1:
+            logger.error("Too many browse layers given.")
+            raise CommandError("Too many browse layers given.")
+        elif len(browse_layer_id) == 1:
+            try:
+                tileset = models.BrowseLayer.objects.get(
+                    id=browse_layer_id[0]
+                ).id
+            except models.BrowseLayer.DoesNotExist:
+                logger.error("Browse layer '%s' does not exist."
+                             % browse_layer_id[0])
+                raise CommandError("Browse layer '%s' does not exist."
+                                   % browse_layer_id[0])
+
+        while True:
+            runs, failed_runs = process_seed_queue(tileset)
+            if runs:
+                logger.info("Finished %d seed runs." % runs)
+            if failed_runs:
+                logger.error("%d seed runs failed, their seed jobs are kept "
+                             "in the queue." % failed_runs)
+
+            if not interval:
+                break
+            time.sleep(interval)
@@ -0,0 +1,114 @@
+#-------------------------------------------------------------------------------
+#
+# Project: ngEO Browse Server <http://ngeo.eox.at>
+# Authors: Stephan Meissl <stephan.meissl@eox.at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2015 EOX IT Services GmbH
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+
+
+import time
+import logging
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from eoxserver.core.util.timetools import getDateTime
+
+from ngeo_browse_server.config import models
+from ngeo_browse_server.control.management.commands import LogToConsoleMixIn
+from ngeo_browse_server.control.queries import get_coverage_infos
+from ngeo_browse_server.storage import get_file_manager
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(LogToConsoleMixIn, BaseCommand):
+
+    option_list = BaseCommand.option_list + (
+        make_option('--start',
+            dest='start',
+            help=("Optional start date and time in ISO 8601 format.")
+        ),
+        make_option('--end',
+            dest='end',
+            help=("Optional end date and time in ISO 8601 format.")
+        ),
+    )
+
+    args = ("browse_layer_id [--start=<start-date-time>] "
+            "[--end=<end-date-time>]")
+    help = ("Downloads the optimized files of the browses of the given browse "
+            "layer, optionally within a time window, from the object storage "
+            "into the local file cache.")
+
+    def handle(self, *browse_layer_id, **kwargs):
+        # parse command arguments
+        self.verbosity = int(kwargs.get("verbosity", 1))
+        traceback = kwargs.get("traceback", False)
+        self.set_up_logging(["ngeo_browse_server"], self.verbosity, traceback)
+
+        # check consistency
+        if not len(browse_layer_id):
+            logger.error("No browse layer given.")
+            raise CommandError("No browse layer given.")
+        elif len(browse_layer_id) > 1:
+            logger.error("Too many browse layers given.")
+            raise CommandError("Too many browse layers given.")
+        else:
+            browse_layer_id = browse_layer_id[0]
+
+        try:
+            browse_layer = models.BrowseLayer.objects.get(id=browse_layer_id)
+        except models.BrowseLayer.DoesNotExist:
+            logger.error("Browse layer '%s' does not exist."
+                         % browse_layer_id)
+            raise CommandError("Browse layer '%s' does not exist."
+                               % browse_layer_id)
+
+        manager = get_file_manager()
+        if manager is None or manager.cache is None:
+            logger.error("No file cache of a remote storage configured.")
+            raise CommandError("No file cache of a remote storage configured.")
+
+        start = kwargs.get("start")
+        end = kwargs.get("end")
+
+        browses_qs = models.Browse.objects.filter(browse_layer=browse_layer)
+        if start:
+            browses_qs = browses_qs.filter(start_time__gte=getDateTime(start))
+        if end:
+            browses_qs = browses_qs.filter(end_time__lte=getDateTime(end))
+
+        filenames = [
+            info.filename for info in get_coverage_infos(browses_qs).values()
+            if info.filename and info.filename.startswith('/vsi')
+        ]
+
+        logger.info("Warming the file cache with %d files of browse layer "
+                    "'%s'." % (len(filenames), browse_layer_id))
+
+        begin = time.time()
+        manager.map(manager.get_cached_file, filenames)
+
+        logger.info("Warmed the file cache in %.3fs." % (time.time() - begin))
+        manager.log_statistics()
@@ -51,9 +51,10 @@ from ngeo_browse_server.control.ingest.result import (
     IngestBrowseFailureResult
 )
 from ngeo_browse_server.mapcache.config import (
-    get_mapcache_seed_config, get_tileset_path
+    get_tileset_path, get_tileset_import_config, is_tileset_dedup
 )
 from ngeo_browse_server.mapcache.tasks import seed_mapcache
+from ngeo_browse_server.mapcache.seedqueue import get_seed_config
 from eoxserver.core.util.timetools import isotime
 from ngeo_browse_server.mapcache.tileset import URN_TO_GRID
 from ngeo_browse_server.mapcache import tileset
@@ -173,22 +174,24 @@ def import_browse_report(p, browse_report_file, browse_layer_model, crs,
 
         tileset_name = browse_layer_model.id
         dim = isotime(browse.start_time) + "/" + isotime(browse.end_time)
-        ts = tileset.open(get_tileset_path(browse_layer_model.browse_type, config), mode="w")
+        ts = tileset.open(
+            get_tileset_path(browse_layer_model.browse_type, config, dim),
+            mode="w", dedup=is_tileset_dedup(config)
+        )
 
         grid = URN_TO_GRID[browse_layer_model.grid]
         tile_num = 0
 
         # import cache
-        for minzoom, maxzoom in import_cache_levels:
-            logger.info("Importing cached tiles from zoom level %d to %d."
-                        % (minzoom, maxzoom))
-
-            for x, y, z, f in p.get_cache_files(tileset_name, grid, dim):
-                if z < minzoom or z > maxzoom:
-                    continue
+        with ts.writer(**get_tileset_import_config(config)) as writer:
+            for minzoom, maxzoom in import_cache_levels:
+                logger.info("Importing cached tiles from zoom level %d to %d."
+                            % (minzoom, maxzoom))
 
-                ts.add_tile(tileset_name, grid, dim, x, y, z, f)
-                tile_num += 1
+                for x, y, z, f in p.get_cache_files(tileset_name, grid, dim,
+                                                    minzoom, maxzoom):
+                    writer.add_tile(tileset_name, grid, dim, x, y, z, f)
+                    tile_num += 1
 
         logger.info("Imported %d cached tiles." % tile_num)
 
@@ -206,7 +209,10 @@ def import_browse_report(p, browse_report_file, browse_layer_model, crs,
                           start_time=result.time_interval[0],
                           end_time=result.time_interval[1],
                           delete=False,
-                          **get_mapcache_seed_config(config))
+                          **get_seed_config(
+                              browse_layer_model.id, result.time_interval[0],
+                              result.time_interval[1], config=config
+                          ))
 
             logger.info("Successfully finished seeding.")
 
@@ -100,10 +100,121 @@ BROWSE_LAYER_NAME = "browseLayer.xml"
 CACHE_FILE_FRMT = "%s-%d-%d-%d"
 CACHE_FILE_REGEX = ""
 
+# extension of the index sidecar file written next to the package
+INDEX_EXT = ".index"
+
 class PackageException(NGEOException):
     pass
 
 
+def parse_cache_file_name(name):
+    """ Parses the name of a cache file member as written by `PackageWriter`.
+    Returns a tuple ``(tileset, grid, dim, z, x, y)`` or `None` if the name
+    does not denote a cache file.
+    """
+
+    parts = name.split("/")
+    if len(parts) != 4 or parts[0] != SEC_CACHE:
+        return None
+    _, tileset, grid, filename = parts
+
+    try:
+        dim, z, x, y = filename.rsplit("-", 3)
+        return tileset, grid, dim.replace("_", "/"), int(z), int(x), int(y)
+    except ValueError:
+        return None
+
+
+class PackageIndex(object):
+    """ Index of the members of a package: maps the member names to the
+    offsets of their headers within the (uncompressed) archive and groups
+    the cache files by tileset, grid and dimension.
+
+    The index is either built from the archive in a single pass or read from
+    the sidecar file written by the `PackageWriter`.
+    """
+
+    def __init__(self):
+        self._offsets = {}
+        self._dirs = set()
+        self._cache_files = {}
+
+    def add(self, name, offset, is_dir=False):
+        " Add a member to the index. "
+
+        self._offsets[name] = offset
+        if is_dir:
+            self._dirs.add(name)
+            return
+
+        parsed = parse_cache_file_name(name)
+        if parsed:
+            tileset, grid, dim, z, x, y = parsed
+            self._cache_files.setdefault((tileset, grid, dim), []).append(
+                (offset, z, x, y, name)
+            )
+
+    def __contains__(self, name):
+        return name in self._offsets
+
+    def get_offset(self, name):
+        " Returns the header offset of the member `name`. "
+
+        return self._offsets[name]
+
+    def get_files(self, d):
+        """ Returns the names of all files (not directories) within the
+        directory `d` sorted by their position in the archive.
+        """
+
+        prefix = d.rstrip("/") + "/"
+        return [
+            name for offset, name in sorted(
+                (offset, name) for name, offset in self._offsets.iteritems()
+                if name.startswith(prefix) and name not in self._dirs
+            )
+        ]
+
+    def get_cache_files(self, tileset, grid, dim):
+        """ Returns a list of ``(z, x, y, name)`` tuples of the cache files of
+        the given tileset, grid and dimension sorted by their position in the
+        archive.
+        """
+
+        return [
+            (z, x, y, name) for _, z, x, y, name
+            in sorted(self._cache_files.get((tileset, grid, dim), ()))
+        ]
+
+    @classmethod
+    def from_tarfile(cls, tf):
+        " Builds the index by scanning all members of the tarfile once. "
+
+        index = cls()
+        for member in tf.getmembers():
+            if member.isfile() or member.isdir():
+                index.add(member.name, member.offset, member.isdir())
+        return index
+
+    @classmethod
+    def read(cls, f):
+        " Reads the index from a sidecar file. "
+
+        index = cls()
+        for line in f:
+            offset, kind, name = line.rstrip("\n").split("\t", 2)
+            index.add(name, int(offset), kind == "d")
+        return index
+
+    def write(self, f):
+        " Writes the index as a sidecar file. "
+
+        for name, offset in sorted(self._offsets.iteritems(),
+                                   key=lambda item: item[1]):
+            f.write("%d\t%s\t%s\n"
+                    % (offset, "d" if name in self._dirs else "f", name))
+
+
 class PackageWriter(object):
     "ngEO data migration package writer."
     
@@ -115,6 +226,7 @@ class PackageWriter(object):
         )
         self._dirs = set()
         self._cache_files = set()
+        self._index = PackageIndex()
     
     
     def set_browse_layer(self, browse_layer_file):
@@ -184,6 +296,10 @@ class PackageWriter(object):
 
     def close(self):
         self._tarfile.close()
+
+        # write the index sidecar to allow direct access to the members
+        with open(self._path + INDEX_EXT, "w") as f:
+            self._index.write(f)
     
     def _create_info(self, name):
         """ Create a TarInfo object with arbitraty properties set.
@@ -209,6 +325,7 @@ class PackageWriter(object):
                 info = self._create_info(d)
                 info.type = tarfile.DIRTYPE
                 info.mode = 0775
+                self._index.add(d, self._tarfile.offset, True)
                 self._tarfile.addfile(info)
     
     
@@ -223,6 +340,7 @@ class PackageWriter(object):
         f.seek(0)
         
         # actually insert the file
+        self._index.add(name, self._tarfile.offset)
         self._tarfile.addfile(info, f) 
     
     
@@ -244,12 +362,25 @@ class PackageWriter(object):
             # remove the archive file
             self.close()
             os.remove(self._path)
+            os.remove(self._path + INDEX_EXT)
     
 
 
 class PackageReader(object):
+    """ ngEO data migration package reader.
+
+    All members are accessed via a `PackageIndex` which is read from the
+    sidecar file next to the package if present or otherwise built by
+    scanning the archive once. Members are then read directly from their
+    recorded offsets instead of looking them up in the member list.
+    """
+
     def __init__(self, path):
+        self._path = path
         self._tarfile = tarfile.open(path, "r:*")
+        self._index = None
+        self._from_sidecar = False
+        self._members = {}
     
     
     def get_browse_layer(self):
@@ -267,7 +398,7 @@ class PackageReader(object):
     
     def extract_browse_file(self, browse_filename, path=None):
         with open(path, "w+") as f:
-            tf = self._tarfile.extractfile(join(SEC_OPTIMIZED, browse_filename))
+            tf = self._open_file(join(SEC_OPTIMIZED, browse_filename))
             f.write(tf.read())
         
     
@@ -287,48 +418,97 @@ class PackageReader(object):
         return GEOSGeometry(buffer(wkb), 4326)
 
     
-    def get_cache_files(self, tileset, grid, dim):
-        for member in self._filter_files(join(SEC_CACHE, tileset, grid)):
-            name = basename(member.name)
-            actual_dim = name[:41] # TODO: replace this
-            z, x, y = name[42:].split("-")
-            actual_dim = actual_dim.replace("_", "/")
-            
-            if dim != actual_dim:
+    def get_cache_files(self, tileset, grid, dim, minzoom=None, maxzoom=None):
+        """ Yields ``(x, y, z, file)`` tuples for all cache files of the given
+        tileset, grid and dimension, optionally limited to the given zoom
+        levels. The files are read in the order of the archive.
+        """
+
+        for z, x, y, name in self.index.get_cache_files(tileset, grid, dim):
+            if ((minzoom is not None and z < minzoom) or
+                    (maxzoom is not None and z > maxzoom)):
                 continue
             
-            z = int(z)
-            x = int(x)
-            y = int(y)
-            
-            yield x, y, z, self._open_file(member)
+            yield x, y, z, self._open_file(name)
     
     
     def has_cache(self):
         return self._has_file(SEC_CACHE)
+
+
+    @property
+    def index(self):
+        " The `PackageIndex` of the package, loaded on first access. "
+
+        if self._index is None:
+            self._index = self._load_index()
+        return self._index
+
+
+    def _load_index(self):
+        index_path = self._path + INDEX_EXT
+        if (exists(index_path) and
+                os.stat(index_path).st_mtime >= os.stat(self._path).st_mtime):
+            logger.debug("Reading package index from '%s'." % index_path)
+            with open(index_path) as f:
+                self._from_sidecar = True
+                return PackageIndex.read(f)
+
+        return self._scan_index()
+
+
+    def _scan_index(self):
+        start = time()
+        index = PackageIndex.from_tarfile(self._tarfile)
+        self._members = dict(
+            (member.name, member) for member in self._tarfile.getmembers()
+        )
+        logger.debug("Built package index in %.3fs." % (time() - start))
+        return index
             
     
     def _filter_files(self, d):
-        for member in self._tarfile.getmembers():
-            if not member.isfile() or not member.name.startswith(d): # TODO: make better path check
-                continue
-            
-            yield member
+        return self.index.get_files(d)
     
     
+    def _get_member(self, name):
+        member = self._members.get(name)
+        if member is not None:
+            return member
+
+        try:
+            self._tarfile.fileobj.seek(self.index.get_offset(name))
+            member = tarfile.TarInfo.fromtarfile(self._tarfile)
+        except (KeyError, tarfile.HeaderError):
+            member = None
+
+        if member is None or member.name != name:
+            if not self._from_sidecar:
+                raise KeyError(name)
+
+            # the sidecar does not match the package, fall back to scanning
+            # the (freshly opened) archive
+            logger.warning("Package index '%s' is outdated, scanning the "
+                           "package instead." % (self._path + INDEX_EXT))
+            self._tarfile.close()
+            self._tarfile = tarfile.open(self._path, "r:*")
+            self._index = self._scan_index()
+            self._from_sidecar = False
+            return self._members[name]
+
+        return member
+
+
     def _open_file(self, name):
         try:
-            return self._tarfile.extractfile(name)
+            member = self._get_member(name)
         except KeyError:
             raise PackageException("File '%s' is not present in the package."
                                    % name)
+        return self._tarfile.extractfile(member)
         
     def _has_file(self, name):
-        try:
-            self._tarfile.getmember(name)
-            return True
-        except KeyError:
-            return False
+        return name in self.index
 
         
     def close(self):
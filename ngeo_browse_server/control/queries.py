@@ -32,6 +32,7 @@ from os.path import join
 import logging
 import shutil
 from datetime import datetime
+from collections import namedtuple
 
 from django.core.exceptions import ValidationError
 from django.contrib.gis.geos import Polygon, MultiPolygon
@@ -42,19 +43,25 @@ from eoxserver.core.system import System
 from eoxserver.resources.coverages.crss import fromShortCode
 from eoxserver.resources.coverages.metadata import EOMetadata
 from eoxserver.resources.coverages.models import LayerMetadataRecord
+from eoxserver.resources.coverages import models as eoxs_models
 from eoxserver.core.util.timetools import isotime
 from ngeo_browse_server.config import (
     models, get_ngeo_config, get_project_relative_path
 )
 from ngeo_browse_server.config.browselayer.data import get_layer_max_cached_zoom
 from ngeo_browse_server.mapcache import models as mapcache_models
+from ngeo_browse_server.mapcache import tileset
 from ngeo_browse_server.mapcache.tasks import (
-    seed_mapcache, add_mapcache_layer_xml, remove_mapcache_layer_xml
+    add_mapcache_layer_xml, remove_mapcache_layer_xml, merge_time_tiles
 )
+from ngeo_browse_server.mapcache.seedqueue import seed
 from ngeo_browse_server.mapcache.config import (
-    get_mapcache_seed_config, get_tileset_path
+    get_tileset_path, get_tileset_paths, is_merge_incremental,
+    is_seeding_deferred, is_tileset_dedup, is_tileset_sharded
+)
+from ngeo_browse_server.mapcache.exceptions import (
+    LayerException, SeedException
 )
-from ngeo_browse_server.mapcache.exceptions import LayerException
 from ngeo_browse_server.sxcat.tasks import (
     add_collection, disable_collection, remove_collection
 )
@@ -225,9 +232,16 @@ def create_browse(browse, browse_report_model, browse_layer_model, coverage_id,
               end_time__gte=browse.start_time)
         )
 
+    seed_extent = None
     if len(times_qs) > 0:
         # If there are overlapping time entries, merge the time entries to one
         logger.info("Merging %d Time entries." % (len(times_qs) + 1))
+
+        # keep the cached tiles of the merged entries, deferred seeding is
+        # excluded as queued jobs of the entries may not have run yet
+        incremental = (is_merge_incremental(config) and
+                       not is_seeding_deferred(config))
+
         for time_model in times_qs:
             minx = min(minx, time_model.minx)
             miny = min(miny, time_model.miny)
@@ -236,19 +250,51 @@ def create_browse(browse, browse_report_model, browse_layer_model, coverage_id,
             start_time = min(start_time, time_model.start_time)
             end_time = max(end_time, time_model.end_time)
 
-            seed_mapcache(tileset=browse_layer_model.id,
-                          grid=browse_layer_model.grid,
-                          minx=time_model.minx, miny=time_model.miny,
-                          maxx=time_model.maxx, maxy=time_model.maxy,
-                          minzoom=browse_layer_model.lowest_map_level,
-                          maxzoom=get_layer_max_cached_zoom(browse_layer_model),
-                          start_time=time_model.start_time,
-                          end_time=time_model.end_time,
-                          delete=True,
-                          **get_mapcache_seed_config(config))
-
         logger.info("Result time span is %s/%s." % (isotime(start_time),
                                                     isotime(end_time)))
+
+        if incremental:
+            dims = [
+                isotime(time_model.start_time) + "/" +
+                isotime(time_model.end_time)
+                for time_model in times_qs
+            ]
+            dim = isotime(start_time) + "/" + isotime(end_time)
+            shard_paths = None
+            if is_tileset_sharded(config):
+                shard_paths = [
+                    get_tileset_path(
+                        browse_layer_model.browse_type, config, shard_dim
+                    ) for shard_dim in dims
+                ]
+            try:
+                seed_extent = merge_time_tiles(
+                    get_tileset_path(
+                        browse_layer_model.browse_type, config, dim
+                    ),
+                    browse_layer_model.id, browse_layer_model.grid,
+                    dims, dim, extent, (minx, miny, maxx, maxy),
+                    browse_layer_model.lowest_map_level,
+                    get_layer_max_cached_zoom(browse_layer_model),
+                    shard_paths
+                )
+            except SeedException, e:
+                logger.warning("Merging cached tiles failed, re-seeding the "
+                               "merged time span: %s" % str(e))
+                incremental = False
+
+        if not incremental:
+            for time_model in times_qs:
+                seed(tileset=browse_layer_model.id,
+                     grid=browse_layer_model.grid,
+                     minx=time_model.minx, miny=time_model.miny,
+                     maxx=time_model.maxx, maxy=time_model.maxy,
+                     minzoom=browse_layer_model.lowest_map_level,
+                     maxzoom=get_layer_max_cached_zoom(browse_layer_model),
+                     start_time=time_model.start_time,
+                     end_time=time_model.end_time,
+                     delete=True, config=config)
+
         times_qs.delete()
 
     time_model = mapcache_models.Time(start_time=start_time, end_time=end_time,
@@ -259,25 +305,32 @@ def create_browse(browse, browse_report_model, browse_layer_model, coverage_id,
     time_model.full_clean()
     time_model.save()
 
-    seed_areas.append((minx, miny, maxx, maxy, start_time, end_time))
+    seed_areas.append(
+        tuple(seed_extent or (minx, miny, maxx, maxy)) + (start_time, end_time)
+    )
 
     return extent, (browse.start_time, browse.end_time)
 
 
 def remove_browse(browse_model, browse_layer_model, coverage_id,
-                  seed_areas, unseed=True, config=None):
+                  seed_areas, unseed=True, config=None, coverage_info=None):
     """ Delete all models and caches associated with browse model. Image itself
-    is not deleted.
+    is not deleted. `coverage_info` is the `CoverageInfo` of the browse if
+    already fetched via `get_coverage_infos`.
     Returns the extent and filename of the replaced image.
     """
 
     # get previous extent to "un-seed" MapCache in that area
-    rect_ds = System.getRegistry().getFromFactory(
-        "resources.coverages.wrappers.EOCoverageFactory",
-        {"obj_id": browse_model.coverage_id}
-    )
-    replaced_extent = rect_ds.getExtent()
-    replaced_filename = rect_ds.getData().getLocation().getPath()
+    if coverage_info is None:
+        rect_ds = System.getRegistry().getFromFactory(
+            "resources.coverages.wrappers.EOCoverageFactory",
+            {"obj_id": browse_model.coverage_id}
+        )
+        replaced_extent = rect_ds.getExtent()
+        replaced_filename = rect_ds.getData().getLocation().getPath()
+    else:
+        replaced_extent = coverage_info.extent
+        replaced_filename = coverage_info.filename
 
     # delete the EOxServer rectified dataset entry
     rect_mgr = System.getRegistry().findAndBind(
@@ -340,16 +393,15 @@ def remove_browse(browse_model, browse_layer_model, coverage_id,
     if unseed:
         # unseed here
         try:
-            seed_mapcache(tileset=browse_layer_model.id,
-                          grid=browse_layer_model.grid,
-                          minx=time_model.minx, miny=time_model.miny,
-                          maxx=time_model.maxx, maxy=time_model.maxy,
-                          minzoom=browse_layer_model.lowest_map_level,
-                          maxzoom=get_layer_max_cached_zoom(browse_layer_model),
-                          start_time=time_model.start_time,
-                          end_time=time_model.end_time,
-                          delete=True,
-                          **get_mapcache_seed_config(config))
+            seed(tileset=browse_layer_model.id,
+                 grid=browse_layer_model.grid,
+                 minx=time_model.minx, miny=time_model.miny,
+                 maxx=time_model.maxx, maxy=time_model.maxy,
+                 minzoom=browse_layer_model.lowest_map_level,
+                 maxzoom=get_layer_max_cached_zoom(browse_layer_model),
+                 start_time=time_model.start_time,
+                 end_time=time_model.end_time,
+                 delete=True, config=config)
 
         except Exception, e:
             logger.warning("Un-seeding failed: %s" % str(e))
@@ -381,87 +433,12 @@ def remove_browse(browse_model, browse_layer_model, coverage_id,
     time_model.delete()
 
     if len(intersecting_browses_qs):
-
-        class Area(object):
-            def __init__(self, minx, miny, maxx, maxy, start_time, end_time):
-                self.minx = minx
-                self.miny = miny
-                self.maxx = maxx
-                self.maxy = maxy
-                self.start_time = start_time
-                self.end_time = end_time
-
-            def time_intersects(self, other):
-                return (self.end_time >= other.start_time and
-                        self.start_time <= other.end_time)
-
-        # get "areas" with extent and time slice
-        areas = []
-        for browse in intersecting_browses_qs:
-            coverage = System.getRegistry().getFromFactory(
-                "resources.coverages.wrappers.EOCoverageFactory",
-                {"obj_id": browse.coverage_id}
-            )
-            minx, miny, maxx, maxy = coverage.getExtent()
-            areas.append(Area(
-                minx, miny, maxx, maxy, browse.start_time, browse.end_time
-            ))
-
-        # some helpers
-        def intersects_with_group(area, group):
-            for item in group:
-                if area.time_intersects(item):
-                    return True
-            return False
-
-        def merge_groups(first, *others):
-            for other in others:
-                for browse in other:
-                    if browse not in first:
-                        first.append(browse)
-
-        groups = []
-
-        # iterate over all browses that were associated with the deleted time
-        for area in areas:
-            to_be_merged = []
-
-            if len(groups) == 0:
-                groups.append([area])
-                continue
-
-            # check for intersections with other groups
-            for group in groups:
-                if intersects_with_group(area, group):
-                    group.append(area)
-                    to_be_merged.append(group)
-
-            if len(to_be_merged):
-                # actually perform the merge of the groups
-                merge_groups(*to_be_merged)
-                for group in to_be_merged[1:]:
-                    groups.remove(group)
-
-            else:
-                groups.append([area])
+        # get "areas" with extent and time slice of all remaining browses and
+        # regroup them to non-intersecting time windows
+        areas = get_browse_extents(intersecting_browses_qs)
 
         # each group needs to have its own Time model
-        for group in groups:
-            minx = group[0].minx
-            miny = group[0].miny
-            maxx = group[0].maxx
-            maxy = group[0].maxy
-            start_time = group[0].start_time
-            end_time = group[0].end_time
-
-            for browse in group[1:]:
-                minx = min(minx, browse.minx)
-                miny = min(miny, browse.miny)
-                maxx = max(maxx, browse.maxx)
-                maxy = max(maxy, browse.maxy)
-                start_time = min(start_time, browse.start_time)
-                end_time = max(end_time, browse.end_time)
-
+        for minx, miny, maxx, maxy, start_time, end_time in merge_time_areas(areas):
             # create time model
             time = mapcache_models.Time(
                 minx=minx, miny=miny, maxx=maxx, maxy=maxy,
@@ -477,6 +454,161 @@ def remove_browse(browse_model, browse_layer_model, coverage_id,
     return replaced_extent, replaced_filename
 
 
+CoverageInfo = namedtuple(
+    "CoverageInfo", ("coverage_id", "extent", "filename", "footprint")
+)
+
+
+def get_coverage_infos(browses_qs, footprint=False):
+    """ Returns a dictionary mapping the coverage IDs of all browses of the
+    given queryset to `CoverageInfo` tuples with the extent, the path of the
+    optimized file and, if `footprint` is set, the footprint geometry.
+
+    This replaces one `EOCoverageFactory` lookup (and several queries) per
+    browse with one query, plus one for the footprints.
+    """
+
+    rows = eoxs_models.RectifiedDatasetRecord.objects.filter(
+        coverage_id__in=browses_qs.values("coverage_id")
+    ).values_list(
+        "coverage_id", "extent__minx", "extent__miny",
+        "extent__maxx", "extent__maxy",
+        "data_package__localdatapackage__data_location__path",
+        "eo_metadata_id"
+    )
+
+    footprints = {}
+    if footprint:
+        footprints = dict(
+            (record.pk, record.footprint)
+            for record in eoxs_models.EOMetadataRecord.objects.filter(
+                pk__in=eoxs_models.RectifiedDatasetRecord.objects.filter(
+                    coverage_id__in=browses_qs.values("coverage_id")
+                ).values("eo_metadata_id")
+            ).only("id", "footprint")
+        )
+
+    return dict(
+        (coverage_id, CoverageInfo(
+            coverage_id, (minx, miny, maxx, maxy), filename,
+            footprints.get(eo_metadata_id)
+        ))
+        for coverage_id, minx, miny, maxx, maxy, filename, eo_metadata_id
+        in rows
+    )
+
+
+def get_browse_extents(browses_qs):
+    """ Returns a list of ``(minx, miny, maxx, maxy, start_time, end_time)``
+    tuples for all browses of the given queryset which have a registered
+    coverage.
+    """
+
+    infos = get_coverage_infos(browses_qs)
+
+    areas = []
+    for coverage_id, start_time, end_time in browses_qs.values_list(
+            "coverage_id", "start_time", "end_time"):
+        try:
+            areas.append(infos[coverage_id].extent + (start_time, end_time))
+        except KeyError:
+            logger.warning("No coverage found for browse '%s'." % coverage_id)
+    return areas
+
+
+def get_browse_footprints(browse_layer_id, start_time, end_time):
+    """ Returns the footprints of all browses of the browse layer intersecting
+    the given time interval, e.g: of all browses of a `Time` entry.
+    """
+
+    browses_qs = _get_interval_browses(browse_layer_id, start_time, end_time)
+    return [
+        info.footprint
+        for info in get_coverage_infos(browses_qs, footprint=True).values()
+        if info.footprint is not None
+    ]
+
+
+def get_browse_sources(browse_layer_id, start_time, end_time):
+    """ Returns `(filename, footprint)` tuples of the optimized files of all
+    browses of the browse layer intersecting the given time interval, ordered
+    by their time.
+    """
+
+    browses_qs = _get_interval_browses(browse_layer_id, start_time, end_time)
+    infos = get_coverage_infos(browses_qs, footprint=True)
+    return [
+        (infos[coverage_id].filename, infos[coverage_id].footprint)
+        for coverage_id in browses_qs.order_by(
+            "start_time", "end_time"
+        ).values_list("coverage_id", flat=True)
+        if coverage_id in infos
+    ]
+
+
+def get_browse_layer_type(browse_layer_id):
+    """ Returns the browse type of the browse layer, which names its
+    tileset.
+    """
+
+    return models.BrowseLayer.objects.get(id=browse_layer_id).browse_type
+
+
+def _get_interval_browses(browse_layer_id, start_time, end_time):
+    """ Returns a queryset of the browses of the browse layer intersecting the
+    given time interval.
+    """
+
+    if start_time == end_time:
+        browses_qs = models.Browse.objects.filter(
+            browse_layer__id=browse_layer_id,
+            start_time__lte=end_time,
+            end_time__gte=start_time
+        )
+    else:
+        browses_qs = models.Browse.objects.filter(
+            Q(browse_layer__id=browse_layer_id),
+            Q(start_time__lt=end_time,
+              end_time__gt=start_time) |
+            Q(start_time=F("end_time"),
+              start_time__lte=end_time,
+              end_time__gte=start_time)
+        )
+
+    return browses_qs
+
+
+def merge_time_areas(areas):
+    """ Merges ``(minx, miny, maxx, maxy, start_time, end_time)`` tuples with
+    (transitively) intersecting time intervals. Returns a list of the merged
+    tuples, each with the combined extent and time interval of its group.
+
+    The areas are sorted by their start time and swept once, a group is closed
+    as soon as an area starts after the end of all areas of the group. This
+    results in O(n log n) instead of comparing each area with all groups.
+    """
+
+    merged = []
+    current = None
+    for minx, miny, maxx, maxy, start_time, end_time in sorted(
+            areas, key=lambda area: area[4]):
+        if current is not None and start_time <= current[5]:
+            current = (
+                min(current[0], minx), min(current[1], miny),
+                max(current[2], maxx), max(current[3], maxy),
+                current[4], max(current[5], end_time)
+            )
+        else:
+            if current is not None:
+                merged.append(current)
+            current = (minx, miny, maxx, maxy, start_time, end_time)
+
+    if current is not None:
+        merged.append(current)
+
+    return merged
+
+
 def _create_model(browse, browse_report_model, browse_layer_model, coverage_id,
                   model_cls):
     model = model_cls(browse_report=browse_report_model,
@@ -547,6 +679,22 @@ def add_browse_layer(browse_layer, config=None):
     # add an XML section to the mapcache config xml
     add_mapcache_layer_xml(browse_layer, config)
 
+    # create the directory of the shards, MapCache creates the files
+    if is_tileset_sharded(config):
+        shard_dir = os.path.dirname(
+            get_tileset_path(browse_layer.browse_type, config)
+        )
+        if not os.path.exists(shard_dir):
+            os.makedirs(shard_dir)
+
+    # create the tileset up front as MapCache would use the plain schema,
+    # shards are created when seeding
+    elif is_tileset_dedup(config):
+        tileset.open(
+            get_tileset_path(browse_layer.browse_type, config), mode="w",
+            dedup=True
+        ).close()
+
     # create a base directory for optimized files
     directory = get_project_relative_path(join(
         config.get(INGEST_SECTION, "optimized_files_dir"), browse_layer.id
@@ -708,18 +856,24 @@ def delete_browse_layer(browse_layer, purge=False, config=None):
         mapcache_models.Source.objects.get(name=browse_layer.id).delete()
 
         # delete browse layer cache
-        try:
-            logger.info(
-                "Deleting tileset for browse layer '%s'." % browse_layer.id
-            )
-            os.remove(get_tileset_path(browse_layer.browse_type))
-        except OSError:
+        logger.info(
+            "Deleting tileset for browse layer '%s'." % browse_layer.id
+        )
+        tileset_paths = get_tileset_paths(browse_layer.browse_type, config)
+        if not tileset_paths:
             # when no browse was ingested, the sqlite file does not exist, so
             # just issue a warning
             logger.warning(
                 "Could not remove tileset '%s'."
-                % get_tileset_path(browse_layer.browse_type)
+                % get_tileset_path(browse_layer.browse_type, config)
             )
+        for tileset_path in tileset_paths:
+            try:
+                os.remove(tileset_path)
+            except OSError:
+                logger.warning(
+                    "Could not remove tileset '%s'." % tileset_path
+                )
 
         # delete all optimized files by deleting the whole directory of the layer
         optimized_dir = get_project_relative_path(join(
@@ -0,0 +1,87 @@
+#-------------------------------------------------------------------------------
+#
+# Project: ngEO Browse Server <http://ngeo.eox.at>
+# Authors: Fabian Schindler <fabian.schindler@eox.at>
+#          Marko Locher <marko.locher@eox.at>
+#          Stephan Meissl <stephan.meissl@eox.at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2012 European Space Agency
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+
+"""\
+Process wide initialization of the EOxServer system.
+
+`System.init()` (re-)reads the EOxServer configuration and (re-)creates the
+component registry on every call. Long-lived processes serving ingestion
+jobs initialize the system once with `init_system`. Processes forking
+workers after the initialization call `prepare_fork` first, so that the
+workers inherit the initialized state but open their own database
+connections.
+"""
+
+import logging
+from time import time
+
+from django.db import connections
+from django.db.models import get_models
+from eoxserver.core.system import System
+from osgeo import gdal
+
+
+logger = logging.getLogger(__name__)
+
+_initialized = False
+
+
+def init_system(force=False):
+    """ Loads the Django models, initializes the EOxServer system and
+    registers the GDAL drivers unless this has already been done in the
+    current process (or the process it was forked from). Set `force` to
+    re-initialize, e.g: to apply a changed configuration.
+    """
+
+    global _initialized
+    if _initialized and not force:
+        return
+
+    start = time()
+    get_models()
+    gdal.AllRegister()
+    System.init()
+    _initialized = True
+    logger.debug("Initialized the EOxServer system in %.3fs."
+                 % (time() - start))
+
+
+def is_system_initialized():
+    """ Returns `True` if `init_system` has been called in this process. """
+    return _initialized
+
+
+def prepare_fork():
+    """ Closes all database connections of the current process. Must be called
+    before forking processes which use the database, as the forked processes
+    must not share the connections.
+    """
+
+    for connection in connections.all():
+        connection.close()
@@ -44,11 +44,13 @@ import tarfile
 import sqlite3
 from ConfigParser import ConfigParser
 import time
-from urlparse import urlparse
+from urlparse import urlparse, parse_qsl
+from datetime import datetime, timedelta
 from textwrap import dedent
 from SocketServer import TCPServer, ThreadingMixIn
 from BaseHTTPServer import BaseHTTPRequestHandler
 import threading
+from hashlib import md5
 from eoxserver.core.util.timetools import getDateTime
 
 from osgeo import gdal, osr
@@ -74,8 +76,9 @@ from ngeo_browse_server.mapcache import models as mapcache_models
 from ngeo_browse_server.mapcache.config import (
     SEED_SECTION, get_tileset_path
 )
+from ngeo_browse_server.mapcache.seedqueue import process_seed_queue
 from ngeo_browse_server.control.migration.package import (
-    SEC_CACHE, BROWSE_LAYER_NAME, SEC_OPTIMIZED
+    SEC_CACHE, BROWSE_LAYER_NAME, SEC_OPTIMIZED, INDEX_EXT
 )
 from ngeo_browse_server.control.control.config import CTRL_SECTION
 from ngeo_browse_server.storage.conf import (
@@ -326,8 +329,7 @@ class BaseTestCaseMixIn(object):
         if self.configuration.get((STORAGE_SECTION, 'method')):
             manager = get_file_manager()
             filenames = manager.list_contents(self.storage_optimized_prefix)
-            for filename in filenames:
-                manager.delete_file(filename)
+            manager.delete_files(filenames)
             # files = self.get_storage_file_list(self.storage_optimized_prefix)
 
         if exists(self.temp_status_config):
@@ -888,6 +890,35 @@ class SeedMergeTestCaseMixIn(SeedTestCaseMixIn):
             self.assertItemsEqual(expected_timespans, timespans)
 
 
+class SeedQueueTestCaseMixIn(SeedMergeTestCaseMixIn):
+    """ Mixin for deferred seeding test cases. The seed queue is processed
+    after the requests were executed.
+    """
+
+    expected_seed_runs = None
+
+    def setUp_config(self):
+        super(SeedQueueTestCaseMixIn, self).setUp_config()
+        get_ngeo_config().set(SEED_SECTION, "deferred", "true")
+
+    def execute(self, *args, **kwargs):
+        result = super(SeedQueueTestCaseMixIn, self).execute(*args, **kwargs)
+        self.seed_runs, self.failed_seed_runs = process_seed_queue()
+        return result
+
+    def test_seed_queue(self):
+        """ Check that the queue is empty and the jobs were coalesced. """
+
+        self.assertEqual(0, mapcache_models.SeedJob.objects.count())
+
+        self.assertEqual(0, self.failed_seed_runs)
+
+        if self.expected_seed_runs is None:
+            self.skipTest("No expected number of seed runs given.")
+
+        self.assertEqual(self.expected_seed_runs, self.seed_runs)
+
+
 class IngestReplaceTestCaseMixIn(IngestTestCaseMixIn):
     """ Test case mixin for testing replacement tests. """
 
@@ -1162,6 +1193,8 @@ class ExportTestCaseMixIn(BaseTestCaseMixIn):
     def tearDown_files(self):
         super(ExportTestCaseMixIn, self).tearDown_files()
         remove(self.temp_export_file)
+        if exists(self.temp_export_file + INDEX_EXT):
+            remove(self.temp_export_file + INDEX_EXT)
 
     def test_archive_content(self):
         """ Test that the archive contains the expected files.
@@ -1650,6 +1683,400 @@ class SwiftMixIn(object):
             (STORAGE_SECTION, 'container'): environ.get("OS_CONTAINER"),
         }
 
+class SwiftStubMixIn(object):
+    """ Mix in to run a local HTTP server standing in for an OpenStack swift
+        object storage. Objects are kept in memory, the performed requests and
+        the client addresses of the connections are recorded. Each request is
+        delayed by `latency` seconds to simulate a remote storage.
+
+        Static and dynamic large objects are supported, the times of the last
+        modification of the objects are kept in `modified`. Uploads of the
+        objects listed in `failures` (or below a listed prefix ending with a
+        slash) fail with a 503 the given number of times, the ones listed in
+        `corruptions` are stored with a modified content.
+        Deletions with `multipart-manifest=delete` are answered like bulk
+        deletions, the ones of objects listed in `delete_failures` report an
+        error in the body the given number of times.
+    """
+
+    container = "test-container"
+    latency = 0.0
+
+    def setUp(self):
+        objects = {}
+        manifests = {}
+        modified = {}
+        requests = []
+        clients = set()
+        failures = {}
+        corruptions = {}
+        delete_failures = {}
+        latency = self.latency
+        lock = threading.Lock()
+        self.objects = objects
+        self.modified = modified
+        self.requests = requests
+        self.clients = clients
+        self.failures = failures
+        self.corruptions = corruptions
+        self.delete_failures = delete_failures
+
+        def get_etag(name):
+            manifest = manifests.get(name)
+            if manifest is None:
+                return md5(objects[name]).hexdigest()
+            elif isinstance(manifest, list):
+                segments = manifest
+            else:
+                segments = [
+                    key for key in sorted(objects) if key.startswith(manifest)
+                ]
+            return '"%s"' % md5("".join(
+                md5(objects[segment]).hexdigest() for segment in segments
+            )).hexdigest()
+
+        def get_content(name):
+            manifest = manifests.get(name)
+            if manifest is None:
+                return objects[name]
+            elif isinstance(manifest, list):
+                return "".join(objects[segment] for segment in manifest)
+            return "".join(
+                objects[key] for key in sorted(objects)
+                if key.startswith(manifest)
+            )
+
+        def take_failure(name):
+            with lock:
+                for key, count in failures.items():
+                    if count > 0 and (key == name or key.endswith("/") and
+                                      name.startswith(key)):
+                        failures[key] -= 1
+                        return True
+            return False
+
+        class SwiftHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def handle_one_request(self):
+                with lock:
+                    clients.add(self.client_address)
+                BaseHTTPRequestHandler.handle_one_request(self)
+
+            def parse(self):
+                with lock:
+                    requests.append((self.command, self.path))
+                time.sleep(latency)
+                # /v1/<account>/<container>[/<object>]
+                url = urlparse(self.path)
+                parts = url.path.split("/", 4)
+                return (
+                    parts[4] if len(parts) > 4 else None,
+                    dict(parse_qsl(url.query))
+                )
+
+            def read_body(self):
+                if self.headers.getheader("transfer-encoding") == "chunked":
+                    chunks = []
+                    while True:
+                        size = int(self.rfile.readline().split(";")[0], 16)
+                        chunk = self.rfile.read(size)
+                        self.rfile.readline()
+                        if not size:
+                            return "".join(chunks)
+                        chunks.append(chunk)
+                length = int(self.headers.getheader("content-length") or 0)
+                return self.rfile.read(length)
+
+            def respond(self, status, body="", headers=None):
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(body)
+
+            def do_HEAD(self):
+                name, _ = self.parse()
+                if name not in objects:
+                    self.respond(404)
+                elif isinstance(manifests.get(name), basestring):
+                    self.respond(200, headers={
+                        "ETag": get_etag(name),
+                        "X-Object-Manifest": "%s/%s" % (
+                            self.path.split("/")[3], manifests[name]
+                        )
+                    })
+                elif isinstance(manifests.get(name), list):
+                    self.respond(200, headers={
+                        "ETag": get_etag(name),
+                        "X-Static-Large-Object": "True"
+                    })
+                else:
+                    self.respond(200, headers={"ETag": get_etag(name)})
+
+            def do_GET(self):
+                name, params = self.parse()
+                if name is None:
+                    prefix = params.get("prefix", "")
+                    self.respond(200, json.dumps([
+                        {
+                            "name": key, "content_type": "image/tiff",
+                            "bytes": len(get_content(key)),
+                            "last_modified": modified[key].isoformat(),
+                        }
+                        for key in sorted(objects) if key.startswith(prefix)
+                    ]))
+                elif params.get("multipart-manifest") == "get" and \
+                        isinstance(manifests.get(name), list):
+                    self.respond(200, json.dumps([
+                        {"name": "/%s/%s" % (self.path.split("/")[3], segment)}
+                        for segment in manifests[name]
+                    ]))
+                elif name in objects:
+                    self.respond(200, get_content(name))
+                else:
+                    self.respond(404)
+
+            def do_PUT(self):
+                name, params = self.parse()
+                body = self.read_body()
+                etag = self.headers.getheader("etag")
+                if self.headers.getheader("if-none-match") == "*" \
+                        and name in objects:
+                    self.respond(412)
+                elif take_failure(name):
+                    self.respond(503)
+                elif corruptions.get(name):
+                    corruptions[name] -= 1
+                    objects[name] = body[::-1]
+                    modified[name] = datetime.utcnow()
+                    self.respond(201, headers={
+                        "ETag": md5(objects[name]).hexdigest()
+                    })
+                elif etag and etag != md5(body).hexdigest():
+                    self.respond(422)
+                elif params.get("multipart-manifest") == "put":
+                    segments = []
+                    for segment in json.loads(body):
+                        segment_name = segment["path"].split("/", 2)[2]
+                        content = objects.get(segment_name)
+                        if content is None or \
+                                md5(content).hexdigest() != segment["etag"] \
+                                or len(content) != segment["size_bytes"]:
+                            self.respond(400)
+                            return
+                        segments.append(segment_name)
+                    objects[name] = ""
+                    modified[name] = datetime.utcnow()
+                    manifests[name] = segments
+                    self.respond(201)
+                else:
+                    objects[name] = body
+                    modified[name] = datetime.utcnow()
+                    manifest = self.headers.getheader("x-object-manifest")
+                    if manifest:
+                        manifests[name] = manifest.split("/", 1)[1]
+                    self.respond(201, headers={
+                        "ETag": md5(body).hexdigest()
+                    })
+
+            def do_DELETE(self):
+                name, params = self.parse()
+                bulk = params.get("multipart-manifest") == "delete"
+                if bulk and delete_failures.get(name):
+                    delete_failures[name] -= 1
+                    self.respond(200, json.dumps({
+                        "Response Status": "400 Bad Request",
+                        "Errors": [[name, "409 Conflict"]],
+                        "Number Deleted": 0, "Number Not Found": 0,
+                    }))
+                    return
+
+                manifest = manifests.pop(name, None)
+                if objects.pop(name, None) is None:
+                    if bulk:
+                        self.respond(200, json.dumps({
+                            "Response Status": "200 OK", "Errors": [],
+                            "Number Deleted": 0, "Number Not Found": 1,
+                        }))
+                    else:
+                        self.respond(404)
+                    return
+                deleted = 1
+                if bulk and isinstance(manifest, list):
+                    for segment in manifest:
+                        if objects.pop(segment, None) is not None:
+                            deleted += 1
+                if bulk:
+                    self.respond(200, json.dumps({
+                        "Response Status": "200 OK", "Errors": [],
+                        "Number Deleted": deleted, "Number Not Found": 0,
+                    }))
+                else:
+                    self.respond(204)
+
+            def log_request(self, *args, **kwargs):
+                pass
+
+        class ThreadedTCPServer(ThreadingMixIn, TCPServer):
+            allow_reuse_address = True
+            daemon_threads = True
+
+        self.server = ThreadedTCPServer(("localhost", 0), SwiftHandler)
+        self.storage_url = "http://localhost:%d/v1/AUTH_test" % (
+            self.server.server_address[1]
+        )
+        self.server_thread = threading.Thread(target=self.server.serve_forever)
+        self.server_thread.daemon = True
+        self.server_thread.start()
+
+        super(SwiftStubMixIn, self).setUp()
+
+    def tearDown(self):
+        super(SwiftStubMixIn, self).tearDown()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get_requests(self, method):
+        return [path for command, path in self.requests if command == method]
+
+
+class KeystoneStubMixIn(object):
+    """ Mix in to run a local HTTP server standing in for an OpenStack
+        Keystone service. Issued tokens expire after `expires_in` seconds, the
+        number of token requests is recorded. The catalog refers to the
+        `storage_url` of the test case, if any.
+    """
+
+    expires_in = 3600
+
+    def setUp(self):
+        token_requests = []
+        test_case = self
+        self.token_requests = token_requests
+
+        class KeystoneHandler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.getheader("content-length") or 0)
+                token_requests.append(json.loads(self.rfile.read(length)))
+                expires = datetime.utcnow() + timedelta(
+                    seconds=test_case.expires_in
+                )
+                body = json.dumps({"token": {
+                    "expires_at": expires.isoformat() + "Z",
+                    "catalog": [{
+                        "name": "swift", "type": "object-store",
+                        "endpoints": [{
+                            "region": "region", "region_id": "region",
+                            "url": getattr(
+                                test_case, "storage_url",
+                                "http://localhost/v1/AUTH_test"
+                            ),
+                        }]
+                    }]
+                }})
+                self.send_response(201)
+                self.send_header(
+                    "X-Subject-Token", "token-%d" % len(token_requests)
+                )
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_request(self, *args, **kwargs):
+                pass
+
+        class ThreadedTCPServer(ThreadingMixIn, TCPServer):
+            allow_reuse_address = True
+            daemon_threads = True
+
+        self.keystone_server = ThreadedTCPServer(
+            ("localhost", 0), KeystoneHandler
+        )
+        self.auth_config = {
+            "auth_url": "http://localhost:%d/v3" % (
+                self.keystone_server.server_address[1]
+            ),
+            "username": "user", "password": "password",
+            "tenant_id": "tenant", "region_name": "region",
+            "region_id": None,
+        }
+        thread = threading.Thread(target=self.keystone_server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        super(KeystoneStubMixIn, self).setUp()
+
+    def tearDown(self):
+        super(KeystoneStubMixIn, self).tearDown()
+        self.keystone_server.shutdown()
+        self.keystone_server.server_close()
+
+
+class FileServerMixIn(object):
+    """ Mix in to run a local HTTP server serving the contents of the
+        `served_files` dictionary by path. Range requests are supported
+        unless `support_ranges` is disabled. The headers of all requests are
+        recorded.
+    """
+
+    support_ranges = True
+
+    def setUp(self):
+        served_files = {}
+        request_headers = []
+        test_case = self
+        self.served_files = served_files
+        self.request_headers = request_headers
+
+        class FileHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                request_headers.append(dict(self.headers))
+                content = served_files.get(self.path)
+                if content is None:
+                    self.send_error(404)
+                    return
+
+                status = 200
+                range_header = self.headers.getheader("range")
+                if range_header and test_case.support_ranges:
+                    offset = int(range_header.split("=")[1].split("-")[0])
+                    if offset >= len(content):
+                        self.send_error(416)
+                        return
+                    content = content[offset:]
+                    status = 206
+
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_request(self, *args, **kwargs):
+                pass
+
+        class ThreadedTCPServer(ThreadingMixIn, TCPServer):
+            allow_reuse_address = True
+            daemon_threads = True
+
+        self.file_server = ThreadedTCPServer(("localhost", 0), FileHandler)
+        self.file_server_url = "http://localhost:%d" % (
+            self.file_server.server_address[1]
+        )
+        thread = threading.Thread(target=self.file_server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        super(FileServerMixIn, self).setUp()
+
+    def tearDown(self):
+        super(FileServerMixIn, self).tearDown()
+        self.file_server.shutdown()
+        self.file_server.server_close()
+
+
 class PurgeMixIn(BaseTestCaseMixIn):
     """ Mixin for ngEO Purge test cases. Checks whether the browses, 
     browse_reports, mapcache time entries and layer itself were
@@ -27,22 +27,34 @@
 # THE SOFTWARE.
 #------------------------------------------------------------------------------
 
-from os.path import join
+from os.path import join, exists, dirname, getsize
+from os import remove, listdir, stat, environ, sysconf
+import tempfile
+import shutil
+import sqlite3
+from cStringIO import StringIO
 from textwrap import dedent
 import logging
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
+from random import Random
+from multiprocessing import Process, Queue
+from time import time
 from time import sleep
 
 from lxml import etree
+import numpy
+from osgeo import gdal, osr
 from django.conf import settings
 from django.test import TestCase, TransactionTestCase, LiveServerTestCase
+from django.contrib.gis.geos import GEOSGeometry, Polygon
 from django.utils.dateparse import parse_datetime
 from django.utils.timezone import utc
 
+from eoxserver.core.system import System
 from eoxserver.resources.coverages import models as eoxs_models
 
 from ngeo_browse_server import get_version
-from ngeo_browse_server.config import models
+from ngeo_browse_server.config import models, get_ngeo_config
 from ngeo_browse_server.control.testbase import (
     BaseTestCaseMixIn, HttpTestCaseMixin, HttpMixIn, CliMixIn, CliFailureMixIn,
     IngestTestCaseMixIn, IngestIntervalShortenTestCaseMixIn, SeedTestCaseMixIn,
@@ -55,16 +67,48 @@ from ngeo_browse_server.control.testbase import (
     StatusTestCaseMixIn, LogListMixIn, LogFileMixIn, ConfigMixIn,
     ComponentControlTestCaseMixIn, ConfigurationManagementMixIn,
     GenerateReportMixIn, NotifyMixIn, SwiftMixIn, PurgeMixIn,
-    EnableSeedCmdMixIn, CheckOverlapMixIn
+    EnableSeedCmdMixIn, CheckOverlapMixIn, SeedQueueTestCaseMixIn,
+    SwiftStubMixIn, KeystoneStubMixIn, FileServerMixIn
 )
 from ngeo_browse_server.control.ingest.config import (
     INGEST_SECTION
 )
 from ngeo_browse_server.control.control.notification import notify
+from ngeo_browse_server.control.control.reporting import (
+    iter_report_xml, REPORT_CHUNK_SIZE
+)
+from ngeo_browse_server.control.control.accesslog import (
+    AccessLogAggregator, parse_access_time
+)
+from ngeo_browse_server.control.queries import (
+    merge_time_areas, get_coverage_infos
+)
+from ngeo_browse_server.control.migration import package
+from ngeo_browse_server.control import system
+from ngeo_browse_server.control.ingest.download import (
+    download_file, BrowsePrefetcher, PARTIAL_EXT
+)
+from ngeo_browse_server.control.ingest.preprocessing import merge
+from ngeo_browse_server.control.ingest.parallel import can_use_pool
+from ngeo_browse_server.control.ingest.preprocessing.preprocessor import (
+    create_virtual_copy
+)
+from ngeo_browse_server.mapcache import models as mapcache_models
+from ngeo_browse_server.mapcache import tileset, tiling, render
+from ngeo_browse_server.mapcache.tasks import (
+    delete_tiles, merge_time_tiles, seed_mapcache, get_seed_lock
+)
+from ngeo_browse_server.mapcache.config import get_shard_name, SEED_SECTION
+from ngeo_browse_server.mapcache.seedqueue import process_seed_queue
 from ngeo_browse_server.storage.conf import (
     STORAGE_SECTION, AUTH_SECTION
 )
 from ngeo_browse_server.storage.swift.conf import SWIFT_SECTION
+from ngeo_browse_server.storage.cache import FileCache
+from ngeo_browse_server.storage.swift.auth import AuthTokenManager
+from ngeo_browse_server.storage.swift.manager import (
+    SwiftFileManager, SwiftFileExistsError
+)
 
 
 #==============================================================================
@@ -1772,6 +1816,127 @@ class SeedFootprintBrowseGroupPartial(SeedTestCaseMixIn, HttpMixIn, LiveServerTe
     expected_browse_type = "SAR"
     expected_tiles = {0: 4, 1: 4, 2: 4, 3: 4, 4: 4}
 
+#===============================================================================
+# Ingest browse reports with parallel preprocessing
+#===============================================================================
+
+class IngestFootprintBrowseGroupParallel(IngestTestCaseMixIn, HttpTestCaseMixin, TestCase):
+    request_file = "reference_test_data/browseReport_ASA_WS__0P_20100719_101023_group.xml"
+
+    expected_ingested_browse_ids = ("b_id_6", "b_id_7", "b_id_8")
+    expected_inserted_into_series = "TEST_SAR"
+    expected_optimized_files = ['ASA_WS__0P_20100719_101023_proc.tif',
+                                'ASA_WS__0P_20100722_101601_proc.tif',
+                                'ASA_WS__0P_20100725_102231_proc.tif']
+    expected_deleted_files = ['ASA_WS__0P_20100719_101023.jpg',
+                              'ASA_WS__0P_20100722_101601.jpg',
+                              'ASA_WS__0P_20100725_102231.jpg']
+
+    configuration = {
+        (INGEST_SECTION, "workers"): "2",
+    }
+
+    expected_response = """\
+<?xml version="1.0" encoding="UTF-8"?>
+<bsi:ingestBrowseResponse xsi:schemaLocation="http://ngeo.eo.esa.int/schema/browse/ingestion ../ngEOBrowseIngestionService.xsd"
+xmlns:bsi="http://ngeo.eo.esa.int/schema/browse/ingestion" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+    <bsi:status>success</bsi:status>
+    <bsi:ingestionSummary>
+        <bsi:toBeReplaced>3</bsi:toBeReplaced>
+        <bsi:actuallyInserted>3</bsi:actuallyInserted>
+        <bsi:actuallyReplaced>0</bsi:actuallyReplaced>
+    </bsi:ingestionSummary>
+    <bsi:ingestionResult>
+        <bsi:briefRecord>
+            <bsi:identifier>b_id_6</bsi:identifier>
+            <bsi:status>success</bsi:status>
+        </bsi:briefRecord>
+        <bsi:briefRecord>
+            <bsi:identifier>b_id_7</bsi:identifier>
+            <bsi:status>success</bsi:status>
+        </bsi:briefRecord>
+        <bsi:briefRecord>
+            <bsi:identifier>b_id_8</bsi:identifier>
+            <bsi:status>success</bsi:status>
+        </bsi:briefRecord>
+    </bsi:ingestionResult>
+</bsi:ingestBrowseResponse>
+"""
+
+class IngestFootprintBrowseGroupPartialParallel(IngestTestCaseMixIn, HttpTestCaseMixin, TransactionTestCase):
+    request_file = "reference_test_data/browseReport_ASA_WS__0P_20100719_101023_group_partial.xml"
+
+    expected_ingested_browse_ids = ("b_id_6", "b_id_8")
+    expected_inserted_into_series = "TEST_SAR"
+    expected_optimized_files = ['ASA_WS__0P_20100719_101023_proc.tif',
+                                'ASA_WS__0P_20100725_102231_proc.tif']
+    expected_deleted_files = ['ASA_WS__0P_20100719_101023.jpg',
+                              'ASA_WS__0P_20100725_102231.jpg']
+
+    configuration = {
+        (INGEST_SECTION, "workers"): "2",
+    }
+
+    expected_response = """\
+<?xml version="1.0" encoding="UTF-8"?>
+<bsi:ingestBrowseResponse xsi:schemaLocation="http://ngeo.eo.esa.int/schema/browse/ingestion ../ngEOBrowseIngestionService.xsd"
+xmlns:bsi="http://ngeo.eo.esa.int/schema/browse/ingestion" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+    <bsi:status>partial</bsi:status>
+    <bsi:ingestionSummary>
+        <bsi:toBeReplaced>3</bsi:toBeReplaced>
+        <bsi:actuallyInserted>2</bsi:actuallyInserted>
+        <bsi:actuallyReplaced>0</bsi:actuallyReplaced>
+    </bsi:ingestionSummary>
+    <bsi:ingestionResult>
+        <bsi:briefRecord>
+            <bsi:identifier>b_id_6</bsi:identifier>
+            <bsi:status>success</bsi:status>
+        </bsi:briefRecord>
+        <bsi:briefRecord>
+            <bsi:identifier>7_FAILURE</bsi:identifier>
+            <bsi:status>failure</bsi:status>
+            <bsi:error>
+                <bsi:exceptionCode>ValidationError</bsi:exceptionCode>
+                <bsi:exceptionMessage>Browse Identifier &#39;7_FAILURE&#39; not valid: &#39;This field&#39;s must begin with a letter, an underscore, a colon, or a hash and continuing with letters, digits, hyphens, underscores, colons, full stops, or hashes.&#39;.</bsi:exceptionMessage>
+            </bsi:error>
+        </bsi:briefRecord>
+        <bsi:briefRecord>
+            <bsi:identifier>b_id_8</bsi:identifier>
+            <bsi:status>success</bsi:status>
+        </bsi:briefRecord>
+    </bsi:ingestionResult>
+</bsi:ingestBrowseResponse>
+"""
+
+
+def run_in_daemon(func, *args):
+    """ Calls `func` in a daemonic process, like the workers of the
+    browsewatchd2 daemon, and returns its result or the string of the raised
+    exception.
+    """
+    queue = Queue()
+
+    def target():
+        try:
+            queue.put(func(*args))
+        except Exception, e:
+            queue.put("%s: %s" % (type(e).__name__, str(e)))
+
+    process = Process(target=target)
+    process.daemon = True
+    process.start()
+    result = queue.get(timeout=60)
+    process.join()
+    return result
+
+
+class DaemonicPoolTestCase(TestCase):
+    """ Checks that no worker processes are started from daemonic processes.
+    """
+
+    def test_can_use_pool(self):
+        self.assertTrue(can_use_pool())
+        self.assertEqual(False, run_in_daemon(can_use_pool))
 
 
 #===============================================================================
@@ -1795,6 +1960,77 @@ class SeedMerge1(SeedMergeTestCaseMixIn, HttpMultipleMixIn, LiveServerTestCase):
     ]
 
 
+class SeedMergeDeferred1(SeedQueueTestCaseMixIn, HttpMultipleMixIn, LiveServerTestCase):
+    """ Simple merging of two time windows with deferred seeding. The seed
+    jobs of the first time window are dropped as it is merged before seeding.
+    """
+
+    request_files = ("merge_test_data/br_merge_1.xml",
+                     "merge_test_data/br_merge_2.xml"
+                     )
+
+    storage_dir = "data/merge_test_data"
+
+    expected_browse_type = "SAR"
+    expected_tiles = {0: 1, 1: 1, 2: 1, 3: 1, 4: 1}
+    expected_seeded_areas = [
+        (parse_datetime("2010-07-22T21:38:40Z"),
+         parse_datetime("2010-07-22T21:40:38Z"))
+    ]
+    expected_seed_runs = 1
+
+
+class SeedMergeDeferredFailed(SeedQueueTestCaseMixIn, HttpMultipleMixIn, LiveServerTestCase):
+    """ Deferred seeding where the first processing of the queue fails as the
+    seeding lock is held. The seed jobs are kept and seeded by the next
+    processing of the queue.
+    """
+
+    request_files = ("merge_test_data/br_merge_1.xml",
+                     "merge_test_data/br_merge_2.xml"
+                     )
+
+    storage_dir = "data/merge_test_data"
+
+    expected_browse_type = "SAR"
+    expected_tiles = {0: 1, 1: 1, 2: 1, 3: 1, 4: 1}
+    expected_seeded_areas = [
+        (parse_datetime("2010-07-22T21:38:40Z"),
+         parse_datetime("2010-07-22T21:40:38Z"))
+    ]
+    expected_seed_runs = 1
+
+    def execute(self, *args, **kwargs):
+        result = super(SeedQueueTestCaseMixIn, self).execute(*args, **kwargs)
+
+        get_ngeo_config().set(SEED_SECTION, "timeout", "0.1")
+        self.queued_jobs = mapcache_models.SeedJob.objects.count()
+        locks = [
+            get_seed_lock(source_id) for source_id in set(
+                mapcache_models.SeedJob.objects.values_list(
+                    "source", flat=True
+                )
+            )
+        ]
+        try:
+            for lock in locks:
+                lock.acquire()
+            self.failed_result = process_seed_queue()
+            self.kept_jobs = mapcache_models.SeedJob.objects.count()
+        finally:
+            for lock in locks:
+                lock.release()
+
+        self.seed_runs, self.failed_seed_runs = process_seed_queue()
+        return result
+
+    def test_failed_seed_runs(self):
+        """ Check that the jobs of the failed seed runs were kept. """
+
+        self.assertEqual((0, 1), self.failed_result)
+        self.assertEqual(self.queued_jobs, self.kept_jobs)
+
+
 class SeedMerge2(SeedMergeTestCaseMixIn, HttpMultipleMixIn, LiveServerTestCase):
     """ Merging 2 time windows with a third. """
 
@@ -2876,6 +3112,16 @@ class IngestRasterSelfOverviewsAutomatic(BaseTestCaseMixIn, HttpMixIn, OverviewM
 
     expected_overview_count = 4
 
+    def test_no_external_overviews(self):
+        """ Check that the overviews are internal and no temporary overview
+        files are left.
+        """
+        self.assertFalse(exists(self.raster_file + ".ovr"))
+        self.assertEqual(
+            [], [name for name in listdir(dirname(self.raster_file))
+                 if name.endswith(".ovr")]
+        )
+
 
 class IngestRasterSelfOverviewsFixed(BaseTestCaseMixIn, HttpMixIn, OverviewMixIn, TestCase):
     request_file = "reference_test_data/browseReport_ASA_IM__0P_20100722_213840.xml"
@@ -5538,3 +5784,1735 @@ class CheckSimpleOverlappingTimeFromCommand(CheckOverlapMixIn, CliMixIn, LiveSer
         "merged_end": "2010-07-22T21:40:38Z"
     }
 
+
+#===============================================================================
+# Time regrouping
+#===============================================================================
+
+class MergeTimeAreasTestCase(TestCase):
+    """ Regrouping of the time windows of synthetic browses, e.g: when
+    removing a browse from a layer with many browses in the same datatake.
+    The run time is measured by "tools/ngeo_micro_benchmark.py".
+    """
+
+    num_areas = 2000
+
+    def get_areas(self, num, seed=0):
+        random = Random(seed)
+        base = datetime(2017, 1, 1)
+        areas = []
+        for i in range(num):
+            # most browses share few datatakes, some are spread in between
+            if i % 4:
+                start = base + timedelta(minutes=random.randint(0, 10) * 100)
+                end = start + timedelta(minutes=5)
+            else:
+                start = base + timedelta(minutes=random.randint(0, 1000))
+                end = start + timedelta(minutes=random.randint(0, 2))
+            minx, miny = random.uniform(-180, 170), random.uniform(-90, 80)
+            areas.append((minx, miny, minx + 10, miny + 10, start, end))
+        return areas
+
+    def reference_merge(self, areas):
+        # straightforward quadratic grouping of intersecting time windows
+        groups = []
+        for area in areas:
+            intersecting = [
+                group for group in groups
+                if any(area[4] <= other[5] and area[5] >= other[4]
+                       for other in group)
+            ]
+            merged = [area]
+            for group in intersecting:
+                merged.extend(group)
+                groups.remove(group)
+            groups.append(merged)
+
+        return sorted(
+            (min(a[0] for a in group), min(a[1] for a in group),
+             max(a[2] for a in group), max(a[3] for a in group),
+             min(a[4] for a in group), max(a[5] for a in group))
+            for group in groups
+        )
+
+    def test_merge_time_areas_result(self):
+        areas = self.get_areas(500)
+        self.assertEqual(self.reference_merge(areas),
+                         sorted(merge_time_areas(areas)))
+
+    def test_merge_time_areas_disjoint(self):
+        merged = merge_time_areas(self.get_areas(self.num_areas))
+
+        # the time windows must not intersect each other
+        for previous, following in zip(merged, merged[1:]):
+            self.assertLess(previous[5], following[4])
+
+
+#===============================================================================
+# Bulk coverage lookup
+#===============================================================================
+
+class CoverageInfosFootprintBrowseGroup(IngestTestCaseMixIn, HttpTestCaseMixin, TestCase):
+    request_file = "reference_test_data/browseReport_ASA_WS__0P_20100719_101023_group.xml"
+
+    expected_ingested_browse_ids = ("b_id_6", "b_id_7", "b_id_8")
+    expected_inserted_into_series = "TEST_SAR"
+
+    def test_coverage_infos(self):
+        """ Check that the bulk lookup yields the same values as the
+        per-coverage lookup via the EOCoverageFactory.
+        """
+
+        browses_qs = models.Browse.objects.all()
+        infos = get_coverage_infos(browses_qs, footprint=True)
+        self.assertEqual(3, len(infos))
+
+        for browse_model in browses_qs:
+            coverage_wrapper = System.getRegistry().getFromFactory(
+                "resources.coverages.wrappers.EOCoverageFactory",
+                {"obj_id": browse_model.coverage_id}
+            )
+            info = infos[browse_model.coverage_id]
+            self.assertEqual(browse_model.coverage_id, info.coverage_id)
+            self.assertEqual(tuple(coverage_wrapper.getExtent()), info.extent)
+            self.assertEqual(
+                coverage_wrapper.getData().getLocation().getPath(),
+                info.filename
+            )
+            self.assertTrue(
+                coverage_wrapper.getFootprint().equals_exact(info.footprint)
+            )
+
+
+#===============================================================================
+# Package index
+#===============================================================================
+
+class PackageIndexTestCase(TestCase):
+    """ Checks that packages are read identically with the index sidecar
+    written by the package writer and with an index built by scanning the
+    package.
+    """
+
+    dims = ("2010-07-22T21:38:40Z/2010-07-22T21:40:38Z",
+            "2010-07-22T21:38:40Z/2010-07-22T21:38:40Z")
+
+    def setUp(self):
+        self.path = tempfile.mktemp(suffix=".tar.gz")
+        with package.create(self.path, "gz") as p:
+            p.set_browse_layer(StringIO("<browseLayer/>"))
+            for i in range(3):
+                p.add_browse(StringIO("browse %d" % i), "b_%d.tif" % i)
+                for dim in self.dims:
+                    for z in range(2, 5):
+                        p.add_cache_file("TEST_SAR", "WGS84", i, i, z, dim,
+                                         StringIO("%s %d %d" % (dim, i, z)))
+                p.add_browse_report(StringIO("<report_%d/>" % i),
+                                    "report_%d.xml" % i)
+
+    def tearDown(self):
+        remove(self.path)
+        if package.exists(self.path + package.INDEX_EXT):
+            remove(self.path + package.INDEX_EXT)
+
+    def check_package(self):
+        with package.read(self.path) as p:
+            self.assertEqual("<browseLayer/>", p.get_browse_layer().read())
+            self.assertEqual(
+                ["<report_0/>", "<report_1/>", "<report_2/>"],
+                [f.read() for f in p.get_browse_reports()]
+            )
+            self.assertEqual("browse 1", p.get_browse_file("b_1.tif").read())
+            self.assertTrue(p.has_cache())
+
+            tiles = [
+                (x, y, z, f.read()) for x, y, z, f
+                in p.get_cache_files("TEST_SAR", "WGS84", self.dims[0], 3, 4)
+            ]
+            self.assertEqual(
+                [(i, i, z, "%s %d %d" % (self.dims[0], i, z))
+                 for i in range(3) for z in (3, 4)],
+                tiles
+            )
+
+            self.assertRaises(
+                package.PackageException, p.get_browse_file, "b_3.tif"
+            )
+
+    def test_sidecar_index(self):
+        self.assertTrue(package.exists(self.path + package.INDEX_EXT))
+        self.check_package()
+
+    def test_scanned_index(self):
+        remove(self.path + package.INDEX_EXT)
+        self.check_package()
+
+    def test_outdated_index(self):
+        with open(self.path + package.INDEX_EXT, "w") as f:
+            f.write("512\tf\tbrowseLayer.xml\n")
+        self.check_package()
+
+
+#===============================================================================
+# Tileset bulk insertion
+#===============================================================================
+
+class TileWriterTestCase(TestCase):
+    """ Checks the bulk insertion of the `TileWriter` next to single tiles.
+    The insertion rates are compared by "tools/ngeo_micro_benchmark.py".
+    """
+
+    num_single_tiles = 20
+    num_bulk_tiles = 2500
+    tile_data = "\0" * 2048
+
+    def setUp(self):
+        self.path = tempfile.mktemp(suffix=".sqlite")
+        self.ts = tileset.open(self.path, mode="w")
+
+    def tearDown(self):
+        remove(self.path)
+
+    def count_tiles(self):
+        return sum(1 for _ in self.ts.get_tiles("TEST_SAR", "WGS84"))
+
+    def test_tile_writer(self):
+        dim = "2010-07-22T21:38:40Z/2010-07-22T21:40:38Z"
+
+        for x in range(self.num_single_tiles):
+            self.ts.add_tile("TEST_SAR", "WGS84", dim, x, 0, 10,
+                             StringIO(self.tile_data))
+
+        with self.ts.writer(batch_size=1000, synchronous="OFF") as writer:
+            for x in range(self.num_bulk_tiles):
+                writer.add_tile("TEST_SAR", "WGS84", dim, x, 1, 10,
+                                StringIO(self.tile_data))
+
+        self.assertEqual(self.num_bulk_tiles, writer.count)
+        self.assertEqual(
+            self.num_single_tiles + self.num_bulk_tiles, self.count_tiles()
+        )
+
+    def test_tile_writer_error(self):
+        """ Check that the pending batch is discarded on error. """
+
+        dim = "2010-07-22T21:38:40Z/2010-07-22T21:40:38Z"
+
+        with self.assertRaises(ValueError):
+            with self.ts.writer(batch_size=10) as writer:
+                for x in range(15):
+                    writer.add_tile("TEST_SAR", "WGS84", dim, x, 0, 10,
+                                    StringIO(self.tile_data))
+                raise ValueError("Failure")
+
+        self.assertEqual(10, self.count_tiles())
+
+
+class TileSetQueryTestCase(TestCase):
+    """ Checks the filtering of tiles by multiple dimensions, zoom levels and
+    tile coordinates.
+    """
+
+    dims = ["2010-07-%02dT00:00:00Z/2010-07-%02dT00:00:00Z" % (day, day)
+            for day in range(1, 21)]
+
+    def setUp(self):
+        self.path = tempfile.mktemp(suffix=".sqlite")
+        ts = tileset.open(self.path, mode="w")
+        with ts.writer() as writer:
+            for dim in self.dims:
+                for z in range(3):
+                    for x in range(4):
+                        writer.add_tile("TEST_SAR", "WGS84", dim, x, x, z,
+                                        StringIO(dim))
+        self.ts = tileset.open(self.path)
+
+    def tearDown(self):
+        self.ts.close()
+        remove(self.path)
+
+    def test_multiple_dims(self):
+        tiles = list(self.ts.get_tiles(
+            "TEST_SAR", "WGS84", dim=self.dims[:5], batch_size=7
+        ))
+        self.assertEqual(5 * 3 * 4, len(tiles))
+        self.assertEqual(set(self.dims[:5]), set(tile[5] for tile in tiles))
+        for tile in tiles:
+            self.assertEqual(tile[5], tile[6].read())
+
+    def test_single_dim_bbox(self):
+        tiles = list(self.ts.get_tiles(
+            "TEST_SAR", "WGS84", dim=self.dims[0], minzoom=1, maxzoom=2,
+            bbox=(1, 1, 2, 3)
+        ))
+        self.assertEqual(
+            [(1, 1, 1), (1, 1, 2), (2, 2, 1), (2, 2, 2)],
+            sorted(tile[2:5] for tile in tiles)
+        )
+
+    def test_no_dims(self):
+        self.assertEqual(
+            [], list(self.ts.get_tiles("TEST_SAR", "WGS84", dim=[]))
+        )
+        self.assertEqual(
+            len(self.dims) * 3 * 4,
+            len(list(self.ts.get_tiles("TEST_SAR", "WGS84")))
+        )
+
+
+#===============================================================================
+# Windowed footprint generation
+#===============================================================================
+
+class DataMaskTestCase(TestCase):
+    """ Checks the window by window computation of data masks against a
+    computation on the full bands.
+    """
+
+    def setUp(self):
+        self.window_pixels = merge.MASK_WINDOW_PIXELS
+        # force a lot of small windows
+        merge.MASK_WINDOW_PIXELS = 1000
+
+        self.ds = gdal.GetDriverByName("MEM").Create("", 300, 200, 3)
+        self.ds.SetGeoTransform((10.0, 0.01, 0.0, 50.0, 0.0, -0.01))
+        sr = osr.SpatialReference()
+        sr.ImportFromEPSG(4326)
+        self.ds.SetProjection(sr.ExportToWkt())
+        random = Random(42)
+        for idx in range(1, 4):
+            data = numpy.zeros((200, 300), dtype=numpy.uint8)
+            data[20 + idx:180, 30:270 - idx] = random.randint(1, 255)
+            self.ds.GetRasterBand(idx).WriteArray(data)
+
+    def tearDown(self):
+        merge.MASK_WINDOW_PIXELS = self.window_pixels
+
+    def get_mask(self, decimation):
+        size_x, size_y = merge.get_data_mask_size(self.ds, decimation)
+        mask_ds = gdal.GetDriverByName("MEM").Create(
+            "", size_x, size_y, 1, gdal.GDT_Byte
+        )
+        merge.copy_data_mask_georeference(self.ds, mask_ds, decimation)
+        merge.write_data_mask(self.ds, mask_ds.GetRasterBand(1), decimation)
+        return mask_ds
+
+    def test_windowed_mask(self):
+        expected = numpy.zeros((200, 300), dtype=numpy.bool)
+        for idx in range(1, 4):
+            expected |= self.ds.GetRasterBand(idx).ReadAsArray() != 0
+
+        mask = self.get_mask(1).GetRasterBand(1).ReadAsArray()
+        self.assertTrue(numpy.array_equal(expected.astype(numpy.uint8), mask))
+
+    def test_decimated_mask(self):
+        mask_ds = self.get_mask(4)
+        self.assertEqual((75, 50), (mask_ds.RasterXSize, mask_ds.RasterYSize))
+        self.assertEqual(
+            (10.0, 0.04, 0.0, 50.0, 0.0, -0.04), mask_ds.GetGeoTransform()
+        )
+
+        # the data area covers 80% of the width and 80% of the height
+        ratio = mask_ds.GetRasterBand(1).ReadAsArray().mean()
+        self.assertAlmostEqual(0.8 * 0.8, ratio, delta=0.05)
+
+    def test_decimated_footprint(self):
+        footprint = GEOSGeometry(merge.generate_footprint_wkt(self.ds))
+        decimated = GEOSGeometry(
+            merge.generate_footprint_wkt(self.ds, decimation=4)
+        )
+        self.assertAlmostEqual(
+            footprint.area, decimated.area, delta=0.05 * footprint.area
+        )
+
+
+#===============================================================================
+# Virtual input datasets
+#===============================================================================
+
+class VirtualCopyTestCase(TestCase):
+    """ Checks that the virtual copy of an input dataset provides the same
+    pixels and does not alter the original file when georeferenced.
+    """
+
+    def setUp(self):
+        self.path = tempfile.mktemp(suffix=".tif")
+        ds = gdal.GetDriverByName("GTiff").Create(self.path, 64, 32, 3)
+        for idx in range(1, 4):
+            ds.GetRasterBand(idx).WriteArray(
+                numpy.arange(64 * 32, dtype=numpy.uint8).reshape(32, 64) * idx
+            )
+        ds = None
+
+    def tearDown(self):
+        remove(self.path)
+
+    def test_virtual_copy(self):
+        original_ds = gdal.Open(self.path)
+        original_gt = original_ds.GetGeoTransform()
+        vrt_ds = create_virtual_copy(original_ds)
+
+        self.assertEqual("VRT", vrt_ds.GetDriver().ShortName)
+        self.assertEqual(3, vrt_ds.RasterCount)
+
+        vrt_ds.SetGeoTransform((10.0, 0.5, 0.0, 50.0, 0.0, -0.5))
+        out_ds = gdal.GetDriverByName("MEM").CreateCopy("", vrt_ds)
+        self.assertEqual(
+            (10.0, 0.5, 0.0, 50.0, 0.0, -0.5), out_ds.GetGeoTransform()
+        )
+        for idx in range(1, 4):
+            self.assertTrue(numpy.array_equal(
+                original_ds.GetRasterBand(idx).ReadAsArray(),
+                out_ds.GetRasterBand(idx).ReadAsArray()
+            ))
+
+        vrt_ds = None
+        original_ds = None
+        self.assertEqual(original_gt, gdal.Open(self.path).GetGeoTransform())
+
+
+#===============================================================================
+# Swift file manager test cases
+#===============================================================================
+
+class StaticAuthManager(object):
+    def get_auth_token(self):
+        return "token"
+
+
+class SwiftFileManagerTestCase(SwiftStubMixIn, TestCase):
+    """ Checks the pooled and concurrent swift operations against a local
+    stub of the object storage.
+    """
+
+    latency = 0.1
+
+    def setUp(self):
+        super(SwiftFileManagerTestCase, self).setUp()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filenames = []
+        for i in range(8):
+            filename = join(self.tmp_dir, "file_%d.tif" % i)
+            with open(filename, "w") as f:
+                f.write("content %d" % i)
+            self.filenames.append(filename)
+
+    def tearDown(self):
+        super(SwiftFileManagerTestCase, self).tearDown()
+        shutil.rmtree(self.tmp_dir)
+
+    def get_manager(self, **kwargs):
+        return SwiftFileManager(
+            self.container, StaticAuthManager(), self.storage_url, **kwargs
+        )
+
+    def test_connection_reuse(self):
+        manager = self.get_manager(workers=1)
+        for filename in self.filenames:
+            manager.upload_file("prefix", filename)
+
+        self.assertEqual(16, len(self.requests))
+        self.assertEqual(1, len(self.clients))
+
+    def test_upload_precheck(self):
+        manager = self.get_manager()
+        manager.upload_file("prefix", self.filenames[0])
+        self.assertRaises(
+            SwiftFileExistsError, manager.upload_file,
+            "prefix", self.filenames[0]
+        )
+        self.assertEqual(2, len(self.get_requests("HEAD")))
+        self.assertEqual(1, len(self.get_requests("PUT")))
+
+    def test_upload_no_precheck(self):
+        manager = self.get_manager(upload_precheck=False)
+        manager.upload_file("prefix", self.filenames[0])
+        self.objects["prefix/file_0.tif"] = "changed"
+        self.assertRaises(
+            SwiftFileExistsError, manager.upload_file,
+            "prefix", self.filenames[0]
+        )
+        self.assertEqual("changed", self.objects["prefix/file_0.tif"])
+
+        manager.upload_file("prefix", self.filenames[0], replace=True)
+        self.assertEqual("content 0", self.objects["prefix/file_0.tif"])
+
+        self.assertEqual([], self.get_requests("HEAD"))
+        self.assertEqual([], self.get_requests("DELETE"))
+        self.assertEqual(3, len(self.get_requests("PUT")))
+
+    def test_concurrent_operations(self):
+        manager = self.get_manager(workers=4, upload_precheck=False)
+
+        start = time()
+        manager.upload_files("prefix", self.filenames)
+        # sequentially, the uploads would take at least 0.8 seconds
+        self.assertTrue(time() - start < 0.6)
+        self.assertEqual(8, len(self.objects))
+
+        items = [
+            (
+                manager.get_vsi_filename("prefix/file_%d.tif" % i),
+                join(self.tmp_dir, "download_%d.tif" % i)
+            ) for i in range(8)
+        ]
+        manager.download_files(items)
+        for i, (_, local_path) in enumerate(items):
+            with open(local_path) as f:
+                self.assertEqual("content %d" % i, f.read())
+
+        manager.delete_files(manager.list_contents("prefix"))
+        self.assertEqual({}, self.objects)
+        self.assertTrue(len(self.clients) <= 4)
+
+    def test_statistics(self):
+        manager = self.get_manager(upload_precheck=False)
+        manager.upload_files("prefix", self.filenames[:3])
+        self.assertRaises(
+            Exception, manager.delete_files,
+            ["prefix/file_0.tif", "prefix/missing.tif"]
+        )
+
+        statistics = manager.get_statistics()
+        self.assertEqual(3, statistics["upload"]["count"])
+        self.assertEqual(0, statistics["upload"]["failed"])
+        self.assertTrue(statistics["upload"]["mean"] >= self.latency)
+        # the failed deletion is tried three times
+        self.assertEqual(4, statistics["delete"]["count"])
+        self.assertEqual(3, statistics["delete"]["failed"])
+
+
+class SwiftLargeObjectTestCase(SwiftStubMixIn, TestCase):
+    """ Checks the segmented upload of large files including the retry of
+    single segments and the resumption of interrupted uploads.
+    """
+
+    segment_prefix = ".segments/prefix/large.tif/4500/1000"
+
+    def setUp(self):
+        super(SwiftLargeObjectTestCase, self).setUp()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filename = join(self.tmp_dir, "large.tif")
+        self.content = "".join(chr(i % 251) for i in range(4500))
+        with open(self.filename, "wb") as f:
+            f.write(self.content)
+
+    def tearDown(self):
+        super(SwiftLargeObjectTestCase, self).tearDown()
+        shutil.rmtree(self.tmp_dir)
+
+    def get_manager(self, **kwargs):
+        return SwiftFileManager(
+            self.container, StaticAuthManager(), self.storage_url,
+            segment_size=1000, **kwargs
+        )
+
+    def get_segment(self, index):
+        return "%s/%08d" % (self.segment_prefix, index)
+
+    def get_segment_puts(self, index):
+        return [
+            path for path in self.get_requests("PUT")
+            if path.endswith(self.get_segment(index))
+        ]
+
+    def download(self, manager):
+        local_path = join(self.tmp_dir, "download.tif")
+        manager.download_file("prefix/large.tif", local_path)
+        with open(local_path, "rb") as f:
+            return f.read()
+
+    def test_static_large_object(self):
+        manager = self.get_manager()
+        manager.upload_file("prefix", self.filename)
+
+        self.assertEqual(6, len(self.get_requests("PUT")))
+        self.assertEqual(self.content, self.download(manager))
+        self.assertEqual(["prefix/large.tif"], manager.list_contents("prefix"))
+
+        self.assertRaises(
+            SwiftFileExistsError, manager.upload_file, "prefix", self.filename
+        )
+
+        manager.delete_file("prefix/large.tif")
+        self.assertEqual({}, self.objects)
+
+    def test_dynamic_large_object(self):
+        manager = self.get_manager(large_object="dlo")
+        manager.upload_file("prefix", self.filename)
+
+        self.assertEqual(self.content, self.download(manager))
+
+        manager.delete_file("prefix/large.tif")
+        self.assertEqual({}, self.objects)
+
+    def test_segment_retry(self):
+        self.failures[self.get_segment(2)] = 2
+        manager = self.get_manager()
+        manager.upload_file("prefix", self.filename)
+
+        self.assertEqual(3, len(self.get_segment_puts(2)))
+        self.assertEqual(1, len(self.get_segment_puts(3)))
+        self.assertEqual(self.content, self.download(manager))
+        self.assertEqual(
+            2, manager.get_statistics()["upload_segment"]["failed"]
+        )
+
+    def test_checksum_mismatch(self):
+        self.corruptions[self.get_segment(1)] = 1
+        manager = self.get_manager()
+        manager.upload_file("prefix", self.filename)
+
+        self.assertEqual(2, len(self.get_segment_puts(1)))
+        self.assertEqual(self.content, self.download(manager))
+
+    def test_resume(self):
+        self.failures[self.get_segment(3)] = 3
+        manager = self.get_manager()
+        self.assertRaises(
+            Exception, manager.upload_file, "prefix", self.filename
+        )
+        self.assertFalse("prefix/large.tif" in self.objects)
+
+        del self.requests[:]
+        manager.upload_file("prefix", self.filename)
+
+        # only the missing segment and the manifest are uploaded
+        self.assertEqual(1, len(self.get_segment_puts(3)))
+        self.assertEqual(2, len(self.get_requests("PUT")))
+        self.assertEqual(self.content, self.download(manager))
+
+    def test_resume_key(self):
+        self.failures[".segments/prefix/browse/4500/1000/00000003"] = 3
+        manager = self.get_manager()
+        self.assertRaises(
+            Exception, manager.upload_file, "prefix", self.filename,
+            "first.tif", key="browse"
+        )
+
+        # the file is uploaded under another name by the next attempt
+        del self.requests[:]
+        manager.upload_file("prefix", self.filename, "second.tif",
+                            key="browse")
+
+        self.assertEqual(2, len(self.get_requests("PUT")))
+        self.assertEqual(["prefix/second.tif"], manager.list_contents("prefix"))
+
+    def test_resume_missing_segment(self):
+        self.failures[self.get_segment(3)] = 3
+        manager = self.get_manager()
+        self.assertRaises(
+            Exception, manager.upload_file, "prefix", self.filename
+        )
+
+        # a recorded segment removed from the storage meanwhile
+        del self.objects[self.get_segment(1)]
+        del self.requests[:]
+        manager.upload_file("prefix", self.filename)
+
+        self.assertEqual(1, len(self.get_segment_puts(1)))
+        self.assertEqual(1, len(self.get_segment_puts(3)))
+        self.assertEqual(3, len(self.get_requests("PUT")))
+        self.assertEqual(self.content, self.download(manager))
+
+    def test_manifest_failure(self):
+        self.failures["prefix/large.tif"] = 3
+        manager = self.get_manager()
+        self.assertRaises(
+            Exception, manager.upload_file, "prefix", self.filename
+        )
+
+        # the segments are verified and the manifest is uploaded again
+        del self.requests[:]
+        manager.upload_file("prefix", self.filename)
+        self.assertEqual(1, len(self.get_requests("PUT")))
+        self.assertEqual(self.content, self.download(manager))
+
+    def test_delete_stale_segments(self):
+        manager = self.get_manager()
+        manager.upload_file("prefix", self.filename)
+        self.failures["prefix/interrupted.tif"] = 3
+        self.assertRaises(
+            Exception, manager.upload_file, "prefix", self.filename,
+            "interrupted.tif"
+        )
+
+        # only segments older than the maximum age are deleted
+        self.assertEqual(0, manager.delete_stale_segments(3600))
+        for name in self.modified:
+            self.modified[name] -= timedelta(hours=2)
+        self.assertEqual(5, manager.delete_stale_segments(3600))
+
+        self.assertEqual([], manager.list_contents(
+            ".segments/prefix/interrupted.tif/"
+        ))
+        self.assertEqual(self.content, self.download(manager))
+
+    def test_delete_failure(self):
+        manager = self.get_manager()
+        manager.upload_file("prefix", self.filename)
+
+        self.delete_failures["prefix/large.tif"] = 3
+        self.assertRaises(Exception, manager.delete_file, "prefix/large.tif")
+        self.assertTrue("prefix/large.tif" in self.objects)
+
+        self.assertRaises(Exception, manager.delete_file, "prefix/other.tif")
+
+        manager.delete_file("prefix/large.tif")
+        self.assertEqual({}, self.objects)
+
+
+class IngestResumeLargeObjectTestCase(KeystoneStubMixIn, SwiftStubMixIn,
+                                      BaseTestCaseMixIn, HttpMixIn,
+                                      TransactionTestCase):
+    """ Checks that the segments uploaded by a failed ingestion of a browse
+    are reused when the browse is ingested again.
+    """
+
+    request_file = "reference_test_data/browseReport_ASA_IM__0P_20100722_213840.xml"
+    storage_optimized_prefix = "TEST_SAR/2010/"
+    segment_prefix = ".segments/TEST_SAR/2010/b_id_1/"
+
+    configuration = {
+        (STORAGE_SECTION, "method"): "swift",
+        (STORAGE_SECTION, "container"): SwiftStubMixIn.container,
+        (STORAGE_SECTION, "segment_size"): "1024",
+        (STORAGE_SECTION, "workers"): "1",
+        (INGEST_SECTION, "leave_original"): "true",
+    }
+
+    def setUp_config(self):
+        super(IngestResumeLargeObjectTestCase, self).setUp_config()
+        config = get_ngeo_config()
+        for option, value in self.auth_config.items():
+            if value is not None:
+                config.set(SWIFT_SECTION, option, value)
+
+    def setUp_ingest(self):
+        super(IngestResumeLargeObjectTestCase, self).setUp_ingest()
+
+        # the first segment fails in all tries of the first attempt
+        self.failures[self.segment_prefix] = 3
+        self.first_response = self.execute()
+        self.first_files = self.get_storage_file_list(
+            self.storage_optimized_prefix
+        )
+        self.first_requests = len(self.requests)
+
+    def test_failed_attempt(self):
+        self.assertTrue(
+            "<bsi:status>failure</bsi:status>" in self.first_response.content
+        )
+        self.assertEqual([], self.first_files)
+
+    def test_resumed_upload(self):
+        puts = [
+            path for command, path in self.requests[self.first_requests:]
+            if command == "PUT"
+        ]
+        # only the failed segment and the manifest are uploaded again
+        self.assertEqual(2, len(puts))
+        self.assertTrue(self.segment_prefix in puts[0])
+        self.assertTrue(puts[0].endswith("/00000000"))
+
+        files = self.get_storage_file_list(self.storage_optimized_prefix)
+        self.assertEqual(
+            ["ASA_IM__0P_20100722_213840_proc.tif"],
+            [file_[33:] for file_ in files]
+        )
+        self.assertTrue(models.Browse.objects.filter(
+            browse_identifier__value="b_id_1"
+        ).exists())
+
+
+#===============================================================================
+# Remote file cache test cases
+#===============================================================================
+
+class FileCacheTestCase(TestCase):
+    """ Checks the versioning and the LRU eviction of the file cache. """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache = FileCache(join(self.tmp_dir, "cache"), 350)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def add(self, path, etag, content):
+        filename = join(self.tmp_dir, "file")
+        with open(filename, "w") as f:
+            f.write(content)
+        return self.cache.add(path, etag, filename)
+
+    def test_versions(self):
+        self.assertEqual(None, self.cache.get("a/b.tif", "1"))
+        cache_path = self.add("a/b.tif", "1", "x" * 10)
+        self.assertEqual(cache_path, self.cache.get("a/b.tif", "1"))
+        self.assertTrue(cache_path.endswith(".tif"))
+
+        # a new version replaces the old one
+        self.add("a/b.tif", "2", "y" * 10)
+        self.assertEqual(None, self.cache.get("a/b.tif", "1"))
+        self.assertEqual(1, len(listdir(self.cache.directory)))
+
+        self.cache.remove("a/b.tif")
+        self.assertEqual(None, self.cache.get("a/b.tif", "2"))
+        self.assertEqual(
+            {"hits": 1, "misses": 3, "evictions": 0},
+            self.cache.get_statistics()
+        )
+
+    def test_eviction(self):
+        for i in range(3):
+            self.add("file_%d.tif" % i, "1", "x" * 100)
+            # ensure distinct access times
+            sleep(0.01)
+
+        # file_0 is accessed, so file_1 is the least recently used one
+        self.assertNotEqual(None, self.cache.get("file_0.tif", "1"))
+        self.assertEqual(0, self.cache.get_statistics()["evictions"])
+
+        self.add("file_3.tif", "1", "x" * 100)
+        self.assertEqual(None, self.cache.get("file_1.tif", "1"))
+        for i in (0, 2, 3):
+            self.assertNotEqual(None, self.cache.get("file_%d.tif" % i, "1"))
+        self.assertEqual(1, self.cache.get_statistics()["evictions"])
+        self.assertEqual(300, self.cache.get_size())
+
+
+class SwiftFileCacheTestCase(SwiftStubMixIn, TestCase):
+    """ Checks that remote files are read through the local cache. """
+
+    def setUp(self):
+        super(SwiftFileCacheTestCase, self).setUp()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.manager = SwiftFileManager(
+            self.container, StaticAuthManager(), self.storage_url,
+            cache=FileCache(join(self.tmp_dir, "cache"), 1024 * 1024)
+        )
+        self.objects["layer/2010/browse.tif"] = "browse content"
+
+    def tearDown(self):
+        super(SwiftFileCacheTestCase, self).tearDown()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_read_through(self):
+        vsi_path = self.manager.get_vsi_filename("layer/2010/browse.tif")
+        cache_path = self.manager.get_cached_file(vsi_path)
+        self.assertEqual(cache_path, self.manager.get_cached_file(vsi_path))
+        with open(cache_path) as f:
+            self.assertEqual("browse content", f.read())
+        self.assertEqual(1, len(self.get_requests("GET")))
+
+        # a changed object is downloaded again
+        self.objects["layer/2010/browse.tif"] = "changed content"
+        with self.manager.local_file(vsi_path) as local_path:
+            with open(local_path) as f:
+                self.assertEqual("changed content", f.read())
+        self.assertEqual(2, len(self.get_requests("GET")))
+        self.assertEqual(
+            {"hits": 1, "misses": 2, "evictions": 0},
+            self.manager.cache.get_statistics()
+        )
+
+    def test_upload_write_through(self):
+        filename = join(self.tmp_dir, "new.tif")
+        with open(filename, "w") as f:
+            f.write("new content")
+
+        etag = self.manager.upload_file("layer/2011", filename)
+        self.manager.cache_file("layer/2011/new.tif", etag, filename)
+        self.assertFalse(exists(filename))
+
+        cache_path = self.manager.get_cached_file("layer/2011/new.tif")
+        with open(cache_path) as f:
+            self.assertEqual("new content", f.read())
+        self.assertEqual([], self.get_requests("GET"))
+
+        self.manager.delete_file("layer/2011/new.tif")
+        self.assertFalse(exists(cache_path))
+
+
+#===============================================================================
+# Shared Keystone token test cases
+#===============================================================================
+
+class SharedTokenTestCase(KeystoneStubMixIn, TestCase):
+    """ Checks that Keystone tokens are shared via the token cache file. """
+
+    def setUp(self):
+        super(SharedTokenTestCase, self).setUp()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.token_cache = join(self.tmp_dir, "token.json")
+
+    def tearDown(self):
+        super(SharedTokenTestCase, self).tearDown()
+        shutil.rmtree(self.tmp_dir)
+
+    def get_manager(self, token_cache=None, refresh_margin=300):
+        if token_cache is None:
+            token_cache = self.token_cache
+        return AuthTokenManager(self.auth_config, token_cache, refresh_margin)
+
+    def test_shared_token(self):
+        first, second = self.get_manager(), self.get_manager()
+        self.assertEqual("token-1", first.get_auth_token())
+        self.assertEqual("token-1", second.get_auth_token())
+        self.assertEqual(
+            "http://localhost/v1/AUTH_test", second.get_storage_url()
+        )
+
+        self.assertEqual(1, len(self.token_requests))
+        self.assertEqual(
+            {"keystone_requests": 0, "avoided_requests": 1},
+            second.get_statistics()
+        )
+
+    def test_unshared_token(self):
+        first, second = self.get_manager(""), self.get_manager("")
+        first.get_auth_token()
+        second.get_auth_token()
+        self.assertEqual(2, len(self.token_requests))
+
+    def test_proactive_refresh(self):
+        self.expires_in = 200
+        first = self.get_manager()
+        self.assertEqual("token-1", first.get_auth_token())
+
+        # the shared token is still valid long enough
+        self.assertEqual(
+            "token-1", self.get_manager(refresh_margin=60).get_auth_token()
+        )
+        # the shared token is about to expire and is refreshed
+        self.assertEqual("token-2", self.get_manager().get_auth_token())
+        self.assertEqual(2, len(self.token_requests))
+
+    def test_locked_refresh(self):
+        self.expires_in = 200
+        manager = self.get_manager()
+        manager.get_auth_token()
+
+        # while another process refreshes the token, the current token is
+        # used until it actually expires
+        manager.token_cache.lock_timeout = 0.1
+        with manager.token_cache.lock():
+            self.assertEqual("token-1", manager.get_auth_token())
+        self.assertEqual(1, len(self.token_requests))
+
+    def test_inaccessible_cache(self):
+        manager = self.get_manager(join(self.tmp_dir, "missing", "token.json"))
+        self.assertEqual("token-1", manager.get_auth_token())
+        self.assertEqual("token-1", manager.get_auth_token())
+        self.assertEqual(1, len(self.token_requests))
+
+    def test_group_permissions(self):
+        self.get_manager().get_auth_token()
+        self.assertEqual(0660, stat(self.token_cache).st_mode & 0777)
+
+
+#===============================================================================
+# Browse download test cases
+#===============================================================================
+
+class BrowseDownloadTestCase(FileServerMixIn, TestCase):
+    """ Checks the streaming, resumable download and the prefetching of
+    browses referenced by URL.
+    """
+
+    def setUp(self):
+        super(BrowseDownloadTestCase, self).setUp()
+        self.tmp_dir = tempfile.mkdtemp()
+        for i in range(4):
+            self.served_files["/browse_%d.tif" % i] = (
+                "".join(chr((i + j) % 256) for j in range(100000))
+            )
+
+    def tearDown(self):
+        super(BrowseDownloadTestCase, self).tearDown()
+        shutil.rmtree(self.tmp_dir)
+
+    def get_filename(self, url):
+        return join(self.tmp_dir, url.rsplit("/", 1)[1])
+
+    def read(self, filename):
+        with open(filename, "rb") as f:
+            return f.read()
+
+    def test_download(self):
+        url = self.file_server_url + "/browse_0.tif"
+        filename = self.get_filename(url)
+        result = download_file(url, filename, chunk_size=4096)
+
+        self.assertEqual(self.served_files["/browse_0.tif"], self.read(filename))
+        self.assertEqual(100000, result.size)
+        self.assertEqual(0, result.resumed_from)
+        self.assertFalse(exists(filename + PARTIAL_EXT))
+
+    def test_resume(self):
+        url = self.file_server_url + "/browse_1.tif"
+        filename = self.get_filename(url)
+        with open(filename + PARTIAL_EXT, "wb") as f:
+            f.write(self.served_files["/browse_1.tif"][:30000])
+
+        result = download_file(url, filename)
+        self.assertEqual(self.served_files["/browse_1.tif"], self.read(filename))
+        self.assertEqual(30000, result.resumed_from)
+        self.assertEqual("bytes=30000-", self.request_headers[0]["range"])
+
+    def test_resume_unsupported(self):
+        self.support_ranges = False
+        url = self.file_server_url + "/browse_1.tif"
+        filename = self.get_filename(url)
+        with open(filename + PARTIAL_EXT, "wb") as f:
+            f.write("garbage")
+
+        result = download_file(url, filename)
+        self.assertEqual(self.served_files["/browse_1.tif"], self.read(filename))
+        self.assertEqual(0, result.resumed_from)
+
+    def test_prefetch(self):
+        locations = [
+            self.file_server_url + "/browse_%d.tif" % i for i in range(4)
+        ]
+        locations.insert(2, None)
+        prefetcher = BrowsePrefetcher(locations, 2, self.get_filename)
+
+        prefetcher.advance(0)
+        self.assertTrue(locations[1] in prefetcher)
+        self.assertFalse(locations[3] in prefetcher)
+
+        result = prefetcher.get(locations[0])
+        self.assertEqual(100000, result.size)
+        self.assertTrue(result.wait_time >= 0)
+        self.assertFalse(locations[0] in prefetcher)
+
+        prefetcher.advance(1)
+        self.assertTrue(locations[3] in prefetcher)
+        prefetcher.get(locations[1])
+
+        # files prefetched but not retrieved are removed
+        prefetcher.close()
+        self.assertTrue(exists(self.get_filename(locations[1])))
+        self.assertFalse(exists(self.get_filename(locations[3])))
+
+
+#===============================================================================
+# System initialization test cases
+#===============================================================================
+
+class InitSystemTestCase(TestCase):
+    """ Test that the EOxServer system is initialized once per process. """
+
+    class CountingSystem(object):
+        calls = 0
+
+        @classmethod
+        def init(cls):
+            cls.calls += 1
+
+    def setUp(self):
+        self.system = system.System
+        self.initialized = system._initialized
+        system.System = self.CountingSystem
+        system._initialized = False
+        self.CountingSystem.calls = 0
+
+    def tearDown(self):
+        system.System = self.system
+        system._initialized = self.initialized
+
+    def test_init_once(self):
+        system.init_system()
+        system.init_system()
+        self.assertTrue(system.is_system_initialized())
+        self.assertEqual(1, self.CountingSystem.calls)
+
+        system.init_system(force=True)
+        self.assertEqual(2, self.CountingSystem.calls)
+
+
+#===============================================================================
+# Access log aggregation test cases
+#===============================================================================
+
+class AccessLogAggregatorTestCase(TestCase):
+    """ Checks the incremental aggregation of the access log against the
+    aggregation of all lines.
+    """
+
+    line = (
+        '10.0.2.2 - - [%s +0000] "GET /c/wmts/?SERVICE=WMTS&REQUEST=GetTile'
+        '&LAYER=%s HTTP/1.1" %s 100 "-" "Mozilla" 10 "%s"\n'
+    )
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filename = join(self.tmp_dir, "access.log")
+        self.state_dir = join(self.tmp_dir, "state")
+        self.start = datetime(2014, 4, 28)
+        self.random = Random(0)
+        open(self.filename, "w").close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def append(self, minutes, count):
+        """ Appends `count` requests starting `minutes` after the start. """
+        with open(self.filename, "a") as f:
+            for i in range(count):
+                dt = self.start + timedelta(minutes=minutes + i)
+                f.write(self.line % (
+                    dt.strftime("%d/%b/%Y:%H:%M:%S"),
+                    self.random.choice(["layerA", "layerB"]),
+                    self.random.choice(["200", "304", "404"]),
+                    self.random.choice(["-", "user"]),
+                ))
+
+    def aggregate(self, state_dir, begin=None, end=None):
+        aggregator = AccessLogAggregator(self.filename, state_dir)
+        aggregator.update()
+        return sorted(aggregator.aggregate(begin, end)), aggregator.bytes_read
+
+    def test_parse_access_time(self):
+        self.assertEqual(
+            1398690008, parse_access_time("28/Apr/2014:13:00:08 +0000")
+        )
+        self.assertEqual(
+            1398690008, parse_access_time("28/Apr/2014:15:00:08 +0200")
+        )
+        self.assertRaises(ValueError, parse_access_time, "28/Foo/2014:13:00:08 +0000")
+        self.assertRaises(ValueError, parse_access_time, "2014-04-28T13:00:08Z")
+
+    def test_incremental(self):
+        begin = parse_access_time("28/Apr/2014:01:30:00 +0000")
+        end = parse_access_time("28/Apr/2014:05:10:30 +0000")
+        size = 0
+        for minutes in (0, 150, 300):
+            self.append(minutes, 150)
+            expected = self.aggregate(None, begin, end)[0]
+            records, bytes_read = self.aggregate(self.state_dir, begin, end)
+            self.assertEqual(expected, records)
+            # only the appended lines are read
+            self.assertEqual(getsize(self.filename) - size, bytes_read)
+            size = getsize(self.filename)
+
+        self.assertEqual(
+            self.aggregate(None)[0], self.aggregate(self.state_dir)[0]
+        )
+        self.assertEqual(0, self.aggregate(self.state_dir)[1])
+
+        # a rotated log is read from the beginning
+        remove(self.filename)
+        self.append(0, 10)
+        records, bytes_read = self.aggregate(self.state_dir)
+        self.assertEqual(self.aggregate(None)[0], records)
+        self.assertEqual(getsize(self.filename), bytes_read)
+
+
+#===============================================================================
+# Streaming report test cases
+#===============================================================================
+
+class StreamingReportTestCase(TestCase):
+    """ Checks that reports are generated in chunks of bounded size and that
+    the memory used to generate a report does not depend on the number of
+    records. The latter generates a large report and only runs when the
+    NGEO_SLOW_TESTS environment variable is set.
+    """
+
+    line_count = 20000
+    large_line_count = 2000000
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.report_logfile = join(self.tmp_dir, "report.log")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_report_log(self, line_count):
+        start = datetime(2014, 1, 1)
+        with open(self.report_logfile, "w") as f:
+            f.writelines(
+                "/\\/\\".join((
+                    (start + timedelta(seconds=i)).isoformat("T") + "Z",
+                    "TYPE_%d" % (i % 7), "LAYER", "2014-01-01T00:00:00Z",
+                    "2014-01-01T00:01:00Z"
+                )) + "\n"
+                for i in xrange(line_count)
+            )
+
+    def get_rss(self):
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * sysconf("SC_PAGE_SIZE")
+
+    def count_rows(self, chunks):
+        rows = 0
+        tail = ""
+        for chunk in chunks:
+            self.assertTrue(len(chunk) <= REPORT_CHUNK_SIZE)
+            # count the rows also across chunk boundaries
+            rows += (tail + chunk).count("</ROW>")
+            tail = chunk[-5:]
+        return rows
+
+    def test_chunks(self):
+        self.write_report_log(self.line_count)
+        chunks = list(
+            iter_report_xml(None, None, None, self.report_logfile)
+        )
+        self.assertEqual(self.line_count, self.count_rows(chunks))
+        self.assertTrue(len(chunks) > 1)
+
+    def test_bounded_memory(self):
+        if not environ.get("NGEO_SLOW_TESTS"):
+            self.skipTest("NGEO_SLOW_TESTS not set")
+        if not exists("/proc/self/statm"):
+            self.skipTest("RSS of the process not available")
+
+        self.write_report_log(self.large_line_count)
+        rss = [self.get_rss()]
+
+        def measured(chunks):
+            for index, chunk in enumerate(chunks):
+                if index % 100 == 0:
+                    rss.append(self.get_rss())
+                yield chunk
+
+        rows = self.count_rows(measured(
+            iter_report_xml(None, None, None, self.report_logfile)
+        ))
+
+        self.assertEqual(self.large_line_count, rows)
+        self.assertTrue(
+            max(rss) - rss[0] < 50 * 1024 * 1024,
+            "RSS increased by %d bytes." % (max(rss) - rss[0])
+        )
+
+
+#===============================================================================
+# Footprint seeding test cases
+#===============================================================================
+
+class FootprintTilesTestCase(TestCase):
+    """ Checks the tiles planned for seeding against the tiles intersecting a
+    diagonal swath.
+    """
+
+    # a diagonal swath, like a polar orbit datatake, not touching any tile
+    # boundaries of the tested zoom levels
+    footprint = GEOSGeometry(
+        "POLYGON((0.3 40.2, 1.3 39.2, 11.3 49.2, 10.3 50.2, 0.3 40.2))",
+        srid=4326
+    )
+
+    def get_intersecting_tiles(self, geometry, grid, zoom):
+        (origin_x, origin_y, _, _), _, _ = tiling.GRIDS[grid]
+        width, height = tiling.get_tile_size(grid, zoom)
+        cols, rows = tiling.get_grid_size(grid, zoom)
+        return set(
+            (col, row) for col in range(cols) for row in range(rows)
+            if Polygon.from_bbox((
+                origin_x + col * width, origin_y + row * height,
+                origin_x + (col + 1) * width, origin_y + (row + 1) * height
+            )).intersects(geometry)
+        )
+
+    def test_exact_tiles(self):
+        for grid in ("WGS84", "GoogleMapsCompatible"):
+            geometry = tiling.to_grid_geometry(self.footprint, grid)
+            for zoom in range(7):
+                tiles = tiling.get_footprint_tiles([geometry], grid, zoom)
+                self.assertEqual(
+                    self.get_intersecting_tiles(geometry, grid, zoom),
+                    set(
+                        (col, row)
+                        for row, ranges in tiles.items()
+                        for first, last in ranges
+                        for col in range(first, last + 1)
+                    )
+                )
+
+    def test_rectangles(self):
+        tiles = tiling.get_footprint_tiles([self.footprint], "WGS84", 8)
+        rectangles = tiling.get_tile_rectangles(tiles, 4)
+        self.assertEqual(4, len(rectangles))
+
+        covered = []
+        for first_col, first_row, last_col, last_row in rectangles:
+            covered.extend(
+                (col, row)
+                for col in range(first_col, last_col + 1)
+                for row in range(first_row, last_row + 1)
+            )
+        # the rectangles do not overlap and cover all tiles
+        self.assertEqual(len(covered), len(set(covered)))
+        for row, ranges in tiles.items():
+            for first, last in ranges:
+                for col in range(first, last + 1):
+                    self.assertTrue((col, row) in covered)
+
+    def test_dateline(self):
+        footprint = GEOSGeometry(
+            "POLYGON((175 10, 185 10, 185 20, 175 20, 175 10))", srid=4326
+        )
+        # tiles of zoom level 3 are 22.5 degrees wide
+        plan = tiling.get_seed_plan([footprint], "WGS84", 3, 3)
+        extents = sorted(extent for _, extent in plan.extents)
+        self.assertEqual(2, len(extents))
+        self.assertAlmostEqual(-180, extents[0][0], 3)
+        self.assertAlmostEqual(-157.5, extents[0][2], 3)
+        self.assertAlmostEqual(157.5, extents[1][0], 3)
+        self.assertAlmostEqual(180, extents[1][2], 3)
+        self.assertTrue(-180 < extents[0][0] and extents[1][2] < 180)
+
+    def test_seed_plan(self):
+        plan = tiling.get_seed_plan([self.footprint], "WGS84", 0, 10)
+        extent_tiles = sum(
+            tiling.count_extent_tiles("WGS84", zoom, self.footprint.extent)
+            for zoom in range(11)
+        )
+        self.assertEqual(plan.tiles, sum(
+            tiling.count_extent_tiles("WGS84", zoom, extent)
+            for zoom, extent in plan.extents
+        ))
+        self.assertTrue(plan.footprint_tiles <= plan.tiles)
+        self.assertTrue(plan.tiles < extent_tiles / 2)
+
+
+#===============================================================================
+# In-process tile rendering
+#===============================================================================
+
+class TileRenderTestCase(TestCase):
+    """ Renders the tiles of a small browse into a tileset and deletes them
+    again.
+    """
+
+    dim = "2010-07-22T21:38:40Z/2010-07-22T21:40:38Z"
+    # a browse covering exactly one tile of zoom level 3 of the WGS84 grid
+    extent = (0, 45, 22.5, 67.5)
+
+    def setUp(self):
+        self.path = tempfile.mktemp(suffix=".sqlite")
+        self.browse_path = tempfile.mktemp(suffix=".tif")
+
+        # no black pixels, being the offsite color of RGB browses
+        row = "".join(chr(1 + i % 255) for i in range(512))
+        self.create_browse([row * 512] * 3)
+
+        self.footprint = Polygon.from_bbox(self.extent)
+
+    def create_browse(self, bands, color_table=None):
+        ds = gdal.GetDriverByName("GTiff").Create(
+            self.browse_path, 512, 512, len(bands), gdal.GDT_Byte
+        )
+        ds.SetGeoTransform((0, 22.5 / 512, 0, 67.5, 0, -22.5 / 512))
+        srs = osr.SpatialReference()
+        srs.ImportFromEPSG(4326)
+        ds.SetProjection(srs.ExportToWkt())
+        for index, data in enumerate(bands, 1):
+            ds.GetRasterBand(index).WriteRaster(0, 0, 512, 512, data)
+        if color_table:
+            ds.GetRasterBand(1).SetColorTable(color_table)
+        ds.BuildOverviews("NEAREST", [2, 4])
+        ds = None
+
+    def render_tiles(self):
+        tasks = render.get_render_tasks("WGS84", 3, 4, self.extent)
+        render.render_tiles(
+            self.path, "TEST_SAR", "WGS84", self.dim,
+            [(self.browse_path, self.footprint)], tasks
+        )
+        with tileset.open(self.path) as ts:
+            return dict(
+                ((x, y, z), f.read()) for _, _, x, y, z, _, f
+                in ts.get_tiles("TEST_SAR", "WGS84", self.dim)
+            )
+
+    def tearDown(self):
+        for path in (self.path, self.browse_path):
+            if exists(path):
+                remove(path)
+
+    def test_render_and_delete(self):
+        tasks = render.get_render_tasks("WGS84", 2, 4, self.extent)
+        self.assertEqual(1 + 1 + 4, render.count_task_tiles(tasks))
+
+        # a tile not intersecting the browse
+        tasks.append((3, 0, 0, 0))
+        count = render.render_tiles(
+            self.path, "TEST_SAR", "WGS84", self.dim,
+            [(self.browse_path, self.footprint)], tasks
+        )
+        self.assertEqual(7, count)
+
+        with tileset.open(self.path) as ts:
+            tiles = dict(
+                ((x, y, z), f.read()) for _, _, x, y, z, _, f
+                in ts.get_tiles("TEST_SAR", "WGS84", self.dim)
+            )
+        self.assertEqual(7, len(tiles))
+        # partially covered tile
+        self.assertTrue(tiles[(4, 3, 2)].startswith("\x89PNG"))
+        # fully covered tiles
+        self.assertTrue(tiles[(8, 6, 3)].startswith("\xff\xd8"))
+        self.assertTrue(tiles[(17, 13, 4)].startswith("\xff\xd8"))
+        self.assertEqual(render.BLANK_TILE, tiles[(0, 0, 3)])
+
+        self.assertEqual(6, delete_tiles(
+            self.path, "TEST_SAR", "WGS84", self.dim, 2, 4, self.extent
+        ))
+        with tileset.open(self.path) as ts:
+            self.assertEqual(
+                [(0, 0, 3)],
+                [tile[2:5] for tile in ts.get_tiles("TEST_SAR", "WGS84")]
+            )
+
+    def test_render_in_daemon(self):
+        tasks = render.get_render_tasks("WGS84", 2, 4, self.extent)
+        count = run_in_daemon(
+            render.render_tiles, self.path, "TEST_SAR", "WGS84", self.dim,
+            [(self.browse_path, self.footprint)], tasks, 2
+        )
+        self.assertEqual(6, count)
+        with tileset.open(self.path) as ts:
+            self.assertEqual(
+                6, len(list(ts.get_tiles("TEST_SAR", "WGS84", self.dim)))
+            )
+
+    def test_dateline_tasks(self):
+        footprint = GEOSGeometry(
+            "POLYGON((175 10, 185 10, 185 20, 175 20, 175 10))", srid=4326
+        )
+        tasks = render.get_render_tasks(
+            "WGS84", 3, 3, footprint.extent, [footprint]
+        )
+        self.assertEqual([(3, 4, 0, 0), (3, 4, 15, 15)], sorted(tasks))
+
+    def test_palette(self):
+        # the western half is red, the eastern one transparent
+        color_table = gdal.ColorTable()
+        color_table.SetColorEntry(0, (0, 0, 0, 0))
+        color_table.SetColorEntry(1, (255, 0, 0, 255))
+        self.create_browse(
+            [("\x01" * 256 + "\x00" * 256) * 512], color_table
+        )
+
+        tiles = self.render_tiles()
+        self.assertTrue(tiles[(8, 6, 3)].startswith("\x89PNG"))
+        self.assertEqual("#\x00\x00\xff\xff", tiles[(16, 13, 4)])
+        self.assertEqual(render.BLANK_TILE, tiles[(17, 13, 4)])
+
+    def test_nodata(self):
+        # the western half is black, i.e., offsite
+        self.create_browse([
+            ("\x00" * 256 + value * 256) * 512
+            for value in ("\x0a", "\x14", "\x1e")
+        ])
+
+        tiles = self.render_tiles()
+        self.assertTrue(tiles[(8, 6, 3)].startswith("\x89PNG"))
+        self.assertEqual(render.BLANK_TILE, tiles[(16, 13, 4)])
+        self.assertEqual("#\x1e\x14\x0a\xff", tiles[(17, 13, 4)])
+
+
+#===============================================================================
+# Incremental merging of cached time entries
+#===============================================================================
+
+class MergeTimeTilesTestCase(TestCase):
+    """ Checks the re-keying of the tiles of merged time entries. """
+
+    dims = [
+        "2010-07-22T10:00:00Z/2010-07-22T10:10:00Z",
+        "2010-07-22T10:20:00Z/2010-07-22T10:30:00Z",
+    ]
+    merged_dim = "2010-07-22T10:00:00Z/2010-07-22T10:30:00Z"
+
+    def setUp(self):
+        self.path = tempfile.mktemp(suffix=".sqlite")
+        ts = tileset.open(self.path, mode="w")
+        with ts.writer() as writer:
+            # zoom level 3, tiles are 22.5 degrees wide
+            for dim, cols in zip(self.dims, ([0, 1, 2, 3], [2, 3, 4, 12])):
+                for x in cols:
+                    data = dim if x != 3 or dim == self.dims[1] else \
+                        tileset.BLANK_TILE
+                    writer.add_tile("TEST_SAR", "WGS84", dim, x, 4, 3,
+                                    StringIO(data))
+
+    def tearDown(self):
+        remove(self.path)
+
+    def get_tiles(self):
+        with tileset.open(self.path) as ts:
+            return dict(
+                ((x, y, z), (dim, f.read())) for _, _, x, y, z, dim, f
+                in ts.get_tiles("TEST_SAR", "WGS84")
+            )
+
+    def test_merge_dims(self):
+        with tileset.open(self.path) as ts:
+            removed = ts.merge_dims(
+                "TEST_SAR", "WGS84", self.dims, self.merged_dim
+            )
+        # tile 2 exists in both, tile 3 is blank in the first dim only
+        self.assertEqual([(2, 4, 3)], removed)
+
+        tiles = self.get_tiles()
+        self.assertEqual(
+            [(0, 4, 3), (1, 4, 3), (3, 4, 3), (4, 4, 3), (12, 4, 3)],
+            sorted(tiles)
+        )
+        self.assertEqual(
+            set([self.merged_dim]), set(dim for dim, _ in tiles.values())
+        )
+        self.assertEqual(self.dims[1], tiles[(3, 4, 3)][1])
+
+    def test_merge_time_tiles(self):
+        # new browse over tile 12, the removed tile 2 extends the extent
+        extent = merge_time_tiles(
+            self.path, "TEST_SAR", "urn:ogc:def:wkss:OGC:1.0:GoogleCRS84Quad",
+            self.dims, self.merged_dim, (91, 10, 94, 12), (-170, 0, 95, 15),
+            3, 3
+        )
+        self.assertEqual((-135.0, 0, 94, 15), extent)
+        self.assertEqual(
+            [(0, 4, 3), (1, 4, 3), (3, 4, 3), (4, 4, 3)],
+            sorted(self.get_tiles())
+        )
+
+    def test_clip_footprints(self):
+        footprint = GEOSGeometry(
+            "POLYGON((0 0, 20 0, 20 20, 0 20, 0 0))", srid=4326
+        )
+        clipped = tiling.clip_footprints(
+            [footprint, footprint], "GoogleMapsCompatible",
+            (-20037508.34, -20037508.34, 1113194.9, 20037508.34)
+        )
+        self.assertEqual(2, len(clipped))
+        self.assertAlmostEqual(10, clipped[0].extent[2], 3)
+        self.assertEqual([], tiling.clip_footprints(
+            [footprint], "WGS84", (30, 0, 40, 10)
+        ))
+
+
+#===============================================================================
+# Tile deduplication
+#===============================================================================
+
+class DedupTileSetTestCase(TestCase):
+    """ Checks the deduplicating tileset schema and the compaction of
+    tilesets.
+    """
+
+    dim = "2010-07-22T10:00:00Z/2010-07-22T10:10:00Z"
+
+    def setUp(self):
+        self.path = tempfile.mktemp(suffix=".sqlite")
+
+    def tearDown(self):
+        remove(self.path)
+
+    def add_tiles(self, ts):
+        with ts.writer(on_conflict="REPLACE") as writer:
+            for x, data in enumerate(["a", "a", tileset.BLANK_TILE, "b", "a"]):
+                writer.add_tile("TEST_SAR", "WGS84", self.dim, x, 0, 3,
+                                StringIO(data))
+
+    def get_tiles(self):
+        with tileset.open(self.path) as ts:
+            return dict(
+                (x, f.read()) for _, _, x, _, _, _, f
+                in ts.get_tiles("TEST_SAR", "WGS84", self.dim)
+            )
+
+    def count_blobs(self):
+        connection = sqlite3.connect(self.path)
+        try:
+            return connection.execute(
+                "SELECT COUNT(*) FROM tile_blobs"
+            ).fetchone()[0]
+        finally:
+            connection.close()
+
+    def test_writer(self):
+        with tileset.open(self.path, mode="w", dedup=True) as ts:
+            self.assertTrue(ts.dedup)
+            self.add_tiles(ts)
+            # replacing the tiles releases the blob of "b"
+            with ts.writer(on_conflict="REPLACE") as writer:
+                writer.add_tile("TEST_SAR", "WGS84", self.dim, 3, 0, 3,
+                                StringIO("a"))
+                writer.add_tile("TEST_SAR", "WGS84", self.dim, 4, 0, 3,
+                                StringIO(tileset.BLANK_TILE))
+            self.assertEqual(1, writer.blank_count)
+
+        # blank tiles are kept, sharing a single blob
+        self.assertEqual(
+            {0: "a", 1: "a", 2: tileset.BLANK_TILE, 3: "a",
+             4: tileset.BLANK_TILE}, self.get_tiles()
+        )
+        self.assertEqual(2, self.count_blobs())
+
+    def test_mapcache_insert(self):
+        tileset.open(self.path, mode="w", dedup=True).close()
+        connection = sqlite3.connect(self.path)
+        with connection:
+            # the statement MapCache uses to store tiles
+            for x, data in ((0, "a"), (1, "a"), (0, "b"),
+                            (1, tileset.BLANK_TILE), (2, "b"),
+                            (3, tileset.BLANK_TILE)):
+                connection.execute(
+                    "insert or replace into tiles(tileset,grid,x,y,z,data,"
+                    "dim,ctime) values (?,?,?,?,?,?,?,datetime('now'))",
+                    ("TEST_SAR", "WGS84", x, 0, 3, buffer(data), self.dim)
+                )
+        connection.close()
+
+        tiles = {0: "b", 1: tileset.BLANK_TILE, 2: "b", 3: tileset.BLANK_TILE}
+        self.assertEqual(tiles, self.get_tiles())
+        # only the blank tiles reference the same blob right away
+        self.assertEqual(3, self.count_blobs())
+
+        with tileset.open(self.path) as ts:
+            stats = ts.compact()
+        self.assertEqual(1, stats["duplicates"])
+        self.assertEqual((4, 2), (stats["tiles"], stats["blobs"]))
+        self.assertEqual(tiles, self.get_tiles())
+
+    def test_compact(self):
+        with tileset.open(self.path, mode="w") as ts:
+            self.assertFalse(ts.dedup)
+            self.add_tiles(ts)
+            stats = ts.compact()
+            self.assertTrue(ts.dedup)
+
+        self.assertEqual(dict(tiles=5, blobs=3, duplicates=2, orphans=0),
+                         stats)
+        self.assertEqual({0: "a", 1: "a", 2: tileset.BLANK_TILE, 3: "b",
+                          4: "a"}, self.get_tiles())
+
+        with tileset.open(self.path) as ts:
+            self.assertTrue(ts.dedup)
+            self.assertEqual(1, ts.delete_tiles("TEST_SAR", "WGS84",
+                                                self.dim, bbox=(3, 0, 3, 0)))
+        self.assertEqual(2, self.count_blobs())
+
+
+class DedupMergeTimeTilesTestCase(MergeTimeTilesTestCase):
+    """ Checks the re-keying of the tiles of merged time entries in a
+    deduplicating tileset.
+    """
+
+    def setUp(self):
+        super(DedupMergeTimeTilesTestCase, self).setUp()
+        with tileset.open(self.path) as ts:
+            ts.compact()
+
+
+#===============================================================================
+# Time-sharded tilesets
+#===============================================================================
+
+class ShardedTileSetTestCase(TestCase):
+    """ Checks the moving of tiles between the shards of merged time entries.
+    """
+
+    dims = [
+        "2010-07-22T10:00:00Z/2010-07-22T10:10:00Z",
+        "2010-07-22T10:20:00Z/2010-07-22T10:30:00Z",
+    ]
+    merged_dim = "2010-07-22T10:00:00Z/2010-07-22T10:30:00Z"
+
+    def setUp(self):
+        self.shard_dir = tempfile.mkdtemp()
+        self.paths = [self.get_shard_path(dim) for dim in self.dims]
+        for dim, path, cols in zip(self.dims, self.paths, ([0, 1], [1, 2])):
+            with tileset.open(path, mode="w", dedup=dim == self.dims[1]) as ts:
+                with ts.writer() as writer:
+                    for x in cols:
+                        writer.add_tile("TEST_SAR", "WGS84", dim, x, 4, 3,
+                                        StringIO(dim))
+        # another browse layer of the same browse type
+        with tileset.open(self.paths[0]) as ts:
+            with ts.writer() as writer:
+                writer.add_tile("TEST_OPTICAL", "WGS84", self.dims[0], 0, 4,
+                                3, StringIO(self.dims[0]))
+
+    def tearDown(self):
+        shutil.rmtree(self.shard_dir)
+
+    def get_shard_path(self, dim):
+        return join(self.shard_dir, get_shard_name(dim))
+
+    def test_shard_name(self):
+        self.assertEqual(
+            "#2010-07-22T10:00:00Z#2010-07-22T10:10:00Z.sqlite",
+            get_shard_name(self.dims[0])
+        )
+
+    def test_move_tiles(self):
+        with tileset.open(self.paths[0]) as ts:
+            self.assertEqual(
+                (2, 0), ts.move_tiles(self.paths[1], "TEST_SAR", "WGS84")
+            )
+            self.assertEqual(
+                [(0, self.dims[0]), (1, self.dims[0]), (1, self.dims[1]),
+                 (2, self.dims[1])],
+                sorted(
+                    (x, dim) for _, _, x, _, _, dim, _
+                    in ts.get_tiles("TEST_SAR", "WGS84")
+                )
+            )
+
+    def test_merge_time_tiles(self):
+        merged_path = self.get_shard_path(self.merged_dim)
+        extent = merge_time_tiles(
+            merged_path, "TEST_SAR", "urn:ogc:def:wkss:OGC:1.0:GoogleCRS84Quad",
+            self.dims, self.merged_dim, (91, 10, 94, 12), (-170, 0, 95, 15),
+            3, 3, self.paths
+        )
+        # tile 1 exists in both entries
+        self.assertEqual((-157.5, 0, 94, 15), extent)
+
+        with tileset.open(merged_path) as ts:
+            self.assertEqual(
+                [(0, self.merged_dim), (2, self.merged_dim)],
+                sorted(
+                    (x, dim) for _, _, x, _, _, dim, _
+                    in ts.get_tiles("TEST_SAR", "WGS84")
+                )
+            )
+        # only the shard with tiles of the other browse layer is kept
+        self.assertFalse(exists(self.paths[1]))
+        with tileset.open(self.paths[0]) as ts:
+            self.assertEqual(0, len(list(ts.get_tiles("TEST_SAR", "WGS84"))))
+            self.assertEqual(
+                1, len(list(ts.get_tiles("TEST_OPTICAL", "WGS84")))
+            )
+
+    def test_unseed(self):
+        # as the time entries are un-seeded when merging their tiles failed
+        for dim in self.dims:
+            start_time, end_time = [
+                datetime.strptime(value, "%Y-%m-%dT%H:%M:%SZ")
+                for value in dim.split("/")
+            ]
+            seed_mapcache(
+                None, None, "TEST_SAR",
+                "urn:ogc:def:wkss:OGC:1.0:GoogleCRS84Quad",
+                -180, 0, -112.5, 22.5, 3, 3, start_time, end_time, 1, True,
+                renderer="internal", tileset_path=self.get_shard_path(dim),
+                tileset_sharded=True
+            )
+
+        # only the shard with tiles of the other browse layer is kept
+        self.assertFalse(exists(self.paths[1]))
+        with tileset.open(self.paths[0]) as ts:
+            self.assertEqual(0, len(list(ts.get_tiles("TEST_SAR", "WGS84"))))
+            self.assertEqual(
+                1, len(list(ts.get_tiles("TEST_OPTICAL", "WGS84")))
+            )
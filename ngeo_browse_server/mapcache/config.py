@@ -27,7 +27,8 @@
 # THE SOFTWARE.
 #-------------------------------------------------------------------------------
 
-from os.path import join
+from os import listdir
+from os.path import join, dirname, isdir, isfile
 
 from ngeo_browse_server.config import get_ngeo_config, safe_get, get_project_relative_path
 
@@ -49,12 +50,176 @@ def get_mapcache_seed_config(config=None):
     return values
 
 
-def get_tileset_path(browse_type, config=None):
-    """ Returns the path to a tileset SQLite file in the `tileset_root` dir. """
+def is_seeding_deferred(config=None):
+    """ Returns whether or not seeding shall be deferred to the seed queue. """
+    
+    config = config or get_ngeo_config()
+    
+    try:
+        return config.getboolean(SEED_SECTION, "deferred")
+    except:
+        return False
+
+
+def is_footprint_seeding(config=None):
+    """ Returns whether or not only the tiles intersecting the browse
+    footprints shall be seeded instead of the whole extent.
+    """
+    
+    config = config or get_ngeo_config()
+    
+    try:
+        return config.getboolean(SEED_SECTION, "footprint_seeding")
+    except:
+        return False
+
+
+def is_merge_incremental(config=None):
+    """ Returns whether or not the cached tiles of merged `Time` entries shall
+    be kept and only the tiles of the newly added browse be seeded anew.
+    """
+    
+    config = config or get_ngeo_config()
+    
+    try:
+        return config.getboolean(SEED_SECTION, "incremental_merge")
+    except:
+        return False
+
+
+def get_footprint_seeding_config(config=None):
+    """ Returns a dictionary with the footprint seeding settings, suitable for
+    `seed_mapcache`.
+    """
+    
+    values = {}
+    config = config or get_ngeo_config()
+    
+    values["footprint_margin"] = int(
+        safe_get(config, SEED_SECTION, "footprint_margin", 4)
+    )
+    values["max_seed_extents"] = int(
+        safe_get(config, SEED_SECTION, "max_seed_extents", 8)
+    )
+    
+    return values
+
+
+def get_render_config(config=None):
+    """ Returns a dictionary with the settings of the tile renderer, suitable
+    for `seed_mapcache`.
+    """
+    
+    values = {}
+    config = config or get_ngeo_config()
+    
+    values["renderer"] = safe_get(
+        config, SEED_SECTION, "renderer", "mapcache_seed"
+    )
+    values["render_resampling"] = safe_get(
+        config, SEED_SECTION, "render_resampling", "near"
+    )
+    values["render_jpeg_quality"] = int(
+        safe_get(config, SEED_SECTION, "render_jpeg_quality", 85)
+    )
+    
+    return values
+
+
+def get_tileset_import_config(config=None):
+    """ Returns a dictionary with the settings for bulk insertion of tiles into
+    tilesets, suitable for `SQLiteSchemaTileSet.writer`.
+    """
+    
+    values = {}
+    config = config or get_ngeo_config()
+    
+    values["batch_size"] = int(
+        safe_get(config, MAPCACHE_SECTION, "import_batch_size", 1000)
+    )
+    values["synchronous"] = safe_get(
+        config, MAPCACHE_SECTION, "import_synchronous", "NORMAL"
+    )
+    values["journal_mode"] = safe_get(
+        config, MAPCACHE_SECTION, "import_journal_mode"
+    )
+    
+    return values
+
+
+def is_tileset_dedup(config=None):
+    """ Returns whether or not new tilesets shall be created with the
+    deduplicating schema.
+    """
+    
+    config = config or get_ngeo_config()
+    
+    try:
+        return config.getboolean(MAPCACHE_SECTION, "tileset_dedup")
+    except:
+        return False
+
+
+def is_tileset_sharded(config=None):
+    """ Returns whether or not the tilesets shall be split into one file per
+    time dimension value. This is experimental and results in about one file
+    per browse.
+    """
+    
+    config = config or get_ngeo_config()
+    
+    try:
+        return config.getboolean(MAPCACHE_SECTION, "tileset_sharding")
+    except:
+        return False
+
+
+def get_shard_name(dim):
+    """ Returns the file name of the tileset shard of the time dimension
+    value `dim`, as substituted by MapCache for the `{dim}` template.
+    """
+    
+    # MapCache joins the sanitized dimension values prefixed with "#"
+    return "#%s.sqlite" % dim.replace("/", "#").replace(".", "#")
+
+
+def get_tileset_path(browse_type, config=None, dim=None):
+    """ Returns the path to a tileset SQLite file in the `tileset_root` dir.
+    With sharded tilesets, this is the shard of `dim` within the directory of
+    the browse type or, if no `dim` is given, the MapCache `dbfile` template
+    of the shards.
+    """
     
     config = config or get_ngeo_config()
     
     tileset_root = config.get(MAPCACHE_SECTION, "tileset_root")
+    
+    if is_tileset_sharded(config):
+        return join(
+            get_project_relative_path(tileset_root), browse_type,
+            get_shard_name(dim) if dim else "{dim}.sqlite"
+        )
+    
     tileset = browse_type + ".sqlite" if not browse_type.endswith(".sqlite") else ""
     
     return join(get_project_relative_path(tileset_root), tileset)
+
+
+def get_tileset_paths(browse_type, config=None):
+    """ Returns the paths of the existing tileset files of the browse type,
+    i.e: of all its shards if the tilesets are sharded.
+    """
+    
+    config = config or get_ngeo_config()
+    
+    if is_tileset_sharded(config):
+        shard_dir = dirname(get_tileset_path(browse_type, config))
+        if not isdir(shard_dir):
+            return []
+        return sorted(
+            join(shard_dir, name) for name in listdir(shard_dir)
+            if name.startswith("#") and name.endswith(".sqlite")
+        )
+    
+    path = get_tileset_path(browse_type, config)
+    return [path] if isfile(path) else []
@@ -77,3 +77,33 @@ class Time(models.Model):
     
     class Meta:
         db_table = "time"
+
+class SeedJob(models.Model):
+    """A pending (un-)seeding operation for a region and time-interval of the
+    given source. Used for deferred seeding.
+    
+    """
+    source = models.ForeignKey(Source)
+    grid = models.CharField(max_length=256)
+    
+    minx = models.FloatField()
+    miny = models.FloatField()
+    maxx = models.FloatField()
+    maxy = models.FloatField()
+    
+    minzoom = models.IntegerField(null=True, blank=True)
+    maxzoom = models.IntegerField(null=True, blank=True)
+    
+    start_time = models.DateTimeField()
+    end_time = models.DateTimeField()
+    
+    # `delete` would shadow `Model.delete()`
+    unseed = models.BooleanField(default=False)
+    
+    def __unicode__(self):
+        return ("%s %s/%s" % ("Unseed" if self.unseed else "Seed",
+                              self.start_time, self.end_time))
+    
+    class Meta:
+        db_table = "seed_job"
+        ordering = ("id",)
@@ -0,0 +1,391 @@
+#-------------------------------------------------------------------------------
+#
+# Project: ngEO Browse Server <http://ngeo.eox.at>
+# Authors: Fabian Schindler <fabian.schindler@eox.at>
+#          Marko Locher <marko.locher@eox.at>
+#          Stephan Meissl <stephan.meissl@eox.at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2012 European Space Agency
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+
+"""\
+In-process rendering of tiles into the MapCache SQLite tilesets.
+
+Instead of running `mapcache_seed`, which requests every tile from the WMS of
+the browse server, the optimized browse files of a time interval are warped
+onto the tiles with GDAL, which reads from the internal overviews matching
+the resolution of each zoom level. The tiles are rendered by a pool of worker
+processes and inserted by the calling process via a `TileWriter`.
+
+Like on the WMS layers, paletted browses are drawn with the colors and
+transparency of their palette, and black is the offsite color of RGB browses
+without alpha band unless they define their own nodata values.
+
+Tiles are encoded like MapCache's "mixed" format does, i.e., JPEG for opaque
+and PNG for (partially) transparent tiles. Fully transparent and uniform
+opaque tiles are stored as the five byte markers of MapCache's
+`detect_blank` option.
+"""
+
+import os
+import time
+import logging
+from io import BytesIO
+from itertools import imap, groupby
+from multiprocessing import Pool, current_process
+
+from osgeo import gdal, osr
+
+from ngeo_browse_server.mapcache import tileset
+from ngeo_browse_server.mapcache.tileset import BLANK_TILE
+from ngeo_browse_server.mapcache.exceptions import SeedException
+from ngeo_browse_server.mapcache.tasks import GRID_TO_SRID
+from ngeo_browse_server.mapcache.tiling import (
+    GRIDS, get_tile_size, get_extent_tiles, get_footprint_tiles,
+    get_tile_extent, to_grid_geometry, wrap_tiles
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+TILE_SIZE = 256 # pixels
+TILES_PER_TASK = 64
+
+DEF_RESAMPLING = "near"
+DEF_JPEG_QUALITY = 85
+
+_TRANSPARENT = "\x00" * (TILE_SIZE * TILE_SIZE)
+_OPAQUE = "\xff" * (TILE_SIZE * TILE_SIZE)
+
+# offsite color of the WMS layers of RGB browses (nil values of the range type)
+DEF_NODATA = 0
+
+
+def get_render_tasks(grid, minzoom, maxzoom, extent, footprints=None,
+                     margin=0):
+    """ Returns the tiles to render from `minzoom` to `maxzoom` as a list of
+    `(zoom, row, first_col, last_col)` tasks of at most `TILES_PER_TASK`
+    tiles. The tiles either intersect the `extent` or, if given, the lon/lat
+    `footprints` extended by `margin` pixels of the highest zoom level.
+    """
+
+    if footprints:
+        geometries = [
+            to_grid_geometry(footprint, grid) for footprint in footprints
+        ]
+        margin_units = margin * get_tile_size(grid, maxzoom)[0] / TILE_SIZE
+
+    tasks = []
+    for zoom in range(minzoom, maxzoom + 1):
+        if footprints:
+            tiles = get_footprint_tiles(geometries, grid, zoom, margin_units)
+        else:
+            tiles = get_extent_tiles(grid, zoom, extent)
+
+        for row, ranges in sorted(wrap_tiles(grid, zoom, tiles).items()):
+            for first, last in ranges:
+                tasks.extend(
+                    (zoom, row, col, min(last, col + TILES_PER_TASK - 1))
+                    for col in range(first, last + 1, TILES_PER_TASK)
+                )
+    return tasks
+
+
+def count_task_tiles(tasks):
+    """ Returns the number of tiles of the given render tasks. """
+    return sum(last - first + 1 for _, _, first, last in tasks)
+
+
+class TileRenderer(object):
+    """ Renders the tiles of a grid from a list of browse files. `sources` is
+    a list of `(filename, bbox)` tuples in drawing order, where `bbox` is the
+    extent of the browse in grid units or `None` if unknown. Only the
+    browses intersecting a tile are warped.
+
+    Browses with a single band are expanded to RGB(A), using their palette
+    if any. Pixels of RGB browses matching the nodata values on all bands
+    are transparent.
+    """
+
+    def __init__(self, grid, sources, resampling=DEF_RESAMPLING,
+                 jpeg_quality=DEF_JPEG_QUALITY):
+        # no auxiliary files for the in-memory encoded tiles
+        gdal.SetConfigOption("GDAL_PAM_ENABLED", "NO")
+
+        self.grid = grid
+        self.resampling = resampling
+        self.warp_options = {}
+        self.sources = []
+        for filename, bbox in sources:
+            ds = gdal.Open(filename)
+            if ds is None:
+                raise SeedException("Cannot open browse file '%s'." % filename)
+            ds, nodata = self.get_source(ds, filename)
+            self.sources.append((ds, nodata, bbox))
+
+        srs = osr.SpatialReference()
+        srs.ImportFromEPSG(GRID_TO_SRID[grid])
+        self.projection = srs.ExportToWkt()
+
+        (minx, _, maxx, _), _, _ = GRIDS[grid]
+        self.full_width = maxx - minx
+
+        self.mem_driver = gdal.GetDriverByName("MEM")
+        self.jpeg_options = gdal.TranslateOptions(
+            format="JPEG", bandList=[1, 2, 3],
+            creationOptions=["QUALITY=%d" % jpeg_quality]
+        )
+        self.png_options = gdal.TranslateOptions(format="PNG")
+        self.vsimem_name = "/vsimem/ngeo_render_%d" % os.getpid()
+
+    def get_source(self, ds, filename):
+        """ Returns the browse dataset `ds` with three or four bands and the
+        source nodata values to warp it with, `None` if it has an alpha band.
+        """
+
+        band = ds.GetRasterBand(1)
+        if ds.RasterCount == 1:
+            if band.GetColorTable() is not None:
+                ds = gdal.Translate("", ds, format="VRT", rgbExpand="rgba")
+            else:
+                ds = gdal.Translate("", ds, format="VRT", bandList=[1, 1, 1])
+            if ds is None:
+                raise SeedException("Cannot expand browse file '%s': %s"
+                                    % (filename, gdal.GetLastErrorMsg()))
+
+        if ds.RasterCount not in (3, 4):
+            raise SeedException("Cannot render browse file '%s' with %d "
+                                "bands." % (filename, ds.RasterCount))
+
+        last = ds.GetRasterBand(ds.RasterCount)
+        if last.GetColorInterpretation() == gdal.GCI_AlphaBand:
+            return ds, None
+
+        values = [
+            ds.GetRasterBand(index).GetNoDataValue() for index in (1, 2, 3)
+        ]
+        return ds, " ".join(
+            "%g" % (value if value is not None else DEF_NODATA)
+            for value in values
+        )
+
+    def get_warp_options(self, nodata):
+        """ Returns the (cached) warp options for sources with the given
+        nodata values.
+        """
+
+        try:
+            return self.warp_options[nodata]
+        except KeyError:
+            pass
+
+        if nodata is None:
+            options = gdal.WarpOptions(
+                dstAlpha=True, resampleAlg=self.resampling
+            )
+        else:
+            # like the offsite color of MapServer, all bands have to match
+            options = gdal.WarpOptions(
+                dstAlpha=True, resampleAlg=self.resampling,
+                srcNodata=nodata, dstNodata="None",
+                warpOptions=["UNIFIED_SRC_NODATA=YES"]
+            )
+        self.warp_options[nodata] = options
+        return options
+
+    def render(self, zoom, col, row):
+        """ Renders the tile in the given column and row, counted from the
+        bottom, and returns the encoded tile.
+        """
+
+        minx, miny, maxx, maxy = get_tile_extent(self.grid, zoom, col, row)
+
+        # browses unwrapped beyond the dateline are drawn onto the tile
+        # shifted by the width of the grid
+        groups = {}
+        for ds, nodata, bbox in self.sources:
+            for offset in (0, self.full_width):
+                if bbox is None or (
+                        bbox[0] < maxx + offset and bbox[2] > minx + offset
+                        and bbox[1] < maxy and bbox[3] > miny):
+                    groups.setdefault(offset, []).append((ds, nodata))
+                    break
+
+        if not groups:
+            return BLANK_TILE
+
+        tile_ds = self.mem_driver.Create(
+            "", TILE_SIZE, TILE_SIZE, 4, gdal.GDT_Byte
+        )
+        tile_ds.SetProjection(self.projection)
+        tile_ds.GetRasterBand(4).SetColorInterpretation(gdal.GCI_AlphaBand)
+
+        for offset, datasets in sorted(groups.items()):
+            tile_ds.SetGeoTransform((
+                minx + offset, (maxx - minx) / TILE_SIZE, 0,
+                maxy, 0, -(maxy - miny) / TILE_SIZE
+            ))
+            # consecutive browses with the same nodata values are warped at
+            # once, keeping the drawing order
+            for nodata, items in groupby(datasets, lambda item: item[1]):
+                result = gdal.Warp(
+                    tile_ds, [ds for ds, _ in items],
+                    options=self.get_warp_options(nodata)
+                )
+                if result is None:
+                    raise SeedException(
+                        "Rendering tile %d/%d/%d failed: %s"
+                        % (zoom, col, row, gdal.GetLastErrorMsg())
+                    )
+
+        return self.encode(tile_ds)
+
+    def encode(self, tile_ds):
+        """ Encodes the RGBA tile dataset. """
+
+        bands = [
+            tile_ds.GetRasterBand(index).ReadRaster() for index in (1, 2, 3, 4)
+        ]
+        alpha = bands[3]
+
+        if alpha == _TRANSPARENT:
+            return BLANK_TILE
+
+        elif alpha == _OPAQUE:
+            if all(band == band[0] * len(band) for band in bands[:3]):
+                # MapCache stores the color in BGRA order
+                return "#%s%s%s\xff" % (bands[2][0], bands[1][0], bands[0][0])
+            options = self.jpeg_options
+
+        else:
+            options = self.png_options
+
+        encoded_ds = gdal.Translate(self.vsimem_name, tile_ds, options=options)
+        if encoded_ds is None:
+            raise SeedException("Encoding tile failed: %s"
+                                % gdal.GetLastErrorMsg())
+        encoded_ds = None
+
+        handle = gdal.VSIFOpenL(self.vsimem_name, "rb")
+        try:
+            gdal.VSIFSeekL(handle, 0, os.SEEK_END)
+            size = gdal.VSIFTellL(handle)
+            gdal.VSIFSeekL(handle, 0, os.SEEK_SET)
+            return gdal.VSIFReadL(1, size, handle)
+        finally:
+            gdal.VSIFCloseL(handle)
+            gdal.Unlink(self.vsimem_name)
+
+
+# renderer of the current (worker) process
+_renderer = None
+
+
+def _init_renderer(grid, sources, resampling, jpeg_quality):
+    global _renderer
+    _renderer = TileRenderer(grid, sources, resampling, jpeg_quality)
+
+
+def _render_task(task):
+    zoom, row, first, last = task
+    return [
+        (col, row, zoom, _renderer.render(zoom, col, row))
+        for col in range(first, last + 1)
+    ]
+
+
+def get_source_bbox(footprint, grid, margin=0):
+    """ Returns the bounding box of the lon/lat `footprint` in grid units
+    extended by `margin` grid units or `None` if there is no footprint.
+    """
+    if footprint is None:
+        return None
+    minx, miny, maxx, maxy = to_grid_geometry(footprint, grid).extent
+    return (minx - margin, miny - margin, maxx + margin, maxy + margin)
+
+
+def render_tiles(tileset_path, tileset_name, grid, dim, sources, tasks,
+                 threads=1, force=True, resampling=DEF_RESAMPLING,
+                 jpeg_quality=DEF_JPEG_QUALITY, margin=0, writer_config=None,
+                 dedup=False):
+    """ Renders the tiles of the render `tasks` from the `sources`, a list of
+    `(filename, footprint)` tuples of the browses in drawing order, and
+    inserts them into the tileset at `tileset_path` with the given `dim`.
+    Existing tiles are replaced if `force` is set, otherwise kept. `margin`
+    is given in pixels of the highest zoom level of the tasks and extends the
+    footprints. A missing tileset is created, with the deduplicating schema
+    if `dedup` is set. Returns the number of inserted tiles.
+    """
+
+    global _renderer
+
+    if tasks:
+        maxzoom = max(task[0] for task in tasks)
+        margin_units = margin * get_tile_size(grid, maxzoom)[0] / TILE_SIZE
+    else:
+        margin_units = 0
+
+    initargs = (
+        grid,
+        [
+            (filename, get_source_bbox(footprint, grid, margin_units))
+            for filename, footprint in sources
+        ],
+        resampling, jpeg_quality
+    )
+
+    # daemonic processes (e.g: the workers of the browsewatchd2 daemon) are
+    # not allowed to start worker processes
+    if threads > 1 and current_process().daemon:
+        logger.info("Rendering serially within a daemonic process.")
+        threads = 1
+
+    pool = None
+    if threads > 1:
+        pool = Pool(threads, _init_renderer, initargs)
+        results = pool.imap_unordered(_render_task, tasks)
+    else:
+        _init_renderer(*initargs)
+        results = imap(_render_task, tasks)
+
+    ts = tileset.open(tileset_path, mode="w", dedup=dedup)
+    start = time.time()
+    try:
+        with ts.writer(on_conflict="REPLACE" if force else "IGNORE",
+                       **(writer_config or {})) as writer:
+            for tiles in results:
+                for x, y, z, data in tiles:
+                    writer.add_tile(tileset_name, grid, dim, x, y, z,
+                                    BytesIO(data))
+    finally:
+        # the results are either consumed or discarded after an error
+        if pool:
+            pool.terminate()
+            pool.join()
+        _renderer = None
+        ts.close()
+
+    logger.info("Rendered %d tiles of %d browses in %.3fs."
+                % (writer.count, len(sources), time.time() - start))
+    return writer.count
+
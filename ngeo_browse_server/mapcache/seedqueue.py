@@ -0,0 +1,307 @@
+#-------------------------------------------------------------------------------
+#
+# Project: ngEO Browse Server <http://ngeo.eox.at>
+# Authors: Fabian Schindler <fabian.schindler@eox.at>
+#          Marko Locher <marko.locher@eox.at>
+#          Stephan Meissl <stephan.meissl@eox.at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2012 European Space Agency
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+
+"""\
+Deferred seeding of MapCache.
+
+When `deferred` is enabled in the `mapcache.seed` section, (un-)seeding
+operations are stored as `SeedJob` models instead of running `mapcache_seed`
+right away. The queue is processed by `process_seed_queue` (see the
+`ngeo_seed_queue` command) which coalesces all pending jobs of a tileset and
+time interval into a single run.
+
+Each `Time` entry of a tileset is a distinct value of the time dimension.
+Seed jobs of a `Time` entry which has been merged into another one (and thus
+is already scheduled for un-seeding) are dropped entirely.
+
+With `footprint_seeding` enabled, the footprints of the browses of the seeded
+time interval are looked up when actually seeding, so that only the tiles
+intersecting them are generated. Likewise, the browse files are looked up for
+the "internal" `renderer`.
+"""
+
+import time
+import logging
+from itertools import groupby
+
+from eoxserver.core.util.timetools import isotime
+
+from ngeo_browse_server.config import get_ngeo_config, get_project_relative_path
+from ngeo_browse_server.lock import FileLock, LockException
+from ngeo_browse_server.mapcache import models
+from ngeo_browse_server.mapcache.config import (
+    get_mapcache_seed_config, is_seeding_deferred, is_footprint_seeding,
+    get_footprint_seeding_config, get_render_config, get_tileset_path,
+    get_tileset_import_config, is_tileset_dedup, is_tileset_sharded
+)
+from ngeo_browse_server.mapcache.exceptions import SeedException
+from ngeo_browse_server.mapcache.tasks import seed_mapcache, DEF_LOCK_TIMEOUT
+from ngeo_browse_server.mapcache.tileset import URN_TO_GRID
+from ngeo_browse_server.mapcache.tiling import clip_footprints
+
+
+logger = logging.getLogger(__name__)
+
+
+def seed(tileset, grid, minx, miny, maxx, maxy, minzoom, maxzoom,
+         start_time, end_time, delete, config=None):
+    """ (Un-)seeds the given area either synchronously or adds a job to the
+    seed queue if deferred seeding is configured.
+    """
+
+    config = config or get_ngeo_config()
+
+    if is_seeding_deferred(config):
+        enqueue_seed(tileset, grid, minx, miny, maxx, maxy, minzoom, maxzoom,
+                     start_time, end_time, delete)
+    else:
+        seed_mapcache(tileset=tileset, grid=grid,
+                      minx=minx, miny=miny, maxx=maxx, maxy=maxy,
+                      minzoom=minzoom, maxzoom=maxzoom,
+                      start_time=start_time, end_time=end_time,
+                      delete=delete, **get_seed_config(
+                          tileset, start_time, end_time, delete, config,
+                          grid, (minx, miny, maxx, maxy)
+                      ))
+
+
+def get_seed_config(tileset, start_time, end_time, delete=False, config=None,
+                    grid=None, extent=None):
+    """ Returns the keyword arguments for `seed_mapcache` from the
+    configuration. When footprint seeding is enabled, these include the
+    footprints of the browses within the time interval to seed, clipped to
+    the `extent` of the `grid` if given. For the "internal" renderer, these
+    include the tileset path and the browse files. The tileset path is also
+    included for deduplicating tilesets, which are created up front, and when
+    un-seeding sharded tilesets, whose emptied shards are removed.
+    """
+
+    config = config or get_ngeo_config()
+    seed_config = get_mapcache_seed_config(config)
+    seed_config.update(get_render_config(config))
+
+    # imported here as the control app depends on this module
+    from ngeo_browse_server.control import queries
+
+    if not delete and is_footprint_seeding(config):
+        seed_config.update(get_footprint_seeding_config(config))
+        seed_config["footprints"] = queries.get_browse_footprints(
+            tileset, start_time, end_time
+        )
+        if extent and grid in URN_TO_GRID:
+            # e.g: only the area of the browse added to a merged entry
+            seed_config["footprints"] = clip_footprints(
+                seed_config["footprints"], URN_TO_GRID[grid], extent
+            )
+
+    seed_config["tileset_dedup"] = is_tileset_dedup(config)
+    seed_config["tileset_sharded"] = is_tileset_sharded(config)
+    if (seed_config["renderer"] == "internal" or
+            seed_config["tileset_dedup"] or
+            (delete and seed_config["tileset_sharded"])):
+        # the shard of the time interval if the tileset is sharded
+        seed_config["tileset_path"] = get_tileset_path(
+            queries.get_browse_layer_type(tileset), config,
+            "%s/%s" % (isotime(start_time), isotime(end_time))
+        )
+
+    if seed_config["renderer"] == "internal":
+        seed_config["writer_config"] = get_tileset_import_config(config)
+        if not delete:
+            seed_config["sources"] = queries.get_browse_sources(
+                tileset, start_time, end_time
+            )
+
+    return seed_config
+
+
+def enqueue_seed(tileset, grid, minx, miny, maxx, maxy, minzoom, maxzoom,
+                 start_time, end_time, delete=False):
+    """ Adds a (un-)seeding job to the seed queue. The job is saved within the
+    current transaction of the mapcache database.
+    """
+
+    job = models.SeedJob(
+        source_id=tileset, grid=grid,
+        minx=minx, miny=miny, maxx=maxx, maxy=maxy,
+        minzoom=minzoom, maxzoom=maxzoom,
+        start_time=start_time, end_time=end_time,
+        unseed=delete
+    )
+    job.save()
+
+    logger.debug("Queued %s of tileset '%s' for %s/%s."
+                 % ("un-seeding" if delete else "seeding", tileset,
+                    start_time, end_time))
+
+
+def coalesce_seed_jobs(jobs, times):
+    """ Coalesces the given (ordered) seed jobs of a single tileset. `times`
+    is a collection of the `(start_time, end_time)` tuples of the currently
+    existing `Time` entries of the tileset. Returns a list of dictionaries
+    with the parameters for `seed_mapcache`, un-seeding runs first.
+
+    Per time interval the areas of all jobs are merged. A seed job followed
+    by an un-seed job of the same interval cancel each other out, as the
+    `Time` entry has been created and merged away again before any tile was
+    generated. Seed jobs of intervals without a `Time` entry are dropped.
+    """
+
+    plan = {}
+    order = []
+    for job in jobs:
+        key = (job.start_time, job.end_time)
+        if key not in plan:
+            plan[key] = {"seed": None, "unseed": None}
+            order.append(key)
+        entry = plan[key]
+
+        if job.unseed:
+            if entry["seed"] is not None:
+                entry["seed"] = None
+            else:
+                entry["unseed"] = _merge_job(entry["unseed"], job)
+        else:
+            entry["seed"] = _merge_job(entry["seed"], job)
+
+    unseeds = []
+    seeds = []
+    for key in order:
+        entry = plan[key]
+        if entry["unseed"] is not None:
+            unseeds.append(entry["unseed"])
+        if entry["seed"] is not None and key in times:
+            seeds.append(entry["seed"])
+
+    return unseeds + seeds
+
+
+def _merge_job(params, job):
+    """ Merges the area and zoom range of `job` into the seed parameters
+    `params` which are created if `None`.
+    """
+
+    if params is None:
+        return {
+            "grid": job.grid,
+            "minx": job.minx, "miny": job.miny,
+            "maxx": job.maxx, "maxy": job.maxy,
+            "minzoom": job.minzoom, "maxzoom": job.maxzoom,
+            "start_time": job.start_time, "end_time": job.end_time,
+            "delete": job.unseed
+        }
+
+    params["minx"] = min(params["minx"], job.minx)
+    params["miny"] = min(params["miny"], job.miny)
+    params["maxx"] = max(params["maxx"], job.maxx)
+    params["maxy"] = max(params["maxy"], job.maxy)
+
+    if job.minzoom is not None:
+        params["minzoom"] = min(params["minzoom"], job.minzoom) \
+            if params["minzoom"] is not None else job.minzoom
+    if job.maxzoom is not None:
+        params["maxzoom"] = max(params["maxzoom"], job.maxzoom) \
+            if params["maxzoom"] is not None else job.maxzoom
+
+    return params
+
+
+def process_seed_queue(tileset=None, config=None):
+    """ Processes all currently queued seed jobs, optionally only the ones of
+    the given tileset. The jobs of failed seed runs are left in the queue to
+    be retried by the next call. Returns the numbers of performed and failed
+    seed runs.
+    """
+
+    config = config or get_ngeo_config()
+
+    try:
+        lock = FileLock(
+            get_project_relative_path("mapcache_seed_queue.lck"),
+            timeout=DEF_LOCK_TIMEOUT
+        )
+        with lock:
+            jobs_qs = models.SeedJob.objects.all()
+            if tileset:
+                jobs_qs = jobs_qs.filter(source=tileset)
+
+            jobs = list(jobs_qs.order_by("source", "id"))
+            if not jobs:
+                return 0, 0
+
+            start = time.time()
+            runs = 0
+            failed_runs = 0
+            for source_id, source_jobs in groupby(jobs, lambda j: j.source_id):
+                source_jobs = list(source_jobs)
+                times = set(
+                    (t.start_time, t.end_time)
+                    for t in models.Time.objects.filter(source=source_id)
+                )
+                params_list = coalesce_seed_jobs(source_jobs, times)
+
+                logger.info("Coalesced %d seed jobs of tileset '%s' to %d "
+                            "seed runs." % (len(source_jobs), source_id,
+                                            len(params_list)))
+
+                failed = set()
+                for params in params_list:
+                    params.update(get_seed_config(
+                        source_id, params["start_time"], params["end_time"],
+                        params["delete"], config, params["grid"],
+                        (params["minx"], params["miny"],
+                         params["maxx"], params["maxy"])
+                    ))
+                    try:
+                        seed_mapcache(tileset=source_id, **params)
+                        runs += 1
+                    except Exception, e:
+                        logger.warn("Seeding failed: %s" % str(e))
+                        failed.add((params["start_time"], params["end_time"]))
+                        failed_runs += 1
+
+                # remove the processed jobs, newer ones and the ones of the
+                # time windows with failed runs are left for the next run
+                processed_qs = models.SeedJob.objects.filter(
+                    source=source_id, id__lte=source_jobs[-1].id
+                )
+                for start_time, end_time in failed:
+                    processed_qs = processed_qs.exclude(
+                        start_time=start_time, end_time=end_time
+                    )
+                processed_qs.delete()
+
+            logger.info("Processed %d seed jobs with %d seed runs and %d "
+                        "failed seed runs in %.3fs."
+                        % (len(jobs), runs, failed_runs, time.time() - start))
+            return runs, failed_runs
+
+    except LockException, error:
+        raise SeedException("Processing the seed queue failed: %s"
+                            % str(error))
@@ -27,9 +27,11 @@
 # THE SOFTWARE.
 #-------------------------------------------------------------------------------
 
+import os
 import time
 import logging
 import subprocess
+from os.path import isfile
 from functools import wraps
 
 from lxml import etree
@@ -46,14 +48,28 @@ from ngeo_browse_server.lock import (FileLock, LockException)
 from ngeo_browse_server.mapcache.exceptions import (
     SeedException, LayerException
 )
-from ngeo_browse_server.mapcache.tileset import URN_TO_GRID
+from ngeo_browse_server.mapcache.tileset import (
+    URN_TO_GRID, SQLiteSchemaTileSet, open as open_tileset
+)
 from ngeo_browse_server.mapcache.config import (
-    get_mapcache_seed_config, get_tileset_path
+    get_mapcache_seed_config, get_tileset_path, is_tileset_dedup
+)
+from ngeo_browse_server.mapcache.tiling import (
+    get_seed_plan, count_extent_tiles, get_extent_tiles, get_tile_extent,
+    wrap_tiles
 )
 
 # Default seeding file lock time-out.
 DEF_LOCK_TIMEOUT = 60.0 # seconds
 
+# Default footprint seeding settings
+DEF_FOOTPRINT_MARGIN = 4 # pixels of the highest zoom level
+DEF_MAX_SEED_EXTENTS = 8 # per zoom level
+
+# Tile renderers: the external "mapcache_seed" command or the in-process
+# renderer of `ngeo_browse_server.mapcache.render`
+RENDERERS = ("mapcache_seed", "internal")
+
 # Maximum bounds for both supported CRSs
 CRS_BOUNDS = {
     3857: (-20037508.3428, -20037508.3428, 20037508.3428, 20037508.3428),
@@ -71,7 +87,30 @@ logger = logging.getLogger(__name__)
 
 def seed_mapcache(seed_command, config_file, tileset, grid,
                   minx, miny, maxx, maxy, minzoom, maxzoom,
-                  start_time, end_time, threads, delete, force=True):
+                  start_time, end_time, threads, delete, force=True,
+                  footprints=None, footprint_margin=DEF_FOOTPRINT_MARGIN,
+                  max_seed_extents=DEF_MAX_SEED_EXTENTS,
+                  renderer="mapcache_seed", tileset_path=None, sources=None,
+                  render_resampling="near", render_jpeg_quality=85,
+                  writer_config=None, tileset_dedup=False,
+                  tileset_sharded=False):
+    """ Runs `mapcache_seed` for the given extent and time interval. When
+    seeding (not deleting) with lon/lat `footprints`, only the tiles
+    intersecting them are seeded, one run per tile rectangle as planned by
+    `get_seed_plan`.
+
+    With the "internal" `renderer` the tiles are rendered in-process from the
+    `sources`, a list of `(filename, footprint)` tuples of the browses of the
+    time interval, and written directly into the tileset at `tileset_path`.
+
+    With `tileset_dedup` a missing tileset (e.g: a new shard) at
+    `tileset_path` is created with the deduplicating schema before seeding.
+    With `tileset_sharded` the shard at `tileset_path` is removed when
+    un-seeding leaves it empty.
+    """
+
+    if renderer not in RENDERERS:
+        raise SeedException("Invalid renderer '%s'." % renderer)
 
     # translate grid URN to mapcache grid name
     try:
@@ -107,13 +146,14 @@ def seed_mapcache(seed_command, config_file, tileset, grid,
         "config_file='%s', tileset='%s', grid='%s', "
         "extent='%s,%s,%s,%s', zoom='%s,%s', nthreads='%s', "
         "mode='%s', dimension='TIME=%sZ/%sZ'.",
-        seed_command, config_file, tileset, grid,
+        seed_command if renderer == "mapcache_seed" else renderer,
+        config_file, tileset, grid,
         minx, miny, maxx, maxy, minzoom, maxzoom, threads,
         "seed" if not delete else "delete",
         start_time.isoformat(), end_time.isoformat()
     )
 
-    def _get_seed_args(extent):
+    def _get_seed_args(extent, minzoom=minzoom, maxzoom=maxzoom):
         seed_args = [
             seed_command,
             "-c", config_file,
@@ -156,32 +196,229 @@ def seed_mapcache(seed_command, config_file, tileset, grid,
                 seed_command, process.returncode
             ))
 
-    try:
-        config = get_ngeo_config()
-        timeout = safe_get(config, "mapcache.seed", "timeout")
-        timeout = float(timeout) if timeout is not None else DEF_LOCK_TIMEOUT
-    except:
-        timeout = DEF_LOCK_TIMEOUT
+    def _seed_footprints():
+        plan = get_seed_plan(
+            footprints, grid, minzoom, maxzoom, footprint_margin,
+            max_seed_extents
+        )
+        extent_tiles = sum(
+            count_extent_tiles(grid, zoom, (minx, miny, maxx, maxy))
+            for zoom in range(minzoom, maxzoom + 1)
+        )
+        logger.info(
+            "Seeding %d tiles (%d intersecting the footprints) instead of "
+            "the %d tiles of the extent (%.1f%%) in %d runs.",
+            plan.tiles, plan.footprint_tiles, extent_tiles,
+            100.0 * plan.tiles / max(extent_tiles, 1), len(plan.extents)
+        )
+        for zoom, extent in plan.extents:
+            _seed(_get_seed_args(extent, zoom, zoom))
+
+    def _render():
+        # imported here as GDAL is only required by the internal renderer
+        from ngeo_browse_server.mapcache import render
+
+        if not tileset_path:
+            raise SeedException("No tileset path given for tileset '%s'."
+                                % tileset)
+
+        render_start = time.time()
+        dim = "%sZ/%sZ" % (start_time.isoformat(), end_time.isoformat())
+        if delete:
+            count = delete_tiles(
+                tileset_path, tileset, grid, dim, minzoom, maxzoom,
+                (minx, miny, maxx, maxy)
+            )
+            logger.info("Deleted %d tiles in %.3fs.",
+                        count, time.time() - render_start)
+        else:
+            tasks = render.get_render_tasks(
+                grid, minzoom, maxzoom, (minx, miny, maxx, maxy),
+                footprints, footprint_margin
+            )
+            logger.info("Rendering %d tiles of %d browses with %d processes.",
+                        render.count_task_tiles(tasks), len(sources or []),
+                        threads)
+            render.render_tiles(
+                tileset_path, tileset, grid, dim, sources or [], tasks,
+                threads, force, render_resampling, render_jpeg_quality,
+                footprint_margin, writer_config, tileset_dedup
+            )
 
     try:
-        lock = FileLock(get_project_relative_path(
-            "mapcache_seed.%s.lck" % tileset # one seeder process per tileset
-            #"mapcache_seed.lck" # one exclusive seeder process
-        ), timeout=timeout)
+        lock = get_seed_lock(tileset)
 
         start = time.time()
         with lock:
             logger.info("Seeding lock acquired in %.3fs", time.time() - start)
-            if dateline_crossed:
+            if (tileset_dedup and tileset_path and not delete and
+                    not isfile(tileset_path)):
+                # MapCache would create it with the plain schema
+                open_tileset(tileset_path, mode="w", dedup=True).close()
+
+            if renderer == "internal":
+                _render()
+            elif footprints and not delete:
+                _seed_footprints()
+            elif dateline_crossed:
                 _seed(_get_seed_args((minx, miny, bounds[2], maxy)))
                 _seed(_get_seed_args((bounds[0], miny, maxx-full, maxy)))
             else:
                 _seed(_get_seed_args((minx, miny, maxx, maxy)))
 
+            if delete and tileset_sharded and tileset_path:
+                remove_empty_tileset(tileset_path)
+
     except LockException, error:
         raise SeedException("Seeding failed: %s" % str(error))
 
 
+def get_seed_lock(tileset):
+    """ Returns the file lock guarding the seeding of the tileset. """
+
+    try:
+        config = get_ngeo_config()
+        timeout = safe_get(config, "mapcache.seed", "timeout")
+        timeout = float(timeout) if timeout is not None else DEF_LOCK_TIMEOUT
+    except:
+        timeout = DEF_LOCK_TIMEOUT
+
+    return FileLock(get_project_relative_path(
+        "mapcache_seed.%s.lck" % tileset # one seeder process per tileset
+        #"mapcache_seed.lck" # one exclusive seeder process
+    ), timeout=timeout)
+
+
+def remove_empty_tileset(tileset_path):
+    """ Removes the tileset file at `tileset_path` if it holds no tiles,
+    e.g: a shard after un-seeding its time entry. Returns whether or not the
+    file was removed.
+    """
+
+    if not isfile(tileset_path):
+        return False
+
+    with SQLiteSchemaTileSet(tileset_path) as ts:
+        empty = ts.is_empty()
+    if empty:
+        os.remove(tileset_path)
+        logger.debug("Removed empty tileset '%s'." % tileset_path)
+    return empty
+
+
+def delete_tiles(tileset_path, tileset, grid, dim, minzoom, maxzoom, extent):
+    """ Deletes the tiles of the MapCache `grid` with the given `dim` from
+    `minzoom` to `maxzoom` intersecting the `extent` which may cross the
+    dateline. Returns the number of deleted tiles.
+    """
+
+    if not isfile(tileset_path):
+        return 0
+
+    with SQLiteSchemaTileSet(tileset_path) as ts:
+        return _delete_extent_tiles(
+            ts, tileset, grid, dim, minzoom, maxzoom, extent
+        )
+
+
+def _delete_extent_tiles(ts, tileset, grid, dim, minzoom, maxzoom, extent):
+    count = 0
+    for zoom in range(minzoom, maxzoom + 1):
+        tiles = wrap_tiles(grid, zoom, get_extent_tiles(grid, zoom, extent))
+        if not tiles:
+            continue
+        # all rows of an extent have the same column ranges
+        first_row, last_row = min(tiles), max(tiles)
+        for first, last in tiles[first_row]:
+            count += ts.delete_tiles(
+                tileset, grid, dim, zoom, zoom,
+                (first, first_row, last, last_row)
+            )
+    return count
+
+
+def merge_time_tiles(tileset_path, tileset, grid, dims, dim, extent,
+                     merged_extent, minzoom, maxzoom, shard_paths=None):
+    """ Merges the cached tiles of the `Time` entries with the `dims` into
+    the merged `Time` entry with the `dim` instead of un-seeding them. The
+    tiles intersecting the `extent` of the newly added browse are deleted.
+    For sharded tilesets, `tileset_path` is the shard of `dim` and the tiles
+    are first moved there from the `shard_paths` of the merged entries.
+    Emptied shards are removed.
+
+    Returns the extent to seed. This is the `extent` unless tiles existing
+    in several of the merged entries had to be deleted, in which case it is
+    extended by these tiles within the `merged_extent`.
+    """
+
+    try:
+        grid = URN_TO_GRID[grid]
+    except KeyError:
+        raise SeedException("Invalid grid '%s'." % grid)
+
+    shard_paths = [
+        path for path in set(shard_paths or [])
+        if path != tileset_path and isfile(path)
+    ]
+    if not isfile(tileset_path) and not shard_paths:
+        return extent
+
+    start = time.time()
+    try:
+        with get_seed_lock(tileset):
+            exists = isfile(tileset_path)
+            with SQLiteSchemaTileSet(
+                    tileset_path, create=not exists,
+                    dedup=not exists and is_tileset_dedup()) as ts:
+                for path in shard_paths:
+                    moved, remaining = ts.move_tiles(path, tileset, grid)
+                    logger.debug("Moved %d tiles from shard '%s'."
+                                 % (moved, path))
+                    if not remaining:
+                        os.remove(path)
+
+                removed = ts.merge_dims(tileset, grid, dims, dim)
+                invalidated = _delete_extent_tiles(
+                    ts, tileset, grid, dim, minzoom, maxzoom, extent
+                )
+    except LockException, error:
+        raise SeedException("Merging tiles failed: %s" % str(error))
+
+    bounds = CRS_BOUNDS[GRID_TO_SRID[grid]]
+    full = float(bounds[2] - bounds[0])
+    minx, miny, maxx, maxy = extent
+    extent_tiles = {}
+    for x, y, z in removed:
+        # tiles intersecting the extent are seeded anyway
+        if z not in extent_tiles:
+            extent_tiles[z] = wrap_tiles(
+                grid, z, get_extent_tiles(grid, z, extent)
+            )
+        if any(first <= x <= last
+               for first, last in extent_tiles[z].get(y, [])):
+            continue
+
+        tile_minx, tile_miny, tile_maxx, tile_maxy = get_tile_extent(
+            grid, z, x, y
+        )
+        for offset in (0, full):
+            if (tile_minx + offset < merged_extent[2] and
+                    tile_maxx + offset > merged_extent[0]):
+                minx = min(minx, max(tile_minx + offset, merged_extent[0]))
+                maxx = max(maxx, min(tile_maxx + offset, merged_extent[2]))
+                miny = min(miny, max(tile_miny, merged_extent[1]))
+                maxy = max(maxy, min(tile_maxy, merged_extent[3]))
+                break
+
+    logger.info(
+        "Merged the tiles of %d time entries into '%s' in %.3fs, %d tiles "
+        "of multiple entries deleted, %d tiles of the new browse "
+        "invalidated.", len(dims), dim, time.time() - start, len(removed),
+        invalidated
+    )
+    return (minx, miny, maxx, maxy)
+
+
 def lock_mapcache_config(func):
     """ Decorator for functions involving the mapcache configuration to lock
         the mapcache configuration.
@@ -225,6 +462,7 @@ def add_mapcache_layer_xml(browse_layer, config=None):
             "the name '%s' is already inserted." % name
         )
 
+    # for sharded tilesets a template MapCache fills in with the dimension
     tileset_path = get_tileset_path(browse_layer.browse_type)
 
     bounds = CRS_BOUNDS[GRID_TO_SRID[URN_TO_GRID[browse_layer.grid]]]
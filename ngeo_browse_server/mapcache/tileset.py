@@ -27,14 +27,21 @@
 # THE SOFTWARE.
 #-------------------------------------------------------------------------------
 
-from os.path import exists, basename, isfile
+import os
+from os.path import exists, basename, isfile, isdir, dirname
 import sqlite3
+import logging
+import hashlib
+from time import time
 from io import BytesIO
 from datetime import datetime
 
 from django.db import models, connections
 
 
+logger = logging.getLogger(__name__)
+
+
 URN_TO_GRID = {
     "urn:ogc:def:wkss:OGC:1.0:GoogleMapsCompatible": "GoogleMapsCompatible",
     "urn:ogc:def:wkss:OGC:1.0:GoogleCRS84Quad": "WGS84"
@@ -76,84 +83,659 @@ class TileSetException(Exception):
     pass
 
 
-def open(path, mode="r"):
+DEFAULT_BATCH_SIZE = 1000
+
+# MapCache's `detect_blank` marker of a fully transparent tile
+BLANK_TILE = "#\x00\x00\x00\x00"
+
+# SQLite allows 999 bound variables per query per default
+MAX_DIMS_PER_QUERY = 500
+
+SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+JOURNAL_MODES = ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF")
+CONFLICT_MODES = ("ROLLBACK", "ABORT", "FAIL", "IGNORE", "REPLACE")
+
+SCHEMA = [
+    """create table if not exists tiles(
+        tileset text,
+        grid text,
+        x integer,
+        y integer,
+        z integer,
+        data blob,
+        dim text,
+        ctime datetime,
+        primary key(tileset,grid,x,y,z,dim)
+    )""",
+]
+
+# Deduplicating schema: the data of the tiles is stored once per distinct
+# content in `tile_blobs`, keyed by its SHA-1 digest, and referenced by the
+# rows of `tile_refs`. The `tiles` view and its triggers provide the schema
+# MapCache reads and writes. As SQLite has no hash function, blobs inserted
+# via the view (i.e: by MapCache) have no digest until `compact` is run,
+# except for blank tiles which always reference the single blob with the
+# digest of `BLANK_TILE`. Blank tiles are kept as MapCache requests missing
+# tiles anew from the WMS.
+DEDUP_SCHEMA = [
+    """create table if not exists tile_blobs(
+        id integer primary key,
+        hash blob unique,
+        data blob
+    )""",
+    """create table if not exists tile_refs(
+        tileset text,
+        grid text,
+        x integer,
+        y integer,
+        z integer,
+        blob_id integer,
+        dim text,
+        ctime datetime,
+        primary key(tileset,grid,x,y,z,dim)
+    )""",
+    """create index if not exists tile_refs_blob_index
+        on tile_refs(blob_id)""",
+    """create view if not exists tiles as
+        select tile_refs.tileset as tileset, tile_refs.grid as grid,
+            tile_refs.x as x, tile_refs.y as y, tile_refs.z as z,
+            tile_blobs.data as data, tile_refs.dim as dim,
+            tile_refs.ctime as ctime
+        from tile_refs join tile_blobs on tile_blobs.id = tile_refs.blob_id""",
+    # blobs are removed along with their last reference
+    """create trigger if not exists tile_refs_delete after delete on tile_refs
+        when not exists (select 1 from tile_refs where blob_id = old.blob_id)
+        begin
+            delete from tile_blobs where id = old.blob_id;
+        end""",
+    """create trigger if not exists tiles_insert instead of insert on tiles
+        begin
+            delete from tile_refs where tileset = new.tileset
+                and grid = new.grid and x = new.x and y = new.y
+                and z = new.z and dim = new.dim;
+            insert into tile_blobs(hash, data)
+                select X'%(blank_hash)s', new.data
+                where new.data = X'%(blank)s' and not exists (
+                    select 1 from tile_blobs where hash = X'%(blank_hash)s');
+            insert into tile_blobs(data) select new.data
+                where new.data != X'%(blank)s';
+            insert into tile_refs select new.tileset, new.grid, new.x, new.y,
+                new.z, case when new.data = X'%(blank)s'
+                    then (select id from tile_blobs
+                          where hash = X'%(blank_hash)s')
+                    else last_insert_rowid() end,
+                new.dim, coalesce(new.ctime, datetime('now'));
+        end""" % {
+        "blank": BLANK_TILE.encode("hex"),
+        "blank_hash": hashlib.sha1(BLANK_TILE).hexdigest()
+    },
+    """create trigger if not exists tiles_delete instead of delete on tiles
+        begin
+            delete from tile_refs where tileset = old.tileset
+                and grid = old.grid and x = old.x and y = old.y
+                and z = old.z and dim = old.dim;
+        end""",
+]
+
+
+def open(path, mode="r", dedup=False):
+    """ Opens the tileset at `path`. With mode "w" the tileset is created if
+    it does not exist, using the deduplicating schema if `dedup` is set.
+    """
     db_exists = isfile(path)
     create = False
     if not db_exists and mode == "r":
         raise TileSetException("TileSet '%s' does not exist." % path)
     elif not db_exists and mode == "w":
         create = True
+        # e.g: the directory of the shards of a tileset
+        if dirname(path) and not isdir(dirname(path)):
+            os.makedirs(dirname(path))
     
-    # TODO: schema detection
-    # SELECT name FROM sqlite_master WHERE type = 'table';
     # TODO: other schemas
-    return SQLiteSchemaTileSet(path, create)
+    return SQLiteSchemaTileSet(path, create, dedup)
+
+
+def get_digest(data):
+    """ Returns the content hash of the tile `data` as stored in the
+    `tile_blobs` table.
+    """
+    return buffer(hashlib.sha1(data).digest())
 
 
 class SQLiteSchemaTileSet(object):
-    def __init__(self, path, create=False):
+    """ A MapCache SQLite tileset. Queries are performed via a connection
+    which is opened on first use and kept until `close` is called.
+
+    Tilesets with the deduplicating schema (see `DEDUP_SCHEMA`) are detected
+    and have `dedup` set. They are read via the `tiles` view while tiles are
+    deleted and re-keyed in the `tile_refs` table.
+    """
+
+    def __init__(self, path, create=False, dedup=False):
         self.path = path
+        self._connection = None
+        self._indexed = False
         
         if create:
             with sqlite3.connect(path) as connection:
                 cur = connection.cursor()
-                cur.executescript("""\
-                    create table if not exists tiles(
-                        tileset text,
-                        grid text,
-                        x integer,
-                        y integer,
-                        z integer,
-                        data blob,
-                        dim text,
-                        ctime datetime,
-                        primary key(tileset,grid,x,y,z,dim)
-                    );
-                """)
+                cur.executescript(
+                    ";\n".join(DEDUP_SCHEMA if dedup else SCHEMA) + ";"
+                )
+
+        connection = sqlite3.connect(path)
+        try:
+            row = connection.execute(
+                "SELECT type FROM sqlite_master WHERE name = 'tiles'"
+            ).fetchone()
+        finally:
+            connection.close()
+        self.dedup = row is not None and row[0] == "view"
+        self.table = "tile_refs" if self.dedup else "tiles"
+
+    def _get_connection(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path)
+        return self._connection
+
+    def close(self):
+        """ Close the connection of the tileset, if opened. """
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, etype, value, traceback):
+        self.close()
+
+    def create_index(self):
+        """ Create the index for querying tiles by their dimension if it does
+        not yet exist. Failures (e.g: for read-only tilesets) are only logged
+        as the index is not mandatory.
+        """
+        if self._indexed:
+            return
+        self._indexed = True
+
+        try:
+            with self._get_connection() as connection:
+                connection.execute(
+                    "CREATE INDEX IF NOT EXISTS tiles_dim_index "
+                    "ON %s(tileset, grid, dim, z)" % self.table
+                )
+        except sqlite3.Error, e:
+            logger.warning("Could not create index on tileset '%s': %s"
+                           % (self.path, str(e)))
             
-    def get_tiles(self, tileset, grid, dim=None, minzoom=None, maxzoom=None):
+    def get_tiles(self, tileset, grid, dim=None, minzoom=None, maxzoom=None,
+                  bbox=None, batch_size=DEFAULT_BATCH_SIZE):
         """ Generator function to loop over all tiles in a given zoom interval
-        and a given dimension.
+        and a given dimension. `dim` is either a single value or a list of
+        values, which are queried at once. `bbox` limits the tiles to the
+        ``(minx, miny, maxx, maxy)`` tile coordinates (inclusive). Tiles are
+        fetched in batches of `batch_size`.
         """
-        with sqlite3.connect(self.path) as connection:
-            cur = connection.cursor()
-            where_clauses = [
-                "tiles.grid = '%s'" % grid,
-                "tiles.tileset = '%s'" % tileset
+        if dim is None or dim == "":
+            dims = None
+        elif isinstance(dim, basestring):
+            dims = [dim]
+        else:
+            dims = list(dim)
+            if not dims:
+                return
+
+        if dims:
+            self.create_index()
+            # stay below the SQLite limit of bound variables per query
+            dim_chunks = [
+                dims[i:i + MAX_DIMS_PER_QUERY]
+                for i in range(0, len(dims), MAX_DIMS_PER_QUERY)
             ]
-            
-            if minzoom is not None:
-                where_clauses.append("tiles.z >= %d" % minzoom)
-            
-            if maxzoom is not None:
-                where_clauses.append("tiles.z <= %d" % maxzoom)
-                
-            if dim:
-                where_clauses.append("tiles.dim = '%s'" % dim)
-            
-            #rows = self.rows or "tileset, grid, x, y, z, dim, data"
-            
-            sql = ("SELECT tileset, grid, x, y, z, dim, data FROM tiles%s;" 
-                   % (" WHERE " + " AND ".join(where_clauses) 
-                      if len(where_clauses) else ""))
-            
-            cur.execute(sql)
-            
+        else:
+            dim_chunks = [None]
+
+        for dim_chunk in dim_chunks:
+            for row in self._query_tiles(tileset, grid, dim_chunk, minzoom,
+                                         maxzoom, bbox, batch_size):
+                yield row
+
+    def _query_tiles(self, tileset, grid, dims, minzoom, maxzoom, bbox,
+                     batch_size):
+        where_clauses, params = self._get_filter(
+            tileset, grid, dims, minzoom, maxzoom, bbox
+        )
+        
+        sql = ("SELECT tileset, grid, x, y, z, dim, data FROM tiles WHERE %s;"
+               % " AND ".join(where_clauses))
+        
+        cur = self._get_connection().cursor()
+        try:
+            cur.execute(sql, params)
             while True:
-                row = cur.fetchone()
-                if not row:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
                     break
-                
-                yield row[:-1] + (BytesIO(row[-1]),)
+
+                for row in rows:
+                    yield row[:-1] + (BytesIO(row[-1]),)
+        finally:
+            cur.close()
+
+    def delete_tiles(self, tileset, grid, dim=None, minzoom=None,
+                     maxzoom=None, bbox=None):
+        """ Delete all tiles of the given dimension, zoom interval and
+        ``(minx, miny, maxx, maxy)`` tile coordinates (inclusive). Returns the
+        number of deleted tiles.
+        """
+        where_clauses, params = self._get_filter(
+            tileset, grid, [dim] if dim else None, minzoom, maxzoom, bbox,
+            self.table
+        )
+        if dim:
+            self.create_index()
+
+        with self._get_connection() as connection:
+            cur = connection.execute(
+                "DELETE FROM %s WHERE %s;"
+                % (self.table, " AND ".join(where_clauses)), params
+            )
+            return cur.rowcount
+
+    def merge_dims(self, tileset, grid, dims, new_dim):
+        """ Re-key the tiles of all `dims` to `new_dim`, which may be one of
+        `dims`. Where several of the dims have a tile at the same position,
+        blank tiles are dropped in favour of the others. If more than one
+        non-blank tile remains, all are deleted as they need to be rendered
+        anew. Returns the `(x, y, z)` coordinates of the deleted tiles.
+        """
+        dims = sorted(set(dims) | set([new_dim]))
+        dim_filter = "tileset = ? AND grid = ? AND dim IN (%s)" % (
+            ", ".join("?" * len(dims))
+        )
+        params = [tileset, grid] + dims
+        blank = buffer(BLANK_TILE)
+        if self.dedup:
+            blank_filter = "blob_id IN (SELECT id FROM tile_blobs WHERE data = ?)"
+        else:
+            blank_filter = "data = ?"
+
+        self.create_index()
+        removed = []
+        with self._get_connection() as connection:
+            conflicts = connection.execute(
+                "SELECT x, y, z, COUNT(*), SUM(data = ?), MIN(dim) "
+                "FROM tiles WHERE %s GROUP BY z, x, y HAVING COUNT(*) > 1;"
+                % dim_filter, [blank] + params
+            ).fetchall()
+
+            for x, y, z, count, blanks, min_dim in conflicts:
+                tile_filter = "%s AND x = ? AND y = ? AND z = ?" % dim_filter
+                tile_params = params + [x, y, z]
+                if count - blanks > 1:
+                    connection.execute(
+                        "DELETE FROM %s WHERE %s;" % (self.table, tile_filter),
+                        tile_params
+                    )
+                    removed.append((x, y, z))
+                elif count == blanks:
+                    connection.execute(
+                        "DELETE FROM %s WHERE %s AND dim != ?;"
+                        % (self.table, tile_filter), tile_params + [min_dim]
+                    )
+                else:
+                    connection.execute(
+                        "DELETE FROM %s WHERE %s AND %s;"
+                        % (self.table, tile_filter, blank_filter),
+                        tile_params + [blank]
+                    )
+
+            connection.execute(
+                "UPDATE %s SET dim = ? WHERE %s AND dim != ?;"
+                % (self.table, dim_filter), [new_dim] + params + [new_dim]
+            )
+
+        return removed
+
+    def is_empty(self):
+        """ Returns whether or not the tileset holds no tiles at all. """
+        return self._get_connection().execute(
+            "SELECT 1 FROM %s LIMIT 1;" % self.table
+        ).fetchone() is None
+
+    def move_tiles(self, path, tileset, grid):
+        """ Moves all tiles of `tileset` and `grid` from the tileset file at
+        `path`, e.g: a shard of another dimension, into this tileset. Returns
+        the number of moved tiles and of the tiles remaining in the other
+        file.
+        """
+        source_table = SQLiteSchemaTileSet(path).table
+        connection = self._get_connection()
+        connection.execute("ATTACH DATABASE ? AS source", (path,))
+        try:
+            with connection:
+                # counted up front as inserts via the view of deduplicating
+                # tilesets are not reported
+                moved = connection.execute(
+                    "SELECT COUNT(*) FROM source.tiles "
+                    "WHERE tileset = ? AND grid = ?;", (tileset, grid)
+                ).fetchone()[0]
+                connection.execute(
+                    "INSERT INTO main.tiles SELECT tileset, grid, x, y, z, "
+                    "data, dim, ctime FROM source.tiles "
+                    "WHERE tileset = ? AND grid = ?;", (tileset, grid)
+                )
+                connection.execute(
+                    "DELETE FROM source.%s WHERE tileset = ? AND grid = ?;"
+                    % source_table, (tileset, grid)
+                )
+                remaining = connection.execute(
+                    "SELECT COUNT(*) FROM source.%s;" % source_table
+                ).fetchone()[0]
+        finally:
+            connection.execute("DETACH DATABASE source")
+
+        return moved, remaining
+
+    def _get_filter(self, tileset, grid, dims, minzoom, maxzoom, bbox,
+                    table="tiles"):
+        """ Returns the where clauses and their parameters to select the
+        tiles of the given dimensions, zoom interval and tile bounding box.
+        """
+        where_clauses = ["%s.tileset = ?" % table, "%s.grid = ?" % table]
+        params = [tileset, grid]
+
+        if dims:
+            where_clauses.append(
+                "%s.dim IN (%s)" % (table, ", ".join("?" * len(dims)))
+            )
+            params.extend(dims)
+        
+        if minzoom is not None:
+            where_clauses.append("%s.z >= ?" % table)
+            params.append(minzoom)
+        
+        if maxzoom is not None:
+            where_clauses.append("%s.z <= ?" % table)
+            params.append(maxzoom)
+
+        if bbox is not None:
+            where_clauses.append("%s.x BETWEEN ? AND ?" % table)
+            where_clauses.append("%s.y BETWEEN ? AND ?" % table)
+            params.extend((bbox[0], bbox[2], bbox[1], bbox[3]))
+
+        return where_clauses, params
     
+    def writer(self, batch_size=DEFAULT_BATCH_SIZE, synchronous=None,
+               journal_mode=None, on_conflict=None):
+        """ Returns a `TileWriter` for bulk insertion of tiles. """
+        return TileWriter(self.path, batch_size, synchronous, journal_mode,
+                          on_conflict, self.dedup)
+
     def add_tile(self, tileset, grid, dim, x, y, z, f):
         """ Add a new tile entry into the sqlite database file with the given
-        values.
+        values. Use `writer` when adding more than a few tiles.
         """
         with sqlite3.connect(self.path) as connection:
             cur = connection.cursor()
             cur.execute("INSERT INTO tiles VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
                         (tileset, grid, x, y, z, buffer(f.read()), dim, 
                          datetime.now()))
+
+    def compact(self, batch_size=DEFAULT_BATCH_SIZE):
+        """ Converts the tileset to the deduplicating schema if necessary and
+        removes blobs duplicating others (i.e: inserted via the `tiles` view)
+        and unreferenced blobs. The file is vacuumed afterwards to release
+        the freed pages. Returns a dictionary with the remaining number of
+        `tiles` and `blobs` and the number of removed `duplicates` and
+        `orphans`.
+        """
+        self.close()
+        stats = dict(duplicates=0, orphans=0)
+
+        # transactions are handled explicitly as the sqlite3 module would
+        # commit before the schema changes
+        connection = sqlite3.connect(self.path, isolation_level=None)
+        try:
+            cur = connection.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                if self.dedup:
+                    self._compact_blobs(connection, stats)
+                else:
+                    self._convert(connection, stats, batch_size)
+
+                stats["orphans"] += cur.execute(
+                    "DELETE FROM tile_blobs WHERE id NOT IN "
+                    "(SELECT blob_id FROM tile_refs)"
+                ).rowcount
+                stats["tiles"] = cur.execute(
+                    "SELECT COUNT(*) FROM tile_refs"
+                ).fetchone()[0]
+                stats["blobs"] = cur.execute(
+                    "SELECT COUNT(*) FROM tile_blobs"
+                ).fetchone()[0]
+                cur.execute("COMMIT")
+            except:
+                cur.execute("ROLLBACK")
+                raise
+
+            cur.execute("VACUUM")
+        finally:
+            connection.close()
+
+        self.dedup = True
+        self.table = "tile_refs"
+        self._indexed = False
+        return stats
+
+    def _convert(self, connection, stats, batch_size):
+        """ Moves the tiles of the `tiles` table into the tables of the
+        deduplicating schema.
+        """
+        connection.execute("ALTER TABLE tiles RENAME TO tiles_plain")
+        for statement in DEDUP_SCHEMA:
+            connection.execute(statement)
+
+        cur = connection.execute(
+            "SELECT tileset, grid, x, y, z, data, dim, ctime FROM tiles_plain"
+        )
+        count = 0
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            _insert_dedup_tiles(connection, rows)
+            count += len(rows)
+        cur.close()
+
+        connection.execute("DROP TABLE tiles_plain")
+        stats["duplicates"] = count - connection.execute(
+            "SELECT COUNT(*) FROM tile_blobs"
+        ).fetchone()[0]
+
+    def _compact_blobs(self, connection, stats):
+        """ Merges the blobs without content hash into the existing blobs of
+        the same content. The triggers are re-created beforehand to update
+        those of tilesets created with previous versions of the schema.
+        """
+        for trigger in ("tile_refs_delete", "tiles_insert", "tiles_delete"):
+            connection.execute("DROP TRIGGER IF EXISTS %s" % trigger)
+        for statement in DEDUP_SCHEMA:
+            connection.execute(statement)
+
+        blob_ids = [
+            blob_id for blob_id, in connection.execute(
+                "SELECT id FROM tile_blobs WHERE hash IS NULL"
+            )
+        ]
+        for blob_id in blob_ids:
+            data = connection.execute(
+                "SELECT data FROM tile_blobs WHERE id = ?", (blob_id,)
+            ).fetchone()[0]
+            digest = get_digest(data)
+            row = connection.execute(
+                "SELECT id FROM tile_blobs WHERE hash = ?", (digest,)
+            ).fetchone()
+            if row:
+                connection.execute(
+                    "UPDATE tile_refs SET blob_id = ? WHERE blob_id = ?",
+                    (row[0], blob_id)
+                )
+                connection.execute(
+                    "DELETE FROM tile_blobs WHERE id = ?", (blob_id,)
+                )
+                stats["duplicates"] += 1
+            else:
+                connection.execute(
+                    "UPDATE tile_blobs SET hash = ? WHERE id = ?",
+                    (digest, blob_id)
+                )
         
         
+
+
+def _insert_dedup_tiles(connection, rows, conflict_clause=""):
+    """ Inserts the `(tileset, grid, x, y, z, data, dim, ctime)` rows into
+    the blob store and reference table of a deduplicating tileset. Returns
+    the number of blank tiles, which all reference the same blob.
+    """
+    digests = [get_digest(row[5]) for row in rows]
+
+    connection.executemany(
+        "INSERT OR IGNORE INTO tile_blobs (hash, data) VALUES (?, ?)",
+        [(digest, row[5]) for digest, row in zip(digests, rows)]
+    )
+    connection.executemany(
+        "INSERT %sINTO tile_refs (tileset, grid, x, y, z, blob_id, dim, "
+        "ctime) SELECT ?, ?, ?, ?, ?, id, ?, ? FROM tile_blobs "
+        "WHERE hash = ?" % conflict_clause,
+        [row[:5] + row[6:] + (digest,) for digest, row in zip(digests, rows)]
+    )
+    blank = buffer(BLANK_TILE)
+    return sum(1 for row in rows if row[5] == blank)
+
+
+class TileWriter(object):
+    """ Context manager for the bulk insertion of tiles into a tileset. All
+    tiles are inserted via a single connection with `executemany` and one
+    commit per `batch_size` tiles. The `synchronous` and `journal_mode`
+    pragmas are applied for the time of the insertion, the journal mode of
+    the tileset is restored afterwards. `on_conflict` is the SQLite conflict
+    resolution for already existing tiles, e.g: "REPLACE" to overwrite them.
+
+    For deduplicating tilesets (`dedup`), the data of each distinct tile is
+    inserted once into the blob store.
+
+    When the block is left with an error, the tiles of the current batch are
+    discarded.
+    """
+
+    def __init__(self, path, batch_size=DEFAULT_BATCH_SIZE, synchronous=None,
+                 journal_mode=None, on_conflict=None, dedup=False):
+        if synchronous and synchronous.upper() not in SYNCHRONOUS_MODES:
+            raise TileSetException(
+                "Invalid synchronous mode '%s'." % synchronous
+            )
+        if journal_mode and journal_mode.upper() not in JOURNAL_MODES:
+            raise TileSetException(
+                "Invalid journal mode '%s'." % journal_mode
+            )
+        if on_conflict and on_conflict.upper() not in CONFLICT_MODES:
+            raise TileSetException(
+                "Invalid conflict resolution '%s'." % on_conflict
+            )
+
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        self.synchronous = synchronous
+        self.journal_mode = journal_mode
+        self.on_conflict = on_conflict
+        self.dedup = dedup
+        self.count = 0
+        self.blank_count = 0
+        self._batch = []
+        self._connection = None
+        self._previous_journal_mode = None
+        self._start = None
+
+    def __enter__(self):
+        self._connection = sqlite3.connect(self.path)
+        cur = self._connection.cursor()
+        if self.synchronous:
+            cur.execute("PRAGMA synchronous = %s" % self.synchronous)
+        if self.journal_mode:
+            cur.execute("PRAGMA journal_mode")
+            self._previous_journal_mode = cur.fetchone()[0]
+            cur.execute("PRAGMA journal_mode = %s" % self.journal_mode)
+        self._start = time()
+        return self
+
+    def add_tile(self, tileset, grid, dim, x, y, z, f):
+        """ Add a new tile entry to the current batch. The batch is inserted
+        once it reaches the batch size.
+        """
+        self._batch.append((tileset, grid, x, y, z, buffer(f.read()), dim,
+                            datetime.now()))
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """ Insert and commit the tiles of the current batch. """
+        if not self._batch:
+            return
+
+        batch, self._batch = self._batch, []
+        try:
+            if self.dedup:
+                self._insert_refs(batch)
+            else:
+                self._connection.executemany(
+                    "INSERT %sINTO tiles VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+                    % self._get_conflict_clause(), batch
+                )
+            self._connection.commit()
+        except:
+            self._connection.rollback()
+            raise
+        self.count += len(batch)
+
+    def _get_conflict_clause(self):
+        return "OR %s " % self.on_conflict if self.on_conflict else ""
+
+    def _insert_refs(self, batch):
+        """ Insert the tiles of the batch into a deduplicating tileset. """
+        if self.on_conflict and self.on_conflict.upper() == "REPLACE":
+            # deleted explicitly as the replace conflict resolution does not
+            # trigger the removal of unreferenced blobs
+            self._connection.executemany(
+                "DELETE FROM tile_refs WHERE tileset = ? AND grid = ? "
+                "AND x = ? AND y = ? AND z = ? AND dim = ?",
+                [row[:5] + (row[6],) for row in batch]
+            )
+
+        self.blank_count += _insert_dedup_tiles(
+            self._connection, batch, self._get_conflict_clause()
+        )
+
+    def __exit__(self, etype, value, traceback):
+        try:
+            if etype is None:
+                self.flush()
+            else:
+                self._batch = []
+
+            if self._previous_journal_mode:
+                self._connection.execute(
+                    "PRAGMA journal_mode = %s" % self._previous_journal_mode
+                )
+        finally:
+            self._connection.close()
+            self._connection = None
+
+        elapsed = time() - self._start
+        logger.debug("Inserted %d tiles (%d blank) in %.3fs (%.1f tiles/s)."
+                     % (self.count, self.blank_count, elapsed,
+                        self.count / elapsed if elapsed else 0))
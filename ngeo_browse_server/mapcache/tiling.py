@@ -0,0 +1,472 @@
+#-------------------------------------------------------------------------------
+#
+# Project: ngEO Browse Server <http://ngeo.eox.at>
+# Authors: Fabian Schindler <fabian.schindler@eox.at>
+#          Marko Locher <marko.locher@eox.at>
+#          Stephan Meissl <stephan.meissl@eox.at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2012 European Space Agency
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+
+"""\
+Tile computations on the MapCache grids.
+
+Instead of seeding the whole bounding box of a browse (or of a merged `Time`
+entry), only the tiles intersecting the footprints are seeded. Per zoom level
+the footprints are intersected with each row of tiles, which yields the exact
+column ranges of the intersecting tiles. These are combined into a few
+rectangles of tiles, one `mapcache_seed` run each.
+
+Tile columns are not wrapped at the dateline: footprints crossing the dateline
+are unwrapped to x values beyond the eastern grid bound and the according
+tiles are only wrapped when converted to extents.
+"""
+
+import heapq
+from collections import namedtuple
+from math import floor, ceil, log, tan, pi, radians, degrees, atan, exp
+
+from django.contrib.gis.geos import Polygon, MultiPolygon
+
+
+# extent and number of columns and rows at zoom level 0 of the MapCache grids
+GRIDS = {
+    "GoogleMapsCompatible": (
+        (-20037508.3427892, -20037508.3427892,
+         20037508.3427892, 20037508.3427892), 1, 1
+    ),
+    "WGS84": ((-180.0, -90.0, 180.0, 90.0), 2, 1),
+}
+
+EARTH_RADIUS = 6378137.0 # metres, spherical mercator
+MAX_LATITUDE = 85.0511287798 # degrees, bounds of spherical mercator
+
+# fraction of a tile the extents are shrunk by to exclude neighbouring tiles
+EXTENT_EPSILON = 1e-6
+
+
+SeedPlan = namedtuple("SeedPlan", ("extents", "tiles", "footprint_tiles"))
+
+
+def get_tile_size(grid, zoom):
+    """ Returns the width and height of a tile of the given zoom level in
+    grid units.
+    """
+    (minx, miny, maxx, maxy), cols, rows = GRIDS[grid]
+    return (maxx - minx) / (cols << zoom), (maxy - miny) / (rows << zoom)
+
+
+def get_grid_size(grid, zoom):
+    """ Returns the number of columns and rows of the given zoom level. """
+    _, cols, rows = GRIDS[grid]
+    return cols << zoom, rows << zoom
+
+
+def to_grid_geometry(footprint, grid):
+    """ Converts a lon/lat `footprint` to the coordinates of the grid. Edges
+    of footprints generated from a raster in the grid's CRS are straight again
+    after this conversion. Unwrapped longitudes are kept.
+    """
+
+    if grid != "GoogleMapsCompatible":
+        return footprint
+
+    def project(coords):
+        return [
+            (
+                radians(x) * EARTH_RADIUS,
+                log(tan(pi / 4 + radians(
+                    max(-MAX_LATITUDE, min(MAX_LATITUDE, y))
+                ) / 2)) * EARTH_RADIUS
+            )
+            for x, y in coords
+        ]
+
+    if isinstance(footprint, Polygon):
+        polygons = [footprint]
+    else:
+        polygons = list(footprint)
+
+    return MultiPolygon([
+        Polygon(*[project(ring.coords) for ring in polygon])
+        for polygon in polygons
+    ])
+
+
+def clip_footprints(footprints, grid, extent):
+    """ Clips the lon/lat `footprints` to the `extent` given in coordinates
+    of the grid. Footprints not intersecting the extent are dropped.
+    """
+
+    minx, miny, maxx, maxy = extent
+    if grid == "GoogleMapsCompatible":
+        minx, maxx = degrees(minx / EARTH_RADIUS), degrees(maxx / EARTH_RADIUS)
+        miny, maxy = [
+            degrees(2 * atan(exp(y / EARTH_RADIUS)) - pi / 2)
+            for y in (miny, maxy)
+        ]
+
+    bbox = Polygon.from_bbox((minx, miny, maxx, maxy))
+    clipped = []
+    for footprint in footprints:
+        bbox.srid = footprint.srid
+        intersection = footprint.intersection(bbox)
+        if intersection.geom_type == "GeometryCollection":
+            # drop the parts only touching the extent
+            intersection = MultiPolygon([
+                part for part in intersection if part.geom_type == "Polygon"
+            ], srid=footprint.srid)
+        if intersection.geom_type in ("Polygon", "MultiPolygon") and \
+                not intersection.empty:
+            clipped.append(intersection)
+    return clipped
+
+
+def _get_column_range(grid, zoom, minx, maxx):
+    """ Returns the first and last (unwrapped) column intersecting the range
+    `minx` to `maxx`.
+    """
+    (origin_x, _, _, _), _, _ = GRIDS[grid]
+    width, _ = get_tile_size(grid, zoom)
+    cols, _ = get_grid_size(grid, zoom)
+
+    first = max(0, int(floor((minx - origin_x) / width)))
+    last = min(2 * cols - 1, int(ceil((maxx - origin_x) / width)) - 1)
+    return first, max(first, last)
+
+
+def _get_row_range(grid, zoom, miny, maxy):
+    """ Returns the first and last row (counted from the bottom)
+    intersecting the range `miny` to `maxy`.
+    """
+    (_, origin_y, _, _), _, _ = GRIDS[grid]
+    _, height = get_tile_size(grid, zoom)
+    _, rows = get_grid_size(grid, zoom)
+
+    first = max(0, int(floor((miny - origin_y) / height)))
+    last = min(rows - 1, int(ceil((maxy - origin_y) / height)) - 1)
+    return first, max(first, last)
+
+
+def count_extent_tiles(grid, zoom, extent):
+    """ Returns the number of tiles of the given zoom level intersecting the
+    `extent` which may cross the dateline.
+    """
+    minx, miny, maxx, maxy = extent
+    cols, _ = get_grid_size(grid, zoom)
+    first_col, last_col = _get_column_range(grid, zoom, minx, maxx)
+    first_row, last_row = _get_row_range(grid, zoom, miny, maxy)
+    return (
+        min(cols, last_col - first_col + 1) * (last_row - first_row + 1)
+    )
+
+
+def get_extent_tiles(grid, zoom, extent):
+    """ Returns the tiles of the given zoom level intersecting the `extent`
+    which may cross the dateline, in the same form as
+    :func:`get_footprint_tiles`.
+    """
+    minx, miny, maxx, maxy = extent
+    cols, _ = get_grid_size(grid, zoom)
+    first_col, last_col = _get_column_range(grid, zoom, minx, maxx)
+    first_row, last_row = _get_row_range(grid, zoom, miny, maxy)
+    last_col = min(last_col, first_col + cols - 1)
+    return dict(
+        (row, [(first_col, last_col)])
+        for row in range(first_row, last_row + 1)
+    )
+
+
+def get_tile_extent(grid, zoom, col, row):
+    """ Returns the extent of the tile in the given (unwrapped) column and
+    row in grid units.
+    """
+    (origin_x, origin_y, _, _), _, _ = GRIDS[grid]
+    width, height = get_tile_size(grid, zoom)
+    return (
+        origin_x + col * width, origin_y + row * height,
+        origin_x + (col + 1) * width, origin_y + (row + 1) * height
+    )
+
+
+def get_footprint_tiles(geometries, grid, zoom, margin=0):
+    """ Returns the tiles of the given zoom level intersecting any of the
+    `geometries` (in grid coordinates) extended by `margin` grid units as a
+    dictionary mapping rows to sorted lists of `(first, last)` column ranges.
+    """
+
+    _, height = get_tile_size(grid, zoom)
+    (_, origin_y, _, _), _, _ = GRIDS[grid]
+
+    tiles = {}
+    for geometry in geometries:
+        if geometry.empty:
+            continue
+        minx, miny, maxx, maxy = geometry.extent
+        first_row, last_row = _get_row_range(
+            grid, zoom, miny - margin, maxy + margin
+        )
+        for row in range(first_row, last_row + 1):
+            strip = Polygon.from_bbox((
+                minx - margin, origin_y + row * height - margin,
+                maxx + margin, origin_y + (row + 1) * height + margin
+            ))
+            intersection = geometry.intersection(strip)
+            if intersection.empty:
+                continue
+
+            if intersection.geom_type in ("Point", "LineString", "Polygon"):
+                parts = [intersection]
+            else:
+                parts = list(intersection)
+
+            # the projection of each connected part on the x axis is a
+            # single range, all tiles of that range intersect the part
+            for part in parts:
+                part_minx, _, part_maxx, _ = part.extent
+                tiles.setdefault(row, []).append(_get_column_range(
+                    grid, zoom, part_minx - margin, part_maxx + margin
+                ))
+
+    for row, ranges in tiles.items():
+        tiles[row] = _merge_ranges(ranges)
+    return tiles
+
+
+def wrap_tiles(grid, zoom, tiles):
+    """ Wraps the column ranges of `tiles` (as returned by
+    :func:`get_footprint_tiles`) at the dateline. The returned ranges are
+    within the grid and do not overlap.
+    """
+    cols, _ = get_grid_size(grid, zoom)
+    wrapped = {}
+    for row, ranges in tiles.items():
+        row_ranges = []
+        for first, last in ranges:
+            if last - first + 1 >= cols:
+                row_ranges.append((0, cols - 1))
+            elif first >= cols:
+                row_ranges.append((first - cols, last - cols))
+            elif last >= cols:
+                row_ranges.extend([(first, cols - 1), (0, last - cols)])
+            else:
+                row_ranges.append((first, last))
+        wrapped[row] = _merge_ranges(row_ranges)
+    return wrapped
+
+
+def _merge_ranges(ranges):
+    """ Merges overlapping and adjacent `(first, last)` ranges. """
+    merged = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return merged
+
+
+def _get_components(tiles):
+    """ Groups the column ranges of `tiles` into 8-connected components.
+    Returns a list of dictionaries mapping rows to `[first, last]` hulls of
+    the component's ranges in that row.
+    """
+
+    ranges = [
+        (row, first, last)
+        for row in sorted(tiles) for first, last in tiles[row]
+    ]
+    parents = range(len(ranges))
+
+    def find(index):
+        while parents[index] != index:
+            parents[index] = parents[parents[index]]
+            index = parents[index]
+        return index
+
+    # ranges of consecutive rows are compared with two pointers
+    start = 0
+    while start < len(ranges):
+        end = start
+        while end < len(ranges) and ranges[end][0] == ranges[start][0]:
+            end += 1
+        next_end = end
+        while next_end < len(ranges) and \
+                ranges[next_end][0] == ranges[start][0] + 1:
+            next_end += 1
+
+        i, j = start, end
+        while i < end and j < next_end:
+            _, first, last = ranges[i]
+            _, next_first, next_last = ranges[j]
+            if first <= next_last + 1 and next_first <= last + 1:
+                parents[find(i)] = find(j)
+            if last < next_last:
+                i += 1
+            else:
+                j += 1
+        start = end
+
+    components = {}
+    for index, (row, first, last) in enumerate(ranges):
+        component = components.setdefault(find(index), {})
+        if row in component:
+            hull = component[row]
+            hull[0], hull[1] = min(hull[0], first), max(hull[1], last)
+        else:
+            component[row] = [first, last]
+    return components.values()
+
+
+def get_tile_rectangles(tiles, max_count):
+    """ Covers the `tiles` (as returned by :func:`get_footprint_tiles`) with
+    `(first_col, first_row, last_col, last_row)` rectangles of tiles.
+
+    Each connected component of tiles starts with one rectangle per row.
+    Vertically adjacent rectangles of a component are merged, always the pair
+    adding the fewest tiles first, until there are at most `max_count`
+    rectangles. Pairs adding no tiles are always merged.
+    """
+
+    # band: [first_row, last_row, first_col, last_col, previous, next, version]
+    bands = []
+    heap = []
+
+    def area(first_row, last_row, first_col, last_col):
+        return (last_row - first_row + 1) * (last_col - first_col + 1)
+
+    def merge_cost(index):
+        band, other = bands[index], bands[bands[index][5]]
+        return area(
+            band[0], other[1], min(band[2], other[2]), max(band[3], other[3])
+        ) - area(*band[:4]) - area(*other[:4])
+
+    def push(index):
+        if index is not None and bands[index][5] is not None:
+            heapq.heappush(heap, (
+                merge_cost(index), index,
+                bands[index][6], bands[bands[index][5]][6]
+            ))
+
+    for component in _get_components(tiles):
+        previous = None
+        for row in sorted(component):
+            first, last = component[row]
+            bands.append([row, row, first, last, previous, None, 0])
+            if previous is not None:
+                bands[previous][5] = len(bands) - 1
+            previous = len(bands) - 1
+
+    for index in range(len(bands)):
+        push(index)
+
+    count = len(bands)
+    removed = set()
+    while heap:
+        cost, index, version, next_version = heapq.heappop(heap)
+        band = bands[index]
+        if index in removed or band[6] != version or band[5] is None or \
+                bands[band[5]][6] != next_version:
+            continue
+        if cost > 0 and count <= max_count:
+            break
+
+        other = bands[band[5]]
+        band[1] = other[1]
+        band[2], band[3] = min(band[2], other[2]), max(band[3], other[3])
+        band[6] += 1
+        removed.add(band[5])
+        band[5] = other[5]
+        if other[5] is not None:
+            bands[other[5]][4] = index
+        count -= 1
+
+        push(band[4])
+        push(index)
+
+    return [
+        (band[2], band[0], band[3], band[1])
+        for index, band in enumerate(bands) if index not in removed
+    ]
+
+
+def get_rectangle_extents(grid, zoom, rectangle):
+    """ Returns the extents of the `(first_col, first_row, last_col,
+    last_row)` tile rectangle, two if it crosses the dateline. The extents are
+    shrunk slightly to not touch any neighbouring tiles.
+    """
+
+    (origin_x, origin_y, _, _), _, _ = GRIDS[grid]
+    width, height = get_tile_size(grid, zoom)
+    cols, _ = get_grid_size(grid, zoom)
+    first_col, first_row, last_col, last_row = rectangle
+
+    if first_col >= cols:
+        column_ranges = [(first_col - cols, last_col - cols)]
+    elif last_col >= cols:
+        column_ranges = [(first_col, cols - 1), (0, last_col - cols)]
+    else:
+        column_ranges = [(first_col, last_col)]
+
+    epsilon_x = width * EXTENT_EPSILON
+    epsilon_y = height * EXTENT_EPSILON
+    return [
+        (
+            origin_x + first * width + epsilon_x,
+            origin_y + first_row * height + epsilon_y,
+            origin_x + (last + 1) * width - epsilon_x,
+            origin_y + (last_row + 1) * height - epsilon_y
+        )
+        for first, last in column_ranges
+    ]
+
+
+def get_seed_plan(footprints, grid, minzoom, maxzoom, margin=0,
+                  max_extents=8):
+    """ Plans the seeding of the tiles intersecting the lon/lat `footprints`
+    from `minzoom` to `maxzoom`. `margin` is given in pixels of the highest
+    zoom level and accounts for simplified footprints. Returns a `SeedPlan`
+    with a list of `(zoom, extent)` tuples to seed, the number of tiles within
+    these extents and the number of tiles actually intersecting the
+    footprints.
+    """
+
+    geometries = [to_grid_geometry(footprint, grid) for footprint in footprints]
+    margin_units = margin * get_tile_size(grid, maxzoom)[0] / 256
+
+    extents = []
+    tiles = footprint_tiles = 0
+    for zoom in range(minzoom, maxzoom + 1):
+        zoom_tiles = get_footprint_tiles(geometries, grid, zoom, margin_units)
+        footprint_tiles += sum(
+            last - first + 1
+            for ranges in zoom_tiles.values() for first, last in ranges
+        )
+        for rectangle in get_tile_rectangles(zoom_tiles, max_extents):
+            first_col, first_row, last_col, last_row = rectangle
+            tiles += (last_col - first_col + 1) * (last_row - first_row + 1)
+            extents.extend(
+                (zoom, extent)
+                for extent in get_rectangle_extents(grid, zoom, rectangle)
+            )
+
+    return SeedPlan(extents, tiles, footprint_tiles)
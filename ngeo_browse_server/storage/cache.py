@@ -0,0 +1,198 @@
+# ------------------------------------------------------------------------------
+#
+# Project: ngEO Browse Server <http://ngeo.eox.at>
+# Authors: Fabian Schindler <fabian.schindler@eox.at>
+#
+# ------------------------------------------------------------------------------
+# Copyright (C) 2019 European Space Agency
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# ------------------------------------------------------------------------------
+
+
+""" Size bounded on-disk cache of files of a remote storage.
+
+Cached files are keyed by the path of the remote object and its ETag, so a
+changed object is never served from the cache. The least recently used files
+are evicted when the size of the cache exceeds its limit. Access times are
+tracked via the modification times of the cached files, so the cache can be
+shared by multiple processes.
+"""
+
+import os
+from os.path import join, splitext, getsize, dirname, abspath
+import shutil
+import tempfile
+import threading
+import logging
+from hashlib import sha1
+
+
+logger = logging.getLogger(__name__)
+
+TEMP_PREFIX = ".tmp_"
+
+
+class FileCache(object):
+    """ LRU cache of remote files within `directory` limited to `max_size`
+        bytes.
+    """
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._statistics = {"hits": 0, "misses": 0, "evictions": 0}
+
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # may have been created by another process meanwhile
+                if not os.path.isdir(directory):
+                    raise
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self._statistics[key] += value
+
+    def _get_key(self, path):
+        return sha1(path).hexdigest()
+
+    def get_cache_path(self, path, etag):
+        """ Returns the path of the cached file of the remote object `path`
+            with the given `etag`.
+        """
+        return join(self.directory, "%s_%s%s" % (
+            self._get_key(path), etag.strip('"'), splitext(path)[1]
+        ))
+
+    def get(self, path, etag):
+        """ Returns the path of the cached file or `None` if the object is not
+            cached (in that version).
+        """
+        cache_path = self.get_cache_path(path, etag)
+        try:
+            # mark as recently used
+            os.utime(cache_path, None)
+        except OSError:
+            self._count("misses")
+            return None
+
+        self._count("hits")
+        return cache_path
+
+    def get_temp_path(self):
+        """ Returns a new temporary file path within the cache directory to
+            download a file to before adding it.
+        """
+        handle, temp_path = tempfile.mkstemp(
+            prefix=TEMP_PREFIX, dir=self.directory
+        )
+        os.close(handle)
+        return temp_path
+
+    def add(self, path, etag, local_path):
+        """ Moves the file `local_path` into the cache as the version `etag` of
+            the object `path`. Other versions of the object are removed.
+            Returns the path of the cached file.
+        """
+        cache_path = self.get_cache_path(path, etag)
+        key = self._get_key(path) + "_"
+
+        if dirname(abspath(local_path)) != abspath(self.directory):
+            temp_path = self.get_temp_path()
+            shutil.move(local_path, temp_path)
+            local_path = temp_path
+        os.rename(local_path, cache_path)
+
+        for filename in os.listdir(self.directory):
+            if filename.startswith(key) and \
+                    join(self.directory, filename) != cache_path:
+                self._remove(join(self.directory, filename))
+
+        self.evict()
+        return cache_path
+
+    def remove(self, path):
+        """ Removes all cached versions of the object `path`. """
+        key = self._get_key(path) + "_"
+        for filename in os.listdir(self.directory):
+            if filename.startswith(key):
+                self._remove(join(self.directory, filename))
+
+    def _remove(self, filename):
+        try:
+            os.remove(filename)
+            return True
+        except OSError:
+            # already removed by another process
+            return False
+
+    def evict(self):
+        """ Removes the least recently used files until the cache does not
+            exceed its maximum size.
+        """
+        entries = []
+        total = 0
+        for filename in os.listdir(self.directory):
+            if filename.startswith(TEMP_PREFIX):
+                continue
+            filename = join(self.directory, filename)
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, filename))
+            total += stat.st_size
+
+        if total <= self.max_size:
+            return
+
+        for _, size, filename in sorted(entries):
+            if total <= self.max_size:
+                break
+            if self._remove(filename):
+                self._count("evictions")
+                logger.debug("Evicted '%s' from the file cache." % filename)
+            total -= size
+
+    def get_size(self):
+        """ Returns the current size of all cached files in bytes. """
+        size = 0
+        for filename in os.listdir(self.directory):
+            if not filename.startswith(TEMP_PREFIX):
+                try:
+                    size += getsize(join(self.directory, filename))
+                except OSError:
+                    pass
+        return size
+
+    def get_statistics(self):
+        with self._lock:
+            return dict(self._statistics)
+
+    def log_statistics(self):
+        statistics = self.get_statistics()
+        logger.info(
+            "File cache: %d hits, %d misses, %d evictions, %d bytes used." % (
+                statistics["hits"], statistics["misses"],
+                statistics["evictions"], self.get_size()
+            )
+        )
@@ -27,7 +27,7 @@
 
 
 from ngeo_browse_server.config import (
-    get_ngeo_config, safe_get
+    get_ngeo_config, safe_get, get_project_relative_path
 )
 
 
@@ -48,3 +48,49 @@ def get_swift_container(conf=None):
 def get_auth_method(conf=None):
     conf = conf or get_ngeo_config()
     return safe_get(conf, AUTH_SECTION, 'method', None)
+
+
+def get_swift_client_config(conf=None):
+    """ Returns a dictionary with the connection pooling, concurrency and
+        large object settings for the `SwiftFileManager`.
+    """
+    conf = conf or get_ngeo_config()
+
+    values = {
+        "pool_size": int(safe_get(conf, STORAGE_SECTION, 'pool_size', 10)),
+        "workers": int(safe_get(conf, STORAGE_SECTION, 'workers', 4)),
+        "upload_precheck": True,
+        "segment_size": int(
+            safe_get(conf, STORAGE_SECTION, 'segment_size', 0)
+        ),
+        "large_object": safe_get(
+            conf, STORAGE_SECTION, 'large_object', 'slo'
+        ),
+    }
+
+    try:
+        values["upload_precheck"] = conf.getboolean(
+            STORAGE_SECTION, 'upload_precheck'
+        )
+    except:
+        pass
+
+    return values
+
+
+def get_file_cache_config(conf=None):
+    """ Returns a dictionary with the settings of the local cache of remote
+        files or `None` if it is not enabled.
+    """
+    conf = conf or get_ngeo_config()
+
+    directory = safe_get(conf, STORAGE_SECTION, 'cache_dir')
+    if not directory:
+        return None
+
+    return {
+        "directory": get_project_relative_path(directory),
+        "max_size": int(
+            safe_get(conf, STORAGE_SECTION, 'cache_size', 10737418240)
+        ),
+    }
@@ -1,14 +1,25 @@
+import os
 import json
-from datetime import datetime
+import tempfile
+import threading
+from os.path import dirname, exists
+from datetime import datetime, timedelta
+from hashlib import sha1
 
 from django.utils.dateparse import parse_datetime
 from django.utils.timezone import make_aware, utc
 import requests
 import logging
 
-from ngeo_browse_server.storage.swift.conf import get_swift_auth_config
+from ngeo_browse_server.lock import FileLock, LockException
+from ngeo_browse_server.storage.swift.conf import (
+    get_swift_auth_config, get_token_cache_config
+)
 logger = logging.getLogger(__name__)
 
+# permissions of the token cache file, shared by the users of a group
+TOKEN_CACHE_MODE = 0660
+
 
 class SwiftAuthError(Exception):
     pass
@@ -81,9 +92,72 @@ def get_auth_token_and_swift_endpoint(auth_url, username, password, project_id,
     )
 
 
+class TokenCache(object):
+    """ Token cache in a JSON file shared by all processes of a node. Tokens
+        are stored per `key` (a hash of the credentials). The file is
+        replaced atomically, so reading requires no locking. Refreshing a
+        token is serialized via a lock file, so that only one process
+        requests a new token from Keystone. The file is readable and writable
+        by the group, so that processes of all users in the group of the
+        directory can share it.
+    """
+
+    def __init__(self, filename, lock_timeout=10):
+        self.filename = filename
+        self.lock_timeout = lock_timeout
+
+    def read(self, key):
+        """ Returns the tuple `(token, expires, storage_url)` stored for `key`
+            or `None`.
+        """
+        try:
+            with open(self.filename) as f:
+                entry = json.load(f)[key]
+            return (
+                entry["token"], parse_datetime(entry["expires"]),
+                entry["storage_url"]
+            )
+        except (IOError, ValueError, KeyError, TypeError):
+            return None
+
+    def write(self, key, token, expires, storage_url):
+        try:
+            with open(self.filename) as f:
+                entries = json.load(f)
+        except (IOError, ValueError):
+            entries = {}
+
+        entries[key] = {
+            "token": token,
+            "expires": expires.isoformat(),
+            "storage_url": storage_url,
+        }
+
+        handle, tmp_filename = tempfile.mkstemp(
+            prefix=".token_", dir=dirname(self.filename) or "."
+        )
+        try:
+            # mkstemp creates the file only readable by the current user
+            os.fchmod(handle, TOKEN_CACHE_MODE)
+            with os.fdopen(handle, "w") as f:
+                json.dump(entries, f)
+            os.rename(tmp_filename, self.filename)
+        except:
+            if exists(tmp_filename):
+                os.remove(tmp_filename)
+            raise
+
+    def lock(self):
+        return FileLock(self.filename + ".lck", self.lock_timeout)
+
+
 class AuthTokenManager(object):
-    """ This class manages auth tokens retrieved via the Keystone API """
-    def __init__(self, config=None):
+    """ This class manages auth tokens retrieved via the Keystone API. When a
+        `token_cache` is configured, tokens are shared with all other
+        processes using the same cache file. Tokens are refreshed
+        `refresh_margin` seconds before they expire.
+    """
+    def __init__(self, config=None, token_cache=None, refresh_margin=None):
         self.token = None
         self.expires = None
         self.storage_url = None
@@ -97,18 +171,98 @@ class AuthTokenManager(object):
         self.region_name = config['region_name']
         self.region_id = config['region_id']
 
-    def _refresh_token(self):
-        utcnow = make_aware(datetime.utcnow(), utc)
-        if not self.expires or utcnow >= self.expires:
-            items = get_auth_token_and_swift_endpoint(
-                self.auth_url,
-                self.username,
-                self.password,
-                self.tenant_id,
-                self.region_name,
-                self.region_id,
+        if token_cache is None or refresh_margin is None:
+            cache_config = get_token_cache_config()
+            if token_cache is None:
+                token_cache = cache_config["token_cache"]
+            if refresh_margin is None:
+                refresh_margin = cache_config["refresh_margin"]
+
+        self.token_cache = TokenCache(token_cache) if token_cache else None
+        self.refresh_margin = timedelta(seconds=refresh_margin or 0)
+        self.key = sha1("\0".join(
+            str(value) for value in (
+                self.auth_url, self.username, self.tenant_id,
+                self.region_name, self.region_id
             )
+        )).hexdigest()
+
+        self._lock = threading.Lock()
+        self.statistics = {"keystone_requests": 0, "avoided_requests": 0}
+
+    def _is_valid(self, expires, margin=True):
+        if not expires:
+            return False
+        utcnow = make_aware(datetime.utcnow(), utc)
+        return utcnow < expires - (self.refresh_margin if margin else timedelta())
+
+    def _request_token(self):
+        items = get_auth_token_and_swift_endpoint(
+            self.auth_url,
+            self.username,
+            self.password,
+            self.tenant_id,
+            self.region_name,
+            self.region_id,
+        )
+        self.statistics["keystone_requests"] += 1
+        self.token, self.expires, self.storage_url = items
+        return items
+
+    def _use_cached(self):
+        """ Takes the token from the shared cache if it is still valid. """
+        items = self.token_cache.read(self.key)
+        if items and self._is_valid(items[1]):
             self.token, self.expires, self.storage_url = items
+            self.statistics["avoided_requests"] += 1
+            return True
+        return False
+
+    def _refresh_token(self):
+        with self._lock:
+            if self._is_valid(self.expires):
+                return
+
+            if self.token_cache is None:
+                self._request_token()
+                return
+
+            if self._use_cached():
+                return
+
+            try:
+                with self.token_cache.lock():
+                    # another process may have refreshed the token meanwhile
+                    if self._use_cached():
+                        return
+                    token, expires, storage_url = self._request_token()
+                    self.token_cache.write(
+                        self.key, token, expires, storage_url
+                    )
+            except LockException, e:
+                # keep using the current token until it actually expires
+                if self._is_valid(self.expires, margin=False):
+                    return
+                logger.warn("Could not lock the token cache: %s" % e)
+                self._request_token()
+            except (OSError, IOError), e:
+                # e.g. a cache or lock file not accessible by this user
+                logger.warn(
+                    "Could not use the token cache '%s': %s"
+                    % (self.token_cache.filename, e)
+                )
+                if not self._is_valid(self.expires):
+                    self._request_token()
+
+            logger.info(
+                "Refreshed Keystone token valid until %s, %d requests "
+                "avoided via the shared token cache so far." % (
+                    self.expires, self.statistics["avoided_requests"]
+                )
+            )
+
+    def get_statistics(self):
+        return dict(self.statistics)
 
     def get_auth_token(self):
         self._refresh_token()
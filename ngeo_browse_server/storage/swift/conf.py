@@ -27,7 +27,7 @@
 
 
 from ngeo_browse_server.config import (
-    get_ngeo_config, safe_get
+    get_ngeo_config, safe_get, get_project_relative_path
 )
 
 SWIFT_SECTION = 'storage.auth.swift'
@@ -59,3 +59,21 @@ def get_swift_auth_config(conf=None):
         'insecure': False,
         'timeout':  safe_get(conf, SWIFT_SECTION, 'timeout'),
     }
+
+
+def get_token_cache_config(conf=None):
+    """ Returns the path of the token cache file shared by all processes (or
+        `None` if disabled) and the number of seconds before their expiry
+        that tokens are refreshed.
+    """
+    conf = conf or get_ngeo_config()
+
+    token_cache = safe_get(conf, SWIFT_SECTION, 'token_cache')
+    return {
+        'token_cache': (
+            get_project_relative_path(token_cache) if token_cache else None
+        ),
+        'refresh_margin': int(
+            safe_get(conf, SWIFT_SECTION, 'refresh_margin', 300)
+        ),
+    }
@@ -1,19 +1,59 @@
 import os
-from os.path import basename, join
+from os.path import basename, join, getsize
 import shutil
 import logging
+import tempfile
+import threading
+import time
+import json
+from datetime import datetime, timedelta
+from hashlib import md5
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
 
 from osgeo import gdal
 import requests
+from requests.adapters import HTTPAdapter
 
 logger = logging.getLogger(__name__)
 
 
+DEFAULT_POOL_SIZE = 10
+DEFAULT_WORKERS = 4
+
+# segments of large objects are stored in the same container below this prefix
+SEGMENTS_PREFIX = ".segments"
+LARGE_OBJECT_TYPES = ("slo", "dlo")
+
+
+class SwiftFileExistsError(Exception):
+    pass
+
+
+def create_session(pool_size=DEFAULT_POOL_SIZE):
+    """ Creates a `requests.Session` keeping up to `pool_size` connections to
+        the storage alive, so that subsequent requests do not need a new
+        TCP/TLS handshake.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
 def upload_file(storage_url, container, prefix, file_, auth_token,
-                filename=None, replace=False):
+                filename=None, replace=False, precheck=True, session=None):
+    """ Uploads the given file to `<prefix>/<basename>` of the container.
+        With `precheck` a HEAD request checks whether the object already
+        exists beforehand. Otherwise a conditional PUT (`If-None-Match: *`)
+        is sent which fails when the object exists, or, when `replace` is
+        set, a plain PUT overwriting the object.
+    """
+    session = session or requests
 
     if isinstance(file_, basestring):
-        file_ = open(file_)
+        file_ = open(file_, 'rb')
 
     filename = filename or file_.name
 
@@ -21,44 +61,234 @@ def upload_file(storage_url, container, prefix, file_, auth_token,
     path = join(prefix, basename(filename))
 
     url = "%s/%s/%s" % (storage_url, container, path)
-    resp = requests.head(url, headers=headers)
 
-    if resp.status_code == 200:
-        if replace:
-            delete_file(storage_url, container, path)
-        else:
-            raise Exception("File at path '%s' already exists" % path)
+    if precheck:
+        if object_exists(storage_url, container, path, auth_token, session):
+            if replace:
+                delete_file(
+                    storage_url, container, path, auth_token, session=session
+                )
+            else:
+                raise SwiftFileExistsError(
+                    "File at path '%s' already exists" % path
+                )
+
+    elif not replace:
+        headers["If-None-Match"] = "*"
 
     logger.debug("Performing upload of file '%s' to '%s'" % (filename, url))
-    resp = requests.put(url, data=file_, headers=headers)
-    if resp.status_code != 201:
+    resp = session.put(url, data=file_, headers=headers)
+    if resp.status_code == 412:
+        raise SwiftFileExistsError("File at path '%s' already exists" % path)
+
+    elif resp.status_code != 201:
         raise Exception(
             "Upload of file '%s' to %s failed, message: %s" % (
                 filename, url, resp.text
             )
         )
 
+    return resp.headers.get("ETag", "").strip('"') or None
+
+
+def object_exists(storage_url, container, path, auth_token, session=None):
+    session = session or requests
+
+    headers = {"X-Auth-Token": auth_token}
+    url = "%s/%s/%s" % (storage_url, container, path)
+
+    resp = session.head(url, headers=headers)
+    return resp.status_code == 200
+
+
+def get_object_etag(storage_url, container, path, auth_token, session=None):
+    """ Returns the ETag of the object or `None` if it does not exist. """
+    session = session or requests
 
-def delete_file(storage_url, container, path, auth_token):
     headers = {"X-Auth-Token": auth_token}
     url = "%s/%s/%s" % (storage_url, container, path)
 
+    resp = session.head(url, headers=headers)
+    if resp.status_code != 200:
+        return None
+    return resp.headers.get("ETag", "").strip('"')
+
+
+def get_object_manifest(storage_url, container, path, auth_token,
+                        session=None):
+    """ Returns the `X-Object-Manifest` header of a dynamic large object or
+        `None` for any other object.
+    """
+    session = session or requests
+
+    headers = {"X-Auth-Token": auth_token}
+    url = "%s/%s/%s" % (storage_url, container, path)
+
+    resp = session.head(url, headers=headers)
+    if resp.status_code != 200:
+        return None
+    return resp.headers.get("X-Object-Manifest")
+
+
+def get_segments_prefix(storage_url, container, path, auth_token,
+                        session=None):
+    """ Returns the common prefix of the segments of the static or dynamic
+        large object `path` or `None` for any other object.
+    """
+    session = session or requests
+
+    headers = {"X-Auth-Token": auth_token}
+    url = "%s/%s/%s" % (storage_url, container, path)
+
+    resp = session.head(url, headers=headers)
+    if resp.status_code == 404:
+        return None
+    elif resp.status_code != 200:
+        raise Exception("Failed to retrieve metadata of '%s'" % path)
+
+    manifest = resp.headers.get("X-Object-Manifest")
+    if manifest:
+        return manifest.split("/", 1)[1].rstrip("/")
+    elif resp.headers.get("X-Static-Large-Object", "").lower() != "true":
+        return None
+
+    resp = session.get(
+        url, params={"multipart-manifest": "get"}, headers=headers
+    )
+    if resp.status_code != 200:
+        raise Exception("Failed to retrieve manifest of '%s'" % path)
+
+    # segment names are given as "/<container>/<path>"
+    segments = resp.json()
+    if not segments:
+        return None
+    return segments[0]["name"].split("/", 2)[2].rsplit("/", 1)[0]
+
+
+def upload_segment(storage_url, container, path, reader, etag, auth_token,
+                   session=None):
+    """ Uploads a single segment of a large object. The MD5 checksum `etag`
+        is sent along to be verified by the storage and compared to the
+        checksum returned by it.
+    """
+    session = session or requests
+
+    headers = {"X-Auth-Token": auth_token, "ETag": etag}
+    url = "%s/%s/%s" % (storage_url, container, path)
+
+    logger.debug("Performing upload of segment '%s'" % url)
+    try:
+        resp = session.put(url, data=reader, headers=headers)
+    finally:
+        reader.close()
+
+    if resp.status_code != 201:
+        raise Exception(
+            "Upload of segment '%s' failed, message: %s" % (path, resp.text)
+        )
+
+    received_etag = resp.headers.get("ETag", etag).strip('"')
+    if received_etag != etag:
+        raise Exception(
+            "Checksum mismatch of segment '%s': expected %s, got %s" % (
+                path, etag, received_etag
+            )
+        )
+
+
+def upload_manifest(storage_url, container, path, segments, auth_token,
+                    large_object="slo", conditional=False, session=None):
+    """ Creates the large object `path` from the uploaded `segments`, a list
+        of `(segment_path, etag, size)` tuples. For static large objects the
+        storage verifies the checksums and sizes of all segments, dynamic
+        large objects simply refer to the common prefix of the segments.
+    """
+    session = session or requests
+
+    headers = {"X-Auth-Token": auth_token}
+    if conditional:
+        headers["If-None-Match"] = "*"
+    url = "%s/%s/%s" % (storage_url, container, path)
+
+    logger.debug("Performing upload of %s manifest '%s'" % (large_object, url))
+    if large_object == "slo":
+        manifest = [{
+            "path": "/%s/%s" % (container, segment_path),
+            "etag": etag,
+            "size_bytes": size,
+        } for segment_path, etag, size in segments]
+        resp = session.put(
+            url, data=json.dumps(manifest), headers=headers,
+            params={"multipart-manifest": "put"}
+        )
+    else:
+        headers["X-Object-Manifest"] = "%s/%s/" % (
+            container, segments[0][0].rsplit("/", 1)[0]
+        )
+        resp = session.put(url, data="", headers=headers)
+
+    if resp.status_code == 412:
+        raise SwiftFileExistsError("File at path '%s' already exists" % path)
+
+    elif resp.status_code != 201:
+        raise Exception(
+            "Upload of manifest '%s' failed, message: %s" % (path, resp.text)
+        )
+
+
+def delete_file(storage_url, container, path, auth_token, params=None,
+                session=None):
+    session = session or requests
+
+    headers = {"X-Auth-Token": auth_token}
+    bulk = (params or {}).get("multipart-manifest") == "delete"
+    if bulk:
+        headers["Accept"] = "application/json"
+    url = "%s/%s/%s" % (storage_url, container, path)
+
     logger.debug("Performing deletion of file '%s'" % url)
-    resp = requests.delete(url, headers=headers)
+    resp = session.delete(url, headers=headers, params=params)
 
     if resp.status_code >= 300:
         raise Exception(
             "Failed to delete file '%s'. Error was %s" % (path, resp.text)
         )
 
+    # deletions of (static large) objects with their segments are answered
+    # like bulk deletions, reporting failures in the body only
+    if bulk:
+        try:
+            result = resp.json()
+        except ValueError:
+            raise Exception(
+                "Failed to delete file '%s'. Invalid response %s"
+                % (path, resp.text)
+            )
+        status = result.get("Response Status", "")
+        if (result.get("Errors") or not status.startswith("2") or
+                (result.get("Number Not Found") and
+                 not result.get("Number Deleted"))):
+            raise Exception(
+                "Failed to delete file '%s'. Error was %s %s" % (
+                    path, status or "Not Found", result.get("Errors") or ""
+                )
+            )
+
+
+def list_contents(storage_url, container, prefix_path, auth_token,
+                  details=False, session=None):
+    """ Returns the names of the objects below `prefix_path` or, with
+        `details`, their listing entries including the size and the time of
+        the last modification.
+    """
+    session = session or requests
 
-def list_contents(storage_url, container, prefix_path, auth_token):
     headers = {"X-Auth-Token": auth_token}
     url = "%s/%s" % (storage_url, container)
 
     logger.debug("Listing contents at '%s'" % url)
 
-    resp = requests.get(url, params={
+    resp = session.get(url, params={
         "prefix": prefix_path,
         "format": "json",
     }, headers=headers)
@@ -68,19 +298,22 @@ def list_contents(storage_url, container, prefix_path, auth_token):
 
     contents = resp.json()
     return [
-        item["name"]
+        item if details else item["name"]
         for item in contents
         if item["content_type"] != "application/x-directory"
     ]
 
 
-def download_file(storage_url, container, path, local_path, auth_token):
+def download_file(storage_url, container, path, local_path, auth_token,
+                  session=None):
+    session = session or requests
+
     headers = {"X-Auth-Token": auth_token}
     url = "%s/%s/%s" % (storage_url, container, path)
 
     logger.debug("Downloading file from '%s'" % url)
 
-    resp = requests.get(url, headers=headers, stream=True)
+    resp = session.get(url, headers=headers, stream=True)
 
     if resp.status_code != 200:
         raise Exception("Failed to download file '%s'" % path)
@@ -89,14 +322,126 @@ def download_file(storage_url, container, path, local_path, auth_token):
         shutil.copyfileobj(resp.raw, out_file)
 
 
-class SwiftFileManager(object):
+def get_segment_md5(filename, offset, length, block_size=1024 * 1024):
+    """ Returns the hex MD5 checksum of `length` bytes of the file starting at
+        `offset`.
+    """
+    checksum = md5()
+    with open(filename, "rb") as f:
+        f.seek(offset)
+        while length > 0:
+            data = f.read(min(block_size, length))
+            if not data:
+                break
+            checksum.update(data)
+            length -= len(data)
+    return checksum.hexdigest()
+
+
+class SegmentReader(object):
+    """ File-like object streaming `length` bytes of a file starting at
+        `offset`.
+    """
+    def __init__(self, filename, offset, length):
+        self._file = open(filename, "rb")
+        self._file.seek(offset)
+        self._remaining = length
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size=-1):
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def close(self):
+        self._file.close()
+
+
+class OperationStatistics(object):
+    """ Thread safe counters of the number, the failures and the latencies of
+        the storage operations.
     """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    def add(self, operation, duration, failed=False):
+        with self._lock:
+            counter = self._counters.setdefault(operation, {
+                "count": 0, "failed": 0, "total": 0.0, "max": 0.0
+            })
+            counter["count"] += 1
+            counter["failed"] += int(failed)
+            counter["total"] += duration
+            counter["max"] = max(counter["max"], duration)
+
+    def get(self):
+        """ Returns a dictionary with the counters of each operation including
+            the mean latency in seconds.
+        """
+        with self._lock:
+            result = {}
+            for operation, counter in self._counters.items():
+                result[operation] = dict(
+                    counter, mean=counter["total"] / counter["count"]
+                )
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._counters = {}
+
+
+class SwiftFileManager(object):
+    """ Manages the files of a container on an OpenStack swift object storage.
+        All requests share a pooled session, the `*_files` methods run the
+        operations on multiple files concurrently in up to `workers` threads.
+        Files larger than `segment_size` (if set) are uploaded as static or
+        dynamic large objects (`large_object`) in concurrently uploaded
+        segments.
     """
-    def __init__(self, container, auth_manager, storage_url=None, retries=3):
+    def __init__(self, container, auth_manager, storage_url=None, retries=3,
+                 pool_size=DEFAULT_POOL_SIZE, workers=DEFAULT_WORKERS,
+                 upload_precheck=True, segment_size=0, large_object="slo",
+                 cache=None):
         self.container = container
         self.auth_manager = auth_manager
         self.storage_url = storage_url
         self.retries = retries
+        self.pool_size = pool_size
+        self.workers = workers
+        self.upload_precheck = upload_precheck
+        if large_object not in LARGE_OBJECT_TYPES:
+            raise ValueError(
+                "Unsupported large object type '%s'" % large_object
+            )
+        self.segment_size = segment_size
+        self.large_object = large_object
+        self.cache = cache
+        self.statistics = OperationStatistics()
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self):
+        with self._session_lock:
+            if self._session is None:
+                self._session = create_session(
+                    max(self.pool_size, self.workers)
+                )
+            return self._session
+
+    def close(self):
+        """ Closes all pooled connections. """
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
 
     def prepare_environment(self):
         os.environ['SWIFT_AUTH_TOKEN'] = self.auth_manager.get_auth_token()
@@ -108,55 +453,326 @@ class SwiftFileManager(object):
     def get_vsi_filename(self, path):
         return '/vsiswift/%s/%s' % (self.container, path)
 
-    def retry(self, func, get_args):
-        """ Retrying wrapper function.
+    def get_statistics(self):
+        return self.statistics.get()
+
+    def log_statistics(self):
+        for operation, counter in sorted(self.get_statistics().items()):
+            logger.info(
+                "Swift %s: %d requests (%d failed), mean latency %.3fs, "
+                "max latency %.3fs." % (
+                    operation, counter["count"], counter["failed"],
+                    counter["mean"], counter["max"]
+                )
+            )
+        if self.cache:
+            self.cache.log_statistics()
+        if hasattr(self.auth_manager, "get_statistics"):
+            statistics = self.auth_manager.get_statistics()
+            logger.info(
+                "Keystone: %d token requests, %d requests avoided via the "
+                "shared token cache." % (
+                    statistics["keystone_requests"],
+                    statistics["avoided_requests"]
+                )
+            )
+
+    def retry(self, func, get_args, operation=None):
+        """ Retrying wrapper function. `SwiftFileExistsError` is raised right away.
+            The latency of each try is recorded for `operation`.
         """
         for i in range(self.retries):
+            start = time.time()
             try:
-                return func(*get_args())
+                result = func(*get_args(), session=self.session)
+            except SwiftFileExistsError:
+                self.statistics.add(operation, time.time() - start, True)
+                raise
             except:
-                pass
+                self.statistics.add(operation, time.time() - start, True)
+            else:
+                self.statistics.add(operation, time.time() - start)
+                return result
         raise
 
-    def upload_file(self, prefix, file_, filename=None, replace=None):
+    def map(self, func, items):
+        """ Calls `func` for each of the `items` in a bounded pool of threads.
+            All calls are performed, the first exception (if any) is raised
+            afterwards. Returns the list of results.
+        """
+        items = list(items)
+        if not items:
+            return []
+
+        def call(item):
+            try:
+                return True, func(item)
+            except Exception, e:
+                logger.error("Swift operation on '%s' failed: %s" % (item, e))
+                return False, e
+
+        workers = min(self.workers, len(items))
+        if workers <= 1:
+            outcomes = map(call, items)
+        else:
+            pool = ThreadPool(workers)
+            try:
+                outcomes = pool.map(call, items)
+            finally:
+                pool.close()
+                pool.join()
+
+        for success, value in outcomes:
+            if not success:
+                raise value
+        return [value for _, value in outcomes]
+
+    def _strip_path(self, path):
+        if path.startswith('/vsiswift'):
+            path = '/'.join(path.split('/')[3:])
+        return path
+
+    def upload_file(self, prefix, file_, filename=None, replace=None,
+                    key=None):
+        if self.segment_size and isinstance(file_, basestring) \
+                and getsize(file_) > self.segment_size:
+            return self.upload_large_file(
+                prefix, file_, filename, replace, key
+            )
+
         return self.retry(
             upload_file,
             lambda: (
                 self.storage_url or self.auth_manager.get_storage_url(),
                 self.container,
                 prefix, file_,
-                self.auth_manager.get_auth_token(), filename, replace
+                self.auth_manager.get_auth_token(), filename, replace,
+                self.upload_precheck
             ),
+            "upload"
+        )
+
+    def get_segment_prefix(self, prefix, key, size):
+        """ Returns the prefix of the segments of a file of `size` bytes
+            uploaded for `key` below `prefix`.
+        """
+        return "%s/%d/%d" % (
+            join(SEGMENTS_PREFIX, prefix, key), size, self.segment_size
+        )
+
+    def upload_large_file(self, prefix, local_path, filename=None,
+                          replace=None, key=None):
+        """ Uploads the file in segments of `segment_size` bytes which are
+            retried individually. The segments are stored below a prefix
+            derived from `key` (defaults to the file name), so that a
+            repeated upload for the same `key` after an interruption skips
+            the segments already stored with the same checksum.
+        """
+        path = join(prefix, basename(filename or local_path))
+        size = getsize(local_path)
+        storage_url = lambda: (
+            self.storage_url or self.auth_manager.get_storage_url()
+        )
+
+        if self.upload_precheck:
+            found = self.retry(
+                object_exists, lambda: (
+                    storage_url(), self.container, path,
+                    self.auth_manager.get_auth_token()
+                ), "head"
+            )
+            if found and replace:
+                self.delete_file(path)
+            elif found:
+                raise SwiftFileExistsError(
+                    "File at path '%s' already exists" % path
+                )
+
+        segment_prefix = self.get_segment_prefix(
+            prefix, key or basename(path), size
+        )
+        uploaded = set(self.list_contents(segment_prefix + "/"))
+        if uploaded:
+            logger.info(
+                "Resuming upload of '%s' with %d uploaded segments."
+                % (path, len(uploaded))
+            )
+
+        def upload(segment):
+            index, offset, length = segment
+            segment_path = "%s/%08d" % (segment_prefix, index)
+            etag = get_segment_md5(local_path, offset, length)
+            if segment_path not in uploaded or self.retry(
+                    get_object_etag, lambda: (
+                        storage_url(), self.container, segment_path,
+                        self.auth_manager.get_auth_token()
+                    ), "head") != etag:
+                self.retry(
+                    upload_segment, lambda: (
+                        storage_url(), self.container, segment_path,
+                        SegmentReader(local_path, offset, length), etag,
+                        self.auth_manager.get_auth_token()
+                    ), "upload_segment"
+                )
+            return segment_path, etag, length
+
+        segments = self.map(upload, [
+            (index, offset, min(self.segment_size, size - offset))
+            for index, offset in enumerate(
+                xrange(0, size, self.segment_size)
+            )
+        ])
+
+        self.retry(
+            upload_manifest, lambda: (
+                storage_url(), self.container, path, segments,
+                self.auth_manager.get_auth_token(), self.large_object,
+                not self.upload_precheck and not replace
+            ), "upload_manifest"
+        )
+
+        logger.info(
+            "Uploaded '%s' as %s in %d segments." % (
+                path, self.large_object, len(segments)
+            )
+        )
+
+        # the ETag of a large object is the checksum of the segment checksums
+        return md5("".join(etag for _, etag, _ in segments)).hexdigest()
+
+    def upload_files(self, prefix, files, replace=None):
+        """ Uploads all `files` (paths) to the given prefix concurrently. """
+        return self.map(
+            lambda file_: self.upload_file(prefix, file_, replace=replace),
+            files
         )
 
     def delete_file(self, path):
-        if path.startswith('/vsiswift'):
-            path = '/'.join(path.split('/')[3:])
+        path = self._strip_path(path)
+
+        # static large objects are deleted together with their segments, the
+        # segments of dynamic large objects have to be deleted separately
+        params = None
+        manifest = None
+        if self.segment_size and self.large_object == "slo":
+            params = {"multipart-manifest": "delete"}
+        elif self.segment_size:
+            manifest = self.retry(
+                get_object_manifest,
+                lambda: (
+                    self.storage_url or self.auth_manager.get_storage_url(),
+                    self.container,
+                    path,
+                    self.auth_manager.get_auth_token()
+                ),
+                "head"
+            )
 
-        return self.retry(
+        result = self.retry(
             delete_file,
             lambda: (
                 self.storage_url or self.auth_manager.get_storage_url(),
                 self.container,
                 path,
-                self.auth_manager.get_auth_token()
+                self.auth_manager.get_auth_token(),
+                params
             ),
+            "delete"
+        )
+
+        if manifest:
+            segments_prefix = manifest.split("/", 1)[1]
+            self.delete_files(self.list_contents(segments_prefix))
+
+        if self.cache:
+            self.cache.remove(path)
+
+        return result
+
+    def delete_stale_segments(self, max_age):
+        """ Deletes the segments of interrupted uploads which have not been
+            resumed within `max_age` seconds, i.e., the segments of all
+            uploads older than that which are not referenced by a large
+            object. Returns the number of deleted segments.
+        """
+        threshold = datetime.utcnow() - timedelta(seconds=max_age)
+
+        uploads = {}
+        for item in self.list_contents(SEGMENTS_PREFIX + "/", details=True):
+            uploads.setdefault(item["name"].rsplit("/", 1)[0], []).append(
+                item
+            )
+
+        stale = {}
+        for segment_prefix, items in uploads.items():
+            if all(datetime.strptime(item["last_modified"][:19],
+                                     "%Y-%m-%dT%H:%M:%S") < threshold
+                   for item in items):
+                stale[segment_prefix] = [item["name"] for item in items]
+
+        # the large objects are stored below the prefix of their segments,
+        # i.e. ".segments/<prefix>/<key>/<size>/<segment size>"
+        prefixes = set(
+            "/".join(segment_prefix.split("/")[1:-3])
+            for segment_prefix in stale
         )
+        referenced = set()
+        for prefix in prefixes:
+            paths = [
+                path for path in self.list_contents(
+                    prefix + "/" if prefix else ""
+                ) if not path.startswith(SEGMENTS_PREFIX + "/")
+            ]
+            referenced.update(self.map(
+                lambda path: self.retry(
+                    get_segments_prefix, lambda: (
+                        self.storage_url or
+                        self.auth_manager.get_storage_url(),
+                        self.container, path,
+                        self.auth_manager.get_auth_token()
+                    ), "head"
+                ), paths
+            ))
+
+        paths = []
+        for segment_prefix, names in sorted(stale.items()):
+            if segment_prefix not in referenced:
+                logger.info(
+                    "Deleting %d segments of the interrupted upload '%s'."
+                    % (len(names), segment_prefix)
+                )
+                paths.extend(names)
+
+        # the segments are plain objects regardless of `large_object`
+        self.map(
+            lambda path: self.retry(
+                delete_file, lambda: (
+                    self.storage_url or self.auth_manager.get_storage_url(),
+                    self.container, path, self.auth_manager.get_auth_token()
+                ), "delete"
+            ), paths
+        )
+        return len(paths)
+
+    def delete_files(self, paths):
+        """ Deletes all files of the given `paths` concurrently. """
+        return self.map(self.delete_file, paths)
 
-    def list_contents(self, prefix_path):
+    def list_contents(self, prefix_path, details=False):
         return self.retry(
             list_contents,
             lambda: (
                 self.storage_url or self.auth_manager.get_storage_url(),
                 self.container,
                 prefix_path,
-                self.auth_manager.get_auth_token()
+                self.auth_manager.get_auth_token(),
+                details
             ),
+            "list"
         )
 
     def download_file(self, path, local_path):
-        if path.startswith('/vsiswift'):
-            path = '/'.join(path.split('/')[3:])
+        path = self._strip_path(path)
 
         return self.retry(
             download_file,
@@ -167,4 +783,74 @@ class SwiftFileManager(object):
                 local_path,
                 self.auth_manager.get_auth_token()
             ),
+            "download"
+        )
+
+    def get_cached_file(self, path):
+        """ Returns the path of a local copy of the remote file within the
+            cache. The file is downloaded if it is not cached in its current
+            version.
+        """
+        path = self._strip_path(path)
+
+        etag = self.retry(
+            get_object_etag,
+            lambda: (
+                self.storage_url or self.auth_manager.get_storage_url(),
+                self.container,
+                path,
+                self.auth_manager.get_auth_token()
+            ),
+            "head"
+        )
+        if etag is None:
+            raise Exception("File '%s' does not exist" % path)
+
+        cache_path = self.cache.get(path, etag)
+        if cache_path:
+            return cache_path
+
+        temp_path = self.cache.get_temp_path()
+        try:
+            self.download_file(path, temp_path)
+            return self.cache.add(path, etag, temp_path)
+        except:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def cache_file(self, path, etag, local_path):
+        """ Moves the local file `local_path` with the content of the remote
+            file `path` into the cache. Without a configured cache or a known
+            `etag` the file is simply removed.
+        """
+        if self.cache and etag:
+            self.cache.add(self._strip_path(path), etag, local_path)
+        else:
+            os.remove(local_path)
+
+    @contextmanager
+    def local_file(self, path):
+        """ Context manager providing a local copy of the remote file. Without
+            a configured cache the file is downloaded to a temporary file which
+            is removed afterwards.
+        """
+        if self.cache:
+            yield self.get_cached_file(path)
+            return
+
+        handle, temp_path = tempfile.mkstemp(
+            suffix=os.path.splitext(path)[1]
         )
+        os.close(handle)
+        try:
+            self.download_file(path, temp_path)
+            yield temp_path
+        finally:
+            os.remove(temp_path)
+
+    def download_files(self, items):
+        """ Downloads all files of the `(path, local_path)` tuples in `items`
+            concurrently.
+        """
+        return self.map(lambda item: self.download_file(*item), items)
@@ -1,8 +1,10 @@
 
 from ngeo_browse_server.config import get_ngeo_config
 from ngeo_browse_server.storage.conf import (
-    get_storage_method, get_swift_container
+    get_storage_method, get_swift_container, get_swift_client_config,
+    get_file_cache_config
 )
+from ngeo_browse_server.storage.cache import FileCache
 
 from ngeo_browse_server.storage.swift.auth import AuthTokenManager
 from ngeo_browse_server.storage.swift.manager import SwiftFileManager
@@ -15,9 +17,12 @@ def get_file_manager(config=None):
     if storage_method == 'local':
         return None
     elif storage_method == 'swift':
+        cache_config = get_file_cache_config(config)
         return SwiftFileManager(
             get_swift_container(config),
-            AuthTokenManager()
+            AuthTokenManager(),
+            cache=FileCache(**cache_config) if cache_config else None,
+            **get_swift_client_config(config)
         )
     else:
         raise Exception("Unsupported storage method '%s'" % storage_method)
@@ -214,15 +214,24 @@ class RedisStatReader(object):
         for key in queue_ids:
             pipeline.llen(key)
         result = pipeline.execute()
+
+        def _parse_status(status):
+            # the status may be followed by the daemon's scaling state
+            status, _, scaling = (status or "").partition(" ")
+            return status or None, json.loads(scaling) if scaling else None
+
+        daemons = []
+        for idx, id_ in enumerate(daemon_ids):
+            status, scaling = _parse_status(result[3*idx+0])
+            daemons.append({
+                "id": id_,
+                "status": status,
+                "scaling": scaling,
+                "buffer": result[3*idx+1],
+                "jobs": result[3*idx+2],
+            })
         return {
-            "daemons": [
-                {
-                    "id": id_,
-                    "status": result[3*idx+0],
-                    "buffer": result[3*idx+1],
-                    "jobs": result[3*idx+2],
-                } for idx, id_ in enumerate(daemon_ids)
-            ],
+            "daemons": daemons,
             "queues": zip(queue_ids, result[3*len(daemon_ids):])
         }
 
@@ -272,11 +281,16 @@ def ingestion_stat(redis_host, redis_port, redis_key_set, log_file):
         dt = datetime.utcfromtimestamp(ceil(timestamp))
         return dt.isoformat("T") + "Z"
 
-    def _render_daemon(id, status, jobs, buffer, **kwargs):
+    def _render_daemon(id, status, jobs, buffer, scaling=None, **kwargs):
         screen.write_line("\tdaemon status:\t%s" % status)
         screen.write_line("\tdaemon name:\t%s" % id)
         screen.write_line("\tbuffered BRs:\t%s" % _format_br_count(buffer))
         screen.write_line("\tjobs in progress:\t%s" % _format_br_count(jobs))
+        if scaling:
+            screen.write_line(
+                "\tworkers:\t%(workers)d/%(capacity)d, %(decision)s, "
+                "load %(load).2f, %(recycled)d recycled" % scaling
+            )
         screen.write_line("")
 
     def _render_qstate(qstate):
@@ -31,7 +31,9 @@
 from __future__ import print_function
 import sys
 import json
-from os import environ
+from os import environ, getpid, getloadavg, sysconf
+from itertools import count
+from functools import partial
 from os.path import basename
 from datetime import datetime
 from time import sleep, time
@@ -40,12 +42,16 @@ from logging import (
     DEBUG, INFO, WARNING, ERROR, CRITICAL, NOTSET,
 )
 from signal import SIGINT, SIGTERM, signal, SIG_IGN
-from threading import Event as ThreadEvent
+from threading import Event as ThreadEvent, Lock as ThreadLock, Thread
 from multiprocessing import cpu_count
 from multiprocessing import (
     BoundedSemaphore as ProcessBoundedSemaphore,
-    Pool as ProcessPool
+    Event as ProcessEvent,
+    Process,
+    Queue as ProcessQueue,
+    Value as ProcessValue,
 )
+from Queue import Empty
 import multiprocessing.util as mp_util
 from redis import Redis, ConnectionError
 from lxml import etree
@@ -72,7 +78,9 @@ DEF_BS_INSTANCE_PATH = environ.get(  # browse server instance path
 DEF_BS_SETTINGS_MODULE = environ.get( # browse server instance settings module
     "DJANGO_SETTINGS_MODULE", "ngeo_browse_server_instance.settings"
 )
-#DEF_MAX_TASKS_PER_WORKER = 16   # worker restarted after this number of tasks
+DEF_MAX_JOBS_PER_WORKER = None  # worker recycled after this number of jobs
+DEF_MAX_WORKER_RSS = None       # worker recycled above this RSS in MB
+DEF_MAX_LOAD = None             # no scaling up above this load per CPU
 
 # Browse Report XML paths
 XPATH_BR_BROWSE_TYPE = (
@@ -149,19 +157,259 @@ def wp_handle_ingestion_job(job):
     return job
 
 
+def get_rss():
+    """ Get resident set size of the current process in bytes. """
+    try:
+        with open("/proc/self/statm") as file_:
+            return int(file_.read().split()[1]) * sysconf("SC_PAGE_SIZE")
+    except (IOError, OSError, IndexError, ValueError):
+        # peak RSS reported in kB on Linux
+        from resource import getrusage, RUSAGE_SELF
+        return getrusage(RUSAGE_SELF).ru_maxrss * 1024
+
+
+def wp_worker_loop(tasks, results, current, initializer, max_jobs, max_rss):
+    """ Worker process main loop. The worker exits when retired by the pool
+    or when recycled after max_jobs jobs or exceeding max_rss bytes RSS.
+    The id of the running task is kept in the shared value current.
+    """
+    if initializer:
+        initializer()
+    n_jobs = 0
+    reason = "retired"
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        task_id, func, args, kwargs = task
+        # unlike queued messages, the shared value is set immediately, so the
+        # pool can fail the task if the worker gets killed while running it
+        current.value = task_id
+        try:
+            results.put(("result", task_id, True, func(*args, **kwargs)))
+        except Exception as error:
+            results.put(("result", task_id, False, error))
+        current.value = -1
+        n_jobs += 1
+        if max_jobs and n_jobs >= max_jobs:
+            reason = "recycled after %d jobs" % n_jobs
+            break
+        rss = get_rss()
+        if max_rss and rss > max_rss:
+            reason = "recycled at %dMB RSS" % (rss >> 20)
+            break
+    results.put(("exit", getpid(), None, reason))
+
+
+class WorkerPool(object):
+    """ Process pool with a variable number of worker processes.
+
+    Unlike the multiprocessing pool, the pool can be resized and it recycles
+    its worker processes after a number of jobs or when their memory usage
+    exceeds a limit, which contains the memory growth of the GDAL based
+    ingestion. Retired or recycled workers exit after finishing their
+    current job. The jobs of failed workers are reported to their error
+    callbacks.
+    """
+    MAINTENANCE_INTERVAL = 1 # seconds
+
+    def __init__(self, processes, initializer=None, max_jobs=None,
+                 max_rss=None, logger=None):
+        self.initializer = initializer
+        self.max_jobs = max_jobs
+        self.max_rss = max_rss
+        self.logger = logger or getLogger(LOGGER_NAME)
+        self.recycled = 0
+        self._size = 0
+        self._retiring = 0
+        self._closed = False
+        self._workers = {} # pid -> process
+        self._callbacks = {} # task id -> (callback, error callback)
+        self._current = {} # pid -> shared id of the running task
+        self._task_ids = count()
+        self._lock = ThreadLock()
+        self._tasks = ProcessQueue()
+        self._results = ProcessQueue()
+        self._result_handler = Thread(target=self._handle_results)
+        self._result_handler.daemon = True
+        self.resize(processes)
+        self._result_handler.start()
+
+    @property
+    def size(self):
+        """ Number of the running worker processes. """
+        return len(self._workers)
+
+    def resize(self, processes):
+        """ Set the number of worker processes. """
+        with self._lock:
+            if self._closed:
+                return
+            retired = len(self._workers) - self._retiring - processes
+            for _ in range(retired):
+                self._tasks.put(None)
+            self._retiring += max(0, retired)
+            self._size = processes
+            self._maintain()
+
+    def apply_async(self, func, args=(), kwds=None, callback=None,
+                    error_callback=None):
+        """ Submit a job. The callback is called with the result, the error
+        callback with the exception if the job failed or its worker died.
+        """
+        task_id = next(self._task_ids)
+        self._callbacks[task_id] = (callback, error_callback)
+        self._tasks.put((task_id, func, args, kwds or {}))
+
+    def close(self):
+        """ Let the workers exit after finishing all submitted jobs. """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            for _ in range(len(self._workers) - self._retiring):
+                self._tasks.put(None)
+            self._retiring = len(self._workers)
+
+    def terminate(self):
+        """ Terminate all worker processes immediately. """
+        with self._lock:
+            self._closed = True
+            for process in self._workers.values():
+                process.terminate()
+        self._tasks.cancel_join_thread()
+
+    def join(self):
+        """ Wait for all worker processes to exit. """
+        while self._workers:
+            for process in list(self._workers.values()):
+                process.join(self.MAINTENANCE_INTERVAL)
+            # remove dead processes which could not report their exit
+            with self._lock:
+                self._maintain()
+
+    def _fail(self, task_id, error):
+        """ Report the failure of a task to its error callback. """
+        _, error_callback = self._callbacks.pop(task_id, (None, None))
+        self.logger.error("Worker job failed! (%s)", error)
+        if error_callback:
+            try:
+                error_callback(error)
+            except Exception as error:
+                self.logger.error("Job error callback failed! (%s)", error)
+
+    def _maintain(self):
+        """ Remove dead and start new worker processes (lock held). """
+        for pid, process in list(self._workers.items()):
+            if not process.is_alive():
+                # regularly exited workers are also reported by the handler
+                del self._workers[pid]
+                task_id = self._current.pop(pid).value
+                if process.exitcode and not self._closed:
+                    self.logger.warning(
+                        "Worker process %s died! (exit code %s)",
+                        pid, process.exitcode
+                    )
+                if process.exitcode and task_id >= 0:
+                    self._fail(task_id, Exception(
+                        "Worker process %s died with exit code %s."
+                        % (pid, process.exitcode)
+                    ))
+        if self._closed:
+            return
+        for _ in range(self._size - len(self._workers) + self._retiring):
+            current = ProcessValue("l", -1, lock=False)
+            process = Process(target=wp_worker_loop, args=(
+                self._tasks, self._results, current, self.initializer,
+                self.max_jobs, self.max_rss,
+            ))
+            process.daemon = True
+            process.start()
+            self._workers[process.pid] = process
+            self._current[process.pid] = current
+            self.logger.debug("Worker process %s started.", process.pid)
+
+    def _handle_results(self):
+        """ Result handler thread. """
+        while not (self._closed and not self._workers):
+            try:
+                message, id_, success, value = self._results.get(
+                    True, self.MAINTENANCE_INTERVAL
+                )
+            except Empty:
+                with self._lock:
+                    self._maintain()
+                continue
+            except (IOError, EOFError):
+                break
+            if message == "result":
+                if not success:
+                    with self._lock:
+                        self._fail(id_, value)
+                    continue
+                callback, _ = self._callbacks.pop(id_, (None, None))
+                if callback:
+                    try:
+                        callback(value)
+                    except Exception as error:
+                        self.logger.error("Job callback failed! (%s)", error)
+            elif message == "exit":
+                with self._lock:
+                    process = self._workers.pop(id_, None)
+                    self._current.pop(id_, None)
+                    if process:
+                        process.join()
+                    if value == "retired" or self._closed:
+                        self._retiring = max(0, self._retiring - 1)
+                    else:
+                        self.recycled += 1
+                        self.logger.info(
+                            "Worker process %s %s.", id_, value
+                        )
+                    self._maintain()
+
+
 class BrowseWatchDaemon(object):
     WORKER_SEMAPHORE_TIMEOUT = 1 # second
     WORKER_TERMINATION_DELAY = 2 # seconds
     REDIS_KEY_SET_REFRESH = 15 # seconds
-    REDIS_POLL_INTERVAL = 1 # second
+    REDIS_BLOCK_TIMEOUT = 15 # seconds, must be shorter than REDIS_STATUS_EXPIRE
     REDIS_CONNECTION_TIMEOUTS = [15, 30, 60, 120, 240] # seconds
     REDIS_STATUS_EXPIRE = 60 # second
+    SCALING_INTERVAL = 5 # seconds
+    SCALE_DOWN_DELAY = 60 # seconds of lower demand before scaling down
+
+    # Lua script refreshing the daemon status and moving the next report
+    # to the daemon's buffer in one server-side step. Buffered reports are
+    # returned first, unless disabled, then the ingestion queues are tried
+    # in the given order.
+    #   KEYS: status key, buffer key, ingestion queues ...
+    #   ARGV: status expiration, status, read buffer flag ("1" or "0")
+    #   returns: [source key, report] or nil
+    REDIS_GET_REPORT_SCRIPT = (
+        "redis.call('SET',KEYS[1],ARGV[2],'EX',ARGV[1]) "
+        "local report "
+        "if ARGV[3]=='1' then "
+        "report=redis.call('LINDEX',KEYS[2],-1) "
+        "if report then return {KEYS[2],report} end "
+        "end "
+        "for i=3,#KEYS do "
+        "report=redis.call('RPOPLPUSH',KEYS[i],KEYS[2]) "
+        "if report then return {KEYS[i],report} end "
+        "end "
+        "return nil"
+    )
 
     class KeyCounters(object):
-        """ Key counters. Used to prioritize faster ingestion queues. """
+        """ Key counters. Used to prioritize faster ingestion queues.
+        Optional per-key limits cap the number of counted jobs and per-key
+        weights give a key a larger share of the jobs.
+        """
 
-        def __init__(self):
+        def __init__(self, limits=None, weights=None):
             self.counters = {}
+            self.limits = limits or {}
+            self.weights = weights or {}
 
         def __getitem__(self, key):
             return self.counters.get(key, 0)
@@ -184,14 +432,25 @@ class BrowseWatchDaemon(object):
             else:
                 del self[key]
 
+        @property
+        def total(self):
+            """ Sum of all counters. """
+            return sum(self.counters.values())
+
+        def get_limit(self, key, max_count):
+            """ Get the maximum counter value of a key. """
+            return min(max_count, self.limits.get(key, max_count))
+
         def sort_keys(self, keys, max_count=1):
-            """ Get keys sorted by the counter values.
-            Only keys with not more than max_count are allowed.
+            """ Get keys sorted by the counter values divided by the weights.
+            Only keys with not more than max_count (or their own limit less
+            one) are allowed.
             """
             return [
                 key for _, _, key in sorted(
-                    (self[k], i, k) for i, k in enumerate(keys)
-                    if self[k] <= max_count
+                    (self[k] / float(self.weights.get(k, 1)), i, k)
+                    for i, k in enumerate(keys)
+                    if self[k] < self.get_limit(k, max_count + 1)
                 )
             ]
 
@@ -235,16 +494,35 @@ class BrowseWatchDaemon(object):
 
     def __init__(self, redis, key_set, worker_pool, worker_semaphore,
                  daemon_id, logger, max_jobs_per_queue,
-                 finish_incomplete_and_stop=False):
+                 finish_incomplete_and_stop=False, min_workers=None,
+                 max_workers=None, max_load=None, queue_limits=None,
+                 queue_weights=None):
         self.worker_semaphore = worker_semaphore
         self.worker_pool = worker_pool
         self.logger = logger
         self.redis = redis
         self.key_set = key_set
         self.keys = []
-        self._key_counter = self.KeyCounters()
+        self._key_counter = self.KeyCounters(queue_limits, queue_weights)
+        # worker scaling, disabled if max_workers is not set
+        self.max_workers = max_workers
+        self.min_workers = max_workers if min_workers is None else min_workers
+        self.max_load = max_load
+        self.capacity = max_workers
+        self._held_slots = 0 # semaphore slots held to reduce the capacity
+        self._demand_last_high = time()
+        self.status = "RUNNING"
         self._keys_last_update = float("-inf") # never
         self._terminated = ThreadEvent() # implements abortable sleep
+        # new report or finished job; unlike the threading event, the
+        # multiprocessing event does not poll while waiting with a timeout
+        self._wakeup = ProcessEvent()
+        self._waiters = set() # keys with a running blocking wait
+        self._waiters_lock = ThreadLock()
+        self._buffered_sources = {} # report -> key of the blocking waits
+        self._get_report_script = redis.register_script(
+            self.REDIS_GET_REPORT_SCRIPT
+        )
         self.finish_incomplete_and_stop = finish_incomplete_and_stop
         self._redis_connection_trial = 0
         self._daemon_id = daemon_id
@@ -264,7 +542,9 @@ class BrowseWatchDaemon(object):
 
         self.logger.info("Shutting down daemon ...")
         self._terminated.set()
+        self._wakeup.set()
 
+        # also interrupts the blocking waits
         self.logger.debug("Disconnecting Redis connections ...")
         for connection in self.redis.connection_pool.get_all_connections():
             connection.disconnect()
@@ -321,6 +601,7 @@ class BrowseWatchDaemon(object):
             self._key_counter.decrement(job.get('source'))
             self.worker_semaphore.release()
             self.logger.debug("Semaphore released.")
+            self._wakeup.set()
             error = job.get('error')
             if error:
                 job_logger.error(
@@ -339,12 +620,25 @@ class BrowseWatchDaemon(object):
             else:
                 job_logger.debug("Job removed.")
 
+        def error_callback(job, error):
+            """ Worker error callback, e.g. for jobs of died workers. """
+            stopped = time()
+            callback(dict(
+                job, started=job.get("started", stopped), stopped=stopped,
+                status="ERROR", error=error
+            ))
+
         try:
             self._init_status()
+            if self.max_workers:
+                scaler = Thread(target=self._scale_workers_loop)
+                scaler.daemon = True
+                scaler.start()
             for job in self.read_jobs():
                 self._key_counter.increment(job['source'])
                 self.worker_pool.apply_async(
-                    wp_handle_ingestion_job, [job], {}, callback=callback
+                    wp_handle_ingestion_job, [job], {}, callback=callback,
+                    error_callback=partial(error_callback, job)
                 )
             self.worker_pool.close()
             self.worker_pool.join()
@@ -382,6 +676,8 @@ class BrowseWatchDaemon(object):
         # process regular jobs
         for slot in slots_iterator:
             self.update_keys()
+            # cleared before reading so that no wake-up gets lost
+            self._wakeup.clear()
             job = self.get_new_job()
             if job:
                 JobIdLoggingContextAdapter(self.logger, job["job_id"]).info(
@@ -391,8 +687,148 @@ class BrowseWatchDaemon(object):
             else:
                 slot.release()
                 self.logger.debug("Semaphore released.")
-                if self._terminated.wait(self.REDIS_POLL_INTERVAL):
-                    raise self.Terminated
+                self.wait_for_reports()
+
+    def wait_for_reports(self):
+        """ Block until a new report is available, a running job finished or
+        the blocking timeout is reached.
+
+        The waiting is event-driven: for each ingestion queue eligible by the
+        key counters a thread blocks in BRPOPLPUSH which moves an arriving
+        report atomically to the daemon's buffer. A report is thus never lost
+        even if the daemon is stopped right after it has been received.
+        """
+        keys = self._key_counter.sort_keys(
+            self.keys, max_count=(self.max_jobs_per_queue - 1)
+        )
+        self.start_waiters(keys)
+        self._wakeup.wait(self.REDIS_BLOCK_TIMEOUT)
+        if self._terminated.is_set():
+            raise self.Terminated
+
+    def start_waiters(self, keys):
+        """ Start blocking waits for the given keys. Keys with an already
+        running wait are skipped.
+        """
+        redis = self.redis
+        with self._waiters_lock:
+            keys = [key for key in keys if key not in self._waiters]
+            self._waiters.update(keys)
+        for key in keys:
+            thread = Thread(target=self._wait_for_report, args=(redis, key))
+            thread.daemon = True
+            thread.start()
+
+    def _wait_for_report(self, redis, key):
+        """ Wait for a new report in the given key (thread target). """
+        try:
+            report = redis.brpoplpush(
+                key, self.buffer_key, self.REDIS_BLOCK_TIMEOUT
+            )
+            if report is not None:
+                self.logger.debug("Report received from %s.", key)
+                with self._waiters_lock:
+                    self._buffered_sources[report] = key
+        except Exception as error:
+            # disconnected connections may raise various errors on shutdown
+            if not self._terminated.is_set():
+                self.logger.warning("Waiting for %s failed! (%s)", key, error)
+        finally:
+            with self._waiters_lock:
+                self._waiters.discard(key)
+            self._wakeup.set()
+
+    def _scale_workers_loop(self):
+        """ Worker scaling thread. """
+        while not self._terminated.wait(self.SCALING_INTERVAL):
+            try:
+                self.scale_workers()
+            except Exception as error:
+                if not self._terminated.is_set():
+                    self.logger.error("Worker scaling failed! (%s)", error)
+
+    def scale_workers(self):
+        """ Adjust the number of workers to the demand, i.e., the running
+        jobs and the reports they can be taken from the ingestion queues
+        within the queue limits. No workers are added while the host load
+        per CPU exceeds max_load and workers are removed only after the demand
+        has been lower for SCALE_DOWN_DELAY seconds. The decision is reported
+        in the daemon status.
+        """
+        active = self._key_counter.total
+        backlog = self.get_backlog()
+        load = getloadavg()[0] / cpu_count()
+        target = max(self.min_workers, min(self.max_workers, active + backlog))
+        now = time()
+        if target >= self.capacity:
+            self._demand_last_high = now
+
+        if target > self.capacity:
+            if self.max_load is not None and load > self.max_load:
+                decision = "limited by load"
+            else:
+                decision = "up"
+                self._set_capacity(target)
+        elif target < self.capacity:
+            if (now - self._demand_last_high) < self.SCALE_DOWN_DELAY:
+                decision = "cooling down"
+            else:
+                decision = "down"
+                self._set_capacity(target)
+        else:
+            decision = "hold"
+
+        if decision in ("up", "down"):
+            self.logger.info(
+                "Workers scaled %s to %d (%d active jobs, %d queued reports, "
+                "load %.2f).", decision, self.capacity, active, backlog, load
+            )
+
+        self.status = "RUNNING %s" % json.dumps(dict(
+            capacity=self.capacity,
+            workers=self.worker_pool.size,
+            active=active,
+            backlog=backlog,
+            load=round(load, 2),
+            decision=decision,
+            recycled=self.worker_pool.recycled,
+        ), sort_keys=True)
+        if not self._terminated.is_set():
+            self.redis.set(
+                self.status_key, self.status, ex=self.REDIS_STATUS_EXPIRE
+            )
+
+    def _set_capacity(self, capacity):
+        """ Set the number of jobs processed in parallel. The excess worker
+        semaphore slots are held by the daemon. Slots of running jobs cannot
+        be taken, the capacity is then reduced in the following steps.
+        """
+        held_slots = self.max_workers - capacity
+        while self._held_slots < held_slots and \
+                self.worker_semaphore.acquire(False):
+            self._held_slots += 1
+        while self._held_slots > held_slots:
+            self.worker_semaphore.release()
+            self._held_slots -= 1
+        self.capacity = self.max_workers - self._held_slots
+        self.worker_pool.resize(self.capacity)
+
+    def get_backlog(self):
+        """ Get the number of buffered reports and of the queued reports
+        which can be read within the queue limits.
+        """
+        keys = list(self.keys)
+        pipeline = self.redis.pipeline()
+        pipeline.llen(self.buffer_key)
+        for key in keys:
+            pipeline.llen(key)
+        response = pipeline.execute()
+        return response[0] + sum(
+            max(0, min(length, self._key_counter.get_limit(
+                key, self.max_jobs_per_queue
+            ) - self._key_counter[key]))
+            for key, length in zip(keys, response[1:])
+        )
 
     def get_slots(self):
         """ Generator wrapping the worker pool semaphore, yielding semaphore
@@ -415,7 +851,7 @@ class BrowseWatchDaemon(object):
         pipeline.get(self.status_key)
         pipeline.set(self.status_key, "RUNNING")
         status, _ = pipeline.execute()
-        if status == "RUNNING":
+        if status and status.split(" ", 1)[0] == "RUNNING":
             raise CommandError(
                 "Another %s demon process is running! Stop the other "
                 "process or use a different daemon id." % self._daemon_id
@@ -447,37 +883,68 @@ class BrowseWatchDaemon(object):
                 return keys # key not found - do nothing
             return keys[:index] + keys[index+1:] + keys[index:index+1]
 
-        def _get_report():
+        def _get_buffered_report(readable_keys):
+            # report daemon status and read the buffered reports
             pipeline = self.redis.pipeline()
-            # report daemon status
-            pipeline.set(self.status_key, "RUNNING")
-            pipeline.expire(self.status_key, self.REDIS_STATUS_EXPIRE)
-            # read reports from the buffer if non-empty
-            pipeline.lindex(self.buffer_key, -1)
-            # check non-empty keys
-            for key in self.keys:
-                pipeline.exists(key)
-            response = pipeline.execute()
-            report = response[2]
-            if report: # buffer is non-empty
-                self.logger.debug("Reading buffered report.")
-                return self.buffer_key, report # item from the buffer is returned
-            # pick the non-empty keys and prioritize them by the key counter
+            pipeline.set(
+                self.status_key, self.status, ex=self.REDIS_STATUS_EXPIRE
+            )
+            pipeline.lrange(self.buffer_key, 0, -1)
+            _, reports = pipeline.execute()
+            # reports received by the blocking waits keep their source and
+            # stay buffered while their source has reached its job limit
+            with self._waiters_lock:
+                for report in reversed(reports): # oldest first
+                    key = self._buffered_sources.get(report, self.buffer_key)
+                    if key == self.buffer_key or key in readable_keys:
+                        self._buffered_sources.pop(report, None)
+                        return key, report
+            return None
+
+        def _get_report():
             # prioritize keys with lower key counters
             # queues with reached MAX_JOBS_PER_INGESTION_QUEUE are skipped
-            readable_keys = self._key_counter.sort_keys([
-                key for key, count in zip(self.keys, response[3:]) if count > 0
-            ], max_count=(self.max_jobs_per_queue - 1))
-            for key in readable_keys:
-                report = self.redis.rpoplpush(key, self.buffer_key)
-                if report:
+            readable_keys = self._key_counter.sort_keys(
+                self.keys, max_count=(self.max_jobs_per_queue - 1)
+            )
+            with self._waiters_lock:
+                has_sources = bool(self._buffered_sources)
+            response = None
+            if has_sources:
+                response = _get_buffered_report(readable_keys)
+            if response:
+                key, report = response
+                self.logger.debug("Reading buffered report.")
+            else:
+                # report daemon status and read the report from the buffer,
+                # unless already checked, or from the first non-empty key in
+                # a single round-trip
+                response = self._get_report_script(
+                    keys=[self.status_key, self.buffer_key] + readable_keys,
+                    args=[self.REDIS_STATUS_EXPIRE, self.status,
+                          "0" if has_sources else "1"],
+                )
+                if not response:
+                    self.logger.debug("No report available.")
+                    return None
+                key, report = response
+                if key == self.buffer_key: # buffer is non-empty
+                    # the report may just have been received by a blocking
+                    # wait of a source which has reached its job limit
+                    with self._waiters_lock:
+                        key = self._buffered_sources.get(report, key)
+                        if key != self.buffer_key and key not in readable_keys:
+                            self.logger.debug(
+                                "Keeping buffered report of %s." % key
+                            )
+                            return None
+                        self._buffered_sources.pop(report, None)
+                    self.logger.debug("Reading buffered report.")
+                else:
                     self.logger.debug("Reading report from %s." % key)
-                    # re-order keys to prevent reading from the same key
-                    self.keys = _move_key_to_tail(self.keys, key)
-                    return key, report
-
-            self.logger.debug("No report available.")
-            return None
+            # re-order keys to prevent reading from the same key
+            self.keys = _move_key_to_tail(self.keys, key)
+            return key, report
 
         def _create_new_job(key, report):
             pipeline = self.redis.pipeline()
@@ -554,19 +1021,43 @@ class BrowseWatchDaemon(object):
 
 def start_browsewatchd(redis_host, redis_port, redis_key_set, n_workers,
                        daemon_id, finish_incomplete_and_stop,
-                       max_jobs_per_queue, **kwargs):
+                       max_jobs_per_queue, min_workers, max_load,
+                       queue_limits, queue_weights, max_jobs_per_worker,
+                       max_worker_rss, **kwargs):
     BrowseWatchDaemon(
         redis=Redis(host=redis_host, port=redis_port),
         key_set=redis_key_set,
         logger=getLogger(LOGGER_NAME),
-        worker_pool=ProcessPool(n_workers, init_worker),
+        worker_pool=WorkerPool(
+            n_workers, init_worker,
+            max_jobs=max_jobs_per_worker,
+            max_rss=(max_worker_rss << 20 if max_worker_rss else None),
+        ),
         daemon_id=daemon_id,
         worker_semaphore=ProcessBoundedSemaphore(n_workers),
         finish_incomplete_and_stop=finish_incomplete_and_stop,
         max_jobs_per_queue=max_jobs_per_queue,
+        min_workers=min_workers,
+        max_workers=n_workers,
+        max_load=max_load,
+        queue_limits=queue_limits,
+        queue_weights=queue_weights,
     ).run()
 
 
+def prefork_init(logger):
+    """ Initialize Django, EOxServer and GDAL once in the daemon process.
+    The worker processes, including the replacements of recycled workers,
+    are forked from the daemon process and inherit the initialized state
+    instead of initializing it for each job.
+    """
+    start = time()
+    init_system()
+    # the workers open their own database connections
+    prepare_fork()
+    logger.info("Worker environment initialized in %.3fs.", time() - start)
+
+
 def init_worker():
     """ Process pool initialization. """
     # prevent SIGINT propagation to the subprocesses
@@ -586,6 +1077,7 @@ def main(*args):
         # Django imports performed after the instance part configuration
         import_from_module("ngeo_browse_server.config.browsereport.decoding", "decode_browse_report")
         import_from_module("ngeo_browse_server.control.ingest", "ingest_browse_report")
+        import_from_module("ngeo_browse_server.control.system", "init_system", "prepare_fork")
 
         # setup console logging - must be performed AFTER the Django imports
         setup_logging(
@@ -594,6 +1086,9 @@ def main(*args):
             else [LOGGER_NAME]
         )
 
+        # initialize the workers' environment before they are forked
+        prefork_init(getLogger(LOGGER_NAME))
+
         # start the daemon
         start_browsewatchd(**kwargs)
 
@@ -685,6 +1180,19 @@ def parse_args(*args):
     django_instance_path = DEF_BS_INSTANCE_PATH
     extra_logging = DEF_EXTRA_LOGGING
     max_jobs_per_queue = None
+    min_workers = None
+    max_load = DEF_MAX_LOAD
+    queue_limits = {}
+    queue_weights = {}
+    max_jobs_per_worker = DEF_MAX_JOBS_PER_WORKER
+    max_worker_rss = DEF_MAX_WORKER_RSS
+
+    def _parse_key_value(value, type_, label):
+        key, _, value = value.rpartition("=")
+        value = type_(value)
+        if not key or value <= 0:
+            raise ValueError("Invalid %s!" % label)
+        return key, value
 
     it_args = iter(args[1:])
     for option in it_args:
@@ -708,6 +1216,39 @@ def parse_args(*args):
                         "Invalid max. jobs per queue value %s!" %
                         max_jobs_per_queue
                     )
+            elif option == "--min-workers":
+                min_workers = int(next(it_args))
+                if min_workers < 1:
+                    raise ValueError(
+                        "Invalid min. worker count %s!" % min_workers
+                    )
+            elif option == "--max-load":
+                max_load = float(next(it_args))
+                if max_load <= 0:
+                    raise ValueError("Invalid max. load %s!" % max_load)
+            elif option == "--queue-limit":
+                key, value = _parse_key_value(
+                    next(it_args), int, "ingestion queue limit"
+                )
+                queue_limits[key] = value
+            elif option == "--queue-weight":
+                key, value = _parse_key_value(
+                    next(it_args), float, "ingestion queue weight"
+                )
+                queue_weights[key] = value
+            elif option == "--max-jobs-per-worker":
+                max_jobs_per_worker = int(next(it_args))
+                if max_jobs_per_worker < 1:
+                    raise ValueError(
+                        "Invalid max. jobs per worker value %s!" %
+                        max_jobs_per_worker
+                    )
+            elif option == "--max-worker-rss":
+                max_worker_rss = int(next(it_args))
+                if max_worker_rss < 1:
+                    raise ValueError(
+                        "Invalid max. worker RSS %s!" % max_worker_rss
+                    )
             elif option in ("-i", "--id", "--daemon-id"):
                 daemon_id = next(it_args)
                 if not daemon_id:
@@ -759,6 +1300,9 @@ def parse_args(*args):
     if max_jobs_per_queue is None:
         max_jobs_per_queue = n_workers
     max_jobs_per_queue = min(n_workers, max_jobs_per_queue)
+    if min_workers is None:
+        min_workers = n_workers
+    min_workers = min(n_workers, min_workers)
 
     return dict(
         redis_host=redis_host,
@@ -772,6 +1316,12 @@ def parse_args(*args):
         extra_logging=extra_logging,
         finish_incomplete_and_stop=finish_incomplete_and_stop,
         max_jobs_per_queue=max_jobs_per_queue,
+        min_workers=min_workers,
+        max_load=max_load,
+        queue_limits=queue_limits,
+        queue_weights=queue_weights,
+        max_jobs_per_worker=max_jobs_per_worker,
+        max_worker_rss=max_worker_rss,
     )
 
 
@@ -797,10 +1347,30 @@ def print_usage(execname):
         "        Redis port number",
         "    --nworkers | -n <no-workers>  [%s]" % DEF_N_WORKERS,
         "        Number of parallel processes. ",
+        "        With --min-workers, the maximum number of parallel processes.",
+        "    --min-workers <no-workers>    [<no-workers>]",
+        "        Minimum number of parallel processes. The number of processes",
+        "        is adjusted between the minimum and maximum according to the",
+        "        number of queued reports. The scaling is reported in the",
+        "        daemon status.",
+        "    --max-load <load>             [no limit]",
+        "        No processes are added while the host load average per CPU",
+        "        exceeds this value.",
         "    --max-jobs-per-queue <no-jobs>  [<no-workers>]",
         "        Maximum number of simultaneous ingestions jobs per one ",
         "        ingestion queue. Defaults to the max. number of jobs, i.e., ",
         "        the numbers of worker processes.",
+        "    --queue-limit <queue>=<no-jobs>",
+        "        Lower maximum number of simultaneous ingestion jobs of one",
+        "        ingestion queue. Can be repeated for multiple queues.",
+        "    --queue-weight <queue>=<weight>  [1]",
+        "        Relative share of the ingestion jobs of one ingestion queue.",
+        "        Can be repeated for multiple queues.",
+        "    --max-jobs-per-worker <no-jobs>  [no limit]",
+        "        Worker processes are replaced after this number of jobs.",
+        "    --max-worker-rss <MB>         [no limit]",
+        "        Worker processes are replaced when their resident memory",
+        "        exceeds this limit after a job.",
         "    --id | -i <identifier>        [%s]" % DEF_DAEMON_ID,
         "        Daemon identifier, unique per each running daemon instance.",
         "    --settings-module <settings>  [%s]" % DEF_BS_SETTINGS_MODULE,
@@ -0,0 +1,229 @@
+#-------------------------------------------------------------------------------
+#
+#  Browse reports' feed watch daemon - job pickup latency benchmark
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2021 EOX IT Services GmbH
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+# pylint: disable=missing-docstring,too-many-arguments,too-many-locals
+"""
+Measure the end-to-end pickup latency of the browsewatchd2 daemon, i.e., the
+time between pushing a browse report to an ingestion queue and the daemon
+reading it as a new job. The benchmark runs the daemon's job reader against
+a local Redis server without any worker processes; the jobs are completed
+immediately after their pickup.
+
+Only Redis keys containing "browsewatchd_benchmark" are touched.
+"""
+
+from __future__ import print_function
+import sys
+from os.path import basename
+from time import sleep, time
+from random import Random
+from logging import getLogger, StreamHandler, WARNING
+from threading import Thread
+from multiprocessing import BoundedSemaphore
+from redis import Redis
+
+from browsewatchd2 import BrowseWatchDaemon, DEF_REDIS_HOST, DEF_REDIS_PORT
+
+PREFIX = "browsewatchd_benchmark"
+DEF_N_QUEUES = 4
+DEF_N_REPORTS = 200
+DEF_INTERVAL = 0.05 # seconds, mean interval between two pushed reports
+DEF_N_SLOTS = 2
+
+REPORT_TEMPLATE = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<rep:browseReport xmlns:rep="http://ngeo.eo.esa.int/schema/browseReport" '
+    'version="1.3">'
+    '<rep:responsibleOrgName>EOX</rep:responsibleOrgName>'
+    '<rep:dateTime>2021-01-01T00:00:00Z</rep:dateTime>'
+    '<rep:browseType>%(collection)s</rep:browseType>'
+    '<rep:browse><rep:browseIdentifier>%(identifier)s</rep:browseIdentifier>'
+    '</rep:browse></rep:browseReport>'
+)
+
+
+class NoWorkerPool(object):
+    """ Worker pool placeholder required by the daemon's shutdown. """
+    def close(self):
+        pass
+    terminate = join = close
+
+
+class PollingBrowseWatchDaemon(BrowseWatchDaemon):
+    """ Daemon reading the queues in fixed intervals as the daemon did before
+    the blocking waits have been introduced.
+    """
+    POLL_INTERVAL = 1 # second
+
+    def wait_for_reports(self):
+        if self._terminated.wait(self.POLL_INTERVAL):
+            raise self.Terminated
+
+
+def run_benchmark(redis_host, redis_port, daemon_class, n_queues, n_reports,
+                  interval, n_slots, seed=0):
+    """ Run one benchmark and return the list of pickup latencies and number
+    of commands processed by the Redis server.
+    """
+    redis = Redis(host=redis_host, port=redis_port)
+    key_set = "%s:queues" % PREFIX
+    queues = ["%s:queue:%d" % (PREFIX, i) for i in range(n_queues)]
+    _cleanup(redis)
+    redis.sadd(key_set, *queues)
+
+    logger = getLogger("browsewatchd_benchmark")
+    semaphore = BoundedSemaphore(n_slots)
+    daemon = daemon_class(
+        redis=Redis(host=redis_host, port=redis_port),
+        key_set=key_set,
+        worker_pool=NoWorkerPool(),
+        worker_semaphore=semaphore,
+        daemon_id="%s:daemon" % PREFIX,
+        logger=logger,
+        max_jobs_per_queue=n_slots,
+    )
+    # the queues are watched even if empty and no other keys are touched
+    daemon.update_keys = lambda: setattr(daemon, "keys", list(queues))
+
+    pushed = {}
+    latencies = []
+
+    def _consume():
+        for job in daemon.read_jobs():
+            latencies.append(time() - pushed[job["product_id"]])
+            daemon.remove_job(job["job_id"])
+            semaphore.release()
+            if len(latencies) >= n_reports:
+                break
+
+    consumer = Thread(target=_consume)
+    consumer.start()
+    sleep(0.5) # let the daemon settle
+
+    commands_before = redis.info("stats")["total_commands_processed"]
+    random = Random(seed)
+    for index in range(n_reports):
+        sleep(random.expovariate(1.0 / interval))
+        identifier = "report_%d" % index
+        queue = random.choice(queues)
+        pushed[identifier] = time()
+        redis.lpush(queue, REPORT_TEMPLATE % {
+            "collection": queue, "identifier": identifier,
+        })
+
+    consumer.join()
+    commands = redis.info("stats")["total_commands_processed"] - commands_before
+    daemon.shutdown()
+    _cleanup(redis)
+    return latencies, commands
+
+
+def _cleanup(redis):
+    keys = redis.keys("*%s*" % PREFIX)
+    if keys:
+        redis.delete(*keys)
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def main(*args):
+    redis_host, redis_port = DEF_REDIS_HOST, DEF_REDIS_PORT
+    n_queues, n_reports = DEF_N_QUEUES, DEF_N_REPORTS
+    interval, n_slots = DEF_INTERVAL, DEF_N_SLOTS
+    modes = ["blocking", "polling"]
+
+    it_args = iter(args[1:])
+    try:
+        for option in it_args:
+            if option == "--host":
+                redis_host = next(it_args)
+            elif option == "--port":
+                redis_port = int(next(it_args))
+            elif option == "--queues":
+                n_queues = int(next(it_args))
+            elif option == "--reports":
+                n_reports = int(next(it_args))
+            elif option == "--interval":
+                interval = float(next(it_args))
+            elif option == "--slots":
+                n_slots = int(next(it_args))
+            elif option == "--blocking-only":
+                modes = ["blocking"]
+            else:
+                print_usage(args[0])
+                return 1
+    except (StopIteration, ValueError):
+        print_usage(args[0])
+        return 1
+
+    getLogger("browsewatchd_benchmark").addHandler(StreamHandler())
+    getLogger("browsewatchd_benchmark").setLevel(WARNING)
+
+    print("%d reports, %d queues, %.3fs mean interval, %d slots" % (
+        n_reports, n_queues, interval, n_slots
+    ))
+    for mode in modes:
+        latencies, commands = run_benchmark(
+            redis_host, redis_port,
+            BrowseWatchDaemon if mode == "blocking" else PollingBrowseWatchDaemon,
+            n_queues, n_reports, interval, n_slots,
+        )
+        print(
+            "%-8s pickup latency: mean %.2fms, median %.2fms, "
+            "95%% %.2fms, max %.2fms; %d Redis commands" % (
+                mode,
+                1e3 * sum(latencies) / len(latencies),
+                1e3 * _percentile(latencies, 0.5),
+                1e3 * _percentile(latencies, 0.95),
+                1e3 * max(latencies),
+                commands,
+            )
+        )
+    return 0
+
+
+def print_usage(execname):
+    """ print command usage """
+    print("\n".join([
+        "USAGE: %s [options]" % basename(execname),
+        "OPTIONS:",
+        "    --host <redis-host>      [%s]" % DEF_REDIS_HOST,
+        "    --port <redis-port>      [%s]" % DEF_REDIS_PORT,
+        "    --queues <no-queues>     [%s]" % DEF_N_QUEUES,
+        "    --reports <no-reports>   [%s]" % DEF_N_REPORTS,
+        "    --interval <seconds>     [%s]" % DEF_INTERVAL,
+        "        Mean interval between two pushed reports.",
+        "    --slots <no-slots>       [%s]" % DEF_N_SLOTS,
+        "        Number of simultaneously processed jobs.",
+        "    --blocking-only",
+        "        Skip the polling reference run.",
+    ]), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main(*sys.argv))
@@ -0,0 +1,222 @@
+#-------------------------------------------------------------------------------
+#
+#  Browse Server micro-benchmarks of single components
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2021 EOX IT Services GmbH
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+# pylint: disable=missing-docstring,import-error
+"""
+Measure the run time of single Browse Server components on synthetic input
+of a configurable size. The measurements depend on the machine and are
+therefore not part of the test suite, which only checks the results.
+"""
+
+from __future__ import print_function
+import sys
+import shutil
+import tempfile
+from os import environ, remove, sysconf
+from os.path import basename, join
+from io import BytesIO
+from time import time
+from random import Random
+from datetime import datetime, timedelta
+
+DEF_BS_INSTANCE_PATH = environ.get(  # browse server instance path
+    "INSTANCE_PATH", "/var/www/ngeo/ngeo_browse_server_instance"
+)
+DEF_BS_SETTINGS_MODULE = environ.get( # browse server instance settings module
+    "DJANGO_SETTINGS_MODULE", "ngeo_browse_server_instance.settings"
+)
+
+
+def get_time_areas(num, seed=0):
+    """ Return `num` synthetic `(minx, miny, maxx, maxy, start, end)` areas
+    of browses, most of them sharing few datatakes.
+    """
+    random = Random(seed)
+    base = datetime(2017, 1, 1)
+    areas = []
+    for i in range(num):
+        if i % 4:
+            start = base + timedelta(minutes=random.randint(0, 10) * 100)
+            end = start + timedelta(minutes=5)
+        else:
+            start = base + timedelta(minutes=random.randint(0, 1000))
+            end = start + timedelta(minutes=random.randint(0, 2))
+        minx, miny = random.uniform(-180, 170), random.uniform(-90, 80)
+        areas.append((minx, miny, minx + 10, miny + 10, start, end))
+    return areas
+
+
+def bench_merge_time_areas(size):
+    """ Regrouping of the time windows of synthetic browses, e.g., when
+    removing a browse from a layer with many browses in the same datatake.
+    """
+    from ngeo_browse_server.control.queries import merge_time_areas
+
+    areas = get_time_areas(size)
+    start = time()
+    merged = merge_time_areas(areas)
+    elapsed = time() - start
+    print("merged %d areas to %d time windows in %.3fs" % (
+        len(areas), len(merged), elapsed
+    ))
+
+
+def bench_tile_writer(size):
+    """ Insertion rate of single tiles compared to the bulk insertion of the
+    `TileWriter` into a scratch tileset. A tenth of the tiles is inserted
+    one by one.
+    """
+    from ngeo_browse_server.mapcache import tileset
+
+    dim = "2010-07-22T21:38:40Z/2010-07-22T21:40:38Z"
+    tile_data = "\0" * 2048
+    num_single = max(1, size // 10)
+
+    path = tempfile.mktemp(prefix="ngeo_micro_benchmark_", suffix=".sqlite")
+    try:
+        with tileset.open(path, mode="w") as ts:
+            start = time()
+            for x in range(num_single):
+                ts.add_tile("TEST_SAR", "WGS84", dim, x, 0, 10,
+                            BytesIO(tile_data))
+            single_rate = num_single / (time() - start)
+
+            start = time()
+            with ts.writer(batch_size=1000, synchronous="OFF") as writer:
+                for x in range(size):
+                    writer.add_tile("TEST_SAR", "WGS84", dim, x, 1, 10,
+                                    BytesIO(tile_data))
+            bulk_rate = size / (time() - start)
+    finally:
+        remove(path)
+
+    print("%.1f tiles/s with single inserts, %.1f tiles/s with bulk inserts "
+          "(%.1fx)" % (single_rate, bulk_rate, bulk_rate / single_rate))
+
+
+def get_rss():
+    """ Return the resident set size of the process in bytes. """
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * sysconf("SC_PAGE_SIZE")
+
+
+def bench_report(size):
+    """ Run time and memory increase of the streamed generation of a report
+    of a browse report log file with `size` records.
+    """
+    from ngeo_browse_server.control.control.reporting import iter_report_xml
+
+    tmp_dir = tempfile.mkdtemp(prefix="ngeo_micro_benchmark_")
+    try:
+        report_logfile = join(tmp_dir, "report.log")
+        base = datetime(2014, 1, 1)
+        with open(report_logfile, "w") as f:
+            f.writelines(
+                "/\\/\\".join((
+                    (base + timedelta(seconds=i)).isoformat("T") + "Z",
+                    "TYPE_%d" % (i % 7), "LAYER", "2014-01-01T00:00:00Z",
+                    "2014-01-01T00:01:00Z"
+                )) + "\n"
+                for i in xrange(size)
+            )
+
+        rss = max_rss = get_rss()
+        length = 0
+        start = time()
+        for index, chunk in enumerate(
+                iter_report_xml(None, None, None, report_logfile)):
+            length += len(chunk)
+            if index % 100 == 0:
+                max_rss = max(max_rss, get_rss())
+        elapsed = time() - start
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    print("generated %d bytes of %d records in %.3fs, RSS increased by %d "
+          "bytes" % (length, size, elapsed, max_rss - rss))
+
+
+BENCHMARKS = {  # name: (function, default size)
+    "merge-time-areas": (bench_merge_time_areas, 10000),
+    "report": (bench_report, 2000000),
+    "tile-writer": (bench_tile_writer, 5000),
+}
+
+
+def main(*args):
+    settings_module = DEF_BS_SETTINGS_MODULE
+    instance_path = DEF_BS_INSTANCE_PATH
+    size = None
+    names = []
+
+    it_args = iter(args[1:])
+    try:
+        for option in it_args:
+            if option == "--settings-module":
+                settings_module = next(it_args)
+            elif option == "--instance-path":
+                instance_path = next(it_args)
+            elif option == "--size":
+                size = int(next(it_args))
+            elif option in BENCHMARKS:
+                names.append(option)
+            else:
+                print_usage(args[0])
+                return 1
+    except (StopIteration, ValueError):
+        print_usage(args[0])
+        return 1
+
+    environ["DJANGO_SETTINGS_MODULE"] = settings_module
+    sys.path.insert(0, instance_path)
+
+    for name in names or sorted(BENCHMARKS):
+        func, default_size = BENCHMARKS[name]
+        print("%s: " % name, end="")
+        func(size or default_size)
+    return 0
+
+
+def print_usage(execname):
+    """ print command usage """
+    print("\n".join([
+        "USAGE: %s [options] [<benchmark> ...]" % basename(execname),
+        "BENCHMARKS:",
+    ] + [
+        "    %-30s[size %d]" % (name, BENCHMARKS[name][1])
+        for name in sorted(BENCHMARKS)
+    ] + [
+        "OPTIONS:",
+        "    --size <size>                 [size of the benchmark]",
+        "        Number of synthetic items to process.",
+        "    --settings-module <settings>  [%s]" % DEF_BS_SETTINGS_MODULE,
+        "        Browse Server Django setting module.",
+        "    --instance-path <path>        [%s]" % DEF_BS_INSTANCE_PATH,
+        "        Browse Server Django instance path.",
+    ]), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main(*sys.argv))
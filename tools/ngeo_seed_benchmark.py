@@ -0,0 +1,251 @@
+#-------------------------------------------------------------------------------
+#
+#  Browse Server seeding benchmark - mapcache_seed vs. in-process renderer
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2021 EOX IT Services GmbH
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+# pylint: disable=missing-docstring,too-many-arguments,too-many-locals
+# pylint: disable=import-error
+"""
+Seed one time interval of an ingested browse layer (e.g., of a fixture
+browse) side by side with the `mapcache_seed` command and with the
+in-process renderer and compare the run times and resulting tiles.
+
+Both renderers write into scratch tilesets in a temporary directory, the
+tileset of the browse layer is not touched. `mapcache_seed` runs with a copy
+of the MapCache configuration pointing the cache of the browse layer to its
+scratch tileset and requests the tiles from the WMS of the running browse
+server instance.
+"""
+
+from __future__ import print_function
+import sys
+import shutil
+import tempfile
+from os import environ
+from os.path import basename, join, getsize
+from time import time
+
+DEF_BS_INSTANCE_PATH = environ.get(  # browse server instance path
+    "INSTANCE_PATH", "/var/www/ngeo/ngeo_browse_server_instance"
+)
+DEF_BS_SETTINGS_MODULE = environ.get( # browse server instance settings module
+    "DJANGO_SETTINGS_MODULE", "ngeo_browse_server_instance.settings"
+)
+RENDERERS = ("mapcache_seed", "internal")
+
+
+def run_benchmark(browse_layer_id, time_interval, zoom, threads, renderers):
+    """ Seed the time interval with each renderer and return a list of
+    `(renderer, seconds, tiles, size)` tuples where `tiles` maps the tile
+    coordinates to the encoded tiles and `size` is the tileset file size.
+    """
+    from lxml import etree
+    from eoxserver.core.util.timetools import isotime, getDateTime
+    from ngeo_browse_server.config import get_ngeo_config
+    from ngeo_browse_server.config.models import BrowseLayer
+    from ngeo_browse_server.config.browselayer.data import (
+        get_layer_max_cached_zoom
+    )
+    from ngeo_browse_server.mapcache import models as mapcache_models
+    from ngeo_browse_server.mapcache import tileset
+    from ngeo_browse_server.mapcache.tileset import URN_TO_GRID
+    from ngeo_browse_server.control.queries import get_browse_sources
+    from ngeo_browse_server.mapcache.seedqueue import get_seed_config
+    from ngeo_browse_server.mapcache.tasks import (
+        seed_mapcache, read_mapcache_xml
+    )
+
+    config = get_ngeo_config()
+    browse_layer = BrowseLayer.objects.get(id=browse_layer_id)
+    times_qs = mapcache_models.Time.objects.filter(source=browse_layer.id)
+    if time_interval:
+        start, end = time_interval.split("/")
+        times_qs = times_qs.filter(
+            start_time=getDateTime(start), end_time=getDateTime(end)
+        )
+    time_model = times_qs.order_by("-end_time")[0]
+
+    minzoom, maxzoom = zoom or (
+        browse_layer.lowest_map_level, get_layer_max_cached_zoom(browse_layer)
+    )
+    dim = "%s/%s" % (isotime(time_model.start_time),
+                     isotime(time_model.end_time))
+    print("browse layer '%s', dim %s, zoom %d-%d, %d threads" % (
+        browse_layer.id, dim, minzoom, maxzoom, threads
+    ))
+
+    scratch_dir = tempfile.mkdtemp(prefix="ngeo_seed_benchmark_")
+    try:
+        # MapCache configuration writing into a scratch tileset
+        root = read_mapcache_xml(config)
+        root.xpath("cache[@name='%s']/dbfile" % browse_layer.id)[0].text = (
+            join(scratch_dir, "mapcache_seed.sqlite")
+        )
+        config_file = join(scratch_dir, "mapcache.xml")
+        with open(config_file, "w") as f:
+            f.write(etree.tostring(root, pretty_print=True))
+
+        results = []
+        for renderer in renderers:
+            seed_config = get_seed_config(
+                browse_layer.id, time_model.start_time, time_model.end_time,
+                config=config
+            )
+            seed_config.update(
+                renderer=renderer, config_file=config_file, threads=threads,
+                tileset_path=join(scratch_dir, "%s.sqlite" % renderer),
+            )
+            if renderer == "internal":
+                seed_config["sources"] = get_browse_sources(
+                    browse_layer.id, time_model.start_time,
+                    time_model.end_time
+                )
+
+            start = time()
+            seed_mapcache(
+                tileset=browse_layer.id, grid=browse_layer.grid,
+                minx=time_model.minx, miny=time_model.miny,
+                maxx=time_model.maxx, maxy=time_model.maxy,
+                minzoom=minzoom, maxzoom=maxzoom,
+                start_time=time_model.start_time,
+                end_time=time_model.end_time,
+                delete=False, **seed_config
+            )
+            elapsed = time() - start
+
+            path = join(scratch_dir, "%s.sqlite" % renderer)
+            with tileset.open(path) as ts:
+                tiles = dict(
+                    ((x, y, z), f.read())
+                    for _, _, x, y, z, _, f in ts.get_tiles(
+                        browse_layer.id, URN_TO_GRID[browse_layer.grid], dim
+                    )
+                )
+            results.append((renderer, elapsed, tiles, getsize(path)))
+        return results
+
+    finally:
+        shutil.rmtree(scratch_dir)
+
+
+def _is_blank(data):
+    return len(data) == 5 and data[0] == "#"
+
+
+def print_results(results):
+    for renderer, elapsed, tiles, size in results:
+        blank = sum(1 for data in tiles.values() if _is_blank(data))
+        print(
+            "%-14s %8.2fs %8d tiles %8.1f tiles/s %6d blank %10d bytes" % (
+                renderer, elapsed, len(tiles),
+                len(tiles) / elapsed if elapsed else 0, blank, size
+            )
+        )
+
+    if len(results) == 2:
+        (_, elapsed_a, tiles_a, _), (_, elapsed_b, tiles_b, _) = results
+        keys_a, keys_b = set(tiles_a), set(tiles_b)
+        print("speed-up %.1fx; %d common tiles, %d only %s, %d only %s; "
+              "%d common tiles differ in blankness" % (
+                  elapsed_a / elapsed_b if elapsed_b else 0,
+                  len(keys_a & keys_b),
+                  len(keys_a - keys_b), results[0][0],
+                  len(keys_b - keys_a), results[1][0],
+                  sum(
+                      1 for key in keys_a & keys_b
+                      if _is_blank(tiles_a[key]) != _is_blank(tiles_b[key])
+                  )
+              ))
+
+
+def main(*args):
+    settings_module = DEF_BS_SETTINGS_MODULE
+    instance_path = DEF_BS_INSTANCE_PATH
+    browse_layer_id = None
+    time_interval = None
+    zoom = None
+    threads = 1
+    renderers = RENDERERS
+
+    it_args = iter(args[1:])
+    try:
+        for option in it_args:
+            if option == "--settings-module":
+                settings_module = next(it_args)
+            elif option == "--instance-path":
+                instance_path = next(it_args)
+            elif option == "--time":
+                time_interval = next(it_args)
+            elif option == "--zoom":
+                zoom = tuple(int(level) for level in next(it_args).split(","))
+                if len(zoom) != 2:
+                    raise ValueError
+            elif option == "--threads":
+                threads = int(next(it_args))
+            elif option == "--renderer":
+                renderers = (next(it_args),)
+                if renderers[0] not in RENDERERS:
+                    raise ValueError
+            elif browse_layer_id is None and not option.startswith("-"):
+                browse_layer_id = option
+            else:
+                print_usage(args[0])
+                return 1
+    except (StopIteration, ValueError):
+        print_usage(args[0])
+        return 1
+
+    if browse_layer_id is None:
+        print_usage(args[0])
+        return 1
+
+    environ["DJANGO_SETTINGS_MODULE"] = settings_module
+    sys.path.insert(0, instance_path)
+
+    print_results(run_benchmark(
+        browse_layer_id, time_interval, zoom, threads, renderers
+    ))
+    return 0
+
+
+def print_usage(execname):
+    """ print command usage """
+    print("\n".join([
+        "USAGE: %s [options] <browse-layer-id>" % basename(execname),
+        "OPTIONS:",
+        "    --time <start>/<end>          [latest Time entry]",
+        "        Time interval of the Time entry to seed.",
+        "    --zoom <min>,<max>            [zoom levels of the browse layer]",
+        "    --threads <no-threads>        [1]",
+        "        Threads of mapcache_seed and processes of the renderer.",
+        "    --renderer <renderer>",
+        "        Run only one of %s." % ", ".join(RENDERERS),
+        "    --settings-module <settings>  [%s]" % DEF_BS_SETTINGS_MODULE,
+        "        Browse Server Django setting module.",
+        "    --instance-path <path>        [%s]" % DEF_BS_INSTANCE_PATH,
+        "        Browse Server Django instance path.",
+    ]), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main(*sys.argv))
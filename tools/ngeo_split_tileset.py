@@ -0,0 +1,167 @@
+#-------------------------------------------------------------------------------
+#
+#  Browse Server tool - split tilesets into time dimension shards
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2021 EOX IT Services GmbH
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+# pylint: disable=missing-docstring,too-many-arguments,too-many-locals
+# pylint: disable=import-error
+"""
+Split an existing MapCache SQLite tileset into one shard file per time
+dimension value, as used with the `tileset_sharding` option of the
+`mapcache` section.
+
+The shards are written into the shard directory of the tileset, per default
+the path of the tileset file without the `.sqlite` extension, i.e., the
+directory MapCache reads the shards of the browse type from. Existing shards
+are extended. Once all tilesets of the instance are split, enable
+`tileset_sharding` and refresh the MapCache configuration of the browse
+layers.
+"""
+
+from __future__ import print_function
+import sys
+import sqlite3
+from os import environ, remove
+from os.path import basename, join, getsize, splitext
+from time import time
+
+DEF_BS_INSTANCE_PATH = environ.get(  # browse server instance path
+    "INSTANCE_PATH", "/var/www/ngeo/ngeo_browse_server_instance"
+)
+DEF_BS_SETTINGS_MODULE = environ.get( # browse server instance settings module
+    "DJANGO_SETTINGS_MODULE", "ngeo_browse_server_instance.settings"
+)
+DEF_BATCH_SIZE = 1000
+
+
+def split_tileset(path, shard_dir, dedup=False, batch_size=DEF_BATCH_SIZE):
+    """ Copy the tiles of the tileset at `path` into the shards of their
+    dimension values in `shard_dir` and return a list of
+    `(shard_path, tiles, size)` tuples.
+    """
+    from ngeo_browse_server.mapcache import tileset
+    from ngeo_browse_server.mapcache.config import get_shard_name
+
+    connection = sqlite3.connect(path)
+    try:
+        keys = connection.execute(
+            "SELECT DISTINCT dim, tileset, grid FROM tiles ORDER BY dim"
+        ).fetchall()
+    finally:
+        connection.close()
+
+    results = []
+    with tileset.open(path) as source:
+        for dim, tileset_name, grid in keys:
+            shard_path = join(shard_dir, get_shard_name(dim))
+            with tileset.open(shard_path, mode="w", dedup=dedup) as shard:
+                with shard.writer(batch_size=batch_size,
+                                  on_conflict="REPLACE") as writer:
+                    for _, _, x, y, z, _, f in source.get_tiles(
+                            tileset_name, grid, dim):
+                        writer.add_tile(tileset_name, grid, dim, x, y, z, f)
+            results.append((shard_path, writer.count, getsize(shard_path)))
+    return results
+
+
+def main(*args):
+    settings_module = DEF_BS_SETTINGS_MODULE
+    instance_path = DEF_BS_INSTANCE_PATH
+    path = None
+    shard_dir = None
+    dedup = False
+    remove_source = False
+    batch_size = DEF_BATCH_SIZE
+
+    it_args = iter(args[1:])
+    try:
+        for option in it_args:
+            if option == "--settings-module":
+                settings_module = next(it_args)
+            elif option == "--instance-path":
+                instance_path = next(it_args)
+            elif option == "--dedup":
+                dedup = True
+            elif option == "--remove":
+                remove_source = True
+            elif option == "--batch-size":
+                batch_size = int(next(it_args))
+            elif path is None and not option.startswith("-"):
+                path = option
+            elif shard_dir is None and not option.startswith("-"):
+                shard_dir = option
+            else:
+                print_usage(args[0])
+                return 1
+    except (StopIteration, ValueError):
+        print_usage(args[0])
+        return 1
+
+    if path is None:
+        print_usage(args[0])
+        return 1
+
+    environ["DJANGO_SETTINGS_MODULE"] = settings_module
+    sys.path.insert(0, instance_path)
+
+    shard_dir = shard_dir or splitext(path)[0]
+    size = getsize(path)
+    start = time()
+    results = split_tileset(path, shard_dir, dedup, batch_size)
+    elapsed = time() - start
+
+    for shard_path, tiles, shard_size in results:
+        print("%-60s %8d tiles %12d bytes" % (
+            basename(shard_path), tiles, shard_size
+        ))
+    print("split %d tiles of %d bytes into %d shards of %d bytes in %.2fs" % (
+        sum(tiles for _, tiles, _ in results), size, len(results),
+        sum(shard_size for _, _, shard_size in results), elapsed
+    ))
+
+    if remove_source:
+        remove(path)
+        print("removed %s" % path)
+    return 0
+
+
+def print_usage(execname):
+    """ print command usage """
+    print("\n".join([
+        "USAGE: %s [options] <tileset> [<shard-dir>]" % basename(execname),
+        "OPTIONS:",
+        "    --dedup                       [off]",
+        "        Create new shards with the deduplicating schema.",
+        "    --remove                      [off]",
+        "        Remove the tileset once it is split.",
+        "    --batch-size <tiles>          [%d]" % DEF_BATCH_SIZE,
+        "        Tiles inserted per transaction.",
+        "    --settings-module <settings>  [%s]" % DEF_BS_SETTINGS_MODULE,
+        "        Browse Server Django setting module.",
+        "    --instance-path <path>        [%s]" % DEF_BS_INSTANCE_PATH,
+        "        Browse Server Django instance path.",
+    ]), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main(*sys.argv))
@@ -0,0 +1,192 @@
+#-------------------------------------------------------------------------------
+#
+#  Browse Server start-up time benchmark
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2021 EOX IT Services GmbH
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+# pylint: disable=missing-docstring,too-many-arguments,too-many-locals
+# pylint: disable=missing-docstring,unused-variable,import-error
+"""
+Measure the start-up time of an ingestion process broken down to the
+imported and initialized components. Each run is performed in a fresh
+Python process and the steps are timed in the order in which an ingestion
+process performs them, i.e., each step includes only the work not done by
+the preceding steps.
+
+The last step repeats the EOxServer system initialization and shows the
+per-job cost avoided by the warm workers of the browsewatchd2 daemon and by
+the `ngeo_ingest_browse_report --serve` mode.
+"""
+
+from __future__ import print_function
+import sys
+import json
+import subprocess
+from os import environ
+from os.path import basename, abspath
+from time import time
+
+DEF_BS_INSTANCE_PATH = environ.get(  # browse server instance path
+    "INSTANCE_PATH", "/var/www/ngeo/ngeo_browse_server_instance"
+)
+DEF_BS_SETTINGS_MODULE = environ.get( # browse server instance settings module
+    "DJANGO_SETTINGS_MODULE", "ngeo_browse_server_instance.settings"
+)
+DEF_REPEAT = 5
+
+
+def _import_python_libraries():
+    import lxml.etree
+    import numpy
+
+
+def _import_django_settings():
+    from django.conf import settings
+    settings.INSTALLED_APPS
+
+
+def _load_django_models():
+    from django.db.models import get_models
+    get_models()
+
+
+def _register_gdal_drivers():
+    from osgeo import gdal
+    gdal.AllRegister()
+
+
+def _import_eoxserver():
+    import eoxserver.core.system
+    import eoxserver.processing.preprocessing
+
+
+def _import_ngeo_ingestion():
+    import ngeo_browse_server.control.ingest
+
+
+def _init_eoxserver_system():
+    from eoxserver.core.system import System
+    System.init()
+
+
+def _connect_database():
+    from django.db import connection
+    connection.cursor()
+
+
+STEPS = [
+    ("python libraries (lxml, numpy)", _import_python_libraries),
+    ("django settings", _import_django_settings),
+    ("django models", _load_django_models),
+    ("gdal drivers", _register_gdal_drivers),
+    ("eoxserver modules", _import_eoxserver),
+    ("ngeo ingestion modules", _import_ngeo_ingestion),
+    ("eoxserver System.init()", _init_eoxserver_system),
+    ("database connection", _connect_database),
+    ("eoxserver System.init() per job", _init_eoxserver_system),
+]
+
+
+def run_steps():
+    """ Run the steps in the current process and return their times. """
+    times = []
+    for _, step in STEPS:
+        start = time()
+        step()
+        times.append(time() - start)
+    return times
+
+
+def run_benchmark(repeat, settings_module, instance_path):
+    """ Run the steps in fresh processes and return the lists of times. """
+    env = dict(environ, DJANGO_SETTINGS_MODULE=settings_module)
+    env["PYTHONPATH"] = ":".join(
+        path for path in [instance_path, env.get("PYTHONPATH")] if path
+    )
+    return [
+        json.loads(subprocess.check_output(
+            [sys.executable, abspath(__file__), "--single"], env=env
+        ).splitlines()[-1])
+        for _ in range(repeat)
+    ]
+
+
+def _median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main(*args):
+    repeat = DEF_REPEAT
+    settings_module = DEF_BS_SETTINGS_MODULE
+    instance_path = DEF_BS_INSTANCE_PATH
+
+    it_args = iter(args[1:])
+    try:
+        for option in it_args:
+            if option == "--single":
+                # internal: single run in this process
+                print(json.dumps(run_steps()))
+                return 0
+            elif option == "--repeat":
+                repeat = int(next(it_args))
+            elif option == "--settings-module":
+                settings_module = next(it_args)
+            elif option == "--instance-path":
+                instance_path = next(it_args)
+            else:
+                print_usage(args[0])
+                return 1
+    except (StopIteration, ValueError):
+        print_usage(args[0])
+        return 1
+
+    runs = run_benchmark(repeat, settings_module, instance_path)
+    medians = [_median(times) for times in zip(*runs)]
+    total = sum(medians[:-1])
+
+    print("start-up time, median of %d fresh processes:" % repeat)
+    for (label, _), median in zip(STEPS[:-1], medians[:-1]):
+        print("  %-34s %8.1fms %5.1f%%" % (
+            label, 1e3 * median, 100 * median / total
+        ))
+    print("  %-34s %8.1fms" % ("total", 1e3 * total))
+    print("  %-34s %8.1fms" % (STEPS[-1][0], 1e3 * medians[-1]))
+    return 0
+
+
+def print_usage(execname):
+    """ print command usage """
+    print("\n".join([
+        "USAGE: %s [options]" % basename(execname),
+        "OPTIONS:",
+        "    --repeat <no-runs>            [%s]" % DEF_REPEAT,
+        "        Number of measured fresh processes.",
+        "    --settings-module <settings>  [%s]" % DEF_BS_SETTINGS_MODULE,
+        "        Browse Server Django setting module.",
+        "    --instance-path <path>        [%s]" % DEF_BS_INSTANCE_PATH,
+        "        Browse Server Django instance path.",
+    ]), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main(*sys.argv))